@@ -0,0 +1,260 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from . import metrics
+from .resilience import RateLimited
+
+# Thứ tự ưu tiên: chấm tương tác > sinh đề > chấm hàng loạt/chạy nền
+PRIORITIES = ("interactive", "generate", "batch")
+# Trọng số EWMA của thời gian giữ lượt (dùng ước lượng thời gian chờ)
+_SERVICE_EWMA = 0.2
+
+
+class Overloaded(RateLimited):
+    """Hàng đợi của lớp ưu tiên đã đầy hoặc không kịp tới lượt trong hạn chờ: trả 429 kèm vị trí hàng đợi."""
+
+    def __init__(self, message: str, retry_after: float, position: int) -> None:
+        super().__init__(message, retry_after=retry_after)
+        self.position = position
+
+
+class _Waiter:
+    __slots__ = ("future", "client", "shed", "enqueued")
+
+    def __init__(self, future: "asyncio.Future[None]", client: str, shed: bool) -> None:
+        self.future = future
+        self.client = client
+        self.shed = shed
+        self.enqueued = time.monotonic()
+
+
+class _Lane:
+    """Hàng đợi của một lớp ưu tiên: mỗi client một deque, các client được phục vụ xoay vòng."""
+
+    def __init__(self, max_queue: int, max_wait: float) -> None:
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.clients: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self.size = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def push(self, waiter: _Waiter) -> None:
+        self.clients.setdefault(waiter.client, deque()).append(waiter)
+        self.size += 1
+
+    def pop(self) -> _Waiter:
+        # Lấy yêu cầu sớm nhất của client đứng đầu rồi đưa client đó xuống cuối lượt
+        client, queue = next(iter(self.clients.items()))
+        waiter = queue.popleft()
+        if queue:
+            self.clients.move_to_end(client)
+        else:
+            del self.clients[client]
+        self.size -= 1
+        return waiter
+
+    def remove(self, waiter: _Waiter) -> None:
+        queue = self.clients.get(waiter.client)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self.clients[waiter.client]
+        self.size -= 1
+
+    def position(self, waiter: _Waiter) -> int:
+        """Số yêu cầu cùng lớp được phục vụ trước waiter khi chia lượt xoay vòng theo client."""
+        rank = self.clients[waiter.client].index(waiter)
+        return sum(min(len(q), rank + 1) for c, q in self.clients.items() if c != waiter.client) + rank
+
+
+class Lease:
+    """Một lượt gọi LLM đã được cấp; release() trả lượt (gọi nhiều lần cũng chỉ trả một lần)."""
+
+    __slots__ = ("_scheduler", "_started")
+
+    def __init__(self, scheduler: Optional["AdmissionScheduler"]) -> None:
+        self._scheduler = scheduler
+        self._started = time.monotonic()
+
+    def release(self) -> None:
+        scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None:
+            scheduler._release(time.monotonic() - self._started)
+
+
+class AdmissionScheduler:
+    """Điều phối các request gọi LLM trên một worker: giới hạn số request chạy đồng thời, ưu tiên theo lớp,
+    hàng đợi có giới hạn và chia lượt công bằng giữa các client trong cùng lớp.
+
+    Có lượt trống thì luôn cấp cho lớp ưu tiên cao nhất đang chờ (ưu tiên tuyệt đối). Yêu cầu bị từ chối
+    ngay (Overloaded -> 429) khi hàng đợi của lớp đã đầy hoặc thời gian chờ ước lượng theo thời gian giữ
+    lượt trung bình vượt hạn chờ của lớp; yêu cầu đã vào hàng mà quá hạn chờ cũng bị loại. Hàng đợi đầy
+    thì client đang chiếm nhiều chỗ nhất phải nhường chỗ cho client ít hơn. Việc chạy nền
+    (job, bổ sung kho đề) gọi với shed=False: luôn chờ tới lượt, không bị từ chối.
+    concurrency=0 tắt điều phối (mọi yêu cầu được cấp lượt ngay).
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 0,
+        max_queue: int = 100,
+        max_wait: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.concurrency = max(0, concurrency)
+        waits = {"interactive": 15.0, "generate": 30.0, "batch": 60.0, **(max_wait or {})}
+        self._lanes: Dict[str, _Lane] = {name: _Lane(max(0, max_queue), waits[name]) for name in PRIORITIES}
+        self._running = 0
+        # Chưa có lượt nào xong thì chưa ước lượng được thời gian chờ (chỉ áp giới hạn hàng đợi/hạn chờ)
+        self._service_time: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self, priority: str, client: Optional[str] = None, shed: bool = True) -> AsyncIterator[None]:
+        lease = await self.acquire(priority, client, shed)
+        try:
+            yield
+        finally:
+            lease.release()
+
+    async def acquire(self, priority: str, client: Optional[str] = None, shed: bool = True) -> Lease:
+        """Chờ tới lượt của lớp `priority`; client là khóa chia lượt (người học, IP...)."""
+        if self.concurrency == 0:
+            return Lease(None)
+        lane = self._lanes[priority]
+        if self._running < self.concurrency:
+            # Còn lượt trống nghĩa là không ai đang chờ: cấp ngay
+            self._admit(priority, lane, 0.0)
+            return Lease(self)
+        client = client or "anonymous"
+        if shed:
+            position = self._ahead(priority) + lane.size + 1
+            estimate = self._estimate(position)
+            late = lane.max_wait and estimate is not None and estimate > lane.max_wait
+            full = lane.max_queue and lane.size >= lane.max_queue
+            if late or (full and not self._evict(priority, lane, client)):
+                self._shed(priority, lane, 0.0)
+                raise _overloaded(position, estimate or lane.max_wait)
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), client, shed)
+        lane.push(waiter)
+        metrics.ADMISSION_QUEUED.inc(priority=priority)
+        try:
+            done, _ = await asyncio.wait((waiter.future,), timeout=lane.max_wait if shed and lane.max_wait else None)
+        except asyncio.CancelledError:
+            self._abandon(priority, lane, waiter)
+            raise
+        if not done:
+            position = self._ahead(priority) + lane.position(waiter) + 1
+            self._abandon(priority, lane, waiter)
+            lane.timed_out += 1
+            self._shed(priority, lane, time.monotonic() - waiter.enqueued)
+            raise _overloaded(position, self._estimate(position) or lane.max_wait)
+        # Bị nhường chỗ cho client khác (xem _evict) thì future mang lỗi Overloaded
+        waiter.future.result()
+        return Lease(self)
+
+    def _evict(self, priority: str, lane: _Lane, client: str) -> bool:
+        """Hàng đợi đầy: bỏ yêu cầu mới nhất của client đang chiếm nhiều chỗ nhất để nhường cho client ít hơn."""
+        heaviest, queue = max(lane.clients.items(), key=lambda item: len(item[1]))
+        if heaviest == client or len(queue) <= len(lane.clients.get(client, ())) + 1 or not queue[-1].shed:
+            return False
+        victim = queue.pop()
+        if not queue:
+            del lane.clients[heaviest]
+        lane.size -= 1
+        metrics.ADMISSION_QUEUED.dec(priority=priority)
+        self._shed(priority, lane, time.monotonic() - victim.enqueued)
+        position = self._ahead(priority) + lane.size + 1
+        victim.future.set_exception(_overloaded(position, self._estimate(position) or lane.max_wait))
+        return True
+
+    def _ahead(self, priority: str) -> int:
+        """Số yêu cầu đang chờ ở các lớp ưu tiên cao hơn."""
+        ahead = 0
+        for name in PRIORITIES:
+            if name == priority:
+                return ahead
+            ahead += self._lanes[name].size
+        return ahead
+
+    def _estimate(self, position: int) -> Optional[float]:
+        # Mỗi lượt trống phục vụ một yêu cầu sau trung bình _service_time giây
+        if self._service_time is None:
+            return None
+        return position * self._service_time / max(self.concurrency, 1)
+
+    def _admit(self, priority: str, lane: _Lane, waited: float) -> None:
+        self._running += 1
+        lane.admitted += 1
+        lane.wait_total += waited
+        lane.wait_max = max(lane.wait_max, waited)
+        metrics.ADMISSION_RUNNING.set(self._running)
+        metrics.ADMISSION_WAIT.observe(waited, priority=priority, outcome="admitted")
+
+    def _shed(self, priority: str, lane: _Lane, waited: float) -> None:
+        lane.shed += 1
+        metrics.ADMISSION_WAIT.observe(waited, priority=priority, outcome="shed")
+
+    def _abandon(self, priority: str, lane: _Lane, waiter: _Waiter) -> None:
+        """Người chờ rời đi (hết hạn chờ/bị hủy); nếu vừa được cấp lượt thì trả lại cho người kế tiếp."""
+        if waiter.future.done():
+            if waiter.future.exception() is None:
+                self._release(None)
+            return
+        waiter.future.cancel()
+        lane.remove(waiter)
+        metrics.ADMISSION_QUEUED.dec(priority=priority)
+
+    def _release(self, held: Optional[float]) -> None:
+        self._running -= 1
+        if held is not None:
+            previous = held if self._service_time is None else self._service_time
+            self._service_time = previous + _SERVICE_EWMA * (held - previous)
+        while self._running < self.concurrency:
+            for priority in PRIORITIES:
+                lane = self._lanes[priority]
+                if lane.size:
+                    break
+            else:
+                break
+            waiter = lane.pop()
+            metrics.ADMISSION_QUEUED.dec(priority=priority)
+            self._admit(priority, lane, time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+        metrics.ADMISSION_RUNNING.set(self._running)
+
+    def stats(self) -> dict:
+        lanes = {}
+        for name, lane in self._lanes.items():
+            lanes[name] = {
+                "queued": lane.size,
+                "clients": len(lane.clients),
+                "admitted": lane.admitted,
+                "shed": lane.shed,
+                "timed_out": lane.timed_out,
+                "wait_ms_avg": round(lane.wait_total * 1000 / lane.admitted, 1) if lane.admitted else None,
+                "wait_ms_max": round(lane.wait_max * 1000, 1),
+                "max_queue": lane.max_queue,
+                "max_wait": lane.max_wait,
+            }
+        return {
+            "enabled": self.concurrency > 0,
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "service_ms_avg": round(self._service_time * 1000, 1) if self._service_time is not None else None,
+            "priorities": lanes,
+        }
+
+
+def _overloaded(position: int, retry_after: float) -> Overloaded:
+    return Overloaded(
+        f"Hệ thống đang quá tải (vị trí hàng đợi {position}), vui lòng thử lại sau",
+        retry_after=retry_after,
+        position=position,
+    )
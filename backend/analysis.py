@@ -0,0 +1,338 @@
+import re
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Sequence, Tuple
+
+# numpy chỉ được import khi tính đặc trưng lần đầu (analyze_batch/estimate_bands), không phải lúc khởi động
+if TYPE_CHECKING:
+    import numpy as np
+
+_WORD_FILE = Path(__file__).parent / "data" / "word_frequency.txt"
+_TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n|\n(?=\s{2,}|\t)")
+_COHESIVE_DEVICES = (
+    "however", "moreover", "furthermore", "in addition", "additionally", "besides", "therefore", "thus",
+    "hence", "consequently", "as a result", "as a consequence", "for example", "for instance", "such as",
+    "in particular", "on the other hand", "on the contrary", "in contrast", "by contrast", "nevertheless",
+    "nonetheless", "although", "even though", "whereas", "while", "firstly", "secondly", "thirdly",
+    "finally", "lastly", "first of all", "to begin with", "in conclusion", "to conclude", "to sum up",
+    "overall", "in summary", "similarly", "likewise", "in other words", "that is to say", "meanwhile",
+    "subsequently", "afterwards", "despite", "in spite of", "because of", "due to", "owing to",
+    "not only", "as well as", "in fact", "indeed", "admittedly", "undoubtedly", "this means that",
+)
+_COHESIVE_RE = re.compile(r"\b(" + "|".join(sorted((re.escape(d) for d in _COHESIVE_DEVICES), key=len, reverse=True)) + r")\b")
+_SUBORDINATORS = frozenset(
+    "although because since unless whereas while which who whom whose that if when whenever where "
+    "wherever though until once whether".split()
+)
+_FUNCTION_WORDS = frozenset(
+    "a an the and or but nor so yet for of in on at to from by with without about into onto over under "
+    "between among through during before after above below up down out off than as is am are was were be "
+    "been being have has had do does did will would shall should can could may might must i you he she it "
+    "we they me him her us them my your his its our their this that these those there here not no all any "
+    "some each every both either neither such what which who whom whose when where why how if then".split()
+)
+
+FEATURE_NAMES: Tuple[str, ...] = (
+    "word_count",
+    "sentence_count",
+    "paragraph_count",
+    "mean_sentence_length",
+    "sentence_length_std",
+    "type_token_ratio",
+    "lexical_diversity",
+    "lexical_sophistication",
+    "cohesive_density",
+    "cohesive_variety",
+    "complex_sentence_ratio",
+    "spelling_error_rate",
+)
+_F = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+@dataclass
+class EssayFeatures:
+    """Đặc trưng văn bản của một bài viết, tính cục bộ (không gọi LLM)."""
+
+    word_count: int
+    sentence_count: int
+    paragraph_count: int
+    mean_sentence_length: float
+    sentence_length_std: float
+    type_token_ratio: float
+    # Guiraud (số từ khác nhau / căn bậc hai số từ): ít phụ thuộc độ dài bài hơn TTR
+    lexical_diversity: float
+    # Tỉ lệ từ nội dung thuộc nhóm học thuật hoặc ngoài danh sách từ thông dụng
+    lexical_sophistication: float
+    # Số từ nối trên 100 từ và số từ nối khác nhau
+    cohesive_density: float
+    cohesive_variety: int
+    # Số liên từ phụ thuộc/đại từ quan hệ trên mỗi câu
+    complex_sentence_ratio: float
+    spelling_error_rate: float
+
+    def as_dict(self) -> Dict[str, float]:
+        return asdict(self)
+
+
+class _Lexicon:
+    """Danh sách từ kèm thứ hạng tần suất, nhận diện biến thể hình thái và lỗi chính tả đơn giản."""
+
+    def __init__(self, path: Path) -> None:
+        self.ranks: Dict[str, int] = {}
+        self.academic_rank = 0
+        rank = 0
+        for line in path.read_text(encoding="utf-8").splitlines():
+            word = line.strip()
+            if word == "# academic":
+                self.academic_rank = rank
+                continue
+            if not word or word.startswith("#"):
+                continue
+            rank += 1
+            self.ranks.setdefault(word, rank)
+        if not self.academic_rank:
+            self.academic_rank = rank + 1
+        self._deletes: FrozenSet[str] = frozenset()
+
+    @property
+    def deletes(self) -> FrozenSet[str]:
+        # Biến thể bỏ một ký tự của mọi từ (kiểu SymSpell), chỉ dựng khi cần kiểm tra chính tả
+        if not self._deletes:
+            self._deletes = frozenset(d for word in self.ranks if len(word) >= 4 for d in _deletes(word))
+        return self._deletes
+
+    def misspelled(self, word: str) -> bool:
+        """Từ lạ cách một từ đã biết đúng một lỗi gõ (thừa/thiếu/sai/đảo ký tự)."""
+        if len(word) < 5 or "'" in word:
+            return False
+        deletes = self.deletes
+        if word in deletes:
+            return True
+        return any(d in self.ranks or d in deletes for d in _deletes(word))
+
+
+def _deletes(word: str) -> List[str]:
+    return [word[:i] + word[i + 1 :] for i in range(len(word))]
+
+
+_SUFFIXES = (
+    ("ies", "y"), ("ied", "y"), ("ier", "y"), ("iest", "y"), ("ily", "y"), ("ness", ""), ("ment", ""),
+    ("ing", ""), ("ing", "e"), ("ed", ""), ("ed", "e"), ("es", ""), ("s", ""), ("ly", ""), ("ly", "le"),
+    ("er", ""), ("er", "e"), ("est", ""), ("est", "e"), ("al", ""), ("ally", ""), ("ity", ""), ("ity", "e"),
+)
+_PREFIXES = ("un", "in", "im", "ir", "il", "dis", "re", "non", "mis", "over", "under", "pre", "co")
+
+
+def _stems(word: str) -> List[str]:
+    """Các dạng gốc có thể của một từ (biến cách, hậu tố thường gặp, ise/ize, our/or)."""
+    stems = [word]
+    for suffix, replacement in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            base = word[: -len(suffix)]
+            stems.append(base + replacement)
+            # Phụ âm cuối được gấp đôi: stopped, running, bigger
+            if suffix in ("ing", "ed", "er", "est") and len(base) >= 3 and base[-1] == base[-2]:
+                stems.append(base[:-1])
+    if "is" in word[-7:]:
+        stems.append(word[:-7] + word[-7:].replace("is", "iz"))
+    if "our" in word:
+        stems.append(word.replace("our", "or"))
+    return stems
+
+
+@lru_cache(maxsize=65536)
+def _rank(word: str) -> int:
+    """Thứ hạng của từ (hoặc dạng gốc của nó) trong danh sách; 0 nếu không có."""
+    ranks = _lexicon().ranks
+    for stem in _stems(word):
+        rank = ranks.get(stem)
+        if rank:
+            return rank
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 4:
+            rest = word[len(prefix) :]
+            for stem in _stems(rest):
+                rank = ranks.get(stem)
+                if rank:
+                    return rank
+    if "'" in word:
+        # Dạng rút gọn/sở hữu (don't, government's): xét phần trước dấu nháy
+        return _rank(word.split("'", 1)[0]) or 1
+    return 0
+
+
+@lru_cache(maxsize=1)
+def _lexicon() -> _Lexicon:
+    return _Lexicon(_WORD_FILE)
+
+
+@lru_cache(maxsize=65536)
+def _token_info(word: str) -> Tuple[int, bool, bool]:
+    """(thứ hạng, là từ nội dung, nghi sai chính tả) của một token viết thường."""
+    rank = _rank(word)
+    return rank, word not in _FUNCTION_WORDS, rank == 0 and _lexicon().misspelled(word)
+
+
+def analyze_batch(essays: Sequence[str]) -> "np.ndarray":
+    """Ma trận đặc trưng (số bài x len(FEATURE_NAMES)) cho cả lớp trong một lần.
+
+    Tách từ/câu chạy theo từng bài; mọi phép đếm và thống kê được gom thành mảng phẳng
+    kèm chỉ số bài rồi tính bằng np.bincount, nên chi phí gần như tuyến tính theo tổng số từ.
+    """
+    import numpy as np
+
+    n = len(essays)
+    out = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float64)
+    if n == 0:
+        return out
+    academic_rank = _lexicon().academic_rank
+    vocab: Dict[str, int] = {}
+    tok_essay: List[int] = []
+    tok_id: List[int] = []
+    tok_rank: List[int] = []
+    tok_content: List[bool] = []
+    tok_misspelled: List[bool] = []
+    sent_essay: List[int] = []
+    sent_len: List[int] = []
+    subordinators = np.zeros(n)
+    cohesive = np.zeros(n)
+    variety = np.zeros(n)
+    for i, essay in enumerate(essays):
+        text = essay or ""
+        lower = text.lower()
+        out[i, _F["word_count"]] = len(text.split())
+        paragraphs = [p for p in _PARAGRAPH_RE.split(text.strip()) if p.strip()]
+        out[i, _F["paragraph_count"]] = len(paragraphs)
+        for sentence in _SENTENCE_RE.split(lower.strip()):
+            words = _TOKEN_RE.findall(sentence)
+            if not words:
+                continue
+            sent_essay.append(i)
+            sent_len.append(len(words))
+            for word in words:
+                rank, content, misspelled = _token_info(word)
+                tok_essay.append(i)
+                tok_id.append(vocab.setdefault(word, len(vocab)))
+                tok_rank.append(rank)
+                tok_content.append(content)
+                tok_misspelled.append(misspelled)
+                if word in _SUBORDINATORS:
+                    subordinators[i] += 1
+        devices = _COHESIVE_RE.findall(lower)
+        cohesive[i] = len(devices)
+        variety[i] = len(set(devices))
+
+    essay_idx = np.asarray(tok_essay, dtype=np.int64)
+    ranks = np.asarray(tok_rank, dtype=np.int64)
+    content = np.asarray(tok_content, dtype=bool)
+    misspelled = np.asarray(tok_misspelled, dtype=bool)
+    tokens = np.bincount(essay_idx, minlength=n).astype(np.float64)
+    safe_tokens = np.maximum(tokens, 1.0)
+    # Số từ khác nhau của từng bài: cặp (bài, từ) duy nhất
+    pairs = np.unique(essay_idx * max(len(vocab), 1) + np.asarray(tok_id, dtype=np.int64))
+    types = np.bincount(pairs // max(len(vocab), 1), minlength=n).astype(np.float64)
+    sophisticated = content & ~misspelled & ((ranks == 0) | (ranks >= academic_rank))
+    content_count = np.maximum(np.bincount(essay_idx, weights=content, minlength=n), 1.0)
+
+    s_idx = np.asarray(sent_essay, dtype=np.int64)
+    s_len = np.asarray(sent_len, dtype=np.float64)
+    sentences = np.bincount(s_idx, minlength=n).astype(np.float64)
+    safe_sentences = np.maximum(sentences, 1.0)
+    mean_len = np.bincount(s_idx, weights=s_len, minlength=n) / safe_sentences
+    mean_sq = np.bincount(s_idx, weights=s_len * s_len, minlength=n) / safe_sentences
+    out[:, _F["sentence_count"]] = sentences
+    out[:, _F["mean_sentence_length"]] = mean_len
+    out[:, _F["sentence_length_std"]] = np.sqrt(np.maximum(mean_sq - mean_len * mean_len, 0.0))
+    out[:, _F["type_token_ratio"]] = types / safe_tokens
+    out[:, _F["lexical_diversity"]] = types / np.sqrt(safe_tokens)
+    out[:, _F["lexical_sophistication"]] = np.bincount(essay_idx, weights=sophisticated, minlength=n) / content_count
+    out[:, _F["cohesive_density"]] = cohesive * 100.0 / safe_tokens
+    out[:, _F["cohesive_variety"]] = variety
+    out[:, _F["complex_sentence_ratio"]] = subordinators / safe_sentences
+    out[:, _F["spelling_error_rate"]] = np.bincount(essay_idx, weights=misspelled, minlength=n) / safe_tokens
+    return out
+
+
+def analyze_essay(essay: str) -> EssayFeatures:
+    """Đặc trưng của một bài viết (dùng chung đường tính vector hóa với analyze_batch)."""
+    return features_from_row(analyze_batch([essay])[0])
+
+
+def features_from_row(row: "np.ndarray") -> EssayFeatures:
+    values = {name: float(round(row[i], 4)) for i, name in enumerate(FEATURE_NAMES)}
+    for name in ("word_count", "sentence_count", "paragraph_count", "cohesive_variety"):
+        values[name] = int(values[name])
+    return EssayFeatures(**values)
+
+
+def estimate_bands(features: "np.ndarray", task_types: Sequence[str]) -> "np.ndarray":
+    """Band tạm tính (chưa làm tròn) cho 4 tiêu chí theo thứ tự rubric, từ ma trận đặc trưng.
+
+    Đây là heuristic tuyến tính từng đoạn, chỉ dùng để phản hồi tức thì trước khi có điểm của
+    giám khảo LLM; các mức cap theo số từ được áp dụng ở bước làm tròn như khi chấm đầy đủ.
+    """
+    import numpy as np
+
+    f = np.atleast_2d(features)
+    task1 = np.array([t == "task1" for t in task_types])
+    min_words = np.where(task1, 150.0, 250.0)
+    ideal_paragraphs = np.where(task1, 3.0, 4.0)
+    words = f[:, _F["word_count"]]
+    paragraphs = f[:, _F["paragraph_count"]]
+
+    length = np.clip(words / min_words, 0.0, 1.2)
+    structure = np.clip(paragraphs / ideal_paragraphs, 0.0, 1.0)
+    task = 3.0 + 2.5 * np.minimum(length, 1.0) + 5.0 * np.maximum(length - 1.0, 0.0) + 1.0 * structure
+
+    density = f[:, _F["cohesive_density"]]
+    # Từ nối quá thưa hoặc quá dày (máy móc) đều bị trừ
+    density_score = np.clip(1.0 - np.abs(density - 3.0) / 3.0, 0.0, 1.0)
+    variety = np.clip(f[:, _F["cohesive_variety"]] / 8.0, 0.0, 1.0)
+    coherence = 4.0 + 1.5 * structure + 1.0 * density_score + 1.0 * variety
+
+    diversity = np.clip((f[:, _F["lexical_diversity"]] - 4.0) / 5.0, 0.0, 1.0)
+    sophistication = np.clip(f[:, _F["lexical_sophistication"]] / 0.15, 0.0, 1.0)
+    spelling = np.clip(f[:, _F["spelling_error_rate"]] * 40.0, 0.0, 2.0)
+    lexical = 4.0 + 2.0 * diversity + 1.5 * sophistication - spelling
+
+    complexity = np.clip(f[:, _F["complex_sentence_ratio"]] / 0.8, 0.0, 1.0)
+    variation = np.clip(f[:, _F["sentence_length_std"]] / 8.0, 0.0, 1.0)
+    mean_len = f[:, _F["mean_sentence_length"]]
+    length_ok = ((mean_len >= 12.0) & (mean_len <= 28.0)).astype(np.float64)
+    grammar = 4.0 + 1.5 * complexity + 1.0 * variation + 1.0 * length_ok
+
+    bands = np.stack([task, coherence, lexical, grammar], axis=1)
+    return np.clip(bands, 3.0, 8.0)
+
+
+@dataclass
+class ParagraphStats:
+    """Số đo rẻ của một đoạn, dùng cho phản hồi tức thì khi đang viết nháp (không gọi LLM, không numpy)."""
+
+    words: int
+    sentences: int
+    # Số lần xuất hiện của từng từ nội dung (từ 4 ký tự trở lên, bỏ hư từ) để phát hiện lặp từ
+    content: Dict[str, int]
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Các đoạn của bài viết, theo đúng quy tắc tách đoạn khi đếm paragraph_count."""
+    return [p for p in _PARAGRAPH_RE.split((text or "").strip()) if p.strip()]
+
+
+def paragraph_stats(paragraph: str) -> ParagraphStats:
+    """Số từ (cách đếm như word_count), số câu và tần suất từ nội dung của một đoạn."""
+    sentences = 0
+    content: Dict[str, int] = {}
+    for sentence in _SENTENCE_RE.split(paragraph.lower().strip()):
+        words = _TOKEN_RE.findall(sentence)
+        if not words:
+            continue
+        sentences += 1
+        for word in words:
+            if len(word) >= 4 and word not in _FUNCTION_WORDS:
+                content[word] = content.get(word, 0) + 1
+    return ParagraphStats(words=len(paragraph.split()), sentences=sentences, content=content)
@@ -0,0 +1,307 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from . import metrics
+from .charts import DEFAULT_DPI, RENDER_VERSION, ChartRenderer, RenderResult, detect_chart_type, render_chart
+
+logger = logging.getLogger(__name__)
+
+# <chart_id>.json (dữ liệu đã chuẩn hóa) và <chart_id>[-<dpi>].<định dạng> (ảnh đã vẽ)
+_FILE_NAME = re.compile(r"^[0-9a-f]{32}(?:-\d+)?\.(?:json|png|webp|svg)$")
+_CHART_ID = re.compile(r"^[0-9a-f]{32}$")
+# File tạm của worker khác chỉ bị dọn khi đã cũ hơn chừng này giây (worker đó hẳn đã chết giữa chừng)
+_TMP_GRACE = 600.0
+
+
+def normalize_chart(data: dict, prompt: str = "") -> dict:
+    """Dữ liệu biểu đồ dạng chuẩn: chart_type đã xác định (có thể suy từ đề), bỏ trường None."""
+    normalized = {key: value for key, value in data.items() if value is not None}
+    normalized["chart_type"] = detect_chart_type(data, prompt)
+    return normalized
+
+
+def chart_id(data: dict) -> str:
+    """Hash của dữ liệu đã chuẩn hóa (khóa sắp xếp, không khoảng trắng) cùng phiên bản cách vẽ."""
+    raw = json.dumps([RENDER_VERSION, data], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def is_chart_id(value: str) -> bool:
+    return bool(_CHART_ID.match(value))
+
+
+class ChartStore:
+    """Kho ảnh biểu đồ định địa chỉ theo nội dung trên đĩa, giới hạn tổng dung lượng theo LRU.
+
+    Mỗi biểu đồ lưu dữ liệu đã chuẩn hóa (<id>.json) và các bản đã vẽ theo định dạng/dpi;
+    bản chưa có được vẽ lại từ dữ liệu khi có request. Cùng dữ liệu luôn ra cùng id nên sinh
+    lại biểu đồ giống hệt là cache hit. Thứ tự LRU dựng lại từ mtime khi khởi động; nhiều worker
+    dùng chung thư mục vẫn an toàn (file ghi nguyên tử, file bị worker khác xóa coi như miss).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        renderer: Optional[ChartRenderer] = None,
+        default_dpi: int = DEFAULT_DPI,
+    ) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.renderer = renderer
+        self.default_dpi = default_dpi
+        # Tên file -> kích thước, cũ nhất (ít dùng gần đây nhất) trước
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+        self._scan()
+
+    def url(self, chart_id: str, fmt: str = "png") -> str:
+        return f"/api/charts/{chart_id}.{fmt}"
+
+    def variant(self, chart_id: str, fmt: str, dpi: Optional[int] = None) -> str:
+        """Tên file của một bản vẽ; SVG là vector nên không phụ thuộc dpi."""
+        if fmt == "svg":
+            return f"{chart_id}.svg"
+        return f"{chart_id}-{dpi or self.default_dpi}.{fmt}"
+
+    def etag(self, chart_id: str, fmt: str, dpi: Optional[int] = None) -> str:
+        return f'"{self.variant(chart_id, fmt, dpi)}"'
+
+    def save(self, data: dict, prompt: str = "") -> Optional[str]:
+        """Lưu dữ liệu biểu đồ và vẽ sẵn bản PNG mặc định; trả về id, None nếu không vẽ/không ghi được."""
+        normalized, key = self._prepare(data, prompt)
+        if key is None:
+            return None
+        name = self.variant(key, "png")
+        if self._touch(name):
+            return key
+        result = self._render(normalized, "png", self.default_dpi)
+        if result is None:
+            return None
+        self._store(name, result)
+        return key
+
+    async def asave(self, data: dict, prompt: str = "") -> Optional[str]:
+        normalized, key = await asyncio.to_thread(self._prepare, data, prompt)
+        if key is None:
+            return None
+        name = self.variant(key, "png")
+        if self._touch(name):
+            return key
+        result = await self._arender(normalized, "png", self.default_dpi)
+        if result is None:
+            return None
+        await asyncio.to_thread(self._store, name, result)
+        return key
+
+    def get(self, chart_id: str, fmt: str = "png", dpi: Optional[int] = None) -> Optional[bytes]:
+        """Ảnh của biểu đồ theo định dạng/dpi (vẽ nếu chưa có); None nếu id không có trong kho."""
+        name = self.variant(chart_id, fmt, dpi)
+        image = self._read(name)
+        if image is not None:
+            return image
+        data = self._load_data(chart_id)
+        if data is None:
+            return None
+        result = self._render(data, fmt, dpi or self.default_dpi)
+        if result is None:
+            return None
+        self._store(name, result)
+        return result.data
+
+    async def aget(self, chart_id: str, fmt: str = "png", dpi: Optional[int] = None) -> Optional[bytes]:
+        name = self.variant(chart_id, fmt, dpi)
+        image = await asyncio.to_thread(self._read, name)
+        if image is not None:
+            return image
+        data = await asyncio.to_thread(self._load_data, chart_id)
+        if data is None:
+            return None
+        result = await self._arender(data, fmt, dpi or self.default_dpi)
+        if result is None:
+            return None
+        await asyncio.to_thread(self._store, name, result)
+        return result.data
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, size = len(self._entries), self._bytes
+        return {
+            "path": str(self.path),
+            "files": files,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_errors": self.write_errors,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _prepare(self, data: dict, prompt: str):
+        """Dữ liệu đã chuẩn hóa và id; id là None nếu không ghi được dữ liệu (URL sẽ không vẽ lại được)."""
+        normalized = normalize_chart(data, prompt)
+        key = chart_id(normalized)
+        name = f"{key}.json"
+        if not self._touch(name, count=False):
+            raw = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+            if not self._write(name, raw.encode("utf-8")):
+                return normalized, None
+        return normalized, key
+
+    def _render(self, data: dict, fmt: str, dpi: int) -> Optional[RenderResult]:
+        if self.renderer is not None:
+            return self.renderer.render(data, dpi=dpi, fmt=fmt)
+        try:
+            return render_chart(data, dpi=dpi, fmt=fmt)
+        except Exception:  # noqa: BLE001 - best effort
+            return None
+
+    async def _arender(self, data: dict, fmt: str, dpi: int) -> Optional[RenderResult]:
+        if self.renderer is not None:
+            return await self.renderer.arender(data, dpi=dpi, fmt=fmt)
+        return await asyncio.to_thread(self._render, data, fmt, dpi)
+
+    def _store(self, name: str, result: RenderResult) -> None:
+        # Thời gian đo trong tiến trình vẽ (có thể là worker của pool)
+        metrics.observe_stage("chart_render", result.render_seconds, task_type="task1")
+        metrics.observe_stage("png_encode", result.encode_seconds, task_type="task1")
+        # Ghi ảnh lỗi thì bỏ qua: dữ liệu đã có trong kho nên ảnh được vẽ lại ở lần đọc sau
+        self._write(name, result.data)
+
+    def _load_data(self, chart_id: str) -> Optional[dict]:
+        raw = self._read(f"{chart_id}.json", count=False)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _touch(self, name: str, count: bool = True) -> bool:
+        """Đánh dấu file vừa được dùng; False nếu không có trong kho."""
+        with self._lock:
+            known = name in self._entries
+            if known:
+                self._entries.move_to_end(name)
+        if known and self._utime(name):
+            if count:
+                self.hits += 1
+            return True
+        self._forget(name)
+        if count:
+            self.misses += 1
+        return False
+
+    def _read(self, name: str, count: bool = True) -> Optional[bytes]:
+        try:
+            data = (self.path / name).read_bytes()
+        except OSError:
+            if count:
+                self.misses += 1
+            self._forget(name)
+            return None
+        self._utime(name)
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+            else:
+                # Do worker khác ghi: đưa vào chỉ mục của tiến trình này
+                self._entries[name] = len(data)
+                self._bytes += len(data)
+        if count:
+            self.hits += 1
+        return data
+
+    def _write(self, name: str, data: bytes) -> bool:
+        """Ghi file vào kho; False (đã ghi log) nếu lỗi đĩa (hết chỗ, mất quyền...)."""
+        # Ghi file tạm rồi đổi tên: worker khác không bao giờ đọc phải file ghi dở
+        tmp = self.path / f".{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, self.path / name)
+        except OSError as exc:
+            self.write_errors += 1
+            logger.warning("Không ghi được %s vào kho biểu đồ: %s", name, exc)
+            self._remove([tmp.name])
+            return False
+        with self._lock:
+            self._bytes += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            victims = self._evict_locked()
+        self._remove(victims)
+        return True
+
+    def _utime(self, name: str) -> bool:
+        # mtime là thời điểm dùng gần nhất: giữ đúng thứ tự LRU sau khi khởi động lại
+        try:
+            os.utime(self.path / name)
+            return True
+        except OSError:
+            return False
+
+    def _forget(self, name: str) -> None:
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._bytes -= size
+
+    def _evict_locked(self) -> list:
+        victims = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            victims.append(name)
+        return victims
+
+    def _remove(self, names: list) -> None:
+        for name in names:
+            try:
+                (self.path / name).unlink()
+            except OSError:
+                pass
+
+    def _scan(self) -> None:
+        """Dựng chỉ mục LRU từ thư mục (cũ nhất theo mtime trước), dọn file tạm sót lại."""
+        found = []
+        now = time.time()
+        for entry in os.scandir(self.path):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # Không xóa file tạm worker khác đang ghi dở (chỉ file của pid này hoặc đã quá cũ)
+                try:
+                    pid = int(entry.name.rsplit(".", 3)[1])
+                except (IndexError, ValueError):
+                    pid = None
+                if pid == os.getpid() or now - entry.stat().st_mtime > _TMP_GRACE:
+                    self._remove([entry.name])
+            elif _FILE_NAME.match(entry.name):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            for _, name, size in sorted(found):
+                self._entries[name] = size
+                self._bytes += size
+            victims = self._evict_locked()
+        self._remove(victims)
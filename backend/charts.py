@@ -0,0 +1,345 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+# matplotlib và Pillow chỉ được import ở lần vẽ đầu tiên (trong worker hoặc khi vẽ inline), để tiến trình
+# server và các request không vẽ biểu đồ không phải trả thời gian import
+try:  # Không có trên Windows: khi đó bỏ qua giới hạn bộ nhớ của worker
+    import resource
+except ImportError:  # pragma: no cover - phụ thuộc nền tảng
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+FIGSIZE = (10, 6)
+DEFAULT_DPI = 100
+# Định dạng ảnh hỗ trợ -> media type khi trả qua HTTP
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml"}
+FORMATS = tuple(MEDIA_TYPES)
+# Tăng khi đổi cách vẽ để ảnh đã lưu trong kho (theo hash nội dung) không bị dùng lại
+RENDER_VERSION = 1
+
+
+class RenderResult(NamedTuple):
+    """Ảnh đã encode cùng thời gian vẽ và encode, để tiến trình chính ghi metrics."""
+
+    data: bytes
+    render_seconds: float
+    encode_seconds: float
+
+
+def detect_chart_type(data: dict, prompt: str) -> str:
+    """Loại biểu đồ theo chart_type trong dữ liệu, nếu thiếu thì đoán từ đề bài."""
+    chart_type = str(data.get("chart_type") or "").lower()
+    if chart_type:
+        return chart_type
+    prompt_lower = prompt.lower()
+    if "line" in prompt_lower or "graph" in prompt_lower:
+        return "line"
+    if "bar" in prompt_lower or "column" in prompt_lower:
+        return "bar"
+    if "pie" in prompt_lower or "circular" in prompt_lower:
+        return "pie"
+    if "table" in prompt_lower:
+        return "table"
+    return "bar"
+
+
+def _draw_table(ax, data: dict) -> bool:
+    rows = data.get("data")
+    if not isinstance(rows, list) or not rows:
+        return False
+    ax.axis("tight")
+    ax.axis("off")
+    table = ax.table(cellText=rows, loc="center", cellLoc="center")
+    table.auto_set_font_size(False)
+    table.set_fontsize(9)
+    table.scale(1.2, 1.5)
+    return True
+
+
+def _draw_pie(ax, data: dict) -> bool:
+    if "labels" not in data or "values" not in data:
+        return False
+    ax.pie(data["values"], labels=data["labels"], autopct="%1.1f%%", startangle=90)
+    return True
+
+
+def _draw_bar(ax, data: dict) -> bool:
+    if "series" in data and "categories" in data:
+        cats = data["categories"]
+        series_list = data["series"]
+        # Grouped bar chart: mỗi series một cột trong từng nhóm
+        x = range(len(cats))
+        width = 0.35 if len(series_list) == 2 else 0.8 / max(len(series_list), 1)
+        offset = -width * (len(series_list) - 1) / 2
+        for i, series in enumerate(series_list):
+            values = series.get("values", [])
+            if len(values) == len(cats):
+                positions = [j + offset + i * width for j in x]
+                ax.bar(positions, values, width, label=series.get("label", f"Series {i + 1}"))
+        ax.set_xlabel("Country" if "country" in str(cats).lower() else "Category")
+        ax.set_ylabel(data.get("ylabel", "Value"))
+        ax.set_xticks(list(x))
+        ax.set_xticklabels(cats)
+        ax.legend()
+    elif "categories" in data and "values" in data:
+        ax.bar(data["categories"], data["values"])
+        ax.set_xlabel(data.get("xlabel", "Category"))
+        ax.set_ylabel(data.get("ylabel", "Value"))
+    elif "years" in data and "values" in data:
+        ax.bar(data["years"], data["values"])
+        ax.set_xlabel("Year")
+        ax.set_ylabel(data.get("ylabel", "Value"))
+    else:
+        return False
+    return True
+
+
+def _draw_line(ax, data: dict) -> bool:
+    if "years" in data and "values" in data:
+        ax.plot(data["years"], data["values"], marker="o")
+        ax.set_xlabel("Year")
+        ax.set_ylabel(data.get("ylabel", "Value"))
+    elif "x" in data and "y" in data:
+        ax.plot(data["x"], data["y"], marker="o")
+        ax.set_xlabel(data.get("xlabel", "X"))
+        ax.set_ylabel(data.get("ylabel", "Y"))
+    elif "categories" in data and "values" in data:
+        ax.plot(data["categories"], data["values"], marker="o")
+        ax.set_xlabel("Category")
+        ax.set_ylabel(data.get("ylabel", "Value"))
+    else:
+        return False
+    return True
+
+
+_DRAWERS = {"table": _draw_table, "pie": _draw_pie, "bar": _draw_bar}
+
+
+def render_chart(
+    data: dict, prompt: str = "", dpi: int = DEFAULT_DPI, fmt: str = "png"
+) -> Optional[RenderResult]:
+    """Vẽ biểu đồ thành ảnh PNG/WebP/SVG bằng API hướng đối tượng (Figure + Agg), không dùng trạng thái pyplot.
+
+    Figure không đăng ký vào pyplot nên được giải phóng ngay khi hàm kết thúc, kể cả khi dữ liệu
+    không vẽ được. Bố cục "tight" được tính trong cùng lần vẽ (không vẽ lại như bbox_inches='tight').
+    Trả về None nếu dữ liệu không đủ cho loại biểu đồ.
+    """
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Không hỗ trợ định dạng ảnh {fmt!r}")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from PIL import Image
+
+    started = time.perf_counter()
+    chart_type = detect_chart_type(data, prompt)
+    fig = Figure(figsize=FIGSIZE, dpi=dpi, layout="tight")
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if not _DRAWERS.get(chart_type, _draw_line)(ax, data):
+        return None
+    ax.set_title(data.get("title", "Chart"), fontsize=12, fontweight="bold")
+    if chart_type in ("bar", "line"):
+        for label in ax.get_xticklabels():
+            label.set_rotation(45)
+            label.set_horizontalalignment("right")
+    buf = io.BytesIO()
+    if fmt == "svg":
+        # SVG được vẽ bởi renderer vector riêng: không cần raster Agg; bỏ ngày tạo để cùng dữ liệu cùng nội dung
+        rendered = time.perf_counter()
+        fig.savefig(buf, format="svg", metadata={"Date": None})
+        return RenderResult(buf.getvalue(), rendered - started, time.perf_counter() - rendered)
+    canvas.draw()
+    rendered = time.perf_counter()
+
+    width, height = canvas.get_width_height()
+    image = Image.frombuffer("RGBA", (width, height), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+    # Nền trắng đặc nên bỏ kênh alpha
+    if fmt == "webp":
+        image.convert("RGB").save(buf, format="WEBP", quality=90, method=4)
+    else:
+        # Nén mức 6 cân bằng thời gian encode và kích thước ảnh
+        image.convert("RGB").save(buf, format="PNG", compress_level=6)
+    return RenderResult(buf.getvalue(), rendered - started, time.perf_counter() - rendered)
+
+
+def _init_worker(max_memory_mb: int) -> None:
+    """Khởi tạo worker: giới hạn bộ nhớ, nạp sẵn font và cache text để lần vẽ đầu không chậm."""
+    if resource is not None and max_memory_mb > 0:
+        limit = max_memory_mb * 1024 * 1024
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    warm_up()
+
+
+def warm_up() -> None:
+    """Import matplotlib, nạp font và cache text bằng một lần vẽ nhỏ để lần vẽ thật đầu tiên không chậm."""
+    from matplotlib import font_manager
+
+    font_manager.findfont("DejaVu Sans")
+    render_chart({"chart_type": "bar", "title": "warm-up", "categories": ["a", "b"], "values": [1, 2]})
+
+
+def _ping() -> bool:
+    return True
+
+
+class ChartRenderer:
+    """Vẽ biểu đồ trong pool tiến trình dùng lâu dài, có timeout cho từng lần vẽ và giới hạn bộ nhớ mỗi worker.
+
+    workers=0 vẽ ngay trong tiến trình hiện tại (thread riêng với bản async). Worker bị treo quá
+    timeout thì cả pool được khởi động lại; worker được thay mới sau `max_tasks_per_worker` lần vẽ
+    (Python 3.11+) để rò rỉ bộ nhớ trong thư viện vẽ không tích lũy.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 10.0,
+        max_memory_mb: int = 1024,
+        dpi: int = DEFAULT_DPI,
+        max_tasks_per_worker: int = 500,
+    ) -> None:
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+        self.dpi = dpi
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self) -> None:
+        """Tạo pool và chờ các worker khởi động xong (import matplotlib, nạp font) trước request đầu tiên."""
+        if self.workers == 0:
+            return
+        pool = self._ensure_pool()
+        futures = [pool.submit(_ping) for _ in range(self.workers * 2)]
+        for future in futures:
+            try:
+                future.result(timeout=60)
+            except Exception as exc:  # noqa: BLE001 - pool lỗi sẽ được tạo lại ở lần vẽ sau
+                logger.warning("Không khởi động được worker vẽ biểu đồ: %s", exc)
+                return
+
+    def render(
+        self, data: dict, prompt: str = "", dpi: Optional[int] = None, fmt: str = "png"
+    ) -> Optional[RenderResult]:
+        """Vẽ biểu đồ (dpi mặc định theo renderer); None nếu dữ liệu không vẽ được, lỗi hoặc quá timeout."""
+        dpi = dpi or self.dpi
+        if self.workers == 0:
+            return self._render_inline(data, prompt, dpi, fmt)
+        pool = self._ensure_pool()
+        try:
+            future = pool.submit(render_chart, data, prompt, dpi, fmt)
+            return self._finish(future.result(timeout=self.timeout))
+        except FutureTimeoutError:
+            return self._on_timeout(pool)
+        except Exception as exc:  # noqa: BLE001 - thiếu ảnh thì client hiển thị dữ liệu dạng text
+            return self._on_error(pool, exc)
+
+    async def arender(
+        self, data: dict, prompt: str = "", dpi: Optional[int] = None, fmt: str = "png"
+    ) -> Optional[RenderResult]:
+        dpi = dpi or self.dpi
+        if self.workers == 0:
+            return await asyncio.to_thread(self._render_inline, data, prompt, dpi, fmt)
+        pool = self._ensure_pool()
+        try:
+            future: Future = pool.submit(render_chart, data, prompt, dpi, fmt)
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            return self._finish(result)
+        except asyncio.TimeoutError:
+            return self._on_timeout(pool)
+        except Exception as exc:  # noqa: BLE001
+            return self._on_error(pool, exc)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "dpi": self.dpi,
+            "renders": self.renders,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            # Chờ worker thoát hẳn để tài nguyên multiprocessing (semaphore, pipe) được dọn sạch
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _render_inline(self, data: dict, prompt: str, dpi: int, fmt: str) -> Optional[RenderResult]:
+        try:
+            return self._finish(render_chart(data, prompt, dpi, fmt))
+        except Exception as exc:  # noqa: BLE001
+            self.failures += 1
+            logger.warning("Vẽ biểu đồ lỗi: %s", exc)
+            return None
+
+    def _finish(self, result: Optional[RenderResult]) -> Optional[RenderResult]:
+        if result is None:
+            self.failures += 1
+        else:
+            self.renders += 1
+        return result
+
+    def _on_timeout(self, pool: ProcessPoolExecutor) -> None:
+        self.timeouts += 1
+        logger.warning("Vẽ biểu đồ quá %.1fs, khởi động lại pool vẽ", self.timeout)
+        self._restart(pool)
+        return None
+
+    def _on_error(self, pool: ProcessPoolExecutor, exc: BaseException) -> None:
+        self.failures += 1
+        logger.warning("Vẽ biểu đồ lỗi: %s", exc)
+        if isinstance(exc, BrokenProcessPool):
+            # Worker chết (vd. vượt giới hạn bộ nhớ): pool không dùng được nữa
+            self._restart(pool)
+        return None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        pool = self._pool
+        if pool is not None:
+            return pool
+        with self._lock:
+            if self._pool is None:
+                kwargs = {}
+                if sys.version_info >= (3, 11):
+                    kwargs["max_tasks_per_child"] = self.max_tasks_per_worker
+                # spawn: không fork tiến trình server đang có nhiều thread
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.max_memory_mb,),
+                    **kwargs,
+                )
+            return self._pool
+
+    def _restart(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is not pool:
+                return  # Request khác đã khởi động lại
+            self._pool = None
+            self.restarts += 1
+        # ProcessPoolExecutor không hủy được task đang chạy: dừng hẳn các worker của pool cũ
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
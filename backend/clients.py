@@ -0,0 +1,195 @@
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from .chart_store import ChartStore
+from .charts import ChartRenderer
+from .config import Settings, get_settings
+from .gemini_client import GeminiClient
+from .grade_cache import GradeCache
+from .providers import FakeProvider, Provider
+from .resilience import CircuitBreaker, RateLimiter, Resilience
+from .singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from .near_duplicate import NearDuplicateIndex
+
+
+class ClientRegistry:
+    """Giữ một GeminiClient dùng lâu dài cho mỗi model, chia sẻ giữa mọi endpoint."""
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self._settings = settings
+        self._clients: Dict[str, GeminiClient] = {}
+        self._lock = threading.Lock()
+        self._grade_cache: Optional[GradeCache] = None
+        self._near_duplicates: Optional["NearDuplicateIndex"] = None
+        self._rate_limiter: Optional[RateLimiter] = None
+        self._chart_renderer: Optional[ChartRenderer] = None
+        self._chart_store: Optional[ChartStore] = None
+        self._stores_ready = False
+        self.single_flight = SingleFlight()
+
+    @property
+    def settings(self) -> Settings:
+        # Nạp settings khi cần lần đầu để /api/health vẫn chạy khi thiếu API key
+        if self._settings is None:
+            self._settings = get_settings()
+        return self._settings
+
+    def open_stores(self) -> None:
+        """Khởi tạo (một lần) cache kết quả chấm, chỉ mục bài gần trùng, pool vẽ và kho biểu đồ dùng chung mọi model."""
+        if self._stores_ready:
+            return
+        with self._lock:
+            if self._stores_ready:
+                return
+            settings = self.settings
+            if settings.grade_cache_enabled:
+                self._grade_cache = GradeCache(
+                    max_items=settings.grade_cache_size,
+                    ttl=settings.grade_cache_ttl,
+                    path=settings.grade_cache_path,
+                )
+            if settings.near_dup_enabled:
+                from .near_duplicate import NearDuplicateIndex  # kéo theo numpy, chỉ khi bật
+
+                self._near_duplicates = NearDuplicateIndex(
+                    path=settings.near_dup_path or ":memory:",
+                    threshold=settings.near_dup_threshold,
+                    capacity=settings.near_dup_capacity,
+                )
+            if settings.rate_limit_rpm or settings.rate_limit_tpm:
+                self._rate_limiter = RateLimiter(
+                    requests_per_minute=settings.rate_limit_rpm,
+                    tokens_per_minute=settings.rate_limit_tpm,
+                    path=settings.rate_limit_path or ":memory:",
+                )
+            self._chart_renderer = ChartRenderer(
+                workers=settings.chart_workers,
+                timeout=settings.chart_render_timeout,
+                max_memory_mb=settings.chart_worker_max_mb,
+                dpi=settings.chart_dpi,
+            )
+            if settings.chart_store_enabled:
+                self._chart_store = ChartStore(
+                    settings.chart_store_path,
+                    max_bytes=settings.chart_store_max_mb * 1024 * 1024,
+                    renderer=self._chart_renderer,
+                    default_dpi=settings.chart_dpi,
+                )
+            self._stores_ready = True
+
+    @property
+    def grade_cache(self) -> Optional[GradeCache]:
+        """Cache kết quả chấm (khóa đã gồm tên model)."""
+        self.open_stores()
+        return self._grade_cache
+
+    @property
+    def near_duplicates(self) -> Optional["NearDuplicateIndex"]:
+        """Chỉ mục bài gần trùng (khóa đề đã gồm tên model)."""
+        self.open_stores()
+        return self._near_duplicates
+
+    @property
+    def chart_renderer(self) -> Optional[ChartRenderer]:
+        """Pool tiến trình vẽ biểu đồ Task 1."""
+        self.open_stores()
+        return self._chart_renderer
+
+    @property
+    def chart_store(self) -> Optional[ChartStore]:
+        """Kho ảnh biểu đồ theo hash nội dung."""
+        self.open_stores()
+        return self._chart_store
+
+    def get(self, model_name: Optional[str] = None) -> GeminiClient:
+        """Trả về client của model (mặc định theo settings), tạo mới nếu chưa có."""
+        settings = self.settings
+        self.open_stores()
+        name = model_name or settings.gemini_model
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = GeminiClient(
+                    settings.google_api_key,
+                    name,
+                    max_connections=settings.http_max_connections,
+                    max_keepalive=settings.http_max_keepalive,
+                    keepalive_expiry=settings.http_keepalive_expiry,
+                    timeout=settings.http_timeout,
+                    task1_single_call=settings.task1_single_call,
+                    grade_cache=self._grade_cache,
+                    near_duplicates=self._near_duplicates,
+                    near_dup_mode=settings.near_dup_mode,
+                    single_flight=self.single_flight,
+                    coalesce_grade=settings.single_flight_grade,
+                    coalesce_generate=settings.single_flight_generate,
+                    context_cache=settings.context_cache_enabled,
+                    context_cache_ttl=settings.context_cache_ttl,
+                    resilience=Resilience(
+                        name,
+                        limiter=self._rate_limiter,
+                        breaker=CircuitBreaker(settings.breaker_failure_threshold, settings.breaker_reset_timeout),
+                        max_attempts=settings.retry_max_attempts,
+                        base_delay=settings.retry_base_delay,
+                        max_delay=settings.retry_max_delay,
+                        max_wait=settings.rate_limit_max_wait,
+                    ),
+                    provider=self._provider(),
+                    chart_renderer=self._chart_renderer,
+                    chart_store=self._chart_store,
+                    grade_detail=settings.grade_detail,
+                    pack_max_essays=settings.grade_pack_size,
+                    pack_max_tokens=settings.grade_pack_max_tokens,
+                    fanout_min_words=settings.grade_fanout_min_words,
+                )
+                self._clients[name] = client
+            return client
+
+    def _provider(self) -> Optional[Provider]:
+        """Backend giả khi LLM_PROVIDER=fake; None để GeminiClient tự tạo kết nối Gemini thật."""
+        settings = self.settings
+        if settings.llm_provider != "fake":
+            return None
+        return FakeProvider(
+            latency=settings.fake_latency,
+            error_rate=settings.fake_error_rate,
+            seed=settings.fake_seed,
+            output_tps=settings.fake_output_tps,
+        )
+
+    def _drain(self) -> List[GeminiClient]:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            stores = (self._grade_cache, self._near_duplicates, self._rate_limiter, self._chart_store, self._chart_renderer)
+            for store in stores:
+                if store is not None:
+                    store.close()
+            self._grade_cache = None
+            self._near_duplicates = None
+            self._rate_limiter = None
+            self._chart_store = None
+            self._chart_renderer = None
+            self._stores_ready = False
+        return clients
+
+    def close(self) -> None:
+        """Đóng toàn bộ client khi ứng dụng tắt."""
+        for client in self._drain():
+            try:
+                client.close()
+            except Exception:  # noqa: BLE001 - best effort khi shutdown
+                pass
+
+    async def aclose(self) -> None:
+        """Đóng toàn bộ client (kể cả kết nối async) khi ứng dụng tắt."""
+        for client in self._drain():
+            try:
+                await client.aclose()
+            except Exception:  # noqa: BLE001 - best effort khi shutdown
+                pass
@@ -1,7 +1,11 @@
-from pydantic import BaseModel
+from functools import lru_cache
+from typing import Literal, Optional
+from pydantic import BaseModel, field_validator
 from dotenv import load_dotenv
 import os
 
+from .providers import parse_latency
+
 
 class Settings(BaseModel):
     """Cấu hình ứng dụng đọc từ biến môi trường."""
@@ -9,15 +13,194 @@ class Settings(BaseModel):
     google_api_key: str
     gemini_model: str = "gemini-2.5-flash"
     environment: str = "development"
+    # Giới hạn pool kết nối HTTP dùng chung cho mỗi client Gemini
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_timeout: float = 120.0
+    # Sinh đề Task 1 và dữ liệu biểu đồ trong một lần gọi có schema
+    task1_single_call: bool = False
+    # Kho đề sinh sẵn (task_pool_size=0 để tắt)
+    task_pool_size: int = 0
+    task_pool_low_water: int = 5
+    task_pool_refill_concurrency: int = 2
+    task_pool_dedupe: bool = True
+    task_pool_path: Optional[str] = None
+    # Mức chi tiết mặc định khi request không chỉ định: scores (chỉ band), feedback, full (thêm bản viết lại)
+    grade_detail: Literal["scores", "feedback", "full"] = "full"
+    # Cache kết quả chấm: LRU trong tiến trình + SQLite dùng chung (nếu có đường dẫn)
+    grade_cache_enabled: bool = True
+    grade_cache_size: int = 1024
+    grade_cache_ttl: float = 7 * 24 * 3600
+    grade_cache_path: Optional[str] = None
+    # Chỉ mục bài gần trùng (MinHash/LSH): "reuse" trả lại kết quả cũ, "delta" chấm theo phần chênh lệch
+    near_dup_enabled: bool = False
+    near_dup_threshold: float = 0.85
+    near_dup_mode: Literal["reuse", "delta"] = "reuse"
+    near_dup_path: Optional[str] = None
+    near_dup_capacity: int = 100_000
+    # Gộp các lời gọi LLM trùng đang chạy đồng thời (single-flight)
+    single_flight_grade: bool = False
+    single_flight_generate: bool = False
+    # Đăng ký rubric chấm tĩnh làm context cache phía Gemini (tự quay về prompt đầy đủ nếu lỗi)
+    context_cache_enabled: bool = False
+    context_cache_ttl: float = 3600.0
+    # Job chấm hàng loạt (hàng đợi SQLite, pool worker giới hạn)
+    jobs_db_path: str = "jobs.sqlite"
+    jobs_concurrency: int = 4
+    jobs_max_rows: int = 5000
+    # Dòng đang chấm không được gia hạn quá ngần này giây (worker chết) thì được nhận lại
+    jobs_lease_seconds: float = 60.0
+    # Chấm gộp nhiều bài cùng task trong một lần gọi (rubric gửi một lần; 1 = chấm từng bài)
+    grade_pack_size: int = 1
+    grade_pack_max_tokens: int = 24000
+    # Chấm song song từng tiêu chí (bốn lời gọi nhỏ) cho bài từ ngần này từ trở lên (0 = tắt)
+    grade_fanout_min_words: int = 0
+    # Điều phối request gọi LLM: số request chạy đồng thời mỗi worker (0 = tắt), hàng đợi mỗi lớp ưu tiên
+    # và hạn chờ (giây) của từng lớp trước khi trả 429
+    admission_concurrency: int = 0
+    admission_max_queue: int = 100
+    admission_wait_interactive: float = 15.0
+    admission_wait_generate: float = 30.0
+    admission_wait_batch: float = 60.0
+    # Giới hạn quota (0 = tắt; file SQLite để các worker dùng chung bucket), retry và circuit breaker
+    rate_limit_rpm: int = 0
+    rate_limit_tpm: int = 0
+    rate_limit_path: Optional[str] = None
+    rate_limit_max_wait: float = 20.0
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+    # Trả header Server-Timing (thời gian từng bước) trong mỗi response
+    server_timing: bool = False
+    # Backend sinh nội dung: "gemini" (mặc định) hoặc "fake" cho benchmark/load test không cần API key
+    llm_provider: Literal["gemini", "fake"] = "gemini"
+    fake_latency: str = "lognormal:-0.3,0.4"
+    fake_error_rate: float = 0.0
+    fake_seed: Optional[int] = 0
+    fake_output_tps: float = 0.0
+    # Pool tiến trình vẽ biểu đồ Task 1 (0 = vẽ ngay trong tiến trình server)
+    chart_workers: int = 2
+    chart_render_timeout: float = 10.0
+    chart_worker_max_mb: int = 1024
+    chart_dpi: int = 100
+    # Làm nóng ở thread nền khi khởi động (worker vẽ biểu đồ, font, numpy/từ điển, kết nối tới Gemini, config request)
+    # thay vì chặn khởi động; tắt thì mọi thứ được nạp ở request đầu tiên cần tới
+    warmup_on_start: bool = True
+    # Kho ảnh biểu đồ trên đĩa theo hash nội dung (response trả URL thay vì ảnh base64)
+    chart_store_enabled: bool = True
+    chart_store_path: str = "chart_store"
+    chart_store_max_mb: int = 256
+    # Lịch sử chấm (SQLite, ghi theo lô ở thread nền). Lưu toàn văn bài viết nên mặc định tắt;
+    # đặt history_db_path để bật
+    history_db_path: Optional[str] = None
+    history_batch_size: int = 200
+    history_flush_interval: float = 0.5
+    # Phản hồi tức thì cho bài nháp qua WebSocket (giới hạn mỗi worker; draft_idle_grade=0 để tắt tự chấm)
+    draft_max_connections: int = 5000
+    draft_max_chars: int = 20000
+    draft_debounce: float = 0.3
+    draft_idle_grade: float = 120.0
+    draft_idle_detail: Literal["scores", "feedback", "full"] = "scores"
+
+    @field_validator("fake_latency")
+    @classmethod
+    def _check_latency(cls, value: str) -> str:
+        # Báo lỗi cấu hình ngay khi khởi động thay vì ở mỗi request gọi LLM
+        parse_latency(value)
+        return value
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Đọc biến môi trường dạng bật/tắt (1/true/yes/on)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Nạp .env và trả về Settings."""
+    """Nạp .env một lần duy nhất và trả về Settings dùng chung cho cả tiến trình."""
     load_dotenv()
     api_key = os.getenv("GOOGLE_API_KEY", "")
     model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-    if not api_key:
+    provider = os.getenv("LLM_PROVIDER", "gemini").strip().lower()
+    if not api_key and provider != "fake":
         raise RuntimeError(
             "Thiếu GOOGLE_API_KEY. Hãy tạo file .env và điền khóa API."
         )
-    return Settings(google_api_key=api_key, gemini_model=model)
+    return Settings(
+        google_api_key=api_key,
+        gemini_model=model,
+        environment=os.getenv("ENVIRONMENT", "development"),
+        http_max_connections=int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "100")),
+        http_max_keepalive=int(os.getenv("GEMINI_HTTP_MAX_KEEPALIVE", "20")),
+        http_keepalive_expiry=float(os.getenv("GEMINI_HTTP_KEEPALIVE_EXPIRY", "30")),
+        http_timeout=float(os.getenv("GEMINI_HTTP_TIMEOUT", "120")),
+        task1_single_call=_env_flag("GEMINI_TASK1_SINGLE_CALL"),
+        task_pool_size=int(os.getenv("TASK_POOL_SIZE", "0")),
+        task_pool_low_water=int(os.getenv("TASK_POOL_LOW_WATER", "5")),
+        task_pool_refill_concurrency=int(os.getenv("TASK_POOL_REFILL_CONCURRENCY", "2")),
+        task_pool_dedupe=_env_flag("TASK_POOL_DEDUPE", True),
+        task_pool_path=os.getenv("TASK_POOL_PATH") or None,
+        grade_detail=os.getenv("GRADE_DETAIL", "full"),
+        grade_cache_enabled=_env_flag("GRADE_CACHE_ENABLED", True),
+        grade_cache_size=int(os.getenv("GRADE_CACHE_SIZE", "1024")),
+        grade_cache_ttl=float(os.getenv("GRADE_CACHE_TTL", str(7 * 24 * 3600))),
+        grade_cache_path=os.getenv("GRADE_CACHE_PATH") or None,
+        near_dup_enabled=_env_flag("NEAR_DUP_ENABLED"),
+        near_dup_threshold=float(os.getenv("NEAR_DUP_THRESHOLD", "0.85")),
+        near_dup_mode=os.getenv("NEAR_DUP_MODE", "reuse"),
+        near_dup_path=os.getenv("NEAR_DUP_PATH") or None,
+        near_dup_capacity=int(os.getenv("NEAR_DUP_CAPACITY", "100000")),
+        single_flight_grade=_env_flag("SINGLE_FLIGHT_GRADE"),
+        single_flight_generate=_env_flag("SINGLE_FLIGHT_GENERATE"),
+        context_cache_enabled=_env_flag("GEMINI_CONTEXT_CACHE"),
+        context_cache_ttl=float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600")),
+        jobs_db_path=os.getenv("JOBS_DB_PATH", "jobs.sqlite"),
+        jobs_concurrency=int(os.getenv("JOBS_CONCURRENCY", "4")),
+        jobs_max_rows=int(os.getenv("JOBS_MAX_ROWS", "5000")),
+        jobs_lease_seconds=float(os.getenv("JOBS_LEASE_SECONDS", "60")),
+        grade_pack_size=int(os.getenv("GRADE_PACK_SIZE", "1")),
+        grade_pack_max_tokens=int(os.getenv("GRADE_PACK_MAX_TOKENS", "24000")),
+        grade_fanout_min_words=int(os.getenv("GRADE_FANOUT_MIN_WORDS", "0")),
+        admission_concurrency=int(os.getenv("ADMISSION_CONCURRENCY", "0")),
+        admission_max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "100")),
+        admission_wait_interactive=float(os.getenv("ADMISSION_WAIT_INTERACTIVE", "15")),
+        admission_wait_generate=float(os.getenv("ADMISSION_WAIT_GENERATE", "30")),
+        admission_wait_batch=float(os.getenv("ADMISSION_WAIT_BATCH", "60")),
+        rate_limit_rpm=int(os.getenv("GEMINI_RATE_LIMIT_RPM", "0")),
+        rate_limit_tpm=int(os.getenv("GEMINI_RATE_LIMIT_TPM", "0")),
+        rate_limit_path=os.getenv("GEMINI_RATE_LIMIT_PATH") or None,
+        rate_limit_max_wait=float(os.getenv("GEMINI_RATE_LIMIT_MAX_WAIT", "20")),
+        retry_max_attempts=int(os.getenv("GEMINI_RETRY_ATTEMPTS", "3")),
+        retry_base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5")),
+        retry_max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", "8")),
+        breaker_failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+        breaker_reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+        server_timing=_env_flag("SERVER_TIMING"),
+        llm_provider=provider,
+        fake_latency=os.getenv("FAKE_LLM_LATENCY", "lognormal:-0.3,0.4"),
+        fake_error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        fake_seed=int(os.environ["FAKE_LLM_SEED"]) if os.getenv("FAKE_LLM_SEED") else 0,
+        fake_output_tps=float(os.getenv("FAKE_LLM_OUTPUT_TPS", "0")),
+        chart_workers=int(os.getenv("CHART_WORKERS", "2")),
+        chart_render_timeout=float(os.getenv("CHART_RENDER_TIMEOUT", "10")),
+        chart_worker_max_mb=int(os.getenv("CHART_WORKER_MAX_MB", "1024")),
+        chart_dpi=int(os.getenv("CHART_DPI", "100")),
+        warmup_on_start=_env_flag("WARMUP_ON_START", True),
+        chart_store_enabled=_env_flag("CHART_STORE_ENABLED", True),
+        chart_store_path=os.getenv("CHART_STORE_PATH", "chart_store"),
+        chart_store_max_mb=int(os.getenv("CHART_STORE_MAX_MB", "256")),
+        history_db_path=os.getenv("HISTORY_DB_PATH") or None,
+        history_batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "200")),
+        history_flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5")),
+        draft_max_connections=int(os.getenv("DRAFT_MAX_CONNECTIONS", "5000")),
+        draft_max_chars=int(os.getenv("DRAFT_MAX_CHARS", "20000")),
+        draft_debounce=int(os.getenv("DRAFT_DEBOUNCE_MS", "300")) / 1000,
+        draft_idle_grade=float(os.getenv("DRAFT_IDLE_GRADE_SECONDS", "120")),
+        draft_idle_detail=os.getenv("DRAFT_IDLE_DETAIL", "scores"),
+    )
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from google.genai import types
+
+from .prompts import grading_instructions
+
+logger = logging.getLogger(__name__)
+
+
+class RubricContextCache:
+    """Đăng ký hướng dẫn chấm tĩnh của từng task làm cached content phía Gemini.
+
+    Mỗi lần chấm chỉ còn gửi đề + bài viết và tham chiếu tới cache, giảm token đầu vào và
+    thời gian tới token đầu tiên. Cache được gia hạn trước khi hết TTL; nếu tạo/gia hạn thất
+    bại (model không hỗ trợ, nội dung quá ngắn...), get_name trả về None trong một khoảng
+    cooldown để caller gửi prompt đầy đủ như bình thường.
+    """
+
+    def __init__(
+        self,
+        client,
+        model_name: str,
+        ttl: float = 3600.0,
+        refresh_margin: float = 300.0,
+        retry_after: float = 600.0,
+    ) -> None:
+        self._client = client
+        self.model_name = model_name
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.retry_after = retry_after
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._disabled_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.refreshed = 0
+        self.failures = 0
+
+    def _fresh(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] - self.refresh_margin > time.time():
+            return entry[0]
+        return None
+
+    def _unavailable(self, key: str) -> bool:
+        return self._disabled_until.get(key, 0.0) > time.time()
+
+    def get_name(self, task_type: str, detail: str = "full") -> Optional[str]:
+        """Tên cached content còn hạn của task (theo mức chi tiết), hoặc None nếu cần gửi prompt đầy đủ."""
+        key = _key(task_type, detail)
+        name = self._fresh(key)
+        if name is not None or self._unavailable(key):
+            return name
+        with self._lock:
+            name = self._fresh(key)
+            if name is not None or self._unavailable(key):
+                return name
+            return self._create_or_refresh(task_type, detail)
+
+    async def aget_name(self, task_type: str, detail: str = "full") -> Optional[str]:
+        key = _key(task_type, detail)
+        name = self._fresh(key)
+        if name is not None or self._unavailable(key):
+            return name
+        # Tạo/gia hạn cache là lời gọi đồng bộ, hiếm khi xảy ra: chạy trong thread riêng
+        return await asyncio.to_thread(self.get_name, task_type, detail)
+
+    def _create_or_refresh(self, task_type: str, detail: str) -> Optional[str]:
+        ttl = f"{int(self.ttl)}s"
+        key = _key(task_type, detail)
+        entry = self._entries.get(key)
+        try:
+            if entry is not None and entry[1] > time.time():
+                self._client.caches.update(name=entry[0], config=types.UpdateCachedContentConfig(ttl=ttl))
+                name = entry[0]
+                self.refreshed += 1
+            else:
+                cached = self._client.caches.create(
+                    model=self.model_name,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"ielts-rubric-{key}",
+                        system_instruction=grading_instructions(task_type, detail),
+                        ttl=ttl,
+                    ),
+                )
+                name = cached.name
+                self.created += 1
+        except Exception as exc:  # noqa: BLE001 - thiếu cache thì quay về prompt đầy đủ
+            self.failures += 1
+            self._entries.pop(key, None)
+            self._disabled_until[key] = time.time() + self.retry_after
+            logger.warning("Không tạo được context cache cho %s: %s", key, exc)
+            return None
+        self._entries[key] = (name, time.time() + self.ttl)
+        return name
+
+    def invalidate(self, task_type: str, detail: str = "full") -> None:
+        """Bỏ cache của task (vd. upstream báo cache không còn tồn tại); lần sau sẽ tạo lại."""
+        self._entries.pop(_key(task_type, detail), None)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "active": sorted(self._entries),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+        }
+
+    def close(self) -> None:
+        """Xóa các cached content đã tạo (best effort) để không tính phí lưu trữ sau khi tắt."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for name, _ in entries:
+            try:
+                self._client.caches.delete(name=name)
+            except Exception:  # noqa: BLE001 - best effort khi shutdown
+                pass
+
+
+def _key(task_type: str, detail: str) -> str:
+    # Mỗi mức chi tiết có hướng dẫn chấm (định dạng đầu ra) riêng nên là một cached content riêng
+    return task_type if detail == "full" else f"{task_type}-{detail}"
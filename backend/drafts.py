@@ -0,0 +1,344 @@
+"""Phản hồi tức thì cho bài nháp qua WebSocket.
+
+Trình duyệt gửi toàn văn bài nháp mỗi khi người học gõ; server gom các lần sửa liên tiếp (debounce),
+so với bản trước theo từng đoạn và chỉ phân tích lại các đoạn đã đổi (số từ so với mức tối thiểu,
+cấu trúc đoạn, lặp từ) rồi đẩy số đo về ngay. Chấm đầy đủ bằng LLM chỉ chạy khi người học bấm nộp
+hoặc sau một khoảng ngừng gõ dài.
+
+Giao thức (JSON, mỗi message một object):
+    client -> server  {"type": "draft", "text": ..., "task_type": "task2", "prompt": ..., "user_id": ...}
+                      {"type": "submit", "detail": "feedback", ...}  (có thể kèm các trường như draft)
+    server -> client  {"type": "metrics", ...}, {"type": "grade", "trigger": "submit"|"idle", "result": ...},
+                      {"type": "error", "status": ..., "detail": ...}
+"""
+import asyncio
+import heapq
+import json
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from . import metrics
+from .analysis import ParagraphStats, paragraph_stats, split_paragraphs
+from .models import GradeResponse
+
+# (prompt, bài viết, task_type, mức chi tiết, user_id) -> kết quả chấm
+DraftGrader = Callable[[str, str, str, Optional[str], Optional[str]], Awaitable[GradeResponse]]
+
+# Mức tối thiểu grade_essay dùng để cap band, và số đoạn lý tưởng như estimate_bands
+_MIN_WORDS = {"task1": 150, "task2": 250}
+_IDEAL_PARAGRAPHS = {"task1": 3, "task2": 4}
+_OVERLONG_PARAGRAPH = 150
+_REPEAT_TOP = 5
+_DETAILS = ("scores", "feedback", "full")
+_MAX_PROMPT_CHARS = 4000
+_MAX_USER_ID_CHARS = 128
+
+# Mã đóng WebSocket (RFC 6455)
+_CLOSE_UNSUPPORTED = 1003
+_CLOSE_TOO_BIG = 1009
+_CLOSE_TRY_AGAIN = 1013
+
+
+class DraftSession:
+    """Trạng thái một bài nháp đang mở: bản mới nhất và số đo từng đoạn của lần phân tích trước.
+
+    Bộ nhớ bị chặn theo độ dài bài: chỉ giữ văn bản mới nhất, số đo từng đoạn và tổng tần suất
+    từ nội dung; không giữ lịch sử các bản sửa.
+    """
+
+    __slots__ = (
+        "task_type", "prompt", "user_id", "text", "version", "analyzed", "graded", "edited_at",
+        "submit", "submit_detail", "words", "_paragraphs", "_content",
+    )
+
+    def __init__(self, task_type: str = "task2") -> None:
+        self.task_type = task_type
+        self.prompt = ""
+        self.user_id: Optional[str] = None
+        self.text = ""
+        # version tăng mỗi lần nội dung đổi; analyzed/graded là version đã phân tích/đã chấm
+        self.version = 0
+        self.analyzed = 0
+        self.graded = 0
+        self.edited_at = 0.0
+        self.submit = False
+        self.submit_detail: Optional[str] = None
+        self.words = 0
+        self._paragraphs: List[Tuple[int, ParagraphStats]] = []
+        self._content: Dict[str, int] = {}
+
+    @property
+    def min_words(self) -> int:
+        return _MIN_WORDS[self.task_type]
+
+    def edit(self, text: Optional[str] = None, task_type: Optional[str] = None) -> bool:
+        """Nhận bản nháp mới; trả về False nếu không có gì thay đổi."""
+        changed = False
+        if task_type in _MIN_WORDS and task_type != self.task_type:
+            self.task_type = task_type
+            changed = True
+        if text is not None and text != self.text:
+            self.text = text
+            changed = True
+        if changed:
+            self.version += 1
+            self.edited_at = time.monotonic()
+        return changed
+
+    def analyze(self) -> dict:
+        """Số đo của bản nháp hiện tại; chỉ đoạn mới hoặc đã sửa được phân tích lại."""
+        started = time.perf_counter()
+        previous = dict(self._paragraphs)
+        paragraphs: List[Tuple[int, ParagraphStats]] = []
+        changed: List[int] = []
+        for i, part in enumerate(split_paragraphs(self.text)):
+            key = hash(part)
+            stats = previous.get(key)
+            if stats is None:
+                stats = paragraph_stats(part)
+                changed.append(i)
+            paragraphs.append((key, stats))
+        self._update_content(paragraphs)
+        self._paragraphs = paragraphs
+        self.analyzed = self.version
+        self.words = sum(stats.words for _, stats in paragraphs)
+
+        count = len(paragraphs)
+        # Câu chủ đề + triển khai: đoạn thân bài chỉ một câu thường là ý chưa được phát triển
+        single_sentence = [i for i, (_, stats) in enumerate(paragraphs) if 0 < i < count - 1 and stats.sentences < 2]
+        overlong = [i for i, (_, stats) in enumerate(paragraphs) if stats.words > _OVERLONG_PARAGRAPH]
+        threshold = max(3, self.words // 50)
+        repeated = heapq.nlargest(
+            _REPEAT_TOP, ((n, word) for word, n in self._content.items() if n >= threshold)
+        )
+        return {
+            "type": "metrics",
+            "version": self.version,
+            "task_type": self.task_type,
+            "word_count": self.words,
+            "min_words": self.min_words,
+            "remaining": max(0, self.min_words - self.words),
+            "sentence_count": sum(stats.sentences for _, stats in paragraphs),
+            "paragraph_words": [stats.words for _, stats in paragraphs],
+            "changed": changed,
+            "structure": {
+                "paragraphs": count,
+                "ideal": _IDEAL_PARAGRAPHS[self.task_type],
+                "single_sentence": single_sentence,
+                "overlong": overlong,
+            },
+            "repetition": [{"word": word, "count": n} for n, word in repeated],
+            "analysis_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def _update_content(self, paragraphs: List[Tuple[int, ParagraphStats]]) -> None:
+        # Cộng/trừ tần suất từ của các đoạn bị bỏ/được thêm thay vì đếm lại cả bài
+        old = Counter(key for key, _ in self._paragraphs)
+        new = Counter(key for key, _ in paragraphs)
+        by_key = {**dict(self._paragraphs), **dict(paragraphs)}
+        for keys, sign in ((old - new, -1), (new - old, 1)):
+            for key, times in keys.items():
+                for word, n in by_key[key].content.items():
+                    total = self._content.get(word, 0) + sign * times * n
+                    if total > 0:
+                        self._content[word] = total
+                    else:
+                        self._content.pop(word, None)
+
+
+class DraftHub:
+    """Các kết nối bài nháp của một worker: giới hạn số kết nối/độ dài bài, debounce và hẹn giờ chấm.
+
+    Mỗi kết nối có một task đọc message (chỉ cập nhật DraftSession) và một vòng lặp duy nhất gửi
+    message đi, nên không có hai lần gửi chồng nhau trên cùng socket.
+    """
+
+    def __init__(
+        self,
+        grade: DraftGrader,
+        max_connections: int = 5000,
+        max_chars: int = 20000,
+        debounce: float = 0.3,
+        idle_grade: float = 120.0,
+        idle_detail: Optional[str] = "scores",
+    ) -> None:
+        self._grade = grade
+        self.max_connections = max(1, max_connections)
+        self.max_chars = max(1, max_chars)
+        self.debounce = max(0.0, debounce)
+        self.idle_grade = max(0.0, idle_grade)
+        self.idle_detail = idle_detail
+        self._open = 0
+        self._peak = 0
+        self._rejected = 0
+        self._analyses = 0
+        self._analysis_seconds = 0.0
+        self._paragraphs_analyzed = 0
+        self._paragraphs_reused = 0
+        self._grades: Dict[str, int] = {"submit": 0, "idle": 0}
+
+    def stats(self) -> dict:
+        return {
+            "open": self._open,
+            "peak": self._peak,
+            "rejected": self._rejected,
+            "max_connections": self.max_connections,
+            "analyses": self._analyses,
+            "analysis_ms_avg": round(self._analysis_seconds * 1000 / self._analyses, 3) if self._analyses else None,
+            "paragraphs_analyzed": self._paragraphs_analyzed,
+            "paragraphs_reused": self._paragraphs_reused,
+            "grades": dict(self._grades),
+        }
+
+    async def serve(self, websocket: WebSocket) -> None:
+        """Phục vụ một kết nối cho tới khi client đóng (hoặc gửi message không hợp lệ)."""
+        if self._open >= self.max_connections:
+            self._rejected += 1
+            await websocket.close(code=_CLOSE_TRY_AGAIN)
+            return
+        await websocket.accept()
+        self._open += 1
+        self._peak = max(self._peak, self._open)
+        session = DraftSession()
+        wake = asyncio.Event()
+        reader = asyncio.create_task(self._read(websocket, session, wake))
+        grading: Optional[asyncio.Task] = None
+        try:
+            while not reader.done():
+                timeout = self._timeout(session, grading)
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                wake.clear()
+                if grading is not None and grading.done():
+                    await websocket.send_json(grading.result())
+                    grading = None
+                now = time.monotonic()
+                if session.analyzed != session.version and (session.submit or now >= session.edited_at + self.debounce):
+                    await websocket.send_json(self._analyze(session))
+                if grading is not None:
+                    continue
+                if session.submit:
+                    session.submit = False
+                    if not session.prompt or not session.text.strip():
+                        await websocket.send_json(
+                            {"type": "error", "trigger": "submit", "status": 400, "detail": "Thiếu prompt hoặc essay"}
+                        )
+                        continue
+                    grading = self._start_grade(session, "submit", session.submit_detail, wake)
+                elif self._idle_due(session) and now >= session.edited_at + self.idle_grade:
+                    grading = self._start_grade(session, "idle", self.idle_detail, wake)
+            code = reader.result()
+            if code is not None:
+                await websocket.close(code=code)
+        except (WebSocketDisconnect, ConnectionError, RuntimeError):
+            # Client đóng giữa chừng khi server đang gửi
+            pass
+        finally:
+            reader.cancel()
+            if grading is not None:
+                grading.cancel()
+            self._open -= 1
+
+    def _timeout(self, session: DraftSession, grading: Optional[asyncio.Task]) -> Optional[float]:
+        """Thời gian chờ tới mốc debounce/chấm khi ngừng gõ gần nhất (None: chờ message tiếp theo)."""
+        deadlines = []
+        if session.analyzed != session.version:
+            deadlines.append(session.edited_at + self.debounce)
+        elif grading is None and self._idle_due(session):
+            deadlines.append(session.edited_at + self.idle_grade)
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _idle_due(self, session: DraftSession) -> bool:
+        # Chỉ tự chấm bản đã phân tích, chưa chấm, có đề và đủ số từ tối thiểu
+        return (
+            self.idle_grade > 0
+            and bool(session.prompt)
+            and session.graded != session.version
+            and session.analyzed == session.version
+            and session.words >= session.min_words
+        )
+
+    def _analyze(self, session: DraftSession) -> dict:
+        with metrics.stage("draft_analysis", task_type=session.task_type):
+            message = session.analyze()
+        self._analyses += 1
+        self._analysis_seconds += message["analysis_ms"] / 1000
+        self._paragraphs_analyzed += len(message["changed"])
+        self._paragraphs_reused += len(message["paragraph_words"]) - len(message["changed"])
+        return message
+
+    def _start_grade(
+        self, session: DraftSession, trigger: str, detail: Optional[str], wake: asyncio.Event
+    ) -> asyncio.Task:
+        """Chấm bản nháp hiện tại ở task riêng; xong thì đánh thức vòng lặp để gửi kết quả."""
+        session.graded = version = session.version
+        self._grades[trigger] += 1
+        args = (session.prompt, session.text, session.task_type, detail, session.user_id)
+
+        async def run() -> dict:
+            try:
+                result = await self._grade(*args)
+            except Exception as exc:  # pylint: disable=broad-except
+                return {
+                    "type": "error",
+                    "trigger": trigger,
+                    "status": getattr(exc, "status_code", 500),
+                    "detail": getattr(exc, "detail", None) or str(exc),
+                }
+            return {"type": "grade", "trigger": trigger, "version": version, "result": result.model_dump()}
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(lambda _: wake.set())
+        return task
+
+    async def _read(self, websocket: WebSocket, session: DraftSession, wake: asyncio.Event) -> Optional[int]:
+        """Đọc message tới khi client đóng; trả về mã đóng nếu message không hợp lệ."""
+        # JSON của bài dài tối đa max_chars cộng đề bài và vài trường nhỏ
+        limit = 2 * self.max_chars + _MAX_PROMPT_CHARS + 1024
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return None
+                raw = message.get("text")
+                if raw is None:
+                    return _CLOSE_UNSUPPORTED
+                if len(raw) > limit:
+                    return _CLOSE_TOO_BIG
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    return _CLOSE_UNSUPPORTED
+                code = self._apply(session, data)
+                if code is not None:
+                    return code
+                wake.set()
+        finally:
+            wake.set()
+
+    def _apply(self, session: DraftSession, data: object) -> Optional[int]:
+        if not isinstance(data, dict) or data.get("type") not in ("draft", "submit"):
+            return _CLOSE_UNSUPPORTED
+        text = data.get("text")
+        if isinstance(text, str) and len(text) > self.max_chars:
+            return _CLOSE_TOO_BIG
+        prompt = data.get("prompt")
+        if isinstance(prompt, str):
+            session.prompt = prompt[:_MAX_PROMPT_CHARS].strip()
+        user_id = data.get("user_id")
+        if isinstance(user_id, str):
+            session.user_id = user_id[:_MAX_USER_ID_CHARS] or None
+        session.edit(text if isinstance(text, str) else None, data.get("task_type"))
+        if data["type"] == "submit":
+            detail = data.get("detail")
+            session.submit = True
+            session.submit_detail = detail if detail in _DETAILS else None
+        return None
@@ -1,421 +1,1606 @@
-from typing import List, Optional
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
+import contextvars
+import difflib
+import hashlib
+import re
 import json
 import base64
-import io
-from google import genai
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-import matplotlib.pyplot as plt
-import numpy as np
+import time
+from google.genai import types
+from pydantic import BaseModel, create_model
 
-from .models import GenerateTasksResponse, GradeResponse, CriterionScore
+from .analysis import EssayFeatures, analyze_batch, analyze_essay, estimate_bands, features_from_row
+from .chart_store import ChartStore
+from .charts import ChartRenderer, RenderResult, render_chart
+from .context_cache import RubricContextCache
+from .grade_cache import GradeCache, grade_cache_key
+from . import metrics
+from .json_stream import IncrementalJsonObject
+from .models import ChartData, GenerateTasksResponse, GradeResponse, CriterionScore, QuickGradeResponse
+from .prompts import (
+    GRADE_DETAILS,
+    STRICT_POLICY,
+    criterion_instructions,
+    features_block,
+    grading_instructions,
+    grading_payload,
+    improvement_contents,
+    packed_instructions,
+    packed_payload,
+    summary_contents,
+)
+from .providers import GeminiProvider, Provider
+from .resilience import Resilience, UpstreamUnavailable, estimate_tokens
+from .singleflight import SingleFlight
+from .structured import OutputValidationError, ParseCounters, llm_schema, parse_model, repair_contents
+
+if TYPE_CHECKING:
+    from .near_duplicate import NearDuplicateIndex, NearDuplicateMatch
+
+
+# Tăng khi thay đổi prompt/rubric chấm để vô hiệu hóa kết quả đã cache
+RUBRIC_VERSION = "2"
+
+
+# Prompt sinh đề, dùng chung cho nhánh sync và async
+_SYS_T1 = (
+    "You are an IELTS Writing examiner. Generate ONE IELTS Writing Task 1 prompt (Academic). "
+    "The task should require describing a graph/chart/table/process/map. "
+    "Be specific about the visual type and include key details in the prompt. "
+    "Output ONLY the prompt text in English."
+)
+_CHART_JSON_EXAMPLES = (
+    "JSON structure examples:\n"
+    "- Single series bar/line chart: {\"years\": [2018, 2019, 2020], \"values\": [100, 150, 200], \"ylabel\": \"Sales (millions)\", \"title\": \"Sales Over Time\"}\n"
+    "- Multiple series bar chart (comparison): {\"chart_type\": \"bar\", \"categories\": [\"A\", \"B\", \"C\"], \"series\": [{\"label\": \"1990\", \"values\": [100, 150, 200]}, {\"label\": \"2010\", \"values\": [120, 180, 250]}], \"ylabel\": \"Units\", \"title\": \"Comparison Chart\"}\n"
+    "- Pie chart: {\"labels\": [\"A\", \"B\", \"C\"], \"values\": [30, 40, 30], \"title\": \"Distribution\"}\n"
+    "- Table: {\"data\": [[\"Item\", \"Value\"], [\"A\", 100], [\"B\", 200]], \"title\": \"Data Table\"}\n"
+    "Include: chart_type, labels/categories, values/series, units, time periods. "
+    "For comparison charts (multiple years/periods), use 'series' array with each series having 'label' and 'values'. "
+)
+_SYS_T1_CHART = (
+    "Generate detailed chart/graph/table data that matches the Task 1 prompt above. "
+    "If the task is about a graph/chart/table, provide the actual data in VALID JSON format. "
+    + _CHART_JSON_EXAMPLES
+    + "If the task is about a process/map, set chart_type to \"process\" or \"map\" and put a detailed step-by-step "
+    "description in the description field. Output ONLY the JSON object."
+)
+# Chế độ một lần gọi: model trả về đề Task 1 và dữ liệu biểu đồ trong cùng một JSON
+_SYS_T1_COMBINED = (
+    "You are an IELTS Writing examiner. Generate ONE IELTS Writing Task 1 prompt (Academic) together with the data for its visual. "
+    "The task should require describing a graph/chart/table/process/map. "
+    "Be specific about the visual type and include key details in the prompt.\n"
+    "Return a JSON object with two fields:\n"
+    "- task1 (string): ONLY the prompt text in English.\n"
+    "- chart_data (object): if the task is about a graph/chart/table, the actual data for the visual; "
+    "if it is about a process/map, chart_type \"process\" or \"map\" with a detailed step-by-step description in description.\n"
+    + _CHART_JSON_EXAMPLES
+)
+
+# Khi stream, yêu cầu model xuất tiêu chí trước để client thấy điểm sớm nhất
+_STREAM_ORDER = ("criteria", "overall_band", "feedback", "suggestions", "improved_version")
+
+
+class _Task1Output(BaseModel):
+    """JSON của chế độ một lần gọi: đề Task 1 kèm dữ liệu hình minh họa."""
+
+    task1: str
+    chart_data: ChartData
+
+
+class _BandScore(BaseModel):
+    """Một tiêu chí ở mức scores: chỉ tên và band."""
+
+    name: str
+    band: float
+
+
+class _ScoresOutput(BaseModel):
+    """JSON chấm mức scores: không nhận xét, gợi ý hay bản viết lại."""
+
+    overall_band: float
+    criteria: List[_BandScore]
+
+
+class _FeedbackOutput(BaseModel):
+    """JSON chấm mức feedback: như mức đầy đủ nhưng không có bản viết lại."""
+
+    overall_band: float
+    criteria: List[CriterionScore]
+    feedback: str
+    suggestions: str
+
+
+class _ImprovedOutput(BaseModel):
+    """JSON của lần gọi viết lại bài theo yêu cầu."""
+
+    improved_version: str
+
+
+class _CriterionBand(BaseModel):
+    """JSON chấm riêng một tiêu chí ở mức scores (chế độ song song từng tiêu chí)."""
+
+    band: float
+
+
+class _CriterionOutput(_CriterionBand):
+    """JSON chấm riêng một tiêu chí kèm nhận xét."""
+
+    comment: str
+
+
+class _SummaryOutput(BaseModel):
+    """Nhận xét tổng và gợi ý viết sau khi đã chấm song song từng tiêu chí."""
+
+    feedback: str
+    suggestions: str
+
+
+class _SummaryFullOutput(_SummaryOutput):
+    """Như _SummaryOutput, thêm bản viết lại (mức full)."""
+
+    improved_version: str
+
+
+class _PackedScores(BaseModel):
+    """Một bài trong phản hồi chấm gộp mức scores (id lên đầu để nhận ra bài sớm nhất)."""
+
+    id: str
+    overall_band: float
+    criteria: List[_BandScore]
+
+
+class _PackedFeedback(BaseModel):
+    """Một bài trong phản hồi chấm gộp mức feedback."""
+
+    id: str
+    overall_band: float
+    criteria: List[CriterionScore]
+    feedback: str
+    suggestions: str
+
+
+class _PackedFull(_PackedFeedback):
+    """Một bài trong phản hồi chấm gộp mức đầy đủ."""
+
+    improved_version: Optional[str] = None
+
+
+# Model Pydantic của phản hồi chấm theo từng mức chi tiết; các trường nội bộ không gửi cho model
+_GRADE_OUTPUTS = {"scores": _ScoresOutput, "feedback": _FeedbackOutput, "full": GradeResponse}
+_INTERNAL_FIELDS = ("approximate", "similarity", "detail")
+# Phản hồi chấm gộp: {"results": [...]} với mỗi phần tử là kết quả của một bài kèm id
+_PACK_OUTPUTS = {
+    d: create_model(f"_Pack{d.title()}Output", results=(List[m], ...))
+    for d, m in {"scores": _PackedScores, "feedback": _PackedFeedback, "full": _PackedFull}.items()
+}
+# Chế độ song song: một lời gọi mỗi tiêu chí rồi (trừ mức scores) một lời gọi viết nhận xét tổng
+_CRITERION_OUTPUTS = {"scores": _CriterionBand, "feedback": _CriterionOutput, "full": _CriterionOutput}
+_SUMMARY_OUTPUTS = {"feedback": _SummaryOutput, "full": _SummaryFullOutput}
+# Token đầu ra ước lượng cho mỗi bài trong gói (mức full cộng thêm độ dài bản viết lại ~ độ dài bài)
+_PACK_OUTPUT_TOKENS = {"scores": 60, "feedback": 450, "full": 450}
+
+# Schema JSON ràng buộc đầu ra của model, suy ra từ các Pydantic model tương ứng
+_TASK1_COMBINED_SCHEMA = llm_schema(_Task1Output)
+_CHART_SCHEMA = llm_schema(ChartData)
+_GRADE_SCHEMAS = {d: llm_schema(m, exclude=_INTERNAL_FIELDS) for d, m in _GRADE_OUTPUTS.items()}
+_GRADE_STREAM_SCHEMAS = {
+    d: llm_schema(m, exclude=_INTERNAL_FIELDS, order=_STREAM_ORDER) for d, m in _GRADE_OUTPUTS.items()
+}
+_IMPROVED_SCHEMA = llm_schema(_ImprovedOutput)
+_PACK_SCHEMAS = {d: llm_schema(m) for d, m in _PACK_OUTPUTS.items()}
+_CRITERION_SCHEMAS = {d: llm_schema(m) for d, m in _CRITERION_OUTPUTS.items()}
+_SUMMARY_SCHEMAS = {d: llm_schema(m) for d, m in _SUMMARY_OUTPUTS.items()}
+# Tên viết tắt model đôi khi dùng thay cho tên tiêu chí đầy đủ
+_CRITERION_ALIASES = {
+    "ta": "task achievement",
+    "tr": "task response",
+    "cc": "coherence and cohesion",
+    "lr": "lexical resource",
+    "gra": "grammatical range and accuracy",
+}
+# Phần cuối prompt chấm theo chênh lệch: mức scores chỉ cần band
+_DELTA_OUTPUT = {
+    "scores": (
+        "Return a JSON with: overall_band (float), criteria (array of {name, band}) using the exact criterion names. "
+        "Do not write comments."
+    ),
+    "feedback": (
+        "Return a JSON with: overall_band (float), criteria (array of {name, band, comment}) using the exact criterion names, "
+        "feedback (string), suggestions (string). Use Vietnamese for feedback, suggestions and comments."
+    ),
+}
+_SYS_T2 = (
+    "You are an IELTS Writing examiner. Generate ONE IELTS Writing Task 2 prompt. "
+    "It should be realistic, contemporary, and clearly phrased. "
+    "Output ONLY the prompt text in English."
+)
 
 
 class GeminiClient:
     """Client thao tác với Google Gemini cho IELTS Writing."""
 
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash") -> None:
-        self.client = genai.Client(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-2.5-flash",
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 120.0,
+        task1_single_call: bool = False,
+        grade_cache: Optional[GradeCache] = None,
+        near_duplicates: Optional["NearDuplicateIndex"] = None,
+        near_dup_mode: str = "reuse",
+        single_flight: Optional[SingleFlight] = None,
+        coalesce_grade: bool = False,
+        coalesce_generate: bool = False,
+        context_cache: bool = False,
+        context_cache_ttl: float = 3600.0,
+        resilience: Optional[Resilience] = None,
+        provider: Optional[Provider] = None,
+        chart_renderer: Optional[ChartRenderer] = None,
+        chart_store: Optional[ChartStore] = None,
+        grade_detail: str = "full",
+        pack_max_essays: int = 8,
+        pack_max_tokens: int = 24000,
+        fanout_min_words: int = 0,
+    ) -> None:
+        # Mặc định gọi Gemini thật; benchmark/load test truyền FakeProvider để không tốn quota
+        self.provider = provider or GeminiProvider(
+            api_key,
+            max_connections=max_connections,
+            max_keepalive=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+            timeout=timeout,
+        )
         self.model_name = model_name
+        self.task1_single_call = task1_single_call
+        self.grade_cache = grade_cache
+        self.near_duplicates = near_duplicates
+        self.near_dup_mode = near_dup_mode
+        # Gộp lời gọi trùng đang chạy (chỉ bật khi chấp nhận các request nhận chung một kết quả)
+        self.single_flight = single_flight
+        self.coalesce_grade = coalesce_grade
+        self.coalesce_generate = coalesce_generate
+        self.context_cache = RubricContextCache(self.provider, model_name, ttl=context_cache_ttl) if context_cache else None
+        # Giới hạn quota, retry lỗi tạm thời và circuit breaker cho mọi lời gọi generate_content
+        self.resilience = resilience or Resilience(model_name)
+        # Số lần phản hồi JSON hợp lệ ngay/phải sửa/hỏng hẳn, theo loại (grade, chart, task1)
+        self.parse_counters = ParseCounters()
+        # Pool tiến trình vẽ biểu đồ dùng chung; None thì vẽ ngay trong tiến trình (API Figure, không dùng pyplot)
+        self.chart_renderer = chart_renderer
+        # Kho ảnh theo hash nội dung: response chỉ mang URL ảnh thay vì PNG base64
+        self.chart_store = chart_store
+        # Mức chi tiết khi chấm nếu request không chỉ định (scores/feedback/full)
+        self.grade_detail = grade_detail
+        # Giới hạn một gói chấm gộp: số bài và ngân sách token (rubric + các bài + đầu ra ước lượng)
+        self.pack_max_essays = max(1, pack_max_essays)
+        self.pack_max_tokens = pack_max_tokens
+        # Bài từ ngần này từ trở lên được chấm song song từng tiêu chí (0 = tắt)
+        self.fanout_min_words = fanout_min_words
+
+    def close(self) -> None:
+        """Đóng client và giải phóng các kết nối trong pool."""
+        try:
+            if self.context_cache is not None:
+                self.context_cache.close()
+        finally:
+            self.provider.close()
+
+    async def aconnect(self) -> None:
+        """Mở sẵn kết nối tới upstream (không đi qua quota/retry: lỗi chỉ có nghĩa là request đầu tự kết nối)."""
+        await self.provider.aconnect(self.model_name)
+
+    async def aclose(self) -> None:
+        """Đóng cả kết nối async lẫn sync."""
+        try:
+            if self.context_cache is not None:
+                self.context_cache.close()
+        finally:
+            await self.provider.aclose()
+
+    def _generate_text(
+        self,
+        contents: str,
+        config: Optional[types.GenerateContentConfig] = None,
+        coalesce: bool = False,
+        task_type: str = "",
+    ) -> str:
+        """Một lần gọi generate_content trả về text; coalesce=True gộp các lời gọi trùng đang chạy."""
+        def call() -> str:
+            try:
+                with metrics.stage("generate_content", task_type=task_type, model=self.model_name):
+                    resp = self.resilience.call(
+                        lambda: self.provider.generate_content(self.model_name, contents, config),
+                        tokens=estimate_tokens(contents),
+                    )
+            except Exception:
+                metrics.record_call(None, ok=False, task_type=task_type, model=self.model_name)
+                raise
+            return self._response_text(resp, task_type)
+
+        if coalesce and self.single_flight is not None:
+            return self.single_flight.do(self._flight_key(contents, config), call)
+        return call()
+
+    async def _agenerate_text(
+        self,
+        contents: str,
+        config: Optional[types.GenerateContentConfig] = None,
+        coalesce: bool = False,
+        task_type: str = "",
+    ) -> str:
+        async def call() -> str:
+            try:
+                with metrics.stage("generate_content", task_type=task_type, model=self.model_name):
+                    resp = await self.resilience.acall(
+                        lambda: self.provider.agenerate_content(self.model_name, contents, config),
+                        tokens=estimate_tokens(contents),
+                    )
+            except Exception:
+                metrics.record_call(None, ok=False, task_type=task_type, model=self.model_name)
+                raise
+            return self._response_text(resp, task_type)
+
+        if coalesce and self.single_flight is not None:
+            return await self.single_flight.ado(self._flight_key(contents, config), call)
+        return await call()
+
+    def _response_text(self, resp, task_type: str) -> str:
+        """Đếm lời gọi/token theo usage_metadata rồi lấy text của phản hồi."""
+        metrics.record_call(resp, task_type=task_type, model=self.model_name)
+        with metrics.stage("response_to_text", task_type=task_type, model=self.model_name):
+            return _response_to_text(resp)
+
+    def _flight_key(self, contents: str, config: Optional[types.GenerateContentConfig]) -> str:
+        config_json = config.model_dump_json(exclude_none=True) if config is not None else ""
+        raw = f"{self.model_name}\x1f{config_json}\x1f{contents}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def generate_writing_tasks(self, single_call: Optional[bool] = None) -> GenerateTasksResponse:
+        """Sinh hai đề: Task 1 và Task 2 theo chuẩn IELTS Writing.
+
+        Task 2 độc lập nên được sinh song song với chuỗi Task 1 -> dữ liệu biểu đồ.
+        single_call=True gộp đề Task 1 và dữ liệu biểu đồ vào một lần gọi có schema.
+        """
+        if single_call is None:
+            single_call = self.task1_single_call
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # Thread của pool không kế thừa context: chép sang để số đo vẫn gắn đúng endpoint
+            fut_t2 = pool.submit(contextvars.copy_context().run, self._generate_task2)
+            t1, chart_data = self._generate_task1_combined() if single_call else self._generate_task1_chain()
+            t2 = fut_t2.result()
 
-    def generate_writing_tasks(self) -> GenerateTasksResponse:
-        """Sinh hai đề: Task 1 và Task 2 theo chuẩn IELTS Writing."""
-        sys_t1 = (
-            "You are an IELTS Writing examiner. Generate ONE IELTS Writing Task 1 prompt (Academic). "
-            "The task should require describing a graph/chart/table/process/map. "
-            "Be specific about the visual type and include key details in the prompt. "
-            "Output ONLY the prompt text in English."
-        )
-        sys_t1_chart = (
-            "Generate detailed chart/graph/table data that matches the Task 1 prompt above. "
-            "If the task is about a graph/chart/table, provide the actual data in VALID JSON format. "
-            "JSON structure examples:\n"
-            "- Single series bar/line chart: {\"years\": [2018, 2019, 2020], \"values\": [100, 150, 200], \"ylabel\": \"Sales (millions)\", \"title\": \"Sales Over Time\"}\n"
-            "- Multiple series bar chart (comparison): {\"chart_type\": \"bar\", \"categories\": [\"A\", \"B\", \"C\"], \"series\": [{\"label\": \"1990\", \"values\": [100, 150, 200]}, {\"label\": \"2010\", \"values\": [120, 180, 250]}], \"ylabel\": \"Units\", \"title\": \"Comparison Chart\"}\n"
-            "- Pie chart: {\"labels\": [\"A\", \"B\", \"C\"], \"values\": [30, 40, 30], \"title\": \"Distribution\"}\n"
-            "- Table: {\"data\": [[\"Item\", \"Value\"], [\"A\", 100], [\"B\", 200]], \"title\": \"Data Table\"}\n"
-            "Include: chart_type, labels/categories, values/series, units, time periods. "
-            "For comparison charts (multiple years/periods), use 'series' array with each series having 'label' and 'values'. "
-            "If the task is about a process/map, provide a detailed step-by-step description in text format. "
-            "Output ONLY valid JSON wrapped in ```json code block, or plain text if process/map."
-        )
-        sys_t2 = (
-            "You are an IELTS Writing examiner. Generate ONE IELTS Writing Task 2 prompt. "
-            "It should be realistic, contemporary, and clearly phrased. "
-            "Output ONLY the prompt text in English."
-        )
-        resp1 = self.client.models.generate_content(model=self.model_name, contents=sys_t1)
-        t1 = _response_to_text(resp1).strip()
-        
-        # Sinh dữ liệu biểu đồ phù hợp với đề Task 1
-        combined_for_chart = f"{sys_t1}\n\nGenerated prompt:\n{t1}\n\n{sys_t1_chart}"
-        resp1_chart = self.client.models.generate_content(model=self.model_name, contents=combined_for_chart)
-        chart_data = _response_to_text(resp1_chart).strip()
-        
-        resp2 = self.client.models.generate_content(model=self.model_name, contents=sys_t2)
-        t2 = _response_to_text(resp2).strip()
-        
         # Sinh hình ảnh biểu đồ từ dữ liệu
-        chart_image = None
-        if chart_data:
-            chart_image = self._generate_chart_image(chart_data, t1)
-        
+        chart = self._chart_fields(chart_data, t1) if chart_data else {}
+
         return GenerateTasksResponse(
-            task1=t1, 
-            task2=t2, 
+            task1=t1,
+            task2=t2,
             task1_chart_data=chart_data if chart_data else None,
-            task1_chart_image=chart_image
+            **chart,
+        )
+
+    async def agenerate_writing_tasks(self, single_call: Optional[bool] = None) -> GenerateTasksResponse:
+        """Phiên bản async của generate_writing_tasks; vẽ biểu đồ trong thread riêng."""
+        if single_call is None:
+            single_call = self.task1_single_call
+        task1 = self._agenerate_task1_combined() if single_call else self._agenerate_task1_chain()
+        (t1, chart_data), t2 = await asyncio.gather(task1, self._agenerate_task2())
+
+        chart = await self._achart_fields(chart_data, t1) if chart_data else {}
+
+        return GenerateTasksResponse(
+            task1=t1,
+            task2=t2,
+            task1_chart_data=chart_data if chart_data else None,
+            **chart,
+        )
+
+    def _generate_task1_chain(self) -> Tuple[str, str]:
+        """Sinh đề Task 1 rồi sinh dữ liệu biểu đồ (JSON có schema) dựa trên đề đó (2 lần gọi nối tiếp)."""
+        t1 = self._generate_text(_SYS_T1, coalesce=self.coalesce_generate, task_type="task1").strip()
+        contents, config = _chart_contents(t1), _chart_config()
+        text = self._generate_text(contents, config=config, coalesce=self.coalesce_generate, task_type="task1")
+        try:
+            return t1, self._parse_chart(text)
+        except OutputValidationError as exc:
+            text = self._generate_text(*_retry_request(contents, config, text, exc), task_type="task1")
+            return t1, self._parse_chart(text, retry=True)
+
+    async def _agenerate_task1_chain(self) -> Tuple[str, str]:
+        t1 = (await self._agenerate_text(_SYS_T1, coalesce=self.coalesce_generate, task_type="task1")).strip()
+        contents, config = _chart_contents(t1), _chart_config()
+        text = await self._agenerate_text(
+            contents, config=config, coalesce=self.coalesce_generate, task_type="task1"
+        )
+        try:
+            return t1, self._parse_chart(text)
+        except OutputValidationError as exc:
+            text = await self._agenerate_text(*_retry_request(contents, config, text, exc), task_type="task1")
+            return t1, self._parse_chart(text, retry=True)
+
+    def _generate_task1_combined(self) -> Tuple[str, str]:
+        """Sinh đề Task 1 kèm dữ liệu biểu đồ trong một lần gọi JSON có schema."""
+        config = _combined_config()
+        text = self._generate_text(
+            _SYS_T1_COMBINED, config=config, coalesce=self.coalesce_generate, task_type="task1"
+        )
+        try:
+            return self._parse_task1_combined(text)
+        except OutputValidationError as exc:
+            text = self._generate_text(*_retry_request(_SYS_T1_COMBINED, config, text, exc), task_type="task1")
+            return self._parse_task1_combined(text, retry=True)
+
+    async def _agenerate_task1_combined(self) -> Tuple[str, str]:
+        config = _combined_config()
+        text = await self._agenerate_text(
+            _SYS_T1_COMBINED, config=config, coalesce=self.coalesce_generate, task_type="task1"
         )
-    
-    def _generate_chart_image(self, chart_data: str, prompt: str) -> Optional[str]:
-        """Tạo hình ảnh biểu đồ từ dữ liệu JSON bằng matplotlib."""
         try:
-            # Parse JSON từ chart_data
+            return self._parse_task1_combined(text)
+        except OutputValidationError as exc:
+            text = await self._agenerate_text(
+                *_retry_request(_SYS_T1_COMBINED, config, text, exc), task_type="task1"
+            )
+            return self._parse_task1_combined(text, retry=True)
+
+    def _parse_chart(self, text: str, retry: bool = False) -> str:
+        """Dữ liệu biểu đồ đã kiểm tra; lần thử lại vẫn hỏng thì giữ nguyên text (chỉ hiển thị, không vẽ)."""
+        try:
+            with metrics.stage("validate_output", task_type="task1", model=self.model_name):
+                chart = _validate_chart(parse_model(text, ChartData))
+        except OutputValidationError:
+            self.parse_counters.record("chart", "failed" if retry else "invalid")
+            if retry:
+                return (text or "").strip()
+            raise
+        self.parse_counters.record("chart", "repaired" if retry else "ok")
+        return _chart_text(chart)
+
+    def _parse_task1_combined(self, text: str, retry: bool = False) -> Tuple[str, str]:
+        """Tách (đề Task 1, dữ liệu biểu đồ) từ JSON của chế độ một lần gọi."""
+        try:
+            with metrics.stage("validate_output", task_type="task1", model=self.model_name):
+                output = parse_model(text, _Task1Output)
+                if not output.task1.strip():
+                    raise OutputValidationError("task1: must not be empty")
+                _validate_chart(output.chart_data)
+        except OutputValidationError:
+            self.parse_counters.record("task1", "failed" if retry else "invalid")
+            raise
+        self.parse_counters.record("task1", "repaired" if retry else "ok")
+        return output.task1.strip(), _chart_text(output.chart_data)
+
+    def _generate_task2(self) -> str:
+        return self._generate_text(_SYS_T2, coalesce=self.coalesce_generate, task_type="task2").strip()
+
+    async def _agenerate_task2(self) -> str:
+        return (await self._agenerate_text(_SYS_T2, coalesce=self.coalesce_generate, task_type="task2")).strip()
+
+    def _chart_fields(self, chart_data: str, prompt: str) -> dict:
+        """URL ảnh trong kho biểu đồ (nếu bật), không thì ảnh PNG base64 nhúng trong response."""
+        if self.chart_store is None:
+            return {"task1_chart_image": self._generate_chart_image(chart_data, prompt)}
+        data_dict = self._chart_dict(chart_data)
+        if data_dict is None:
+            return {}
+        with metrics.labels(model=self.model_name):
+            key = self.chart_store.save(data_dict, prompt)
+        return {"task1_chart_url": self.chart_store.url(key)} if key else {}
+
+    async def _achart_fields(self, chart_data: str, prompt: str) -> dict:
+        if self.chart_store is None:
+            return {"task1_chart_image": await self._agenerate_chart_image(chart_data, prompt)}
+        data_dict = self._chart_dict(chart_data)
+        if data_dict is None:
+            return {}
+        with metrics.labels(model=self.model_name):
+            key = await self.chart_store.asave(data_dict, prompt)
+        return {"task1_chart_url": self.chart_store.url(key)} if key else {}
+
+    def _generate_chart_image(self, chart_data: str, prompt: str) -> Optional[str]:
+        """Tạo hình ảnh biểu đồ (PNG base64) từ dữ liệu JSON; None nếu không vẽ được."""
+        data_dict = self._chart_dict(chart_data)
+        if data_dict is None:
+            return None
+        if self.chart_renderer is not None:
+            result = self.chart_renderer.render(data_dict, prompt)
+        else:
+            try:
+                result = render_chart(data_dict, prompt)
+            except Exception:  # noqa: BLE001 - best effort
+                result = None
+        return self._chart_image(result)
+
+    async def _agenerate_chart_image(self, chart_data: str, prompt: str) -> Optional[str]:
+        if self.chart_renderer is None:
+            # Vẽ đồng bộ trong thread, tránh chặn event loop
+            return await asyncio.to_thread(self._generate_chart_image, chart_data, prompt)
+        data_dict = self._chart_dict(chart_data)
+        if data_dict is None:
+            return None
+        return self._chart_image(await self.chart_renderer.arender(data_dict, prompt))
+
+    def _chart_dict(self, chart_data: str) -> Optional[dict]:
+        with metrics.stage("extract_json", task_type="task1", model=self.model_name):
             data_dict = _extract_json_dict(chart_data)
-            if not data_dict:
-                # Nếu không parse được JSON, thử tìm JSON trong text
-                try:
-                    json_match = json.loads(chart_data) if chart_data.strip().startswith('{') else None
-                    if json_match:
-                        data_dict = json_match
-                    else:
-                        return None
-                except Exception:
-                    return None
-            
-            # Xác định loại biểu đồ từ data hoặc prompt
-            chart_type = data_dict.get('chart_type', '').lower() if isinstance(data_dict, dict) else ''
-            if not chart_type:
-                prompt_lower = prompt.lower()
-                if 'line' in prompt_lower or 'graph' in prompt_lower:
-                    chart_type = 'line'
-                elif 'bar' in prompt_lower or 'column' in prompt_lower:
-                    chart_type = 'bar'
-                elif 'pie' in prompt_lower or 'circular' in prompt_lower:
-                    chart_type = 'pie'
-                elif 'table' in prompt_lower:
-                    chart_type = 'table'
-                else:
-                    chart_type = 'bar'  # Default
-            
-            # Tạo biểu đồ với matplotlib
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            if chart_type == 'table':
-                # Hiển thị bảng
-                if isinstance(data_dict, dict) and 'data' in data_dict:
-                    table_data = data_dict['data']
-                    if isinstance(table_data, list):
-                        ax.axis('tight')
-                        ax.axis('off')
-                        table = ax.table(cellText=table_data, loc='center', cellLoc='center')
-                        table.auto_set_font_size(False)
-                        table.set_fontsize(9)
-                        table.scale(1.2, 1.5)
-                    else:
-                        return None
-                else:
-                    return None
-                    
-            elif chart_type == 'pie':
-                # Biểu đồ tròn
-                if 'labels' in data_dict and 'values' in data_dict:
-                    ax.pie(data_dict['values'], labels=data_dict['labels'], autopct='%1.1f%%', startangle=90)
-                else:
-                    return None
-                    
-            elif chart_type == 'bar':
-                # Xử lý bar chart với nhiều series
-                if 'series' in data_dict and 'categories' in data_dict:
-                    cats = data_dict['categories']
-                    series_list = data_dict['series']
-                    ylabel = data_dict.get('ylabel', 'Value')
-                    
-                    # Tạo grouped bar chart
-                    x = np.arange(len(cats))
-                    width = 0.35 if len(series_list) == 2 else 0.8 / len(series_list)
-                    offset = -width * (len(series_list) - 1) / 2
-                    
-                    for i, series in enumerate(series_list):
-                        label = series.get('label', f'Series {i+1}')
-                        values = series.get('values', [])
-                        if len(values) == len(cats):
-                            ax.bar(x + offset + i * width, values, width, label=label)
-                    
-                    ax.set_xlabel('Country' if 'country' in str(cats).lower() else 'Category')
-                    ax.set_ylabel(ylabel)
-                    ax.set_title(data_dict.get('title', 'Bar Chart'))
-                    ax.set_xticks(x)
-                    ax.set_xticklabels(cats)
-                    ax.legend()
-                    
-                elif 'categories' in data_dict and 'values' in data_dict:
-                    cats = data_dict['categories']
-                    vals = data_dict['values']
-                    ax.bar(cats, vals)
-                    ax.set_xlabel(data_dict.get('xlabel', 'Category'))
-                    ax.set_ylabel(data_dict.get('ylabel', 'Value'))
-                elif 'years' in data_dict and 'values' in data_dict:
-                    ax.bar(data_dict['years'], data_dict['values'])
-                    ax.set_xlabel('Year')
-                    ax.set_ylabel(data_dict.get('ylabel', 'Value'))
-                else:
-                    return None
-                    
-            else:  # line chart
-                # Biểu đồ đường
-                if 'years' in data_dict and 'values' in data_dict:
-                    ax.plot(data_dict['years'], data_dict['values'], marker='o')
-                    ax.set_xlabel('Year')
-                    ax.set_ylabel(data_dict.get('ylabel', 'Value'))
-                elif 'x' in data_dict and 'y' in data_dict:
-                    ax.plot(data_dict['x'], data_dict['y'], marker='o')
-                    ax.set_xlabel(data_dict.get('xlabel', 'X'))
-                    ax.set_ylabel(data_dict.get('ylabel', 'Y'))
-                elif 'categories' in data_dict and 'values' in data_dict:
-                    ax.plot(data_dict['categories'], data_dict['values'], marker='o')
-                    ax.set_xlabel('Category')
-                    ax.set_ylabel(data_dict.get('ylabel', 'Value'))
-                else:
-                    return None
-            
-            # Set title
-            title = data_dict.get('title', 'Chart')
-            ax.set_title(title, fontsize=12, fontweight='bold')
-            
-            # Rotate x-axis labels if needed
-            if chart_type in ['bar', 'line']:
-                plt.xticks(rotation=45, ha='right')
-            
-            plt.tight_layout()
-            
-            # Chuyển đổi thành base64
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-            buf.seek(0)
-            image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            plt.close(fig)
-            
-            return image_base64
-        except Exception as e:  # noqa: BLE001 - best effort
-            # Nếu không thể tạo biểu đồ, trả về None
+        if not data_dict:
+            # Nếu không parse được JSON, thử tìm JSON trong text
+            try:
+                data_dict = json.loads(chart_data) if chart_data.strip().startswith('{') else None
+            except Exception:  # noqa: BLE001
+                return None
+        return data_dict if isinstance(data_dict, dict) else None
+
+    def _chart_image(self, result: Optional[RenderResult]) -> Optional[str]:
+        if result is None:
             return None
-    def grade_essay(self, prompt: str, essay: str, task_type: str = "task2") -> GradeResponse:
-        """Chấm bài viết theo band descriptors công bố cho Task 1/Task 2."""
-        if task_type == "task1":
-            descriptors_header = (
-                "Evaluate IELTS Writing Task 1 using the public band descriptors.\n"
-                "Criteria names: Task Achievement, Coherence and Cohesion, Lexical Resource, Grammatical Range and Accuracy.\n"
-                "Task 1 specific requirements: write at least 150 words; provide a clear overview summarising main trends, differences or stages; describe significant data accurately; do not include personal opinions or arguments; maintain a formal tone.\n\n"
-                "Band descriptors summary (public version):\n"
-                "9: fully satisfies all requirements; fully developed response; cohesion attracts no attention; skilful paragraphing; wide vocabulary with natural, sophisticated control (only rare slips); wide range of structures with full flexibility and accuracy (rare slips).\n"
-                "8: covers all requirements sufficiently; highlights/illustrates key features appropriately; logical sequencing; manages cohesion well; sufficient and appropriate paragraphing; wide vocabulary fluently and flexibly (precise meanings); skilful uncommon items (occasional inaccuracies); rare spelling/formation errors; wide range of structures; majority error-free; very occasional errors.\n"
-                "7: covers requirements; clear overview of trends/differences/stages; clearly presents and highlights key features (could be more fully extended); logical organisation with clear progression; range of cohesive devices (some under/over-use); sufficient vocabulary for flexibility/precision; some less common items with awareness of style/collocation; occasional lexical errors; variety of complex structures; frequent error-free sentences; good control with a few errors.\n"
-                "6: addresses requirements; overview with appropriately selected information; adequately highlights key features (some details may be irrelevant/inaccurate); coherent arrangement with clear overall progression; cohesive devices used but cohesion may be faulty/mechanical; referencing may be unclear; adequate range of vocabulary with attempts at less common items (some inaccuracy); some spelling/formation errors not impeding communication; mix of simple/complex forms; some grammar/punctuation errors rarely reducing communication.\n"
-                "5: generally addresses task (format may be inappropriate); recounts detail mechanically with no clear overview; inadequately covers key features (focus on details); some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; repetitive due to lack of referencing/substitution; limited vocabulary (minimally adequate) with noticeable errors causing some difficulty; limited range of structures; attempts complex forms but less accurate; frequent grammatical/punctuation errors causing some difficulty.\n"
-                "4: attempts task but does not cover all key features (format may be inappropriate); may confuse features with detail; parts unclear/irrelevant/repetitive/inaccurate; ideas not arranged coherently and no clear progression; some basic cohesive devices (inaccurate/repetitive); only basic vocabulary (repetitive/inappropriate); limited control of word formation/spelling with errors causing strain; very limited range of structures with rare subordination; some accurate structures but errors predominate; punctuation often faulty.\n"
-                "3: fails to address task (may be misunderstood); limited ideas largely irrelevant/repetitive; ideas not organised; very limited cohesive devices not indicating logical relations; very limited words/expressions with very limited control (errors may severely distort); attempts sentence forms but errors predominate and distort meaning.\n"
-                "2: answer barely related to task; very little control of organisational features; extremely limited vocabulary with essentially no control of formation/spelling; cannot use sentence forms except memorised phrases.\n"
-                "1: answer completely unrelated; fails to communicate any message; only isolated words; cannot use sentence forms at all.\n"
-                "0: does not attend/attempt or totally memorised response."
+        # Thời gian đo trong tiến trình vẽ (có thể là worker của pool)
+        metrics.observe_stage("chart_render", result.render_seconds, task_type="task1", model=self.model_name)
+        metrics.observe_stage("png_encode", result.encode_seconds, task_type="task1", model=self.model_name)
+        return base64.b64encode(result.data).decode("ascii")
+
+    def grade_essay(
+        self, prompt: str, essay: str, task_type: str = "task2", bypass_cache: bool = False, detail: Optional[str] = None
+    ) -> GradeResponse:
+        """Chấm bài viết theo band descriptors công bố cho Task 1/Task 2.
+
+        bypass_cache=True bỏ qua kết quả đã cache và chỉ mục bài gần trùng
+        (vẫn ghi kết quả mới vào cache). detail chọn mức chi tiết: "scores" chỉ có band,
+        "feedback" thêm nhận xét và gợi ý, "full" thêm bản viết lại (xem improve_essay);
+        None dùng mức mặc định của client.
+        """
+        detail = detail or self.grade_detail
+        plan = self._plan_grade(prompt, essay, task_type, bypass_cache, detail)
+        if plan.result is not None:
+            return plan.result
+        with metrics.labels(detail=detail):
+            if self._uses_fanout(plan):
+                result = self._grade_fanout(plan, prompt, essay, task_type)
+                return self._finish_grade(plan, result, prompt, essay, task_type)
+            name = self.context_cache.get_name(plan.rubric_task, detail) if self._uses_context_cache(plan) else None
+            contents, config = self._grading_request(plan, name)
+            try:
+                text = self._generate_text(contents, config=config, coalesce=self.coalesce_grade, task_type=task_type)
+            except Exception as exc:
+                if config.cached_content is None or isinstance(exc, UpstreamUnavailable):
+                    raise
+                # Cache phía server có thể đã bị xóa/hết hạn sớm: gửi lại với prompt đầy đủ
+                self.context_cache.invalidate(plan.rubric_task, detail)
+                contents, config = self._grading_request(plan, None)
+                text = self._generate_text(contents, config=config, coalesce=self.coalesce_grade, task_type=task_type)
+            try:
+                result = self._parse_grade(plan, text, task_type)
+            except OutputValidationError as exc:
+                # Tối đa một lần sửa/gửi lại khi phản hồi không đúng schema
+                text = self._generate_text(
+                    *_retry_request(contents, config, text, exc, _criteria_hint(task_type)), task_type=task_type
+                )
+                result = self._parse_grade(plan, text, task_type, retry=True)
+        return self._finish_grade(plan, result, prompt, essay, task_type)
+
+    async def agrade_essay(
+        self, prompt: str, essay: str, task_type: str = "task2", bypass_cache: bool = False, detail: Optional[str] = None
+    ) -> GradeResponse:
+        """Phiên bản async của grade_essay, dùng client aio của SDK."""
+        detail = detail or self.grade_detail
+        plan = self._plan_grade(prompt, essay, task_type, bypass_cache, detail)
+        if plan.result is not None:
+            return plan.result
+        with metrics.labels(detail=detail):
+            if self._uses_fanout(plan):
+                result = await self._agrade_fanout(plan, prompt, essay, task_type)
+                return self._finish_grade(plan, result, prompt, essay, task_type)
+            if self._uses_context_cache(plan):
+                name = await self.context_cache.aget_name(plan.rubric_task, detail)
+            else:
+                name = None
+            contents, config = self._grading_request(plan, name)
+            try:
+                text = await self._agenerate_text(
+                    contents, config=config, coalesce=self.coalesce_grade, task_type=task_type
+                )
+            except Exception as exc:
+                if config.cached_content is None or isinstance(exc, UpstreamUnavailable):
+                    raise
+                self.context_cache.invalidate(plan.rubric_task, detail)
+                contents, config = self._grading_request(plan, None)
+                text = await self._agenerate_text(
+                    contents, config=config, coalesce=self.coalesce_grade, task_type=task_type
+                )
+            try:
+                result = self._parse_grade(plan, text, task_type)
+            except OutputValidationError as exc:
+                text = await self._agenerate_text(
+                    *_retry_request(contents, config, text, exc, _criteria_hint(task_type)), task_type=task_type
+                )
+                result = self._parse_grade(plan, text, task_type, retry=True)
+        return self._finish_grade(plan, result, prompt, essay, task_type)
+
+    async def astream_grade(
+        self, prompt: str, essay: str, task_type: str = "task2", bypass_cache: bool = False, detail: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """Chấm bài dạng stream, trả về lần lượt các sự kiện (tên, dữ liệu) ngay khi có.
+
+        Thứ tự: "criterion" (từng tiêu chí, đã làm tròn/cap), "overall", "feedback",
+        "suggestions", "improved_version" (tùy mức chi tiết), cuối cùng "done" với GradeResponse đầy đủ.
+        Tiêu chí nào không đọc được thì thay bằng sự kiện "error" (có trường "field"); stream vẫn
+        chạy tiếp và "done" mang kết quả đã kiểm tra lại (sửa/gửi lại nếu cần).
+        """
+        detail = detail or self.grade_detail
+        plan = self._plan_grade(prompt, essay, task_type, bypass_cache, detail)
+        if plan.result is not None:
+            for event in _result_events(plan.result):
+                yield event
+            return
+        word_count = plan.features.word_count
+        parser = IncrementalJsonObject()
+        criteria: List[CriterionScore] = []
+        chunks: List[str] = []
+        name = await self.context_cache.aget_name(plan.rubric_task, detail) if self._uses_context_cache(plan) else None
+        contents, config = self._stream_request(plan, name, detail)
+        started = time.perf_counter()
+        try:
+            try:
+                stream = await self._aopen_stream(contents, config)
+            except Exception as exc:
+                if config.cached_content is None or isinstance(exc, UpstreamUnavailable):
+                    raise
+                # Cache phía server có thể đã bị xóa/hết hạn sớm: gửi lại với prompt đầy đủ
+                self.context_cache.invalidate(plan.rubric_task, detail)
+                contents, config = self._stream_request(plan, None, detail)
+                stream = await self._aopen_stream(contents, config)
+            last = None
+            async for chunk in stream:
+                last = chunk
+                text = _chunk_text(chunk)
+                if not text:
+                    continue
+                chunks.append(text)
+                for key, value in parser.feed(text):
+                    if key == "criteria[]" and isinstance(value, dict):
+                        try:
+                            criterion = _stream_criterion(value, task_type, word_count)
+                        except OutputValidationError as exc:
+                            yield "error", {"detail": str(exc), "status": 502, "field": "criteria[]"}
+                            continue
+                        criteria.append(criterion)
+                        yield "criterion", criterion.model_dump()
+                    elif key == "criteria":
+                        yield "overall", {"overall_band": _overall_band(criteria, task_type, word_count)}
+                    elif key in ("feedback", "suggestions", "improved_version"):
+                        yield key, {key: value}
+        except Exception:
+            # Không bọc metrics.labels quanh các lệnh yield của generator: truyền nhãn detail trực tiếp
+            metrics.record_call(None, ok=False, task_type=task_type, model=self.model_name, detail=detail)
+            raise
+        with metrics.labels(detail=detail):
+            # Usage của cả lượt sinh nằm ở chunk cuối; thời gian tính tới khi stream kết thúc
+            metrics.observe_stage(
+                "generate_content", time.perf_counter() - started, task_type=task_type, model=self.model_name
             )
-        else:
-            descriptors_header = (
-                "Evaluate IELTS Writing Task 2 using the public band descriptors.\n"
-                "Criteria names: Task Response, Coherence and Cohesion, Lexical Resource, Grammatical Range and Accuracy.\n\n"
-                "Band descriptors summary (public version):\n"
-                "9: fully addresses all parts; fully developed position with relevant, fully extended and well supported ideas; cohesion attracts no attention; skilful paragraphing; wide vocabulary with natural, sophisticated control (rare slips); wide range of structures with full flexibility and accuracy (rare slips).\n"
-                "8: sufficiently addresses all parts; well-developed response with relevant, extended and supported ideas; logical sequencing; manages cohesion well; sufficient/appropriate paragraphing; wide vocabulary fluently and flexibly to convey precise meanings; skilful uncommon items (occasional inaccuracies); rare spelling/formation errors; wide range of structures; majority error-free; very occasional errors.\n"
-                "7: addresses all parts; clear position throughout; presents, extends and supports main ideas (may over-generalise or supporting ideas lack focus); logical organisation with clear progression; range of cohesive devices (some under/over-use); clear central topic within each paragraph; sufficient vocabulary allowing some flexibility and precision; less common items with some awareness of style/collocation; occasional lexical errors; variety of complex structures; frequent error-free sentences; good control with a few errors.\n"
-                "6: addresses all parts (some parts more fully covered); relevant position though conclusions may be unclear/repetitive; relevant main ideas but some inadequately developed/unclear; coherent arrangement with clear overall progression; cohesive devices used but cohesion may be faulty/mechanical; referencing not always clear/appropriate; paragraphing used but not always logical; adequate vocabulary with attempts at less common items (some inaccuracy); some spelling/formation errors not impeding communication; mix of simple/complex forms; some grammar/punctuation errors rarely reducing communication.\n"
-                "5: addresses the task only partially (format may be inappropriate); expresses a position but development not always clear and no conclusions; some main ideas limited and insufficiently developed with possible irrelevant detail; some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; repetitive due to lack of referencing/substitution; may not write in paragraphs or paragraphing inadequate; limited vocabulary (minimally adequate) with noticeable errors causing some difficulty; limited range of structures; attempts complex forms but less accurate than simple; frequent grammatical/punctuation errors causing some difficulty.\n"
-                "4: minimal or tangential response (format may be inappropriate); unclear position; some main ideas difficult to identify, repetitive/irrelevant/unsupported; ideas not arranged coherently with no clear progression; some basic cohesive devices (inaccurate/repetitive); no/poor paragraphing; only basic vocabulary (repetitive/inappropriate) with limited control of formation/spelling (errors may cause strain); very limited range of structures with only rare subordination; some accurate structures but errors predominate; punctuation often faulty.\n"
-                "3: does not adequately address any part; no clear position; few ideas largely undeveloped/irrelevant; ideas not organised logically; very limited cohesive devices not indicating logical relations; very limited words/expressions with very limited control (errors may severely distort); attempts sentence forms but errors predominate and distort meaning.\n"
-                "2: barely responds; no position; may attempt 1-2 ideas with no development; very little control of organisational features; extremely limited vocabulary with essentially no control of formation/spelling; cannot use sentence forms except memorised phrases.\n"
-                "1: completely unrelated; fails to communicate any message; only isolated words; cannot use sentence forms at all.\n"
-                "0: does not attend/attempt or totally memorised response."
+            metrics.record_call(last, task_type=task_type, model=self.model_name)
+            text = "".join(chunks)
+            try:
+                result = self._parse_grade(plan, text, task_type)
+            except OutputValidationError as exc:
+                text = await self._agenerate_text(
+                    *_retry_request(contents, config, text, exc, _criteria_hint(task_type)), task_type=task_type
+                )
+                result = self._parse_grade(plan, text, task_type, retry=True)
+        result = self._finish_grade(plan, result, prompt, essay, task_type)
+        yield "done", result.model_dump()
+
+    def improve_essay(
+        self,
+        prompt: str,
+        essay: str,
+        task_type: str = "task2",
+        grade: Optional[GradeResponse] = None,
+        bypass_cache: bool = False,
+    ) -> str:
+        """Bản viết lại của một bài đã chấm, chỉ tạo khi người học cần (prompt ngắn, không kèm rubric).
+
+        Nhận xét của lần chấm (grade, hoặc kết quả tìm thấy trong cache) được gửi kèm để bản viết
+        lại sửa đúng các điểm yếu; đã có improved_version trong kết quả thì trả luôn không gọi model.
+        """
+        found, grade = self._improve_lookup(prompt, essay, task_type, grade, bypass_cache)
+        if found is not None:
+            return found
+        contents, config = improvement_contents(prompt, essay, task_type, _assessment(grade)), _improve_config()
+        with metrics.labels(detail="improve"):
+            text = self._generate_text(contents, config=config, coalesce=self.coalesce_grade, task_type=task_type)
+            try:
+                improved = self._parse_improved(text, task_type)
+            except OutputValidationError as exc:
+                text = self._generate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+                improved = self._parse_improved(text, task_type, retry=True)
+        self._store_improved(prompt, essay, task_type, grade, improved)
+        return improved
+
+    async def aimprove_essay(
+        self,
+        prompt: str,
+        essay: str,
+        task_type: str = "task2",
+        grade: Optional[GradeResponse] = None,
+        bypass_cache: bool = False,
+    ) -> str:
+        found, grade = self._improve_lookup(prompt, essay, task_type, grade, bypass_cache)
+        if found is not None:
+            return found
+        contents, config = improvement_contents(prompt, essay, task_type, _assessment(grade)), _improve_config()
+        with metrics.labels(detail="improve"):
+            text = await self._agenerate_text(
+                contents, config=config, coalesce=self.coalesce_grade, task_type=task_type
             )
+            try:
+                improved = self._parse_improved(text, task_type)
+            except OutputValidationError as exc:
+                text = await self._agenerate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+                improved = self._parse_improved(text, task_type, retry=True)
+        self._store_improved(prompt, essay, task_type, grade, improved)
+        return improved
 
-        # Chính sách chấm nghiêm khắc hơn
-        strict_policy = (
-            "Scoring policy (be conservative):\n"
-            "- Use only 0.5 increments for all bands.\n"
-            "- When uncertain between two adjacent bands, choose the LOWER band.\n"
-            "- Provide 1-2 concrete evidence snippets in each criterion comment (what exactly is good/bad).\n"
-            "- Overall band MUST be the arithmetic mean of the four criteria bands, rounded DOWN to the nearest 0.5.\n"
-            "- If word count is below the minimum, apply penalties:\n"
-            "  * Task 1 (<150 words): cap Task Achievement at 5.0 and overall at 5.5.\n"
-            "  * Task 2 (<250 words): cap Task Response at 5.0 and overall at 5.5.\n"
-        )
+    def _improve_lookup(
+        self, prompt: str, essay: str, task_type: str, grade: Optional[GradeResponse], bypass_cache: bool
+    ) -> Tuple[Optional[str], Optional[GradeResponse]]:
+        """(improved_version đã có nếu có, kết quả chấm dùng làm nhận xét) từ grade truyền vào hoặc cache."""
+        if bypass_cache:
+            return None, grade
+        if grade is None and self.grade_cache is not None:
+            # Ưu tiên kết quả chi tiết nhất: mức full có sẵn bản viết lại, mức feedback có nhận xét
+            for detail in reversed(GRADE_DETAILS):
+                grade = self.grade_cache.get(self._cache_key(prompt, essay, task_type, detail))
+                if grade is not None:
+                    break
+        if grade is not None and grade.improved_version:
+            return grade.improved_version, grade
+        return None, grade
+
+    def _parse_improved(self, text: str, task_type: str, retry: bool = False) -> str:
+        try:
+            with metrics.stage("validate_output", task_type=task_type, model=self.model_name):
+                output = parse_model(text, _ImprovedOutput)
+                if not output.improved_version.strip():
+                    raise OutputValidationError("improved_version: must not be empty")
+        except OutputValidationError:
+            self.parse_counters.record("improve", "failed" if retry else "invalid")
+            raise
+        self.parse_counters.record("improve", "repaired" if retry else "ok")
+        return output.improved_version.strip()
+
+    def _store_improved(
+        self, prompt: str, essay: str, task_type: str, grade: Optional[GradeResponse], improved: str
+    ) -> None:
+        """Kết quả mức feedback cộng bản viết lại chính là kết quả mức full: lưu cache để lần sau không gọi lại."""
+        if grade is None or grade.detail != "feedback" or grade.approximate:
+            return
+        full = grade.model_copy(update={"improved_version": improved, "detail": "full"})
+        self._cache_store(self._cache_key(prompt, essay, task_type, "full"), full)
+
+    def _stream_request(
+        self, plan: "_GradePlan", cache_name: Optional[str], detail: str
+    ) -> Tuple[str, types.GenerateContentConfig]:
+        contents, config = self._grading_request(plan, cache_name, stream=True)
+        order = ", ".join(_GRADE_STREAM_SCHEMAS[detail]["properties"])
+        return f"{contents}\n\nOutput the JSON fields in this exact order: {order}.", config
+
+    async def _aopen_stream(
+        self, contents: str, config: Optional[types.GenerateContentConfig]
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """Mở stream generate_content qua lớp resilience.
 
-        # Hướng dẫn chi tiết theo từng tiêu chí (khác biệt giữa Task 1 và Task 2 ở tiêu chí đầu)
-        if task_type == "task1":
-            criterion_guidance = (
-                "Criterion-specific guidance (use exact names):\n"
-                "- Task Achievement (TA):\n"
-                "  Assess: clear overview; accurate selection/synthesis of key features; relevance; no opinions.\n"
-                "  Penalise: missing/unclear overview; misreported/comparative errors; focusing on trivial details; irrelevant content.\n"
-                "- Coherence and Cohesion (CC):\n"
-                "  Assess: logical progression; effective paragraphing; clear referencing/substitution; varied cohesive devices without mechanical feel.\n"
-                "  Penalise: illogical sequence; mechanical/overused devices; unclear referencing; weak or absent paragraphing.\n"
-                "- Lexical Resource (LR):\n"
-                "  Assess: range; precision; appropriacy for visual description; paraphrasing; control of word formation/spelling.\n"
-                "  Penalise: repetition; inaccurate word choice/collocation; spelling/formation errors that strain comprehension.\n"
-                "- Grammatical Range and Accuracy (GRA):\n"
-                "  Assess: variety (simple+complex); clause control; tense/aspect accuracy; punctuation.\n"
-                "  Penalise: frequent errors; limited range; faulty punctuation causing difficulty.\n"
-                "Score each criterion INDEPENDENTLY using 0.5 steps.\n"
-                "Use the EXACT criterion names above in the JSON.\n"
+        SDK chỉ gửi request khi đọc chunk đầu tiên, nên chunk đó được lấy ngay trong lần gọi
+        có retry; lỗi giữa chừng (sau khi đã gửi sự kiện cho client) thì không thử lại.
+        """
+        async def open_stream():
+            stream = await self.provider.agenerate_content_stream(self.model_name, contents, config)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return first, stream
+
+        first, stream = await self.resilience.acall(open_stream, tokens=estimate_tokens(contents))
+
+        async def chunks():
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+
+        return chunks()
+
+    def _plan_grade(
+        self, prompt: str, essay: str, task_type: str, bypass_cache: bool, detail: str = "full"
+    ) -> "_GradePlan":
+        """Tra cache và chỉ mục bài gần trùng, quyết định có cần gọi model và gửi prompt nào."""
+        key, cached = self._cache_lookup(prompt, essay, task_type, bypass_cache, detail)
+        if cached is not None:
+            return _GradePlan(key=key, result=cached, detail=detail)
+        match = None
+        if self.near_duplicates is not None and not bypass_cache:
+            match = self.near_duplicates.query(prompt, essay, task_type, self._near_dup_scope(detail))
+        if match is None:
+            # Đặc trưng văn bản tính một lần, dùng cho cả prompt lẫn bước áp phạt số từ
+            features = analyze_essay(essay)
+            return _GradePlan(
+                key=key,
+                contents=self._build_grading_contents(prompt, essay, task_type, features, detail),
+                payload=grading_payload(prompt, essay, task_type, features),
+                rubric_task=task_type,
+                features=features,
+                detail=detail,
             )
-        else:
-            criterion_guidance = (
-                "Criterion-specific guidance (use exact names):\n"
-                "- Task Response (TR):\n"
-                "  Assess: addresses ALL parts; clear/consistent position; sufficient development/support of main ideas; relevance.\n"
-                "  Penalise: partially addressed task; unclear/inconsistent position; underdeveloped/unsupported ideas; off-topic content.\n"
-                "- Coherence and Cohesion (CC):\n"
-                "  Assess: logical progression; effective paragraphing; clear referencing/substitution; varied cohesive devices without mechanical feel.\n"
-                "  Penalise: illogical sequence; mechanical/overused devices; unclear referencing; weak or absent paragraphing.\n"
-                "- Lexical Resource (LR):\n"
-                "  Assess: range; precision; appropriacy and style; paraphrasing; control of word formation/spelling.\n"
-                "  Penalise: repetition; inaccurate word choice/collocation; spelling/formation errors that cause difficulty.\n"
-                "- Grammatical Range and Accuracy (GRA):\n"
-                "  Assess: variety (simple+complex); clause control; tense/aspect accuracy; punctuation.\n"
-                "  Penalise: frequent errors; limited range; faulty punctuation causing difficulty.\n"
-                "Score each criterion INDEPENDENTLY using 0.5 steps.\n"
-                "Use the EXACT criterion names above in the JSON.\n"
+        if self.near_dup_mode == "delta":
+            features = analyze_essay(essay)
+            return _GradePlan(
+                key=key,
+                match=match,
+                contents=self._build_delta_contents(prompt, essay, task_type, match, features, detail),
+                features=features,
+                detail=detail,
             )
+        return _GradePlan(key=key, result=_approximate(match.response, match.similarity), detail=detail)
 
-        process_guidance = (
-            "Scoring process (follow strictly):\n"
-            "1) Score each criterion independently using the criterion-specific guidance above.\n"
-            "2) Use ONLY 0.5 increments; if uncertain, choose the LOWER band.\n"
-            "3) Compute overall as the arithmetic mean of the four criterion bands, rounded DOWN to the nearest 0.5.\n"
-            "4) Apply word-count penalties and caps as specified.\n"
-        )
+    def _uses_context_cache(self, plan: "_GradePlan") -> bool:
+        return self.context_cache is not None and plan.rubric_task is not None
 
-        grading_instructions = (
-            f"You are an official IELTS Writing examiner. {descriptors_header}\n\n{strict_policy}\n{criterion_guidance}\n{process_guidance}\nReturn a JSON with: \n"
-            "- overall_band (float, 0.0-9.0)\n"
-            "- criteria (array of {name, band, comment}) with the criteria above\n"
-            "- feedback (string) concise summary of strengths and weaknesses\n"
-            "- suggestions (string) concrete, actionable improvements\n"
-            "- improved_version (string) a polished version that preserves meaning and structure\n"
-            "Use Vietnamese for feedback, suggestions, and improved_version."
+    def _uses_fanout(self, plan: "_GradePlan") -> bool:
+        # Chỉ áp dụng khi chấm mới đầy đủ (không áp cho chấm theo chênh lệch bài gần trùng)
+        return (
+            self.fanout_min_words > 0
+            and plan.rubric_task is not None
+            and plan.features.word_count >= self.fanout_min_words
         )
 
-        # Thêm thống kê số từ để mô hình tham chiếu khi áp dụng phạt
+    def _grade_fanout(self, plan: "_GradePlan", prompt: str, essay: str, task_type: str) -> GradeResponse:
+        """Chấm bốn tiêu chí bằng bốn lời gọi nhỏ đồng thời, mỗi lời gọi chỉ mang phần rubric của tiêu chí đó.
+
+        Band được gộp bằng cùng quy tắc làm tròn xuống 0.5 và cap theo số từ; nhận xét tổng, gợi ý
+        (và bản viết lại ở mức full) được viết sau trong một lời gọi riêng dựa trên nhận xét từng tiêu chí.
+        """
+        names = _criteria_names(task_type)
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._grade_criterion, plan, name, task_type)
+                for name in names
+            ]
+            result = _fanout_result([f.result() for f in futures], task_type, plan)
+        if plan.detail == "scores":
+            return result
+        contents, config = _summary_request(prompt, essay, task_type, result)
+        text = self._generate_text(contents, config=config, task_type=task_type)
         try:
-            word_count = len((essay or "").split())
-        except Exception:  # noqa: BLE001 - defensive
-            word_count = 0
+            summary = self._parse_summary(text, plan.detail)
+        except OutputValidationError as exc:
+            text = self._generate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+            summary = self._parse_summary(text, plan.detail, retry=True)
+        return result.model_copy(update=summary.model_dump())
 
-        user_payload = (
-            f"PROMPT:\n{prompt}\n\nWORD_COUNT:{word_count}\nTASK_TYPE:{task_type}\n\nESSAY:\n{essay}\n\n"
-            "Please be fair, consistent, and conservative as per the policy."
-        )
+    async def _agrade_fanout(self, plan: "_GradePlan", prompt: str, essay: str, task_type: str) -> GradeResponse:
+        names = _criteria_names(task_type)
+        criteria = await asyncio.gather(*(self._agrade_criterion(plan, name, task_type) for name in names))
+        result = _fanout_result(list(criteria), task_type, plan)
+        if plan.detail == "scores":
+            return result
+        contents, config = _summary_request(prompt, essay, task_type, result)
+        text = await self._agenerate_text(contents, config=config, task_type=task_type)
+        try:
+            summary = self._parse_summary(text, plan.detail)
+        except OutputValidationError as exc:
+            text = await self._agenerate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+            summary = self._parse_summary(text, plan.detail, retry=True)
+        return result.model_copy(update=summary.model_dump())
+
+    def _grade_criterion(self, plan: "_GradePlan", name: str, task_type: str) -> CriterionScore:
+        contents, config = _criterion_request(plan, name, task_type)
+        text = self._generate_text(contents, config=config, task_type=task_type)
+        try:
+            return self._parse_criterion(text, plan, name, task_type)
+        except OutputValidationError as exc:
+            text = self._generate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+            return self._parse_criterion(text, plan, name, task_type, retry=True)
+
+    async def _agrade_criterion(self, plan: "_GradePlan", name: str, task_type: str) -> CriterionScore:
+        contents, config = _criterion_request(plan, name, task_type)
+        text = await self._agenerate_text(contents, config=config, task_type=task_type)
+        try:
+            return self._parse_criterion(text, plan, name, task_type)
+        except OutputValidationError as exc:
+            text = await self._agenerate_text(*_retry_request(contents, config, text, exc), task_type=task_type)
+            return self._parse_criterion(text, plan, name, task_type, retry=True)
+
+    def _parse_criterion(
+        self, text: str, plan: "_GradePlan", name: str, task_type: str, retry: bool = False
+    ) -> CriterionScore:
+        try:
+            with metrics.stage("validate_output", task_type=task_type, model=self.model_name):
+                raw = parse_model(text, _CRITERION_OUTPUTS[plan.detail])
+                if not 0.0 <= raw.band <= 9.0:
+                    raise OutputValidationError("band: must be between 0 and 9")
+        except OutputValidationError:
+            self.parse_counters.record("criterion", "failed" if retry else "invalid")
+            raise
+        self.parse_counters.record("criterion", "repaired" if retry else "ok")
+        item = {"name": name, "band": raw.band, "comment": getattr(raw, "comment", "")}
+        return _score_criterion(item, task_type, plan.features.word_count)
 
-        contents = f"{grading_instructions}\n\n{user_payload}"
-        resp = self.client.models.generate_content(
-            model=self.model_name,
-            contents=contents,
+    def _parse_summary(self, text: str, detail: str, retry: bool = False) -> _SummaryOutput:
+        try:
+            summary = parse_model(text, _SUMMARY_OUTPUTS[detail])
+        except OutputValidationError:
+            self.parse_counters.record("summary", "failed" if retry else "invalid")
+            raise
+        self.parse_counters.record("summary", "repaired" if retry else "ok")
+        return summary
+
+    def _grading_request(
+        self, plan: "_GradePlan", cache_name: Optional[str], stream: bool = False
+    ) -> Tuple[str, types.GenerateContentConfig]:
+        """(contents, config) gửi lên model: chỉ phần đề/bài nếu rubric đã nằm trong context cache."""
+        if cache_name is None:
+            return plan.contents, _grade_config(stream=stream, detail=plan.detail)
+        return plan.payload, _grade_config(cache_name, stream=stream, detail=plan.detail)
+
+    def _parse_grade(
+        self, plan: "_GradePlan", text: str, task_type: str, retry: bool = False
+    ) -> Optional[GradeResponse]:
+        """Kiểm tra phản hồi chấm; lần thử lại vẫn hỏng thì ném lỗi (hoặc None nếu còn bài gần trùng để dùng lại)."""
+        try:
+            with metrics.stage("validate_output", task_type=task_type, model=self.model_name):
+                result = _validate_grade(text, task_type, plan.features.word_count, plan.detail)
+        except OutputValidationError:
+            self.parse_counters.record("grade", "failed" if retry else "invalid")
+            if retry and plan.match is not None:
+                return None
+            raise
+        self.parse_counters.record("grade", "repaired" if retry else "ok")
+        return result
+
+    def _finish_grade(
+        self, plan: "_GradePlan", result: Optional[GradeResponse], prompt: str, essay: str, task_type: str
+    ) -> GradeResponse:
+        if plan.match is not None:
+            # Chấm theo phần chênh lệch hỏng thì dùng lại kết quả bài gần trùng
+            if result is None:
+                return _approximate(plan.match.response, plan.match.similarity)
+            result = _approximate(result, plan.match.similarity)
+        elif self.near_duplicates is not None:
+            # Chỉ bài chấm đầy đủ mới làm mốc cho các lần nộp lại
+            self.near_duplicates.add(prompt, essay, task_type, self._near_dup_scope(plan.detail), result)
+        self._cache_store(plan.key, result)
+        return result
+
+    def _near_dup_scope(self, detail: str = "full") -> str:
+        # Bài gần trùng chỉ dùng lại kết quả cùng mức chi tiết
+        scope = f"{self.model_name}:{RUBRIC_VERSION}"
+        return scope if detail == "full" else f"{scope}:{detail}"
+
+    def _cache_key(self, prompt: str, essay: str, task_type: str, detail: str = "full") -> str:
+        # Mức full giữ khóa cũ để các kết quả đã cache từ trước vẫn dùng được
+        version = RUBRIC_VERSION if detail == "full" else f"{RUBRIC_VERSION}:{detail}"
+        return grade_cache_key(prompt, essay, task_type, self.model_name, version)
+
+    def _cache_lookup(
+        self, prompt: str, essay: str, task_type: str, bypass_cache: bool, detail: str = "full"
+    ) -> Tuple[Optional[str], Optional[GradeResponse]]:
+        """Trả về (khóa cache, kết quả đã cache nếu có).
+
+        Kết quả đã cache ở mức chi tiết cao hơn cũng dùng được, cắt bớt về đúng mức được yêu cầu.
+        """
+        if self.grade_cache is None:
+            return None, None
+        key = self._cache_key(prompt, essay, task_type, detail)
+        if bypass_cache:
+            return key, None
+        for level in GRADE_DETAILS[GRADE_DETAILS.index(detail):]:
+            cached = self.grade_cache.get(key if level == detail else self._cache_key(prompt, essay, task_type, level))
+            if cached is not None:
+                return key, _trim(cached, detail)
+        return key, None
+
+    def _cache_store(self, key: Optional[str], result: GradeResponse) -> None:
+        if key is not None and self.grade_cache is not None:
+            self.grade_cache.set(key, result)
+
+    def _build_delta_contents(
+        self,
+        prompt: str,
+        essay: str,
+        task_type: str,
+        match: "NearDuplicateMatch",
+        features: EssayFeatures,
+        detail: str = "full",
+    ) -> str:
+        """Prompt ngắn: đưa kết quả chấm bài cũ và phần chênh lệch, yêu cầu điều chỉnh band."""
+        names = ", ".join(_criteria_names(task_type))
+        diff = "\n".join(
+            difflib.unified_diff(
+                _split_sentences(match.essay), _split_sentences(essay), "previous", "revised", lineterm="", n=0
+            )
+        )
+        fields = {"overall_band", "criteria"}
+        if detail != "scores":
+            fields |= {"feedback", "suggestions"}
+        previous = match.response.model_dump(include=fields)
+        return (
+            f"You are an official IELTS Writing examiner. A previous version of this {task_type} essay was already graded "
+            f"(criteria: {names}). The student has revised it slightly. Re-evaluate ONLY the impact of the changes below "
+            "and adjust the previous bands if needed.\n\n"
+            f"{STRICT_POLICY}\n"
+            f"PREVIOUS RESULT (JSON):\n{json.dumps(previous, ensure_ascii=False)}\n\n"
+            f"PROMPT:\n{prompt}\n\n{features_block(features)}\nTASK_TYPE:{task_type}\n\n"
+            f"CHANGES (unified diff by sentence):\n{diff or '(no textual change)'}\n\n"
+            f"{_DELTA_OUTPUT['scores' if detail == 'scores' else 'feedback']}"
         )
 
-        text = _response_to_text(resp) or "{}"
-        data = _extract_json_dict(text)
+    def _build_grading_contents(
+        self,
+        prompt: str,
+        essay: str,
+        task_type: str,
+        features: Optional[EssayFeatures] = None,
+        detail: str = "full",
+    ) -> str:
+        """Ghép hướng dẫn chấm (theo mức chi tiết) và bài viết thành nội dung gửi lên model."""
+        payload = grading_payload(prompt, essay, task_type, features or analyze_essay(essay))
+        return f"{grading_instructions(task_type, detail)}\n\n{payload}"
 
-        # Chuẩn hóa band theo bước 0.5 và áp dụng các giới hạn tổng hợp ở backend (best-effort)
-        def _round_down_to_half(x: float) -> float:
-            try:
-                return max(0.0, (int(x * 2) // 1) / 2)
-            except Exception:
-                return 0.0
-
-        # Tên tiêu chí theo từng task để mapping đúng (Task 1 vs Task 2)
-        if task_type == "task1":
-            expected_names = [
-                "Task Achievement",
-                "Coherence and Cohesion",
-                "Lexical Resource",
-                "Grammatical Range and Accuracy",
-            ]
-            min_words = 150
-            cap_criterion = "Task Achievement"
-        else:
-            expected_names = [
-                "Task Response",
-                "Coherence and Cohesion",
-                "Lexical Resource",
-                "Grammatical Range and Accuracy",
-            ]
-            min_words = 250
-            cap_criterion = "Task Response"
+    def grade_pack(
+        self,
+        items: List[Tuple[str, str]],
+        task_type: str = "task2",
+        bypass_cache: bool = False,
+        detail: Optional[str] = None,
+    ) -> List[Union[GradeResponse, Exception]]:
+        """Chấm nhiều bài (prompt, essay) cùng task_type, gộp nhiều bài vào một lần gọi để rubric chỉ gửi một lần.
+
+        Số bài mỗi gói theo pack_max_essays và ngân sách token pack_max_tokens. Gói có phản hồi hỏng
+        (hoặc thiếu/sai vài bài) được chia đôi phần chưa chấm được và gửi lại; gói còn một bài đi
+        đường chấm thường. Trả về theo thứ tự items: kết quả hoặc exception của từng bài.
+        """
+        detail = detail or self.grade_detail
+        results, pending = self._plan_pack(items, task_type, bypass_cache, detail)
+        with metrics.labels(detail=detail):
+            for pack in self._packs(pending, task_type, detail):
+                self._grade_packed(pack, task_type, detail, results)
+        return results
+
+    async def agrade_pack(
+        self,
+        items: List[Tuple[str, str]],
+        task_type: str = "task2",
+        bypass_cache: bool = False,
+        detail: Optional[str] = None,
+    ) -> List[Union[GradeResponse, Exception]]:
+        """Phiên bản async của grade_pack; các gói (và các nửa khi chia lại) chạy đồng thời."""
+        detail = detail or self.grade_detail
+        results, pending = self._plan_pack(items, task_type, bypass_cache, detail)
+        with metrics.labels(detail=detail):
+            packs = self._packs(pending, task_type, detail)
+            await asyncio.gather(*(self._agrade_packed(pack, task_type, detail, results) for pack in packs))
+        return results
 
+    def _grade_packed(self, pack: List["_PackItem"], task_type: str, detail: str, results: list) -> None:
+        if len(pack) == 1:
+            item = pack[0]
+            try:
+                # Cache đã tra khi lập gói
+                results[item.index] = self.grade_essay(
+                    item.prompt, item.essay, task_type, bypass_cache=True, detail=detail
+                )
+            except Exception as exc:  # noqa: BLE001 - lỗi của từng bài trả về cho người gọi
+                results[item.index] = exc
+            return
         try:
-            word_count = len((essay or "").split())
-        except Exception:
-            word_count = 0
+            text = self._generate_text(
+                self._build_pack_contents(pack, task_type, detail), config=_pack_config(detail), task_type=task_type
+            )
+        except Exception as exc:  # noqa: BLE001
+            for item in pack:
+                results[item.index] = exc
+            return
+        for part in self._settle_pack(pack, text, task_type, detail, results):
+            self._grade_packed(part, task_type, detail, results)
 
-        criteria_items: List[CriterionScore] = []
-        raw_criteria = data.get("criteria", []) or []
-        # Duy trì thứ tự tiêu chí kỳ vọng nếu có thể
-        def _key_order(item: dict) -> int:
+    async def _agrade_packed(self, pack: List["_PackItem"], task_type: str, detail: str, results: list) -> None:
+        if len(pack) == 1:
+            item = pack[0]
             try:
-                name = str(item.get("name", ""))
-                return expected_names.index(name) if name in expected_names else 999
-            except Exception:
-                return 999
-
-        raw_criteria_sorted = sorted(raw_criteria, key=_key_order)
-        for item in raw_criteria_sorted:
-            criteria_items.append(
-                CriterionScore(
-                    name=str(item.get("name", "")),
-                    band=float(item.get("band", 0)),
-                    comment=str(item.get("comment", "")),
+                results[item.index] = await self.agrade_essay(
+                    item.prompt, item.essay, task_type, bypass_cache=True, detail=detail
                 )
+            except Exception as exc:  # noqa: BLE001
+                results[item.index] = exc
+            return
+        try:
+            text = await self._agenerate_text(
+                self._build_pack_contents(pack, task_type, detail), config=_pack_config(detail), task_type=task_type
             )
+        except Exception as exc:  # noqa: BLE001
+            for item in pack:
+                results[item.index] = exc
+            return
+        parts = self._settle_pack(pack, text, task_type, detail, results)
+        await asyncio.gather(*(self._agrade_packed(part, task_type, detail, results) for part in parts))
 
-        # Áp dụng chuẩn hóa band 0.5 và phạt thiếu từ ở backend
-        capped_overall = None
-        rounded_bands: List[float] = []
-        for c in criteria_items:
-            rounded = _round_down_to_half(float(getattr(c, "band", 0)))
-            c.band = rounded
-            rounded_bands.append(rounded)
-
-        if word_count < min_words and criteria_items:
-            # Cap tiêu chí chính tối đa 5.0 nếu thiếu từ
-            for c in criteria_items:
-                if c.name == cap_criterion:
-                    c.band = min(c.band, 5.0)
-            capped_overall = 5.5
-
-        # Tính overall = trung bình, làm tròn xuống 0.5
-        if criteria_items:
-            avg = sum([c.band for c in criteria_items]) / len(criteria_items)
-            overall = _round_down_to_half(avg)
-        else:
-            overall = 0.0
+    def _plan_pack(
+        self, items: List[Tuple[str, str]], task_type: str, bypass_cache: bool, detail: str
+    ) -> Tuple[list, List["_PackItem"]]:
+        """Tra cache (và bài gần trùng ở chế độ reuse) cho từng bài; các bài còn lại cần gửi lên model."""
+        results: list = [None] * len(items)
+        todo = []
+        for index, (prompt, essay) in enumerate(items):
+            key, cached = self._cache_lookup(prompt, essay, task_type, bypass_cache, detail)
+            reuse = self.near_duplicates is not None and not bypass_cache and self.near_dup_mode == "reuse"
+            if cached is None and reuse:
+                match = self.near_duplicates.query(prompt, essay, task_type, self._near_dup_scope(detail))
+                cached = _approximate(match.response, match.similarity) if match is not None else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                todo.append((index, prompt, essay, key))
+        # Đặc trưng văn bản của cả gói tính vector hóa trong một lượt
+        matrix = analyze_batch([essay for _, _, essay, _ in todo])
+        pending = []
+        for (index, prompt, essay, key), row in zip(todo, matrix):
+            features = features_from_row(row)
+            tokens = _pack_tokens(prompt, essay, features, detail)
+            pending.append(_PackItem(index, prompt, essay, key, features, tokens))
+        return results, pending
 
-        if capped_overall is not None:
-            overall = min(overall, capped_overall)
+    def _packs(self, pending: List["_PackItem"], task_type: str, detail: str) -> List[List["_PackItem"]]:
+        """Chia các bài thành gói liên tiếp không vượt số bài tối đa và ngân sách token."""
+        base = estimate_tokens(packed_instructions(task_type, detail))
+        packs: List[List[_PackItem]] = []
+        pack: List[_PackItem] = []
+        used = base
+        for item in pending:
+            if pack and (len(pack) >= self.pack_max_essays or used + item.tokens > self.pack_max_tokens):
+                packs.append(pack)
+                pack, used = [], base
+            pack.append(item)
+            used += item.tokens
+        if pack:
+            packs.append(pack)
+        return packs
 
-        return GradeResponse(
-            overall_band=overall,
-            criteria=criteria_items,
-            feedback=str(data.get("feedback", "")),
-            suggestions=str(data.get("suggestions", "")),
-            improved_version=data.get("improved_version"),
+    def _build_pack_contents(self, pack: List["_PackItem"], task_type: str, detail: str) -> str:
+        """Rubric một lần rồi các bài của gói, mỗi bài mang id theo vị trí trong gói (e1, e2, ...)."""
+        payload = packed_payload(
+            [(eid, item.prompt, item.essay, item.features) for eid, item in zip(_pack_ids(len(pack)), pack)],
+            task_type,
         )
+        return f"{packed_instructions(task_type, detail)}\n\n{payload}"
+
+    def _settle_pack(
+        self, pack: List["_PackItem"], text: str, task_type: str, detail: str, results: list
+    ) -> List[List["_PackItem"]]:
+        """Ghi kết quả hợp lệ của gói; trả về hai nửa các bài còn thiếu/sai để gửi lại."""
+        try:
+            with metrics.stage("validate_output", task_type=task_type, model=self.model_name):
+                raw = parse_model(text, _PACK_OUTPUTS[detail])
+        except OutputValidationError:
+            self.parse_counters.record("pack", "invalid")
+            missing = list(pack)
+        else:
+            by_id = {}
+            for entry in raw.results:
+                by_id.setdefault(entry.id.strip(), entry)
+            missing = []
+            for eid, item in zip(_pack_ids(len(pack)), pack):
+                try:
+                    if eid not in by_id:
+                        raise OutputValidationError(f"results: missing {eid}")
+                    result = _grade_from(by_id[eid], task_type, item.features.word_count, detail)
+                except OutputValidationError:
+                    missing.append(item)
+                    continue
+                plan = _GradePlan(key=item.key, features=item.features, detail=detail)
+                results[item.index] = self._finish_grade(plan, result, item.prompt, item.essay, task_type)
+            self.parse_counters.record("pack", "invalid" if missing else "ok")
+        half = (len(missing) + 1) // 2
+        return [part for part in (missing[:half], missing[half:]) if part]
 
-    def grade_batch(self, task1_prompt: str, task1_essay: str, task2_prompt: str, task2_essay: str):
+    def grade_batch(
+        self,
+        task1_prompt: str,
+        task1_essay: str,
+        task2_prompt: str,
+        task2_essay: str,
+        bypass_cache: bool = False,
+        detail: Optional[str] = None,
+    ):
         """Chấm cả Task 1 và Task 2 trong một lần gọi."""
-        res1 = self.grade_essay(task1_prompt, task1_essay, task_type="task1")
-        res2 = self.grade_essay(task2_prompt, task2_essay, task_type="task2")
+        res1 = self.grade_essay(task1_prompt, task1_essay, "task1", bypass_cache=bypass_cache, detail=detail)
+        res2 = self.grade_essay(task2_prompt, task2_essay, "task2", bypass_cache=bypass_cache, detail=detail)
+        return {"task1": res1, "task2": res2}
+
+    async def agrade_batch(
+        self,
+        task1_prompt: str,
+        task1_essay: str,
+        task2_prompt: str,
+        task2_essay: str,
+        bypass_cache: bool = False,
+        detail: Optional[str] = None,
+    ):
+        """Chấm Task 1 và Task 2 đồng thời trên client aio."""
+        res1, res2 = await asyncio.gather(
+            self.agrade_essay(task1_prompt, task1_essay, "task1", bypass_cache=bypass_cache, detail=detail),
+            self.agrade_essay(task2_prompt, task2_essay, "task2", bypass_cache=bypass_cache, detail=detail),
+        )
         return {"task1": res1, "task2": res2}
 
 
+@dataclass
+class _GradePlan:
+    """Kết quả tra cache trước khi chấm: hoặc đã có result, hoặc cần gửi contents lên model."""
+
+    key: Optional[str] = None
+    result: Optional[GradeResponse] = None
+    contents: Optional[str] = None
+    match: Optional["NearDuplicateMatch"] = None
+    # Phần đề/bài riêng và task của rubric, để thay rubric inline bằng context cache
+    payload: Optional[str] = None
+    rubric_task: Optional[str] = None
+    features: Optional[EssayFeatures] = None
+    detail: str = "full"
+
+
+@dataclass
+class _PackItem:
+    """Một bài chờ chấm gộp: vị trí trong danh sách đầu vào, khóa cache, đặc trưng và số token ước lượng."""
+
+    index: int
+    prompt: str
+    essay: str
+    key: Optional[str]
+    features: EssayFeatures
+    tokens: int
+
+
+def quick_grade_batch(essays: List[str], task_types: List[str]) -> List[QuickGradeResponse]:
+    """Band tạm tính tức thì cho cả lớp từ đặc trưng văn bản (không gọi LLM).
+
+    Cùng quy tắc làm tròn 0.5 và cap theo số từ như khi chấm đầy đủ.
+    """
+    matrix = analyze_batch(essays)
+    bands = estimate_bands(matrix, task_types)
+    results = []
+    for row, raw, task_type in zip(matrix, bands, task_types):
+        features = features_from_row(row)
+        names, _, _ = _task_rules(task_type)
+        comments = _quick_comments(features)
+        criteria = [
+            _score_criterion({"name": name, "band": band, "comment": comment}, task_type, features.word_count)
+            for name, band, comment in zip(names, raw.tolist(), comments)
+        ]
+        results.append(
+            QuickGradeResponse(
+                overall_band=_overall_band(criteria, task_type, features.word_count),
+                criteria=criteria,
+                features=features.as_dict(),
+            )
+        )
+    return results
+
+
+def quick_grade(essay: str, task_type: str = "task2") -> QuickGradeResponse:
+    return quick_grade_batch([essay], [task_type])[0]
+
+
+def warm_up_requests(essay: str) -> None:
+    """Dựng thử payload và config của mọi loại request (lần validate đầu tiên của các type trong SDK chậm)."""
+    grading_payload("warm-up", essay, "task2", analyze_essay(essay))
+    for detail in GRADE_DETAILS:
+        _grade_config(detail=detail)
+        _grade_config(stream=True, detail=detail)
+        _pack_config(detail)
+    _improve_config()
+    _chart_config()
+    _combined_config()
+
+
+def _quick_comments(f: EssayFeatures) -> List[str]:
+    """Căn cứ của từng band tạm tính, theo thứ tự tiêu chí."""
+    return [
+        f"{f.word_count} từ, {f.paragraph_count} đoạn",
+        f"{f.cohesive_density:.1f} từ nối/100 từ ({f.cohesive_variety} loại khác nhau)",
+        f"TTR {f.type_token_ratio:.2f}, {f.lexical_sophistication:.0%} từ ít phổ biến, "
+        f"{f.spelling_error_rate:.1%} từ nghi sai chính tả",
+        f"Câu dài trung bình {f.mean_sentence_length:.1f} từ (độ lệch {f.sentence_length_std:.1f}), "
+        f"{f.complex_sentence_ratio:.2f} liên từ phụ thuộc/câu",
+    ]
+
+
+def _result_events(result: GradeResponse) -> List[Tuple[str, dict]]:
+    """Chuỗi sự kiện stream tương đương cho một kết quả đã có sẵn (vd. lấy từ cache)."""
+    events: List[Tuple[str, dict]] = [("criterion", c.model_dump()) for c in result.criteria]
+    events.append(("overall", {"overall_band": result.overall_band}))
+    if result.detail != "scores":
+        events.append(("feedback", {"feedback": result.feedback}))
+        events.append(("suggestions", {"suggestions": result.suggestions}))
+    if result.improved_version is not None:
+        events.append(("improved_version", {"improved_version": result.improved_version}))
+    events.append(("done", result.model_dump()))
+    return events
+
+
+def _trim(result: GradeResponse, detail: str) -> GradeResponse:
+    """Cắt kết quả chi tiết hơn về đúng mức được yêu cầu."""
+    if result.detail == detail:
+        return result
+    update = {"detail": detail, "improved_version": None}
+    if detail == "scores":
+        update.update(
+            feedback="", suggestions="", criteria=[c.model_copy(update={"comment": ""}) for c in result.criteria]
+        )
+    return result.model_copy(update=update)
+
+
+def _assessment(grade: Optional[GradeResponse]) -> Optional[str]:
+    """Kết quả chấm dạng JSON gọn để gửi kèm prompt viết lại."""
+    if grade is None:
+        return None
+    fields = {"overall_band", "criteria"}
+    if grade.detail != "scores":
+        fields |= {"feedback", "suggestions"}
+    return json.dumps(grade.model_dump(include=fields), ensure_ascii=False)
+
+
+def _approximate(result: GradeResponse, similarity: float) -> GradeResponse:
+    """Đánh dấu kết quả là xấp xỉ (lấy từ/neo theo bài gần trùng)."""
+    return result.model_copy(update={"approximate": True, "similarity": round(similarity, 3)})
+
+
+def _criteria_names(task_type: str) -> List[str]:
+    first = "Task Achievement" if task_type == "task1" else "Task Response"
+    return [first, "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [s for s in re.split(r"(?<=[.!?])\s+|\n+", (text or "").strip()) if s]
+
+
+def _round_down_to_half(x: float) -> float:
+    """Chuẩn hóa band theo bước 0.5 (làm tròn xuống)."""
+    try:
+        return max(0.0, (int(x * 2) // 1) / 2)
+    except Exception:
+        return 0.0
+
+
+def _task_rules(task_type: str) -> Tuple[List[str], int, str]:
+    """(tên tiêu chí theo thứ tự, số từ tối thiểu, tiêu chí bị cap khi thiếu từ) của từng task."""
+    if task_type == "task1":
+        return _criteria_names("task1"), 150, "Task Achievement"
+    return _criteria_names("task2"), 250, "Task Response"
+
+
+def _score_criterion(item: dict, task_type: str, word_count: int) -> CriterionScore:
+    """Một tiêu chí từ JSON của model: làm tròn xuống 0.5, cap 5.0 tiêu chí chính nếu thiếu từ."""
+    _, min_words, cap_criterion = _task_rules(task_type)
+    name = str(item.get("name", ""))
+    band = _round_down_to_half(float(item.get("band", 0)))
+    if word_count < min_words and name == cap_criterion:
+        band = min(band, 5.0)
+    return CriterionScore(name=name, band=band, comment=str(item.get("comment", "")))
+
+
+def _overall_band(criteria: List[CriterionScore], task_type: str, word_count: int) -> float:
+    """Overall = trung bình các tiêu chí làm tròn xuống 0.5; tối đa 5.5 nếu thiếu từ."""
+    if not criteria:
+        return 0.0
+    _, min_words, _ = _task_rules(task_type)
+    overall = _round_down_to_half(sum(c.band for c in criteria) / len(criteria))
+    if word_count < min_words:
+        overall = min(overall, 5.5)
+    return overall
+
+
+def _validate_grade(text: str, task_type: str, word_count: int, detail: str = "full") -> GradeResponse:
+    """Đọc JSON chấm bài trong một lượt, kiểm tra đủ 4 tiêu chí rồi làm tròn/áp phạt thiếu từ."""
+    return _grade_from(parse_model(text, _GRADE_OUTPUTS[detail]), task_type, word_count, detail)
+
+
+def _criterion_key(name: str, task_type: str) -> str:
+    """Tên tiêu chí model trả về, chuẩn hóa chữ thường và quy các tên viết tắt/nhầm về tên chuẩn."""
+    key = " ".join(name.lower().replace("&", "and").split())
+    key = _CRITERION_ALIASES.get(key, key)
+    if key in ("task achievement", "task response"):
+        # Tiêu chí đầu tiên hay bị gọi nhầm tên giữa Task 1 và Task 2
+        key = _task_rules(task_type)[0][0].lower()
+    return key
+
+
+def _stream_criterion(item: dict, task_type: str, word_count: int) -> CriterionScore:
+    """Một tiêu chí nhận được giữa stream, kiểm tra và chuẩn hóa tên như _grade_from."""
+    names = {name.lower(): name for name in _task_rules(task_type)[0]}
+    name = names.get(_criterion_key(str(item.get("name", "")), task_type))
+    if name is None:
+        raise OutputValidationError(f"criteria: unknown criterion {item.get('name')!r}")
+    try:
+        band = float(item.get("band"))
+    except (TypeError, ValueError):
+        raise OutputValidationError(f"criteria.{name}.band: not a number") from None
+    if not 0.0 <= band <= 9.0:
+        raise OutputValidationError(f"criteria.{name}.band: must be between 0 and 9")
+    return _score_criterion({**item, "name": name, "band": band}, task_type, word_count)
+
+
+def _grade_from(raw: BaseModel, task_type: str, word_count: int, detail: str = "full") -> GradeResponse:
+    """Kết quả chấm từ JSON đã đọc (một bài, hoặc một phần tử của phản hồi chấm gộp)."""
+    expected = _task_rules(task_type)[0]
+    by_name = {}
+    for item in raw.criteria:
+        key = _criterion_key(item.name, task_type)
+        if not 0.0 <= item.band <= 9.0:
+            raise OutputValidationError(f"criteria.{item.name}.band: must be between 0 and 9")
+        by_name.setdefault(key, item)
+    missing = [name for name in expected if name.lower() not in by_name]
+    if missing:
+        raise OutputValidationError(f"criteria: missing {', '.join(missing)}")
+    criteria = [
+        _score_criterion({**by_name[name.lower()].model_dump(), "name": name}, task_type, word_count)
+        for name in expected
+    ]
+    return GradeResponse(
+        overall_band=_overall_band(criteria, task_type, word_count),
+        criteria=criteria,
+        feedback=getattr(raw, "feedback", ""),
+        suggestions=getattr(raw, "suggestions", ""),
+        improved_version=getattr(raw, "improved_version", None),
+        detail=detail,
+    )
+
+
+def _criteria_hint(task_type: str) -> str:
+    return "CRITERIA NAMES (use exactly these four): " + ", ".join(_criteria_names(task_type))
+
+
+def _grade_config(
+    cache_name: Optional[str] = None, stream: bool = False, detail: str = "full"
+) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=(_GRADE_STREAM_SCHEMAS if stream else _GRADE_SCHEMAS)[detail],
+        cached_content=cache_name,
+    )
+
+
+def _criterion_request(plan: _GradePlan, name: str, task_type: str) -> Tuple[str, types.GenerateContentConfig]:
+    contents = f"{criterion_instructions(task_type, name, plan.detail)}\n\n{plan.payload}"
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_CRITERION_SCHEMAS[plan.detail],
+    )
+    return contents, config
+
+
+def _summary_request(
+    prompt: str, essay: str, task_type: str, result: GradeResponse
+) -> Tuple[str, types.GenerateContentConfig]:
+    """Lời gọi viết nhận xét tổng/gợi ý (và bản viết lại) từ band và nhận xét từng tiêu chí đã chấm."""
+    assessment = json.dumps(result.model_dump(include={"overall_band", "criteria"}), ensure_ascii=False)
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_SUMMARY_SCHEMAS[result.detail],
+    )
+    return summary_contents(prompt, essay, task_type, assessment, result.detail), config
+
+
+def _fanout_result(criteria: List[CriterionScore], task_type: str, plan: _GradePlan) -> GradeResponse:
+    """Gộp bốn tiêu chí chấm riêng thành kết quả (overall theo cùng quy tắc như khi chấm một lần gọi)."""
+    return GradeResponse(
+        overall_band=_overall_band(criteria, task_type, plan.features.word_count),
+        criteria=criteria,
+        feedback="",
+        suggestions="",
+        detail=plan.detail,
+    )
+
+
+def _pack_config(detail: str = "full") -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_PACK_SCHEMAS[detail],
+    )
+
+
+def _pack_ids(count: int) -> List[str]:
+    return [f"e{n}" for n in range(1, count + 1)]
+
+
+def _pack_tokens(prompt: str, essay: str, features: EssayFeatures, detail: str) -> int:
+    """Token ước lượng một bài chiếm trong gói: đề, đặc trưng, bài viết và phần đầu ra của nó."""
+    tokens = (len(prompt) + len(essay) + len(features_block(features))) // 4 + _PACK_OUTPUT_TOKENS[detail]
+    return tokens + len(essay) // 4 if detail == "full" else tokens
+
+
+def _improve_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_IMPROVED_SCHEMA,
+    )
+
+
+def _retry_request(
+    contents: str,
+    config: types.GenerateContentConfig,
+    text: str,
+    exc: OutputValidationError,
+    hint: str = "",
+) -> Tuple[str, types.GenerateContentConfig]:
+    """Request cho lần thử lại duy nhất: JSON hỏng/rỗng thì gửi lại nguyên request, sai schema thì nhờ model sửa."""
+    if exc.syntax or not (text or "").strip():
+        return contents, config
+    # Prompt sửa không cần rubric nên bỏ tham chiếu context cache
+    return repair_contents(text, str(exc), hint), config.model_copy(update={"cached_content": None})
+
+
+def _validate_chart(chart: ChartData) -> ChartData:
+    """Kiểm tra dữ liệu biểu đồ đủ để vẽ theo chart_type (độ dài các mảng khớp nhau)."""
+    def same_len(a, b) -> bool:
+        return bool(a) and bool(b) and len(a) == len(b)
+
+    kind = chart.chart_type
+    if kind in ("process", "map"):
+        ok = bool((chart.description or "").strip())
+    elif kind == "table":
+        ok = bool(chart.data)
+    elif kind == "pie":
+        ok = same_len(chart.labels, chart.values)
+    elif chart.series:
+        ok = bool(chart.categories) and all(len(s.values) == len(chart.categories) for s in chart.series)
+    else:
+        ok = same_len(chart.categories, chart.values) or same_len(chart.years, chart.values)
+    if not ok:
+        raise OutputValidationError(f"chart_data: fields do not match chart_type {kind!r}")
+    return chart
+
+
+def _chart_text(chart: ChartData) -> str:
+    """Chuỗi task1_chart_data trả cho client: JSON dữ liệu, hoặc mô tả text với process/map."""
+    if chart.chart_type in ("process", "map"):
+        return (chart.description or "").strip()
+    return chart.model_dump_json(exclude_none=True)
+
+
+def _chart_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_CHART_SCHEMA,
+    )
+
+
+def _chart_contents(task1_prompt: str) -> str:
+    """Nội dung yêu cầu sinh dữ liệu biểu đồ cho một đề Task 1 đã có."""
+    return f"{_SYS_T1}\n\nGenerated prompt:\n{task1_prompt}\n\n{_SYS_T1_CHART}"
+
+
+def _combined_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_json_schema=_TASK1_COMBINED_SCHEMA,
+    )
+
+
+def _chunk_text(chunk) -> str:
+    """Text của một chunk stream, giữ nguyên cả chunk chỉ có khoảng trắng (nằm giữa chuỗi JSON)."""
+    text = getattr(chunk, "text", None)
+    if isinstance(text, str):
+        return text
+    return _response_to_text(chunk)
+
+
 def _response_to_text(resp) -> str:
     """Trích text từ nhiều cấu trúc phản hồi google-genai một cách an toàn."""
     # Trường hợp đơn giản có thuộc tính text
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .models import GradeResponse
+
+
+def _normalize(text: str) -> str:
+    """Gộp mọi khoảng trắng liên tiếp để bài nộp lại chỉ khác xuống dòng vẫn trùng khóa."""
+    return " ".join((text or "").split())
+
+
+def grade_cache_key(prompt: str, essay: str, task_type: str, model_name: str, rubric_version: str) -> str:
+    """Khóa cache: hash của đề/bài đã chuẩn hóa cùng task_type, model và phiên bản rubric."""
+    raw = json.dumps(
+        [_normalize(prompt), _normalize(essay), task_type, model_name, rubric_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _MemoryTier:
+    """LRU trong tiến trình, mỗi mục có hạn dùng (TTL)."""
+
+    def __init__(self, max_items: int, ttl: float) -> None:
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, GradeResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[GradeResponse]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: GradeResponse, expires_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (expires_at or time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _SqliteTier:
+    """Tầng cache trên đĩa (SQLite WAL) dùng chung giữa các worker uvicorn."""
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS grade_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_grade_cache_expires ON grade_cache(expires_at)")
+        self._conn.commit()
+        self._writes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Tuple[float, GradeResponse]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM grade_cache WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return row[1], GradeResponse.model_validate_json(row[0])
+
+    def set(self, key: str, value: GradeResponse) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO grade_cache(key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value.model_dump_json(), time.time() + self.ttl),
+            )
+            self._writes += 1
+            # Dọn các mục hết hạn định kỳ thay vì mỗi lần ghi
+            if self._writes % 256 == 0:
+                cur = self._conn.execute("DELETE FROM grade_cache WHERE expires_at < ?", (time.time(),))
+                self.evictions += cur.rowcount
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class GradeCache:
+    """Cache kết quả chấm hai tầng: LRU trong tiến trình, sau đó SQLite dùng chung (tùy chọn)."""
+
+    def __init__(self, max_items: int = 1024, ttl: float = 7 * 24 * 3600, path: Optional[str] = None) -> None:
+        self._memory = _MemoryTier(max_items, ttl)
+        self._disk = _SqliteTier(path, ttl) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[GradeResponse]:
+        value = self._memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value.model_copy(deep=True)
+        if self._disk is not None:
+            entry = self._disk.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                self.disk_hits += 1
+                self._memory.set(key, value, expires_at)
+                return value.model_copy(deep=True)
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: GradeResponse) -> None:
+        # Lưu bản sao để caller sửa response cũng không làm hỏng cache
+        value = value.model_copy(deep=True)
+        self._memory.set(key, value)
+        if self._disk is not None:
+            self._disk.set(key, value)
+
+    def stats(self) -> dict:
+        return {
+            "memory_size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self._memory.evictions + (self._disk.evictions if self._disk else 0),
+            "expirations": self._memory.expirations,
+            "disk_enabled": self._disk is not None,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,397 @@
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .models import GradeResponse
+
+logger = logging.getLogger(__name__)
+
+# Cột band theo tên tiêu chí; tiêu chí đầu là Task Achievement (Task 1) hoặc Task Response (Task 2)
+_CRITERION_COLUMNS = {
+    "task achievement": "band_task",
+    "task response": "band_task",
+    "coherence and cohesion": "band_cc",
+    "lexical resource": "band_lr",
+    "grammatical range and accuracy": "band_gra",
+}
+_BAND_COLUMNS = ("band_task", "band_cc", "band_lr", "band_gra")
+_COLUMN_NAMES = {
+    "band_cc": "Coherence and Cohesion",
+    "band_lr": "Lexical Resource",
+    "band_gra": "Grammatical Range and Accuracy",
+}
+_FIRST_CRITERION = {"task1": "Task Achievement", "task2": "Task Response"}
+_LIST_COLUMNS = (
+    "id, created_at, user_id, prompt_hash, task_type, model, overall_band, "
+    "band_task, band_cc, band_lr, band_gra, approximate, duration_ms"
+)
+
+
+def prompt_hash(prompt: str) -> str:
+    """Khóa đề bài: hash của đề đã gộp khoảng trắng (cùng đề khác xuống dòng vẫn cùng khóa)."""
+    return hashlib.sha256(" ".join((prompt or "").split()).encode("utf-8")).hexdigest()[:32]
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _day_start(day: str) -> float:
+    """Đầu ngày (UTC) của chuỗi YYYY-MM-DD dưới dạng timestamp."""
+    return datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+class GradeHistory:
+    """Lịch sử chấm lưu trong SQLite (WAL), ghi theo lô ở thread nền (write-behind).
+
+    record() chỉ đưa bản ghi vào hàng đợi trong bộ nhớ nên không làm chậm request; hàng đợi
+    đầy (đĩa chậm) thì bản ghi bị bỏ và được đếm trong stats(). Mỗi lô ghi trong một transaction
+    và cộng dồn vào bảng grade_daily (theo ngày UTC, task_type, model) để truy vấn band trung bình
+    theo khoảng ngày chỉ đọc vài trăm dòng dù bảng grades có hàng triệu dòng.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        max_queue: int = 10000,
+    ) -> None:
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._write_conn = self._connect()
+        self._write_conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS prompts (
+                hash TEXT PRIMARY KEY,
+                task_type TEXT NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS grades (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                user_id TEXT,
+                prompt_hash TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                model TEXT NOT NULL,
+                overall_band REAL NOT NULL,
+                band_task REAL,
+                band_cc REAL,
+                band_lr REAL,
+                band_gra REAL,
+                approximate INTEGER NOT NULL DEFAULT 0,
+                duration_ms REAL,
+                essay TEXT NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_grades_user ON grades(user_id, id) WHERE user_id IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS idx_grades_prompt ON grades(prompt_hash, id);
+            CREATE INDEX IF NOT EXISTS idx_grades_created ON grades(created_at);
+            CREATE TABLE IF NOT EXISTS grade_daily (
+                day TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                model TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                sum_overall REAL NOT NULL,
+                sum_task REAL NOT NULL, n_task INTEGER NOT NULL,
+                sum_cc REAL NOT NULL, n_cc INTEGER NOT NULL,
+                sum_lr REAL NOT NULL, n_lr INTEGER NOT NULL,
+                sum_gra REAL NOT NULL, n_gra INTEGER NOT NULL,
+                PRIMARY KEY (day, task_type, model)
+            );
+            """
+        )
+        # Đọc qua kết nối riêng: với WAL, truy vấn lịch sử không phải chờ lô đang ghi
+        self._read_conn = self._connect()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="grade-history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---- Ghi (write-behind) ----
+
+    def record(
+        self,
+        prompt: str,
+        essay: str,
+        task_type: str,
+        result: GradeResponse,
+        model: str,
+        user_id: Optional[str] = None,
+        duration: Optional[float] = None,
+    ) -> bool:
+        """Đưa một kết quả chấm vào hàng đợi ghi; False nếu hàng đợi đầy (bản ghi bị bỏ)."""
+        bands: Dict[str, float] = {}
+        for criterion in result.criteria:
+            column = _CRITERION_COLUMNS.get(criterion.name.strip().lower())
+            if column is not None:
+                bands[column] = criterion.band
+        entry = (
+            time.time(),
+            user_id or None,
+            prompt,
+            task_type,
+            model,
+            result.overall_band,
+            *(bands.get(column) for column in _BAND_COLUMNS),
+            int(result.approximate),
+            round(duration * 1000, 1) if duration is not None else None,
+            essay,
+            result.model_dump_json(),
+        )
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Chờ tới khi mọi bản ghi đã đưa vào hàng đợi được ghi xuống đĩa."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self) -> None:
+        """Ghi nốt hàng đợi rồi đóng kết nối."""
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+        with self._lock:
+            self._read_conn.close()
+        self._write_conn.close()
+
+    def _run(self) -> None:
+        while True:
+            entry = self._queue.get()
+            batch = [entry] if entry is not None else []
+            stop = entry is None
+            # Gom thêm bản ghi tới trong flush_interval để mỗi transaction ghi được nhiều dòng
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+            if batch:
+                try:
+                    self._write(batch)
+                except sqlite3.Error as exc:  # noqa: PERF203 - lỗi đĩa không được làm chết thread ghi
+                    logger.warning("Không ghi được %d bản ghi lịch sử chấm: %s", len(batch), exc)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        prompts = {}
+        rows = []
+        daily: Dict[Tuple[str, str, str], List[float]] = {}
+        for created_at, user_id, prompt, task_type, model, overall, *rest in batch:
+            bands, (approximate, duration_ms, essay, result) = rest[:4], rest[4:]
+            key = prompt_hash(prompt)
+            prompts[key] = (key, task_type, prompt)
+            rows.append(
+                (created_at, user_id, key, task_type, model, overall, *bands, approximate, duration_ms, essay, result)
+            )
+            # n, sum_overall, rồi (tổng, số mẫu) của từng tiêu chí
+            acc = daily.setdefault((_day(created_at), task_type, model), [0, 0.0] + [0.0, 0] * len(_BAND_COLUMNS))
+            acc[0] += 1
+            acc[1] += overall
+            for i, band in enumerate(bands):
+                if band is not None:
+                    acc[2 + 2 * i] += band
+                    acc[3 + 2 * i] += 1
+        conn = self._write_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO prompts(hash, task_type, text) VALUES (?, ?, ?)", prompts.values())
+            conn.executemany(
+                "INSERT INTO grades(created_at, user_id, prompt_hash, task_type, model, overall_band, "
+                "band_task, band_cc, band_lr, band_gra, approximate, duration_ms, essay, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(
+                "INSERT INTO grade_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(day, task_type, model) DO UPDATE SET n = n + excluded.n, "
+                "sum_overall = sum_overall + excluded.sum_overall, "
+                "sum_task = sum_task + excluded.sum_task, n_task = n_task + excluded.n_task, "
+                "sum_cc = sum_cc + excluded.sum_cc, n_cc = n_cc + excluded.n_cc, "
+                "sum_lr = sum_lr + excluded.sum_lr, n_lr = n_lr + excluded.n_lr, "
+                "sum_gra = sum_gra + excluded.sum_gra, n_gra = n_gra + excluded.n_gra",
+                [(*key, *acc) for key, acc in daily.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.written += len(rows)
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    # ---- Đọc ----
+
+    def page(
+        self,
+        user_id: Optional[str] = None,
+        prompt_hash: Optional[str] = None,
+        task_type: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[int] = None,
+    ) -> dict:
+        """Một trang lịch sử (mới nhất trước), phân trang theo id (keyset): truyền next_cursor để lấy trang sau."""
+        where, params = self._filters(user_id, prompt_hash, task_type)
+        if cursor is not None:
+            where.append("id < ?")
+            params.append(cursor)
+        sql = f"SELECT {_LIST_COLUMNS} FROM grades"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            cur = self._read_conn.execute(sql, (*params, limit + 1))
+            names = [col[0] for col in cur.description]
+            rows = cur.fetchall()
+        items = [self._item(dict(zip(names, row))) for row in rows[:limit]]
+        next_cursor = str(items[-1]["id"]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get(self, grade_id: int) -> Optional[dict]:
+        """Một bản ghi đầy đủ: đề, bài viết và kết quả chấm."""
+        with self._lock:
+            cur = self._read_conn.execute(
+                f"SELECT {_LIST_COLUMNS}, essay, result, "
+                "(SELECT text FROM prompts WHERE hash = grades.prompt_hash) AS prompt "
+                "FROM grades WHERE id = ?",
+                (grade_id,),
+            )
+            names = [col[0] for col in cur.description]
+            row = cur.fetchone()
+        if row is None:
+            return None
+        record = dict(zip(names, row))
+        result = json.loads(record.pop("result"))
+        item = self._item(record)
+        item["result"] = result
+        return item
+
+    def summary(
+        self,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        task_type: Optional[str] = None,
+        user_id: Optional[str] = None,
+        prompt_hash: Optional[str] = None,
+    ) -> dict:
+        """Số bài và band trung bình (overall + từng tiêu chí) từ ngày start tới hết ngày end (UTC, YYYY-MM-DD).
+
+        Không lọc theo người dùng/đề thì đọc từ bảng cộng dồn theo ngày; có lọc thì tính trên các
+        dòng của người dùng/đề đó qua index.
+        """
+        if user_id is None and prompt_hash is None:
+            where, params = [], []
+            if start:
+                where.append("day >= ?")
+                params.append(start)
+            if end:
+                where.append("day <= ?")
+                params.append(end)
+            if task_type:
+                where.append("task_type = ?")
+                params.append(task_type)
+            sql = (
+                "SELECT SUM(n), SUM(sum_overall), SUM(sum_task), SUM(n_task), SUM(sum_cc), SUM(n_cc), "
+                "SUM(sum_lr), SUM(n_lr), SUM(sum_gra), SUM(n_gra) FROM grade_daily"
+            )
+            source = "daily"
+        else:
+            where, params = self._filters(user_id, prompt_hash, task_type)
+            if start:
+                where.append("created_at >= ?")
+                params.append(_day_start(start))
+            if end:
+                where.append("created_at < ?")
+                params.append(_day_start(end) + 86400)
+            sql = (
+                "SELECT COUNT(*), SUM(overall_band), SUM(band_task), COUNT(band_task), SUM(band_cc), COUNT(band_cc), "
+                "SUM(band_lr), COUNT(band_lr), SUM(band_gra), COUNT(band_gra) FROM grades"
+            )
+            source = "rows"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._lock:
+            row = self._read_conn.execute(sql, params).fetchone()
+        count, sum_overall, *criteria = row
+        count = count or 0
+        first = _FIRST_CRITERION.get(task_type or "", "Task Achievement / Task Response")
+        averages = {}
+        for i, column in enumerate(_BAND_COLUMNS):
+            total, n = criteria[2 * i], criteria[2 * i + 1]
+            averages[_COLUMN_NAMES.get(column, first)] = round(total / n, 2) if n else None
+        return {
+            "start": start,
+            "end": end,
+            "task_type": task_type,
+            "count": count,
+            "overall_band": round(sum_overall / count, 2) if count else None,
+            "criteria": averages,
+            "source": source,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_batch_ms": self.last_batch_ms,
+        }
+
+    @staticmethod
+    def _filters(
+        user_id: Optional[str], prompt_hash: Optional[str], task_type: Optional[str]
+    ) -> Tuple[List[str], List[object]]:
+        where: List[str] = []
+        params: List[object] = []
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if prompt_hash is not None:
+            where.append("prompt_hash = ?")
+            params.append(prompt_hash)
+        if task_type is not None:
+            where.append("task_type = ?")
+            params.append(task_type)
+        return where, params
+
+    @staticmethod
+    def _item(record: dict) -> dict:
+        first = _FIRST_CRITERION.get(record["task_type"], "Task Response")
+        record["criteria"] = {
+            _COLUMN_NAMES.get(column, first): record.pop(column) for column in _BAND_COLUMNS
+        }
+        record["approximate"] = bool(record["approximate"])
+        return record
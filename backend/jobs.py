@@ -0,0 +1,402 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import IO, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .models import GradeResponse
+from .resilience import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+_INSERT_BATCH = 500
+_TASK_TYPES = ("task1", "task2")
+
+# (job_id, idx, prompt, essay, task_type, attempts)
+JobRow = Tuple[str, int, str, str, str, int]
+# Chấm gộp: danh sách (prompt, essay) cùng task_type -> kết quả hoặc exception của từng bài
+PackGrader = Callable[[List[Tuple[str, str]], str], Awaitable[List[Union[GradeResponse, Exception]]]]
+
+
+class JobUploadError(ValueError):
+    """File tải lên không đúng định dạng JSONL/CSV."""
+
+
+class JobStore:
+    """Hàng đợi job chấm hàng loạt lưu trong SQLite (WAL) để sống sót qua restart.
+
+    Mỗi dòng bài viết là một bản ghi job_rows với trạng thái pending/running/done/failed.
+    Worker "nhận" dòng bằng cách chuyển sang running kèm thời điểm nhận; dòng running quá
+    lease (worker chết giữa chừng) được trả về pending để chấm tiếp. Runner còn sống gia hạn
+    (renew) các dòng nó đang giữ nên lease có thể ngắn hơn thời gian chấm một bài.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_rows: int = 5000) -> None:
+        self.lease_seconds = lease_seconds
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_rows (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                prompt TEXT NOT NULL,
+                essay TEXT NOT NULL,
+                task_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                claimed_at REAL,
+                result TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_rows_status ON job_rows(status);
+            """
+        )
+
+    # ---- Tạo job từ file tải lên ----
+
+    def create_job(self, fh: IO[bytes], fmt: str) -> Tuple[str, int]:
+        """Đọc file (JSONL hoặc CSV) theo từng dòng và ghi vào hàng đợi; trả về (job_id, total)."""
+        job_id = uuid.uuid4().hex
+        text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+        records = _iter_csv(text) if fmt == "csv" else _iter_jsonl(text)
+        total = 0
+        batch: List[tuple] = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for record in records:
+                    if total >= self.max_rows:
+                        raise JobUploadError(f"Tối đa {self.max_rows} bài mỗi job")
+                    batch.append(_row_values(job_id, total, record))
+                    total += 1
+                    if len(batch) >= _INSERT_BATCH:
+                        self._insert_rows(batch)
+                        batch = []
+                if batch:
+                    self._insert_rows(batch)
+                if total == 0:
+                    raise JobUploadError("File không có dòng nào")
+                self._conn.execute(
+                    "INSERT INTO jobs(id, total, created_at) VALUES (?, ?, ?)", (job_id, total, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                text.detach()
+        return job_id, total
+
+    def _insert_rows(self, batch: List[tuple]) -> None:
+        self._conn.executemany(
+            "INSERT INTO job_rows(job_id, idx, prompt, essay, task_type, status, error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+
+    # ---- Hàng đợi cho worker ----
+
+    def claim(self, limit: int) -> List[JobRow]:
+        """Nhận tối đa `limit` dòng pending (theo thứ tự tải lên) để chấm."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Dòng running quá lease: worker trước đã chết, đưa lại vào hàng đợi
+                self._conn.execute(
+                    "UPDATE job_rows SET status = 'pending' WHERE status = 'running' AND claimed_at < ?",
+                    (now - self.lease_seconds,),
+                )
+                rows = self._conn.execute(
+                    "SELECT job_id, idx, prompt, essay, task_type, attempts FROM job_rows "
+                    "WHERE status = 'pending' ORDER BY rowid LIMIT ?",
+                    (limit,),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE job_rows SET status = 'running', claimed_at = ? WHERE job_id = ? AND idx = ?",
+                    [(now, r[0], r[1]) for r in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def complete(self, row: JobRow, result: GradeResponse) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_rows SET status = 'done', result = ?, error = NULL, attempts = attempts + 1 "
+                "WHERE job_id = ? AND idx = ?",
+                (result.model_dump_json(), row[0], row[1]),
+            )
+
+    def fail(self, row: JobRow, error: str, max_attempts: int) -> None:
+        """Ghi lỗi; dòng còn lượt thử thì quay lại pending, hết lượt thì failed."""
+        status = "pending" if row[5] + 1 < max_attempts else "failed"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_rows SET status = ?, error = ?, attempts = attempts + 1 WHERE job_id = ? AND idx = ?",
+                (status, error, row[0], row[1]),
+            )
+
+    def renew(self, rows: List[JobRow]) -> None:
+        """Gia hạn lease của các dòng đang chấm để không bị runner khác nhận lại."""
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_rows SET claimed_at = ? WHERE job_id = ? AND idx = ? AND status = 'running'",
+                [(now, r[0], r[1]) for r in rows],
+            )
+
+    def release(self, rows: List[JobRow]) -> None:
+        """Trả các dòng đã nhận nhưng chưa chấm về pending (khi tắt ứng dụng)."""
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE job_rows SET status = 'pending' WHERE job_id = ? AND idx = ? AND status = 'running'",
+                [(r[0], r[1]) for r in rows],
+            )
+
+    # ---- Truy vấn ----
+
+    def status(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._conn.execute("SELECT total, created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM job_rows WHERE job_id = ? GROUP BY status", (job_id,)
+                ).fetchall()
+            )
+        done = counts.get("done", 0)
+        failed = counts.get("failed", 0)
+        remaining = counts.get("pending", 0) + counts.get("running", 0)
+        if remaining == 0:
+            state = "completed"
+        elif done or failed or counts.get("running", 0):
+            state = "running"
+        else:
+            state = "queued"
+        return {
+            "job_id": job_id,
+            "status": state,
+            "total": job[0],
+            "done": done,
+            "failed": failed,
+            "pending": remaining,
+            "progress": round((done + failed) / job[0], 4) if job[0] else 1.0,
+            "created_at": job[1],
+        }
+
+    def iter_results(self, job_id: str, page_size: int = 200) -> Iterator[str]:
+        """Các dòng JSONL kết quả theo thứ tự tải lên, đọc từng trang để không nạp hết vào bộ nhớ."""
+        last_idx = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT idx, status, result, error FROM job_rows WHERE job_id = ? AND idx > ? "
+                    "ORDER BY idx LIMIT ?",
+                    (job_id, last_idx, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            for idx, status, result, error in rows:
+                line = {"index": idx, "status": status}
+                if result is not None:
+                    line["result"] = json.loads(result)
+                if error is not None and status != "done":
+                    line["error"] = error
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            last_idx = rows[-1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """Pool worker async chấm các dòng pending trong JobStore với số lượng song song giới hạn.
+
+    Có grade_pack và pack_size > 1 thì mỗi worker nhận một gói tối đa pack_size dòng cùng task_type
+    và chấm chung (rubric gửi một lần cho cả gói); kết quả vẫn ghi theo từng dòng.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        grade: Callable[[str, str, str], Awaitable[GradeResponse]],
+        concurrency: int = 4,
+        max_attempts: int = 2,
+        poll_interval: float = 2.0,
+        grade_pack: Optional[PackGrader] = None,
+        pack_size: int = 1,
+    ) -> None:
+        self.store = store
+        self._grade = grade
+        self._grade_pack = grade_pack
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.pack_size = max(1, pack_size) if grade_pack is not None else 1
+        self._queue: "asyncio.Queue[List[JobRow]]" = asyncio.Queue(maxsize=self.concurrency)
+        # Các dòng đã nhận (đang trong hàng đợi hoặc đang chấm) của runner này
+        self._rows: Dict[Tuple[str, int], JobRow] = {}
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        self._tasks.extend(asyncio.create_task(self._work()) for _ in range(self.concurrency))
+
+    def notify(self) -> None:
+        """Báo có job mới để dispatcher không phải chờ tới lượt poll kế tiếp."""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Dòng đã nhận nhưng chưa xong quay lại pending để lần khởi động sau chấm tiếp
+        await asyncio.to_thread(self.store.release, list(self._rows.values()))
+        self._rows.clear()
+
+    async def _dispatch(self) -> None:
+        while True:
+            rows = await asyncio.to_thread(self.store.claim, self.concurrency * self.pack_size)
+            if not rows:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for pack in _packs(rows, self.pack_size):
+                for row in pack:
+                    self._rows[(row[0], row[1])] = row
+                # Hàng đợi đầy thì chờ worker rảnh: số dòng đã nhận luôn bị chặn trên
+                await self._queue.put(pack)
+
+    async def _heartbeat(self) -> None:
+        """Gia hạn lease các dòng đã nhận (đang chờ hoặc đang chấm) ba lần mỗi chu kỳ lease."""
+        while True:
+            await asyncio.sleep(max(1.0, self.store.lease_seconds / 3))
+            try:
+                await asyncio.to_thread(self.store.renew, list(self._rows.values()))
+            except Exception:  # noqa: BLE001 - lần gia hạn sau sẽ thử lại
+                logger.exception("Không gia hạn được lease các dòng đang chấm")
+
+    async def _work(self) -> None:
+        while True:
+            pack = await self._queue.get()
+            pause = 0.0
+            try:
+                try:
+                    outcomes = await self._grade_rows(pack)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:  # noqa: BLE001 - lỗi chung của cả gói ghi vào từng dòng
+                    outcomes = [exc] * len(pack)
+                for row, outcome in zip(pack, outcomes):
+                    try:
+                        pause = max(pause, await self._settle(row, outcome))
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception:  # noqa: BLE001 - lỗi ghi SQLite không được làm chết worker
+                        # Dòng vẫn ở trạng thái running: hết lease sẽ được claim lại và chấm tiếp
+                        logger.exception("Không ghi được kết quả dòng %s/%s", row[0], row[1])
+            finally:
+                self._queue.task_done()
+            if pause:
+                await asyncio.sleep(pause)
+
+    async def _grade_rows(self, pack: List[JobRow]) -> List[Union[GradeResponse, Exception]]:
+        if self._grade_pack is not None and len(pack) > 1:
+            return await self._grade_pack([(row[2], row[3]) for row in pack], pack[0][4])
+        row = pack[0]
+        return [await self._grade(row[2], row[3], row[4])]
+
+    async def _settle(self, row: JobRow, outcome: Union[GradeResponse, Exception]) -> float:
+        """Ghi trạng thái một dòng theo kết quả chấm; trả về số giây worker nên tạm nghỉ."""
+        # Bỏ dòng khỏi self._rows trước khi ghi trạng thái: dòng quay lại pending có thể
+        # được dispatcher nhận lại ngay. Bị hủy khi đang chấm thì dòng vẫn ở đó để stop() trả lại.
+        self._rows.pop((row[0], row[1]), None)
+        if isinstance(outcome, UpstreamUnavailable):
+            # Gemini quá tải/vượt quota: trả dòng về hàng đợi, không tính lượt thử, rồi tạm nghỉ
+            await asyncio.to_thread(self.store.release, [row])
+            return outcome.retry_after
+        if isinstance(outcome, Exception):
+            logger.warning("Chấm dòng %s/%s thất bại: %s", row[0], row[1], outcome)
+            await asyncio.to_thread(self.store.fail, row, str(outcome), self.max_attempts)
+            return 0.0
+        await asyncio.to_thread(self.store.complete, row, outcome)
+        return 0.0
+
+
+def _packs(rows: Sequence[JobRow], size: int) -> Iterator[List[JobRow]]:
+    """Nhóm các dòng đã nhận thành gói tối đa `size` dòng cùng task_type, giữ thứ tự nhận."""
+    groups: Dict[str, List[JobRow]] = {}
+    for row in rows:
+        group = groups.setdefault(row[4], [])
+        group.append(row)
+        if len(group) == size:
+            yield group
+            groups[row[4]] = []
+    yield from (group for group in groups.values() if group)
+
+
+def _iter_jsonl(text: IO[str]) -> Iterator[dict]:
+    for lineno, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise JobUploadError(f"Dòng {lineno} không phải JSON hợp lệ") from exc
+        if not isinstance(record, dict):
+            raise JobUploadError(f"Dòng {lineno} phải là object JSON")
+        yield record
+
+
+def _iter_csv(text: IO[str]) -> Iterator[dict]:
+    reader = csv.DictReader(text)
+    try:
+        if not reader.fieldnames or not {"prompt", "essay"} <= {f.strip() for f in reader.fieldnames}:
+            raise JobUploadError("CSV cần có cột prompt, essay (và tùy chọn task_type)")
+        for record in reader:
+            yield {(k or "").strip(): v for k, v in record.items()}
+    except csv.Error as exc:
+        # Trường quá dài, dấu ngoặc kép không đóng...
+        raise JobUploadError(f"CSV không hợp lệ ở dòng {reader.line_num}: {exc}") from exc
+
+
+def _row_values(job_id: str, idx: int, record: dict) -> tuple:
+    """Giá trị INSERT cho một dòng; dòng thiếu dữ liệu được ghi luôn là failed."""
+    prompt = str(record.get("prompt") or "").strip()
+    essay = str(record.get("essay") or "").strip()
+    task_type = str(record.get("task_type") or "task2").strip().lower()
+    error = None
+    if not prompt or not essay:
+        error = "Thiếu prompt hoặc essay"
+    elif task_type not in _TASK_TYPES:
+        error = f"task_type không hợp lệ: {task_type}"
+    return (job_id, idx, prompt, essay, task_type, "failed" if error else "pending", error)
@@ -0,0 +1,97 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class IncrementalJsonObject:
+    """Parser JSON tăng dần cho một object cấp cao nhất đang được model stream về.
+
+    feed() nhận từng đoạn text và trả về các sự kiện đã hoàn chỉnh:
+    - (key, value) khi một trường cấp cao nhất kết thúc;
+    - (f"{key}[]", item) khi một phần tử object trong mảng cấp cao nhất kết thúc
+      (ví dụ từng tiêu chí trong "criteria"), trước khi cả mảng đóng lại.
+    Phần text trước dấu `{` đầu tiên (vd. ```json) được bỏ qua.
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._done = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None
+        self._key: Optional[str] = None
+        self._value_start = -1
+        self._item_start = -1
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+        self._buf += chunk
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n and not self._done:
+            ch = buf[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None:
+                        self._last_key = json.loads(buf[self._string_start : i + 1])
+                i += 1
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._depth == 1 and self._key is None:
+                self._key = self._last_key
+                self._value_start = i + 1
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "{" and self._depth == 3:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._item_start >= 0:
+                    item = _loads(buf[self._item_start : i + 1])
+                    if item is not None:
+                        events.append((f"{self._key}[]", item))
+                    self._item_start = -1
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_value(buf, i, events)
+                    self._done = True
+            elif ch == "," and self._depth == 1:
+                self._emit_value(buf, i, events)
+            i += 1
+        self._pos = i
+        return events
+
+    def _emit_value(self, buf: str, end: int, events: List[Tuple[str, Any]]) -> None:
+        if self._key is not None:
+            value = _loads(buf[self._value_start : end])
+            if value is not None:
+                events.append((self._key, value))
+        self._key = None
+        self._last_key = None
+
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
@@ -1,11 +1,175 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import math
+import tempfile
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from .config import get_settings
-from .gemini_client import GeminiClient
-from .models import GenerateTasksResponse, GradeRequest, GradeResponse, GradeBatchRequest, GradeBatchResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response, StreamingResponse
+from . import metrics
+from .admission import AdmissionScheduler, Overloaded
+from .chart_store import is_chart_id
+from .charts import MEDIA_TYPES
+from .clients import ClientRegistry
+from .config import Settings, get_settings
+from .drafts import DraftHub
+from .history import GradeHistory
+from .gemini_client import GeminiClient, quick_grade, quick_grade_batch
+from .models import (
+    GenerateTasksResponse,
+    GradeRequest,
+    GradeResponse,
+    GradeBatchRequest,
+    GradeBatchResponse,
+    ImprovedVersionRequest,
+    ImprovedVersionResponse,
+    QuickGradeBatchRequest,
+    QuickGradeResponse,
+)
+from .jobs import JobRunner, JobStore, JobUploadError
+from .resilience import UpstreamUnavailable
+from .structured import OutputValidationError
+from .task_pool import TaskPool
+from .warmup import WarmUp
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Một registry client cho cả tiến trình, đóng kết nối khi tắt ứng dụng
+    settings = _load_settings()
+    app.state.clients = ClientRegistry(settings)
+    app.state.server_timing = settings is not None and settings.server_timing
+    # Điều phối request và bài nháp không cần API key: thiếu settings thì dùng giá trị mặc định
+    effective = settings if settings is not None else Settings(google_api_key="")
+    # Điều phối request gọi LLM (tắt khi ADMISSION_CONCURRENCY=0)
+    app.state.admission = admission = AdmissionScheduler(
+        effective.admission_concurrency,
+        max_queue=effective.admission_max_queue,
+        max_wait={
+            "interactive": effective.admission_wait_interactive,
+            "generate": effective.admission_wait_generate,
+            "batch": effective.admission_wait_batch,
+        },
+    )
+    app.state.warmup = None
+    warmup_task = None
+    if settings is not None:
+        # Nạp cache/chỉ mục bài gần trùng từ đĩa ngay khi khởi động
+        app.state.clients.open_stores()
+        if settings.warmup_on_start:
+            # Làm nóng ở thread nền (worker vẽ, numpy, client HTTP...) để server nhận request ngay;
+            # tắt thì pool vẽ và các thư viện nặng được nạp ở request đầu tiên cần tới
+            app.state.warmup = WarmUp()
+            warmup_task = asyncio.create_task(
+                asyncio.to_thread(app.state.warmup.run, app.state.clients, asyncio.get_running_loop())
+            )
+    app.state.task_pool = None
+    if settings is not None and settings.task_pool_size > 0:
+        app.state.task_pool = TaskPool(
+            max_size=settings.task_pool_size,
+            low_water=settings.task_pool_low_water,
+            refill_concurrency=settings.task_pool_refill_concurrency,
+            dedupe=settings.task_pool_dedupe,
+            persist_path=settings.task_pool_path,
+        )
+
+        async def refill_tasks() -> GenerateTasksResponse:
+            async with admission.slot("batch", "task_pool", shed=False):
+                return await app.state.clients.get().agenerate_writing_tasks()
+
+        app.state.task_pool.start(refill_tasks)
+    app.state.history = None
+    if settings is not None and settings.history_db_path:
+        app.state.history = GradeHistory(
+            settings.history_db_path,
+            batch_size=settings.history_batch_size,
+            flush_interval=settings.history_flush_interval,
+        )
+    app.state.jobs = None
+    if settings is not None:
+        store = JobStore(
+            settings.jobs_db_path, lease_seconds=settings.jobs_lease_seconds, max_rows=settings.jobs_max_rows
+        )
+
+        async def grade_job(prompt: str, essay: str, task_type: str) -> GradeResponse:
+            client = app.state.clients.get()
+            started = time.perf_counter()
+            async with admission.slot("batch", "jobs", shed=False):
+                result = await client.agrade_essay(prompt, essay, task_type=task_type)
+            _record_grade(app, client, prompt, essay, task_type, result, None, started)
+            return result
+
+        async def grade_job_pack(items: List[Tuple[str, str]], task_type: str) -> list:
+            client = app.state.clients.get()
+            started = time.perf_counter()
+            async with admission.slot("batch", "jobs", shed=False):
+                results = await client.agrade_pack(items, task_type=task_type)
+            for (prompt, essay), result in zip(items, results):
+                if isinstance(result, GradeResponse):
+                    _record_grade(app, client, prompt, essay, task_type, result, None, started)
+            return results
+
+        app.state.jobs = JobRunner(
+            store,
+            grade_job,
+            concurrency=settings.jobs_concurrency,
+            grade_pack=grade_job_pack if settings.grade_pack_size > 1 else None,
+            pack_size=settings.grade_pack_size,
+        )
+        # Các job dở dang từ lần chạy trước được chấm tiếp ngay khi khởi động
+        app.state.jobs.start()
+
+    async def grade_draft(
+        prompt: str, essay: str, task_type: str, detail: Optional[str], user_id: Optional[str]
+    ) -> GradeResponse:
+        started = time.perf_counter()
+        try:
+            client = app.state.clients.get()
+            async with admission.slot("interactive", user_id or "drafts"):
+                result = await client.agrade_essay(prompt, essay, task_type=task_type, detail=detail)
+        except Exception as exc:  # pylint: disable=broad-except
+            raise _http_error(exc) from exc
+        _record_grade(app, client, prompt, essay, task_type, result, user_id, started)
+        return result
+
+    # Phân tích bài nháp chạy cục bộ nên vẫn bật khi thiếu API key (chỉ bước chấm báo lỗi)
+    app.state.drafts = DraftHub(
+        grade_draft,
+        max_connections=effective.draft_max_connections,
+        max_chars=effective.draft_max_chars,
+        debounce=effective.draft_debounce,
+        idle_grade=effective.draft_idle_grade,
+        idle_detail=effective.draft_idle_detail,
+    )
+    try:
+        yield
+    finally:
+        if app.state.jobs is not None:
+            await app.state.jobs.stop()
+            app.state.jobs.store.close()
+        if app.state.task_pool is not None:
+            await app.state.task_pool.stop()
+        if app.state.history is not None:
+            # Ghi nốt các bản ghi còn trong hàng đợi
+            await asyncio.to_thread(app.state.history.close)
+        if warmup_task is not None:
+            # Không đóng client/pool vẽ khi thread làm nóng còn đang dùng
+            await warmup_task
+        await app.state.clients.aclose()
 
-app = FastAPI(title="IELTS Writing Assistant")
+
+def _load_settings() -> Optional[Settings]:
+    """Nạp settings khi khởi động; thiếu API key thì để lỗi hiện ra ở từng request."""
+    try:
+        return get_settings()
+    except RuntimeError:
+        return None
+
+
+app = FastAPI(title="IELTS Writing Assistant", lifespan=lifespan)
 
 # CORS cho frontend tĩnh
 app.add_middleware(
@@ -14,7 +178,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cho phép frontend (khác origin) đọc header Server-Timing
+    expose_headers=["Server-Timing"],
 )
+# Đo thời gian từng request/bước xử lý cho /metrics và header Server-Timing
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+def _get_client(request: Request) -> GeminiClient:
+    """Lấy GeminiClient dùng chung từ registry của ứng dụng."""
+    return request.app.state.clients.get()
+
+
+def _client_key(request: Request, user_id: Optional[str] = None) -> Optional[str]:
+    """Khóa chia lượt gọi LLM: người học (user_id) hoặc IP của client."""
+    return user_id or (request.client.host if request.client else None)
+
+
+def _admit(request: Request, priority: str, user_id: Optional[str] = None):
+    """Chờ tới lượt gọi LLM theo lớp ưu tiên (Overloaded -> 429 khi quá tải)."""
+    return request.app.state.admission.slot(priority, _client_key(request, user_id))
+
+
+def _http_error(exc: Exception) -> HTTPException:
+    """Gemini quá tải/vượt quota trả 429/503 kèm Retry-After; JSON sai schema trả 502; lỗi khác vẫn là 500."""
+    if isinstance(exc, UpstreamUnavailable):
+        headers = {"Retry-After": str(int(math.ceil(exc.retry_after)))}
+        if isinstance(exc, Overloaded):
+            headers["X-Queue-Position"] = str(exc.position)
+        return HTTPException(status_code=exc.status_code, detail=str(exc), headers=headers)
+    if isinstance(exc, OutputValidationError):
+        return HTTPException(status_code=502, detail=f"Kết quả chấm từ model không hợp lệ: {exc}")
+    return HTTPException(status_code=500, detail=str(exc))
+
+
+def _record_grade(
+    app: FastAPI,
+    client: GeminiClient,
+    prompt: str,
+    essay: str,
+    task_type: str,
+    result: GradeResponse,
+    user_id: Optional[str],
+    started: float,
+) -> None:
+    """Đưa kết quả chấm vào lịch sử (chỉ xếp hàng, không ghi đĩa trong request)."""
+    history = app.state.history
+    if history is not None:
+        history.record(
+            prompt,
+            essay,
+            task_type,
+            result,
+            model=client.model_name,
+            user_id=user_id,
+            duration=time.perf_counter() - started,
+        )
 
 
 @app.get("/api/health")
@@ -22,6 +241,36 @@ def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Ảnh trong kho định địa chỉ theo nội dung: cùng URL luôn cùng nội dung nên cache vĩnh viễn
+_CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@app.get("/api/charts/{name}")
+async def chart_image(request: Request, name: str, dpi: Optional[int] = Query(None, ge=50, le=300)) -> Response:
+    """Ảnh biểu đồ Task 1 theo <hash>.<png|webp|svg>; định dạng/dpi chưa có sẽ được vẽ từ dữ liệu đã lưu."""
+    chart_id, _, fmt = name.partition(".")
+    try:
+        store = request.app.state.clients.chart_store
+    except RuntimeError:
+        store = None
+    if store is None or fmt not in MEDIA_TYPES or not is_chart_id(chart_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy biểu đồ")
+    etag = store.etag(chart_id, fmt, dpi)
+    headers = {"ETag": etag, "Cache-Control": _CHART_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    image = await store.aget(chart_id, fmt, dpi)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy biểu đồ")
+    return Response(image, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
 # Endpoint tương thích cũ: chuyển hướng sang API mới
 @app.get("/api/generate_task")
 def legacy_generate_task_redirect():
@@ -29,40 +278,387 @@ def legacy_generate_task_redirect():
 
 
 @app.get("/api/generate_tasks", response_model=GenerateTasksResponse)
-def generate_tasks() -> GenerateTasksResponse:
+async def generate_tasks(request: Request, single_call: Optional[bool] = None) -> GenerateTasksResponse:
+    # Ưu tiên đề sinh sẵn trong kho; chỉ sinh trực tiếp khi kho rỗng hoặc chỉ định chế độ sinh
+    pool = request.app.state.task_pool
+    if pool is not None and single_call is None:
+        item = pool.pop()
+        if item is not None:
+            return item
     try:
-        settings = get_settings()
-        client = GeminiClient(settings.google_api_key, settings.gemini_model)
-        return client.generate_writing_tasks()
+        client = _get_client(request)
+        async with _admit(request, "generate"):
+            return await client.agenerate_writing_tasks(single_call=single_call)
     except Exception as exc:  # pylint: disable=broad-except
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        raise _http_error(exc) from exc
+
+
+@app.get("/api/stats/task_pool")
+def task_pool_stats(request: Request) -> dict:
+    pool = request.app.state.task_pool
+    if pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **pool.stats()}
+
+
+@app.get("/api/stats/grade_cache")
+def grade_cache_stats(request: Request) -> dict:
+    try:
+        cache = request.app.state.clients.grade_cache
+    except RuntimeError:
+        cache = None
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/api/stats/near_duplicates")
+def near_duplicate_stats(request: Request) -> dict:
+    try:
+        index = request.app.state.clients.near_duplicates
+    except RuntimeError:
+        index = None
+    if index is None:
+        return {"enabled": False}
+    return {"enabled": True, **index.stats()}
+
+
+@app.get("/api/stats/admission")
+def admission_stats(request: Request) -> dict:
+    return request.app.state.admission.stats()
+
+
+@app.get("/api/stats/warmup")
+def warmup_stats(request: Request) -> dict:
+    warmup = request.app.state.warmup
+    if warmup is None:
+        return {"enabled": False}
+    return {"enabled": True, **warmup.stats()}
+
+
+@app.get("/api/stats/drafts")
+def draft_stats(request: Request) -> dict:
+    return request.app.state.drafts.stats()
+
+
+@app.get("/api/stats/single_flight")
+def single_flight_stats(request: Request) -> dict:
+    return request.app.state.clients.single_flight.stats()
+
+
+@app.get("/api/stats/context_cache")
+def context_cache_stats(request: Request) -> dict:
+    try:
+        cache = _get_client(request).context_cache
+    except RuntimeError:
+        cache = None
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/api/stats/resilience")
+def resilience_stats(request: Request) -> dict:
+    try:
+        return _get_client(request).resilience.stats()
+    except RuntimeError:
+        return {"enabled": False}
+
+
+@app.get("/api/stats/parsing")
+def parsing_stats(request: Request) -> dict:
+    try:
+        return _get_client(request).parse_counters.stats()
+    except RuntimeError:
+        return {"enabled": False}
+
+
+@app.get("/api/stats/charts")
+def chart_stats(request: Request) -> dict:
+    try:
+        renderer = request.app.state.clients.chart_renderer
+        store = request.app.state.clients.chart_store
+    except RuntimeError:
+        renderer = store = None
+    if renderer is None:
+        return {"enabled": False}
+    return {"enabled": True, **renderer.stats(), "store": store.stats() if store is not None else None}
 
 
 @app.post("/api/grade", response_model=GradeResponse)
-def grade(payload: GradeRequest) -> GradeResponse:
+async def grade(payload: GradeRequest, request: Request) -> GradeResponse:
     if not payload.prompt or not payload.essay:
         raise HTTPException(status_code=400, detail="Thiếu prompt hoặc essay")
+    started = time.perf_counter()
     try:
-        settings = get_settings()
-        client = GeminiClient(settings.google_api_key, settings.gemini_model)
-        return client.grade_essay(payload.prompt, payload.essay, task_type=payload.task_type)
+        client = _get_client(request)
+        async with _admit(request, "interactive", payload.user_id):
+            result = await client.agrade_essay(
+                payload.prompt,
+                payload.essay,
+                task_type=payload.task_type,
+                bypass_cache=payload.bypass_cache,
+                detail=payload.detail,
+            )
     except Exception as exc:  # pylint: disable=broad-except
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        raise _http_error(exc) from exc
+    _record_grade(
+        request.app, client, payload.prompt, payload.essay, payload.task_type, result, payload.user_id, started
+    )
+    return result
+
+
+@app.post("/api/grade/quick", response_model=QuickGradeResponse)
+def grade_quick(payload: GradeRequest) -> QuickGradeResponse:
+    """Band tạm tính tức thì từ đặc trưng văn bản (không gọi Gemini, không cần API key)."""
+    if not payload.essay:
+        raise HTTPException(status_code=400, detail="Thiếu essay")
+    return quick_grade(payload.essay, payload.task_type)
+
+
+@app.post("/api/grade/quick_batch", response_model=List[QuickGradeResponse])
+def grade_quick_batch(payload: QuickGradeBatchRequest) -> List[QuickGradeResponse]:
+    """Ước lượng band cho nhiều bài (vd. cả lớp) trong một lần, đặc trưng được tính theo lô bằng NumPy."""
+    if not payload.items or not all(item.essay for item in payload.items):
+        raise HTTPException(status_code=400, detail="Thiếu essay")
+    return quick_grade_batch([item.essay for item in payload.items], [item.task_type for item in payload.items])
+
+
+@app.websocket("/api/drafts/ws")
+async def draft_socket(websocket: WebSocket) -> None:
+    """Số đo tức thì (số từ, cấu trúc đoạn, lặp từ) cho bài nháp đang viết; chấm LLM khi nộp hoặc ngừng gõ lâu."""
+    await websocket.app.state.drafts.serve(websocket)
+
+
+@app.post("/api/grade/stream")
+async def grade_stream(payload: GradeRequest, request: Request) -> StreamingResponse:
+    """Chấm bài qua Server-Sent Events: gửi từng tiêu chí, overall, feedback... ngay khi có."""
+    if not payload.prompt or not payload.essay:
+        raise HTTPException(status_code=400, detail="Thiếu prompt hoặc essay")
+    try:
+        client = _get_client(request)
+        # Giữ lượt tới khi stream kết thúc; từ chối (429) trước khi gửi header
+        lease = await request.app.state.admission.acquire("interactive", _client_key(request, payload.user_id))
+    except Exception as exc:  # pylint: disable=broad-except
+        raise _http_error(exc) from exc
+
+    async def events():
+        started = time.perf_counter()
+        try:
+            async for event, data in client.astream_grade(
+                payload.prompt,
+                payload.essay,
+                task_type=payload.task_type,
+                bypass_cache=payload.bypass_cache,
+                detail=payload.detail,
+            ):
+                if event == "done":
+                    result = GradeResponse.model_validate(data)
+                    _record_grade(
+                        request.app, client, payload.prompt, payload.essay, payload.task_type,
+                        result, payload.user_id, started,
+                    )
+                yield _sse(event, data)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Header đã gửi đi nên báo lỗi bằng một sự kiện riêng
+            error = _http_error(exc)
+            data = {"detail": error.detail, "status": error.status_code}
+            if isinstance(exc, UpstreamUnavailable):
+                data["retry_after"] = exc.retry_after
+            yield _sse("error", data)
+        finally:
+            lease.release()
+
+    stream = events()
+    # Client ngắt trước khi stream bắt đầu thì generator không chạy tới finally: trả lượt khi nó bị thu hồi
+    weakref.finalize(stream, asyncio.get_running_loop().call_soon_threadsafe, lease.release)
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.post("/api/grade_batch", response_model=GradeBatchResponse)
-def grade_batch(payload: GradeBatchRequest) -> GradeBatchResponse:
+async def grade_batch(payload: GradeBatchRequest, request: Request) -> GradeBatchResponse:
     if not all([payload.task1_prompt, payload.task1_essay, payload.task2_prompt, payload.task2_essay]):
         raise HTTPException(status_code=400, detail="Thiếu dữ liệu task1/task2")
+    started = time.perf_counter()
     try:
-        settings = get_settings()
-        client = GeminiClient(settings.google_api_key, settings.gemini_model)
-        result = client.grade_batch(
-            task1_prompt=payload.task1_prompt,
-            task1_essay=payload.task1_essay,
-            task2_prompt=payload.task2_prompt,
-            task2_essay=payload.task2_essay,
-        )
-        return GradeBatchResponse(task1=result["task1"], task2=result["task2"])
+        client = _get_client(request)
+        async with _admit(request, "batch", payload.user_id):
+            result = await client.agrade_batch(
+                task1_prompt=payload.task1_prompt,
+                task1_essay=payload.task1_essay,
+                task2_prompt=payload.task2_prompt,
+                task2_essay=payload.task2_essay,
+                bypass_cache=payload.bypass_cache,
+                detail=payload.detail,
+            )
     except Exception as exc:  # pylint: disable=broad-except
-        raise HTTPException(status_code=500, detail=str(exc)) from exc
+        raise _http_error(exc) from exc
+    for task_type, prompt, essay in (
+        ("task1", payload.task1_prompt, payload.task1_essay),
+        ("task2", payload.task2_prompt, payload.task2_essay),
+    ):
+        _record_grade(request.app, client, prompt, essay, task_type, result[task_type], payload.user_id, started)
+    return GradeBatchResponse(task1=result["task1"], task2=result["task2"])
+
+
+@app.post("/api/grade/improved_version", response_model=ImprovedVersionResponse)
+async def grade_improved_version(payload: ImprovedVersionRequest, request: Request) -> ImprovedVersionResponse:
+    """Bản viết lại cho bài đã chấm ở mức scores/feedback, chỉ tạo khi người học bấm xem."""
+    if not payload.prompt or not payload.essay:
+        raise HTTPException(status_code=400, detail="Thiếu prompt hoặc essay")
+    try:
+        client = _get_client(request)
+        async with _admit(request, "interactive"):
+            improved = await client.aimprove_essay(
+                payload.prompt, payload.essay, task_type=payload.task_type, bypass_cache=payload.bypass_cache
+            )
+    except Exception as exc:  # pylint: disable=broad-except
+        raise _http_error(exc) from exc
+    return ImprovedVersionResponse(improved_version=improved)
+
+
+def _history(request: Request) -> GradeHistory:
+    history = request.app.state.history
+    if history is None:
+        raise HTTPException(status_code=503, detail="Lịch sử chấm chưa được bật (HISTORY_DB_PATH)")
+    return history
+
+
+@app.get("/api/history")
+async def grade_history(
+    request: Request,
+    user_id: str = Query(..., min_length=1, max_length=128),
+    prompt_hash: Optional[str] = None,
+    task_type: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+) -> dict:
+    """Lịch sử chấm của một người học, mới nhất trước; truyền next_cursor của trang trước để lấy trang tiếp theo.
+
+    Chưa có xác thực nên user_id (mã ẩn danh trình duyệt tự tạo) là bắt buộc: không liệt kê bài của mọi người.
+    """
+    history = _history(request)
+    try:
+        after = int(cursor) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="cursor không hợp lệ") from exc
+    return await asyncio.to_thread(history.page, user_id, prompt_hash, task_type, limit, after)
+
+
+@app.get("/api/history/summary")
+async def grade_history_summary(
+    request: Request,
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    task_type: Optional[str] = None,
+    user_id: Optional[str] = None,
+    prompt_hash: Optional[str] = None,
+) -> dict:
+    """Số bài và band trung bình theo từng tiêu chí trong khoảng ngày [start, end] (UTC)."""
+    history = _history(request)
+    try:
+        return await asyncio.to_thread(history.summary, start, end, task_type, user_id, prompt_hash)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Ngày không hợp lệ: {exc}") from exc
+
+
+async def _history_item(request: Request, grade_id: int, user_id: str) -> dict:
+    """Bản ghi của đúng người học: id tăng dần nên không cho đọc bài của người khác bằng cách dò id."""
+    history = _history(request)
+    item = await asyncio.to_thread(history.get, grade_id)
+    if item is None or item["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Không tìm thấy bản ghi")
+    return item
+
+
+@app.get("/api/history/{grade_id}")
+async def grade_history_item(
+    grade_id: int, request: Request, user_id: str = Query(..., min_length=1, max_length=128)
+) -> dict:
+    return await _history_item(request, grade_id, user_id)
+
+
+@app.post("/api/history/{grade_id}/improved_version", response_model=ImprovedVersionResponse)
+async def grade_history_improved_version(
+    grade_id: int, request: Request, user_id: str = Query(..., min_length=1, max_length=128)
+) -> ImprovedVersionResponse:
+    """Bản viết lại cho một bài trong lịch sử; nhận xét của lần chấm đó được gửi kèm cho model."""
+    item = await _history_item(request, grade_id, user_id)
+    grade = GradeResponse.model_validate(item["result"])
+    try:
+        client = _get_client(request)
+        async with _admit(request, "interactive", item.get("user_id")):
+            improved = await client.aimprove_essay(
+                item["prompt"], item["essay"], task_type=item["task_type"], grade=grade
+            )
+    except Exception as exc:  # pylint: disable=broad-except
+        raise _http_error(exc) from exc
+    return ImprovedVersionResponse(improved_version=improved)
+
+
+@app.get("/api/stats/history")
+def history_stats(request: Request) -> dict:
+    history = request.app.state.history
+    if history is None:
+        return {"enabled": False}
+    return {"enabled": True, **history.stats()}
+
+
+def _job_runner(request: Request) -> JobRunner:
+    runner = request.app.state.jobs
+    if runner is None:
+        raise HTTPException(status_code=503, detail="Chưa cấu hình GOOGLE_API_KEY nên chưa thể chấm hàng loạt")
+    return runner
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: Request, format: Optional[str] = None) -> dict:
+    """Tải lên file JSONL/CSV gồm các dòng {prompt, essay, task_type} để chấm hàng loạt."""
+    runner = _job_runner(request)
+    fmt = (format or "").lower()
+    if not fmt:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "jsonl"
+    if fmt not in ("jsonl", "csv"):
+        raise HTTPException(status_code=400, detail="format phải là jsonl hoặc csv")
+    # Ghi body ra file tạm theo từng chunk để không giữ cả file trong bộ nhớ
+    with tempfile.TemporaryFile() as tmp:
+        async for chunk in request.stream():
+            # Ghi đĩa ở thread riêng để không chặn event loop khi file lớn/đĩa chậm
+            await asyncio.to_thread(tmp.write, chunk)
+        tmp.seek(0)
+        try:
+            job_id, total = await asyncio.to_thread(runner.store.create_job, tmp, fmt)
+        except (JobUploadError, UnicodeDecodeError) as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+    runner.notify()
+    return {"job_id": job_id, "total": total}
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str, request: Request) -> dict:
+    runner = _job_runner(request)
+    status = await asyncio.to_thread(runner.store.status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return status
+
+
+@app.get("/api/jobs/{job_id}/results")
+async def job_results(job_id: str, request: Request) -> StreamingResponse:
+    """Tải kết quả dạng JSONL (stream), mỗi dòng gồm index, status và result/error."""
+    runner = _job_runner(request)
+    if await asyncio.to_thread(runner.store.status, job_id) is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return StreamingResponse(
+        runner.store.iter_results(job_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.jsonl"'},
+    )
@@ -0,0 +1,268 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Bucket độ trễ (giây): từ thao tác CPU vài ms tới lời gọi LLM hàng chục giây
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Các trường usage_metadata của google-genai -> nhãn kind của counter token
+_USAGE_FIELDS = (
+    ("prompt", "prompt_token_count"),
+    ("output", "candidates_token_count"),
+    ("cached", "cached_content_token_count"),
+    ("thoughts", "thoughts_token_count"),
+    ("total", "total_token_count"),
+)
+# detail: mức chi tiết khi chấm (scores/feedback/full/improve), rỗng với các lời gọi khác
+_STAGE_LABELS = ("stage", "endpoint", "task_type", "model", "detail")
+_LLM_LABELS = ("endpoint", "task_type", "model", "detail")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter Prometheus có nhãn (chỉ tăng)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Gauge Prometheus có nhãn (giá trị hiện tại, tăng/giảm được)."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Histogram Prometheus có nhãn với bucket cố định."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Mỗi bộ nhãn: [số mẫu theo từng bucket (không cộng dồn) + bucket +Inf, tổng, số mẫu]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+REQUEST_DURATION = Histogram(
+    "ielts_request_duration_seconds", "Thời gian xử lý HTTP request", ("endpoint", "method", "status")
+)
+STAGE_DURATION = Histogram(
+    "ielts_stage_duration_seconds", "Thời gian từng bước xử lý (gọi LLM, parse, vẽ biểu đồ...)", _STAGE_LABELS
+)
+LLM_CALLS = Counter("ielts_llm_calls_total", "Số lời gọi generate_content", (*_LLM_LABELS, "outcome"))
+LLM_TOKENS = Counter("ielts_llm_tokens_total", "Token theo usage_metadata của phản hồi", (*_LLM_LABELS, "kind"))
+ADMISSION_QUEUED = Gauge("ielts_admission_queued", "Số request đang chờ tới lượt gọi LLM", ("priority",))
+ADMISSION_RUNNING = Gauge("ielts_admission_running", "Số request đang giữ lượt gọi LLM", ())
+ADMISSION_WAIT = Histogram(
+    "ielts_admission_wait_seconds", "Thời gian chờ trong hàng đợi trước khi được gọi LLM", ("priority", "outcome")
+)
+_METRICS = (
+    REQUEST_DURATION, STAGE_DURATION, LLM_CALLS, LLM_TOKENS, ADMISSION_QUEUED, ADMISSION_RUNNING, ADMISSION_WAIT
+)
+
+
+class RequestTimings:
+    """Tổng thời gian theo bước của một HTTP request (cho header Server-Timing)."""
+
+    def __init__(self, scope: Optional[dict] = None) -> None:
+        self.scope = scope
+        self.stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        # Sau khi router chọn route, scope có route -> dùng path template để nhãn không phình ra
+        route = (self.scope or {}).get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self, total: float) -> str:
+        with self._lock:
+            items = list(self.stages.items())
+        parts = []
+        for stage, (seconds, count) in items:
+            desc = f';desc="{count} calls"' if count > 1 else ""
+            parts.append(f"{stage};dur={seconds * 1000:.1f}{desc}")
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("metrics_request", default=None)
+_labels: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("metrics_labels", default={})
+
+
+def _current_labels(**overrides: str) -> Dict[str, str]:
+    timings = _request.get()
+    values = {
+        "endpoint": timings.endpoint if timings is not None else "background", "task_type": "", "model": "", "detail": ""
+    }
+    values.update(_labels.get())
+    values.update({k: v for k, v in overrides.items() if v is not None})
+    return values
+
+
+@contextmanager
+def labels(**values: str) -> Iterator[None]:
+    """Gắn nhãn (task_type, model...) cho mọi số đo trong khối lệnh, kể cả trong task/thread con copy context."""
+    token = _labels.set({**_labels.get(), **values})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def observe_stage(stage: str, seconds: float, **overrides: str) -> None:
+    """Ghi thời gian một bước vào histogram và vào Server-Timing của request hiện tại."""
+    STAGE_DURATION.observe(seconds, stage=stage, **_current_labels(**overrides))
+    timings = _request.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str, **overrides: str) -> Iterator[None]:
+    """Đo thời gian một bước xử lý (ghi cả khi bước đó ném lỗi)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start, **overrides)
+
+
+def record_call(resp: Any, ok: bool = True, **overrides: str) -> None:
+    """Đếm một lời gọi LLM và cộng token từ usage_metadata (nếu có)."""
+    values = _current_labels(**overrides)
+    LLM_CALLS.inc(outcome="ok" if ok else "error", **values)
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, field in _USAGE_FIELDS:
+        count = getattr(usage, field, None)
+        if count:
+            LLM_TOKENS.inc(float(count), kind=kind, **values)
+
+
+def render() -> str:
+    """Toàn bộ số đo theo định dạng text của Prometheus (exposition format 0.0.4)."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: đo thời gian mỗi request, gom thời gian từng bước và (tùy chọn) trả header Server-Timing.
+
+    Server-Timing bật khi app.state.server_timing là True; với response dạng stream, header được
+    gửi trước khi xử lý xong nên chỉ gồm các bước đã chạy tới lúc đó.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings(scope)
+        token = _request.set(timings)
+        start = time.perf_counter()
+        status = 500
+        app = scope.get("app")
+        server_timing = bool(getattr(getattr(app, "state", None), "server_timing", False))
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if server_timing:
+                    value = timings.header(time.perf_counter() - start).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request.reset(token)
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start, endpoint=timings.endpoint, method=scope["method"], status=str(status)
+            )
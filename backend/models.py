@@ -1,6 +1,8 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Dict, Optional, List, Literal, Union
 
+# Mức chi tiết khi chấm: scores (chỉ band), feedback (thêm nhận xét, gợi ý), full (thêm bản viết lại)
+GradeDetail = Literal["scores", "feedback", "full"]
 
 class GenerateTasksResponse(BaseModel):
     """Kết quả sinh đề viết IELTS gồm Task 1 và Task 2."""
@@ -9,6 +11,32 @@ class GenerateTasksResponse(BaseModel):
     task2: str = Field(..., description="Đề bài IELTS Writing Task 2")
     task1_chart_data: Optional[str] = Field(None, description="Dữ liệu biểu đồ/bảng cho Task 1 (JSON hoặc text format)")
     task1_chart_image: Optional[str] = Field(None, description="Hình ảnh biểu đồ cho Task 1 (base64 encoded PNG)")
+    task1_chart_url: Optional[str] = Field(
+        None, description="URL ảnh biểu đồ Task 1 trong kho biểu đồ (/api/charts/<hash>.png, thay cho ảnh base64)"
+    )
+
+
+class ChartSeries(BaseModel):
+    """Một chuỗi số liệu (vd. một năm) trong biểu đồ nhiều chuỗi."""
+
+    label: str
+    values: List[float]
+
+
+class ChartData(BaseModel):
+    """Dữ liệu hình minh họa của đề Task 1 do model sinh (theo các dạng mà trình vẽ biểu đồ hỗ trợ)."""
+
+    chart_type: Literal["bar", "line", "pie", "table", "process", "map"]
+    title: str
+    xlabel: Optional[str] = None
+    ylabel: Optional[str] = None
+    years: Optional[List[Union[int, str]]] = Field(None, description="Trục thời gian cho line/bar một chuỗi")
+    categories: Optional[List[str]] = None
+    labels: Optional[List[str]] = Field(None, description="Nhãn các phần của biểu đồ tròn")
+    values: Optional[List[float]] = None
+    series: Optional[List[ChartSeries]] = Field(None, description="Nhiều chuỗi số liệu theo categories")
+    data: Optional[List[List[Union[str, float]]]] = Field(None, description="Các dòng của bảng, dòng đầu là tiêu đề")
+    description: Optional[str] = Field(None, description="Mô tả từng bước cho dạng process/map")
 
 
 class GradeRequest(BaseModel):
@@ -17,6 +45,11 @@ class GradeRequest(BaseModel):
     prompt: str
     essay: str
     task_type: Literal["task1", "task2"] = "task2"
+    bypass_cache: bool = Field(False, description="Bỏ qua kết quả chấm đã cache và chấm lại")
+    user_id: Optional[str] = Field(None, max_length=128, description="Mã người học để lưu và xem lịch sử chấm")
+    detail: Optional[GradeDetail] = Field(
+        None, description="Mức chi tiết: scores, feedback hoặc full (mặc định theo GRADE_DETAIL)"
+    )
 
 
 class GradeBatchRequest(BaseModel):
@@ -26,6 +59,11 @@ class GradeBatchRequest(BaseModel):
     task1_essay: str
     task2_prompt: str
     task2_essay: str
+    bypass_cache: bool = Field(False, description="Bỏ qua kết quả chấm đã cache và chấm lại")
+    user_id: Optional[str] = Field(None, max_length=128, description="Mã người học để lưu và xem lịch sử chấm")
+    detail: Optional[GradeDetail] = Field(
+        None, description="Mức chi tiết: scores, feedback hoặc full (mặc định theo GRADE_DETAIL)"
+    )
 
 
 class CriterionScore(BaseModel):
@@ -44,6 +82,37 @@ class GradeResponse(BaseModel):
     feedback: str
     suggestions: str
     improved_version: Optional[str] = None
+    detail: GradeDetail = Field("full", description="Mức chi tiết của kết quả (scores không có nhận xét/gợi ý)")
+    approximate: bool = Field(False, description="Kết quả lấy từ/neo theo một bài gần trùng đã chấm trước đó")
+    similarity: Optional[float] = Field(None, description="Độ tương đồng ước lượng với bài gần trùng (0-1)")
+
+
+class ImprovedVersionRequest(BaseModel):
+    """Yêu cầu bản viết lại cho một bài đã chấm (khi lúc chấm chỉ lấy mức scores/feedback)."""
+
+    prompt: str
+    essay: str
+    task_type: Literal["task1", "task2"] = "task2"
+    bypass_cache: bool = Field(False, description="Bỏ qua kết quả đã cache và viết lại")
+
+
+class ImprovedVersionResponse(BaseModel):
+    improved_version: str
+
+
+class QuickGradeResponse(BaseModel):
+    """Band tạm tính tức thì từ đặc trưng văn bản, không qua LLM."""
+
+    overall_band: float
+    criteria: List[CriterionScore]
+    features: Dict[str, float] = Field(..., description="Đặc trưng văn bản dùng để ước lượng")
+    provisional: bool = Field(True, description="Luôn True: chỉ là ước lượng, không thay cho điểm chấm đầy đủ")
+
+
+class QuickGradeBatchRequest(BaseModel):
+    """Nhiều bài (vd. cả lớp) cần ước lượng band tức thì trong một lần gửi."""
+
+    items: List[GradeRequest]
 
 
 class GradeBatchResponse(BaseModel):
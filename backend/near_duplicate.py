@@ -0,0 +1,287 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .models import GradeResponse
+
+# Số nguyên tố Mersenne 2^31 - 1: a*x + b với x 32-bit vẫn nằm gọn trong uint64
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+@dataclass
+class NearDuplicateMatch:
+    """Bài đã chấm gần giống nhất với bài mới."""
+
+    entry_id: int
+    similarity: float
+    essay: str
+    response: GradeResponse
+
+
+def _shingle_hashes(text: str, size: int = 3) -> np.ndarray:
+    """Hash crc32 của các shingle gồm `size` từ liên tiếp (đã chuẩn hóa chữ thường)."""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) < size:
+        shingles = [" ".join(words)] if words else [""]
+    else:
+        shingles = [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64))
+
+
+def _prompt_key(prompt: str, task_type: str, scope: str) -> int:
+    """Khóa 63-bit của (đề, task_type, model/rubric): chỉ so bài cùng đề với nhau."""
+    raw = "\x1f".join([" ".join((prompt or "").lower().split()), task_type, scope])
+    return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "little") >> 1
+
+
+class NearDuplicateIndex:
+    """Chỉ mục MinHash/LSH các bài đã chấm để tìm bài nộp lại gần như y hệt.
+
+    Chữ ký MinHash và khóa band nằm trong mảng NumPy (N x num_perm uint32, N x bands uint64).
+    Mỗi band là một bảng băm cỡ cố định (mảng id đầu chuỗi theo bucket) cộng hai mảng
+    `next`/`prev` nối các bài cùng bucket, nên bộ nhớ tăng theo mảng chứ không theo số đối
+    tượng Python. Chỉ mục giữ tối đa `capacity` bài, đầy thì bỏ bài cũ nhất. Bài, đề và kết
+    quả chấm nằm trong SQLite và chỉ được đọc khi có bài khớp.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        seed: int = 1,
+        capacity: int = 100_000,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        if capacity < 1:
+            raise ValueError("capacity phải >= 1")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.capacity = capacity
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+        # Hệ số lẻ ngẫu nhiên để gộp các hàng của một band thành một khóa uint64
+        self._band_mult = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+        # Bảng bucket 2^k >= capacity ô mỗi band; bucket lấy từ các bit cao của khóa band
+        table_bits = max(4, (capacity - 1).bit_length())
+        self._bucket_shift = np.uint64(64 - table_bits)
+        self._band_range = np.arange(bands)
+        self._lock = threading.Lock()
+        self._size = 0
+        self._cursor = 0  # ô ghi kế tiếp; khi đã đầy cũng là ô của bài cũ nhất
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._prompt_keys = np.zeros(0, dtype=np.int64)
+        self._sigs = np.zeros((0, num_perm), dtype=np.uint32)
+        self._keys = np.zeros((0, bands), dtype=np.uint64)
+        self._next = np.zeros((bands, 0), dtype=np.int32)
+        self._prev = np.zeros((bands, 0), dtype=np.int32)
+        self._heads = np.full((bands, 1 << table_bits), -1, dtype=np.int32)
+        self.queries = 0
+        self.matches = 0
+        self.evicted = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS near_dup_entries ("
+            "id INTEGER PRIMARY KEY, prompt_key INTEGER NOT NULL, signature BLOB NOT NULL, "
+            "essay TEXT NOT NULL, response TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def signature(self, text: str) -> np.ndarray:
+        """Chữ ký MinHash (num_perm giá trị uint32) của một bài viết."""
+        hashes = _shingle_hashes(text)
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sigs: np.ndarray) -> np.ndarray:
+        """Khóa LSH cho từng band; nhận (num_perm,) hoặc (N, num_perm), trả về (..., bands) uint64."""
+        bands = sigs.reshape(sigs.shape[:-1] + (self.bands, self.rows)).astype(np.uint64)
+        return (bands * self._band_mult).sum(axis=-1, dtype=np.uint64)
+
+    def _buckets(self, keys: np.ndarray) -> np.ndarray:
+        return (keys >> self._bucket_shift).astype(np.int64)
+
+    def _grow(self, needed: int) -> None:
+        size = self._sigs.shape[0]
+        if needed <= size:
+            return
+        new_size = min(self.capacity, max(needed, size * 2, 1024))
+        sigs = np.zeros((new_size, self.num_perm), dtype=np.uint32)
+        sigs[:size] = self._sigs
+        keys = np.zeros((new_size, self.bands), dtype=np.uint64)
+        keys[:size] = self._keys
+        nxt = np.full((self.bands, new_size), -1, dtype=np.int32)
+        nxt[:, :size] = self._next
+        prev = np.full((self.bands, new_size), -1, dtype=np.int32)
+        prev[:, :size] = self._prev
+        ids = np.zeros(new_size, dtype=np.int64)
+        ids[:size] = self._ids
+        prompt_keys = np.zeros(new_size, dtype=np.int64)
+        prompt_keys[:size] = self._prompt_keys
+        self._sigs, self._keys, self._next, self._prev = sigs, keys, nxt, prev
+        self._ids, self._prompt_keys = ids, prompt_keys
+
+    def _link(self, slot: int) -> None:
+        """Đưa ô `slot` lên đầu chuỗi bucket của nó ở mọi band."""
+        bands = self._band_range
+        buckets = self._buckets(self._keys[slot])
+        heads = self._heads[bands, buckets]
+        self._next[:, slot] = heads
+        self._prev[:, slot] = -1
+        linked = heads != -1
+        self._prev[bands[linked], heads[linked]] = slot
+        self._heads[bands, buckets] = slot
+
+    def _unlink(self, slot: int) -> None:
+        """Gỡ ô `slot` khỏi chuỗi bucket ở mọi band (dùng khi bỏ bài cũ nhất)."""
+        bands = self._band_range
+        buckets = self._buckets(self._keys[slot])
+        prev = self._prev[:, slot]
+        nxt = self._next[:, slot]
+        has_prev = prev != -1
+        self._next[bands[has_prev], prev[has_prev]] = nxt[has_prev]
+        self._heads[bands[~has_prev], buckets[~has_prev]] = nxt[~has_prev]
+        has_next = nxt != -1
+        self._prev[bands[has_next], nxt[has_next]] = prev[has_next]
+
+    def _insert(self, entry_id: int, prompt_key: int, sig: np.ndarray) -> Optional[int]:
+        """Ghi bài vào ô kế tiếp; trả về id bài cũ nhất bị thay chỗ nếu chỉ mục đã đầy."""
+        slot = self._cursor
+        evicted = None
+        if self._size == self.capacity:
+            evicted = int(self._ids[slot])
+            self._unlink(slot)
+        else:
+            self._grow(slot + 1)
+            self._size += 1
+        self._sigs[slot] = sig
+        self._keys[slot] = self._band_keys(sig)
+        self._ids[slot] = entry_id
+        self._prompt_keys[slot] = prompt_key
+        self._link(slot)
+        self._cursor = (slot + 1) % self.capacity
+        return evicted
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT id, prompt_key, signature FROM near_dup_entries ORDER BY id DESC LIMIT ?", (self.capacity,)
+        ).fetchall()
+        if not rows:
+            return
+        rows.reverse()
+        # Bài cũ hơn phần giữ lại (file tạo với capacity lớn hơn) thì xóa luôn khỏi SQLite
+        self._conn.execute("DELETE FROM near_dup_entries WHERE id < ?", (rows[0][0],))
+        self._conn.commit()
+        n = len(rows)
+        self._grow(n)
+        self._ids[:n] = [r[0] for r in rows]
+        self._prompt_keys[:n] = [r[1] for r in rows]
+        self._sigs[:n] = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.uint32).reshape(n, self.num_perm)
+        self._keys[:n] = self._band_keys(self._sigs[:n])
+        # Dựng chuỗi bucket cho toàn bộ chỉ mục bằng NumPy: sắp theo (bucket, ô giảm dần) để
+        # mỗi chuỗi đi từ bài mới nhất về bài cũ nhất như khi thêm lần lượt
+        slots = np.arange(n)
+        for band in range(self.bands):
+            buckets = self._buckets(self._keys[:n, band])
+            order = np.lexsort((-slots, buckets))
+            sorted_buckets = buckets[order]
+            same = sorted_buckets[1:] == sorted_buckets[:-1]
+            self._next[band, order[:-1]] = np.where(same, order[1:], -1)
+            self._next[band, order[-1]] = -1
+            self._prev[band, order[1:]] = np.where(same, order[:-1], -1)
+            self._prev[band, order[0]] = -1
+            starts = np.concatenate(([0], np.flatnonzero(~same) + 1))
+            self._heads[band, sorted_buckets[starts]] = order[starts]
+        self._size = n
+        self._cursor = n % self.capacity
+
+    def add(self, prompt: str, essay: str, task_type: str, scope: str, response: GradeResponse) -> None:
+        """Ghi nhận một bài vừa chấm đầy đủ làm mốc cho các lần nộp lại (đầy thì bỏ bài cũ nhất)."""
+        sig = self.signature(essay)
+        prompt_key = _prompt_key(prompt, task_type, scope)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO near_dup_entries(prompt_key, signature, essay, response) VALUES (?, ?, ?, ?)",
+                (prompt_key, sig.tobytes(), essay, response.model_dump_json()),
+            )
+            evicted = self._insert(cur.lastrowid, prompt_key, sig)
+            if evicted is not None:
+                self._conn.execute("DELETE FROM near_dup_entries WHERE id = ?", (evicted,))
+                self.evicted += 1
+            self._conn.commit()
+
+    def query(self, prompt: str, essay: str, task_type: str, scope: str) -> Optional[NearDuplicateMatch]:
+        """Tìm bài cùng đề có độ tương đồng Jaccard ước lượng >= threshold."""
+        sig = self.signature(essay)
+        prompt_key = _prompt_key(prompt, task_type, scope)
+        with self._lock:
+            self.queries += 1
+            keys = self._band_keys(sig)
+            candidates = set()
+            for band, (key, bucket) in enumerate(zip(keys.tolist(), self._buckets(keys).tolist())):
+                slot = int(self._heads[band, bucket])
+                while slot != -1:
+                    # Một bucket có thể chứa khóa band khác nhau: chỉ lấy bài trùng đúng khóa
+                    if int(self._keys[slot, band]) == key:
+                        candidates.add(slot)
+                    slot = int(self._next[band, slot])
+            if not candidates:
+                return None
+            slots = np.fromiter(candidates, dtype=np.int64)
+            slots = slots[self._prompt_keys[slots] == prompt_key]
+            if slots.size == 0:
+                return None
+            sims = (self._sigs[slots] == sig).mean(axis=1)
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                return None
+            entry_id = int(self._ids[slots[best]])
+            row = self._conn.execute(
+                "SELECT essay, response FROM near_dup_entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+            self.matches += 1
+        return NearDuplicateMatch(
+            entry_id=entry_id,
+            similarity=similarity,
+            essay=row[0],
+            response=GradeResponse.model_validate_json(row[1]),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "queries": self.queries,
+            "matches": self.matches,
+            "evicted": self.evicted,
+            "signature_bytes": int(self._size * self.num_perm * 4),
+            "index_bytes": int(
+                self._sigs.nbytes + self._keys.nbytes + self._next.nbytes + self._prev.nbytes
+                + self._heads.nbytes + self._ids.nbytes + self._prompt_keys.nbytes
+            ),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,403 @@
+from typing import Dict, List, Optional, Tuple
+
+from .analysis import EssayFeatures
+
+# Mức chi tiết khi chấm, từ ít tới nhiều token đầu ra: chỉ band; thêm nhận xét và gợi ý; thêm bản viết lại
+GRADE_DETAILS: Tuple[str, ...] = ("scores", "feedback", "full")
+
+# Phần hướng dẫn chấm (band descriptors, chính sách, hướng dẫn theo tiêu chí) là tĩnh nên được
+# ghép sẵn một lần cho mỗi task_type khi import; mỗi lần chấm chỉ còn ghép phần đề và bài viết.
+
+# Yêu cầu riêng của Task 1 (thuộc tiêu chí Task Achievement)
+_TASK1_REQUIREMENTS = (
+    "Task 1 specific requirements: write at least 150 words; provide a clear overview summarising main trends, differences or stages; describe significant data accurately; do not include personal opinions or arguments; maintain a formal tone."
+)
+
+_DESCRIPTORS: Dict[str, str] = {
+    "task1": (
+        "Evaluate IELTS Writing Task 1 using the public band descriptors.\n"
+        "Criteria names: Task Achievement, Coherence and Cohesion, Lexical Resource, Grammatical Range and Accuracy.\n"
+        + _TASK1_REQUIREMENTS
+        + "\n\n"
+        + "Band descriptors summary (public version):\n"
+        "9: fully satisfies all requirements; fully developed response; cohesion attracts no attention; skilful paragraphing; wide vocabulary with natural, sophisticated control (only rare slips); wide range of structures with full flexibility and accuracy (rare slips).\n"
+        "8: covers all requirements sufficiently; highlights/illustrates key features appropriately; logical sequencing; manages cohesion well; sufficient and appropriate paragraphing; wide vocabulary fluently and flexibly (precise meanings); skilful uncommon items (occasional inaccuracies); rare spelling/formation errors; wide range of structures; majority error-free; very occasional errors.\n"
+        "7: covers requirements; clear overview of trends/differences/stages; clearly presents and highlights key features (could be more fully extended); logical organisation with clear progression; range of cohesive devices (some under/over-use); sufficient vocabulary for flexibility/precision; some less common items with awareness of style/collocation; occasional lexical errors; variety of complex structures; frequent error-free sentences; good control with a few errors.\n"
+        "6: addresses requirements; overview with appropriately selected information; adequately highlights key features (some details may be irrelevant/inaccurate); coherent arrangement with clear overall progression; cohesive devices used but cohesion may be faulty/mechanical; referencing may be unclear; adequate range of vocabulary with attempts at less common items (some inaccuracy); some spelling/formation errors not impeding communication; mix of simple/complex forms; some grammar/punctuation errors rarely reducing communication.\n"
+        "5: generally addresses task (format may be inappropriate); recounts detail mechanically with no clear overview; inadequately covers key features (focus on details); some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; repetitive due to lack of referencing/substitution; limited vocabulary (minimally adequate) with noticeable errors causing some difficulty; limited range of structures; attempts complex forms but less accurate; frequent grammatical/punctuation errors causing some difficulty.\n"
+        "4: attempts task but does not cover all key features (format may be inappropriate); may confuse features with detail; parts unclear/irrelevant/repetitive/inaccurate; ideas not arranged coherently and no clear progression; some basic cohesive devices (inaccurate/repetitive); only basic vocabulary (repetitive/inappropriate); limited control of word formation/spelling with errors causing strain; very limited range of structures with rare subordination; some accurate structures but errors predominate; punctuation often faulty.\n"
+        "3: fails to address task (may be misunderstood); limited ideas largely irrelevant/repetitive; ideas not organised; very limited cohesive devices not indicating logical relations; very limited words/expressions with very limited control (errors may severely distort); attempts sentence forms but errors predominate and distort meaning.\n"
+        "2: answer barely related to task; very little control of organisational features; extremely limited vocabulary with essentially no control of formation/spelling; cannot use sentence forms except memorised phrases.\n"
+        "1: answer completely unrelated; fails to communicate any message; only isolated words; cannot use sentence forms at all.\n"
+        "0: does not attend/attempt or totally memorised response."
+    ),
+    "task2": (
+        "Evaluate IELTS Writing Task 2 using the public band descriptors.\n"
+        "Criteria names: Task Response, Coherence and Cohesion, Lexical Resource, Grammatical Range and Accuracy.\n\n"
+        "Band descriptors summary (public version):\n"
+        "9: fully addresses all parts; fully developed position with relevant, fully extended and well supported ideas; cohesion attracts no attention; skilful paragraphing; wide vocabulary with natural, sophisticated control (rare slips); wide range of structures with full flexibility and accuracy (rare slips).\n"
+        "8: sufficiently addresses all parts; well-developed response with relevant, extended and supported ideas; logical sequencing; manages cohesion well; sufficient/appropriate paragraphing; wide vocabulary fluently and flexibly to convey precise meanings; skilful uncommon items (occasional inaccuracies); rare spelling/formation errors; wide range of structures; majority error-free; very occasional errors.\n"
+        "7: addresses all parts; clear position throughout; presents, extends and supports main ideas (may over-generalise or supporting ideas lack focus); logical organisation with clear progression; range of cohesive devices (some under/over-use); clear central topic within each paragraph; sufficient vocabulary allowing some flexibility and precision; less common items with some awareness of style/collocation; occasional lexical errors; variety of complex structures; frequent error-free sentences; good control with a few errors.\n"
+        "6: addresses all parts (some parts more fully covered); relevant position though conclusions may be unclear/repetitive; relevant main ideas but some inadequately developed/unclear; coherent arrangement with clear overall progression; cohesive devices used but cohesion may be faulty/mechanical; referencing not always clear/appropriate; paragraphing used but not always logical; adequate vocabulary with attempts at less common items (some inaccuracy); some spelling/formation errors not impeding communication; mix of simple/complex forms; some grammar/punctuation errors rarely reducing communication.\n"
+        "5: addresses the task only partially (format may be inappropriate); expresses a position but development not always clear and no conclusions; some main ideas limited and insufficiently developed with possible irrelevant detail; some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; repetitive due to lack of referencing/substitution; may not write in paragraphs or paragraphing inadequate; limited vocabulary (minimally adequate) with noticeable errors causing some difficulty; limited range of structures; attempts complex forms but less accurate than simple; frequent grammatical/punctuation errors causing some difficulty.\n"
+        "4: minimal or tangential response (format may be inappropriate); unclear position; some main ideas difficult to identify, repetitive/irrelevant/unsupported; ideas not arranged coherently with no clear progression; some basic cohesive devices (inaccurate/repetitive); no/poor paragraphing; only basic vocabulary (repetitive/inappropriate) with limited control of formation/spelling (errors may cause strain); very limited range of structures with only rare subordination; some accurate structures but errors predominate; punctuation often faulty.\n"
+        "3: does not adequately address any part; no clear position; few ideas largely undeveloped/irrelevant; ideas not organised logically; very limited cohesive devices not indicating logical relations; very limited words/expressions with very limited control (errors may severely distort); attempts sentence forms but errors predominate and distort meaning.\n"
+        "2: barely responds; no position; may attempt 1-2 ideas with no development; very little control of organisational features; extremely limited vocabulary with essentially no control of formation/spelling; cannot use sentence forms except memorised phrases.\n"
+        "1: completely unrelated; fails to communicate any message; only isolated words; cannot use sentence forms at all.\n"
+        "0: does not attend/attempt or totally memorised response."
+    ),
+}
+
+# Band descriptors tách theo từng tiêu chí (band 9 xuống 1; band 0 giống nhau) cho chế độ chấm song song
+# từng tiêu chí: mỗi lời gọi chỉ mang phần mô tả của tiêu chí mình chấm
+_COMMON_SLICES: Dict[str, Tuple[str, ...]] = {
+    "Coherence and Cohesion": (
+        "cohesion attracts no attention; skilful paragraphing",
+        "logical sequencing; manages cohesion well; sufficient and appropriate paragraphing",
+        "logical organisation with clear progression; range of cohesive devices (some under/over-use)",
+        "coherent arrangement with clear overall progression; cohesive devices used but cohesion may be faulty/mechanical; "
+        "referencing may be unclear",
+        "some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; "
+        "repetitive due to lack of referencing/substitution",
+        "ideas not arranged coherently and no clear progression; some basic cohesive devices (inaccurate/repetitive)",
+        "ideas not organised; very limited cohesive devices not indicating logical relations",
+        "very little control of organisational features",
+        "fails to communicate any message",
+    ),
+    "Lexical Resource": (
+        "wide vocabulary with natural, sophisticated control (only rare slips)",
+        "wide vocabulary fluently and flexibly (precise meanings); skilful uncommon items (occasional inaccuracies); "
+        "rare spelling/formation errors",
+        "sufficient vocabulary for flexibility/precision; some less common items with awareness of style/collocation; "
+        "occasional lexical errors",
+        "adequate range of vocabulary with attempts at less common items (some inaccuracy); some spelling/formation "
+        "errors not impeding communication",
+        "limited vocabulary (minimally adequate) with noticeable errors causing some difficulty",
+        "only basic vocabulary (repetitive/inappropriate); limited control of word formation/spelling with errors "
+        "causing strain",
+        "very limited words/expressions with very limited control (errors may severely distort)",
+        "extremely limited vocabulary with essentially no control of formation/spelling",
+        "only isolated words",
+    ),
+    "Grammatical Range and Accuracy": (
+        "wide range of structures with full flexibility and accuracy (rare slips)",
+        "wide range of structures; majority error-free; very occasional errors",
+        "variety of complex structures; frequent error-free sentences; good control with a few errors",
+        "mix of simple/complex forms; some grammar/punctuation errors rarely reducing communication",
+        "limited range of structures; attempts complex forms but less accurate; frequent grammatical/punctuation "
+        "errors causing some difficulty",
+        "very limited range of structures with rare subordination; some accurate structures but errors predominate; "
+        "punctuation often faulty",
+        "attempts sentence forms but errors predominate and distort meaning",
+        "cannot use sentence forms except memorised phrases",
+        "cannot use sentence forms at all",
+    ),
+}
+_BAND_SLICES: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "task1": {
+        "Task Achievement": (
+            "fully satisfies all requirements; fully developed response",
+            "covers all requirements sufficiently; highlights/illustrates key features appropriately",
+            "covers requirements; clear overview of trends/differences/stages; clearly presents and highlights key "
+            "features (could be more fully extended)",
+            "addresses requirements; overview with appropriately selected information; adequately highlights key "
+            "features (some details may be irrelevant/inaccurate)",
+            "generally addresses task (format may be inappropriate); recounts detail mechanically with no clear "
+            "overview; inadequately covers key features (focus on details)",
+            "attempts task but does not cover all key features (format may be inappropriate); may confuse features "
+            "with detail; parts unclear/irrelevant/repetitive/inaccurate",
+            "fails to address task (may be misunderstood); limited ideas largely irrelevant/repetitive",
+            "answer barely related to task",
+            "answer completely unrelated",
+        ),
+        **_COMMON_SLICES,
+    },
+    "task2": {
+        "Task Response": (
+            "fully addresses all parts; fully developed position with relevant, fully extended and well supported ideas",
+            "sufficiently addresses all parts; well-developed response with relevant, extended and supported ideas",
+            "addresses all parts; clear position throughout; presents, extends and supports main ideas (may "
+            "over-generalise or supporting ideas lack focus)",
+            "addresses all parts (some parts more fully covered); relevant position though conclusions may be "
+            "unclear/repetitive; relevant main ideas but some inadequately developed/unclear",
+            "addresses the task only partially (format may be inappropriate); expresses a position but development "
+            "not always clear and no conclusions; some main ideas limited and insufficiently developed with possible "
+            "irrelevant detail",
+            "minimal or tangential response (format may be inappropriate); unclear position; some main ideas "
+            "difficult to identify, repetitive/irrelevant/unsupported",
+            "does not adequately address any part; no clear position; few ideas largely undeveloped/irrelevant",
+            "barely responds; no position; may attempt 1-2 ideas with no development",
+            "completely unrelated",
+        ),
+        **_COMMON_SLICES,
+        # Task 2 còn yêu cầu mỗi đoạn có ý chính rõ ràng và đánh giá cách chia đoạn
+        "Coherence and Cohesion": (
+            "cohesion attracts no attention; skilful paragraphing",
+            "logical sequencing; manages cohesion well; sufficient/appropriate paragraphing",
+            "logical organisation with clear progression; range of cohesive devices (some under/over-use); clear "
+            "central topic within each paragraph",
+            "coherent arrangement with clear overall progression; cohesive devices used but cohesion may be "
+            "faulty/mechanical; referencing not always clear/appropriate; paragraphing used but not always logical",
+            "some organisation but lack of overall progression; inadequate/inaccurate/over-use of cohesive devices; "
+            "repetitive due to lack of referencing/substitution; may not write in paragraphs or paragraphing inadequate",
+            "ideas not arranged coherently with no clear progression; some basic cohesive devices "
+            "(inaccurate/repetitive); no/poor paragraphing",
+            "ideas not organised logically; very limited cohesive devices not indicating logical relations",
+            "very little control of organisational features",
+            "fails to communicate any message",
+        ),
+    },
+}
+
+_EVIDENCE_RULE = "- Provide 1-2 concrete evidence snippets in each criterion comment (what exactly is good/bad).\n"
+
+# Chính sách chấm nghiêm khắc hơn (dùng chung cho prompt chấm đầy đủ và chấm theo chênh lệch)
+STRICT_POLICY = (
+    "Scoring policy (be conservative):\n"
+    "- Use only 0.5 increments for all bands.\n"
+    "- When uncertain between two adjacent bands, choose the LOWER band.\n"
+    f"{_EVIDENCE_RULE}"
+    "- Overall band MUST be the arithmetic mean of the four criteria bands, rounded DOWN to the nearest 0.5.\n"
+    "- If word count is below the minimum, apply penalties:\n"
+    "  * Task 1 (<150 words): cap Task Achievement at 5.0 and overall at 5.5.\n"
+    "  * Task 2 (<250 words): cap Task Response at 5.0 and overall at 5.5.\n"
+)
+
+# Hướng dẫn chi tiết theo từng tiêu chí (khác biệt giữa Task 1 và Task 2 ở tiêu chí đầu)
+_CRITERION_GUIDANCE: Dict[str, str] = {
+    "task1": (
+        "Criterion-specific guidance (use exact names):\n"
+        "- Task Achievement (TA):\n"
+        "  Assess: clear overview; accurate selection/synthesis of key features; relevance; no opinions.\n"
+        "  Penalise: missing/unclear overview; misreported/comparative errors; focusing on trivial details; irrelevant content.\n"
+        "- Coherence and Cohesion (CC):\n"
+        "  Assess: logical progression; effective paragraphing; clear referencing/substitution; varied cohesive devices without mechanical feel.\n"
+        "  Penalise: illogical sequence; mechanical/overused devices; unclear referencing; weak or absent paragraphing.\n"
+        "- Lexical Resource (LR):\n"
+        "  Assess: range; precision; appropriacy for visual description; paraphrasing; control of word formation/spelling.\n"
+        "  Penalise: repetition; inaccurate word choice/collocation; spelling/formation errors that strain comprehension.\n"
+        "- Grammatical Range and Accuracy (GRA):\n"
+        "  Assess: variety (simple+complex); clause control; tense/aspect accuracy; punctuation.\n"
+        "  Penalise: frequent errors; limited range; faulty punctuation causing difficulty.\n"
+        "Score each criterion INDEPENDENTLY using 0.5 steps.\n"
+        "Use the EXACT criterion names above in the JSON.\n"
+    ),
+    "task2": (
+        "Criterion-specific guidance (use exact names):\n"
+        "- Task Response (TR):\n"
+        "  Assess: addresses ALL parts; clear/consistent position; sufficient development/support of main ideas; relevance.\n"
+        "  Penalise: partially addressed task; unclear/inconsistent position; underdeveloped/unsupported ideas; off-topic content.\n"
+        "- Coherence and Cohesion (CC):\n"
+        "  Assess: logical progression; effective paragraphing; clear referencing/substitution; varied cohesive devices without mechanical feel.\n"
+        "  Penalise: illogical sequence; mechanical/overused devices; unclear referencing; weak or absent paragraphing.\n"
+        "- Lexical Resource (LR):\n"
+        "  Assess: range; precision; appropriacy and style; paraphrasing; control of word formation/spelling.\n"
+        "  Penalise: repetition; inaccurate word choice/collocation; spelling/formation errors that cause difficulty.\n"
+        "- Grammatical Range and Accuracy (GRA):\n"
+        "  Assess: variety (simple+complex); clause control; tense/aspect accuracy; punctuation.\n"
+        "  Penalise: frequent errors; limited range; faulty punctuation causing difficulty.\n"
+        "Score each criterion INDEPENDENTLY using 0.5 steps.\n"
+        "Use the EXACT criterion names above in the JSON.\n"
+    ),
+}
+
+_PROCESS_GUIDANCE = (
+    "Scoring process (follow strictly):\n"
+    "1) Score each criterion independently using the criterion-specific guidance above.\n"
+    "2) Use ONLY 0.5 increments; if uncertain, choose the LOWER band.\n"
+    "3) Compute overall as the arithmetic mean of the four criterion bands, rounded DOWN to the nearest 0.5.\n"
+    "4) Apply word-count penalties and caps as specified.\n"
+)
+
+# Định dạng JSON trả về theo mức chi tiết; mức thấp bỏ hẳn các trường dài để giảm token đầu ra
+_OUTPUT_SPECS: Dict[str, str] = {
+    "scores": (
+        "Return a JSON with: \n"
+        "- overall_band (float, 0.0-9.0)\n"
+        "- criteria (array of {name, band}) with the criteria above\n"
+        "Return ONLY the bands: no comments, feedback, suggestions or rewritten essay."
+    ),
+    "feedback": (
+        "Return a JSON with: \n"
+        "- overall_band (float, 0.0-9.0)\n"
+        "- criteria (array of {name, band, comment}) with the criteria above\n"
+        "- feedback (string) concise summary of strengths and weaknesses\n"
+        "- suggestions (string) concrete, actionable improvements\n"
+        "Do NOT rewrite the essay. Use Vietnamese for feedback and suggestions."
+    ),
+    "full": (
+        "Return a JSON with: \n"
+        "- overall_band (float, 0.0-9.0)\n"
+        "- criteria (array of {name, band, comment}) with the criteria above\n"
+        "- feedback (string) concise summary of strengths and weaknesses\n"
+        "- suggestions (string) concrete, actionable improvements\n"
+        "- improved_version (string) a polished version that preserves meaning and structure\n"
+        "Use Vietnamese for feedback, suggestions, and improved_version."
+    ),
+}
+
+
+def _packed_spec(detail: str) -> str:
+    """Định dạng trả về khi chấm gộp: mảng results, mỗi phần tử là JSON của một bài kèm id."""
+    _, *fields, rule = _OUTPUT_SPECS[detail].splitlines()
+    return (
+        "Several essays follow, each between '=== ESSAY <id> (PROMPT <prompt id>) ===' and "
+        "'=== END <id> ==='. Grade EACH essay independently against its own prompt and word count; "
+        "never compare the essays with each other.\n"
+        "Return a JSON with: \n"
+        "- results (array with exactly one item per essay, in the given order), each item having:\n"
+        "  - id (string) the essay id\n" + "".join(f"  {field}\n" for field in fields) + rule
+    )
+
+
+def _build_instructions(task_type: str, detail: str, packed: bool = False) -> str:
+    # Mức scores không có nhận xét nên bỏ yêu cầu dẫn chứng trong comment
+    policy = STRICT_POLICY.replace(_EVIDENCE_RULE, "") if detail == "scores" else STRICT_POLICY
+    output = _packed_spec(detail) if packed else _OUTPUT_SPECS[detail]
+    return (
+        f"You are an official IELTS Writing examiner. {_DESCRIPTORS[task_type]}\n\n{policy}\n"
+        f"{_CRITERION_GUIDANCE[task_type]}\n{_PROCESS_GUIDANCE}\n{output}"
+    )
+
+
+# Hướng dẫn chấm cho từng (task, mức chi tiết), ghép sẵn một lần khi import
+GRADING_INSTRUCTIONS: Dict[Tuple[str, str], str] = {
+    (t, d): _build_instructions(t, d) for t in ("task1", "task2") for d in GRADE_DETAILS
+}
+# Như trên cho lần gọi chấm gộp nhiều bài (rubric gửi một lần cho cả gói)
+PACKED_INSTRUCTIONS: Dict[Tuple[str, str], str] = {
+    (t, d): _build_instructions(t, d, packed=True) for t in ("task1", "task2") for d in GRADE_DETAILS
+}
+
+
+def grading_instructions(task_type: str, detail: str = "full") -> str:
+    """Hướng dẫn chấm tĩnh của task (task khác "task1" dùng rubric Task 2) theo mức chi tiết."""
+    return GRADING_INSTRUCTIONS[("task1" if task_type == "task1" else "task2", detail)]
+
+
+def packed_instructions(task_type: str, detail: str = "full") -> str:
+    """Hướng dẫn chấm của một gói nhiều bài cùng task, theo mức chi tiết."""
+    return PACKED_INSTRUCTIONS[("task1" if task_type == "task1" else "task2", detail)]
+
+
+def _guidance_slice(task_type: str, name: str) -> str:
+    """Ba dòng (tên, Assess, Penalise) của một tiêu chí trong hướng dẫn theo tiêu chí."""
+    lines = _CRITERION_GUIDANCE[task_type].splitlines(keepends=True)
+    start = next(i for i, line in enumerate(lines) if line.startswith(f"- {name} ("))
+    return "".join(lines[start:start + 3])
+
+
+def _build_criterion_instructions(task_type: str, name: str, detail: str) -> str:
+    if task_type == "task1":
+        task, min_words, main = "Task 1", 150, "Task Achievement"
+    else:
+        task, min_words, main = "Task 2", 250, "Task Response"
+    bands = "".join(f"{band}: {text}.\n" for band, text in zip(range(9, 0, -1), _BAND_SLICES[task_type][name]))
+    requirements = f"{_TASK1_REQUIREMENTS}\n" if name == main and task_type == "task1" else ""
+    cap = f"- If word count is below {min_words}, cap {name} at 5.0.\n" if name == main else ""
+    evidence = "" if detail == "scores" else _EVIDENCE_RULE.replace("each criterion comment", "the comment")
+    output = (
+        "Return a JSON with: band (float, 0.0-9.0)."
+        if detail == "scores"
+        else "Return a JSON with: band (float, 0.0-9.0), comment (string)."
+    )
+    return (
+        f"You are an official IELTS Writing examiner. Evaluate ONLY the {name} criterion of this IELTS Writing {task} "
+        "response using the public band descriptors; the other criteria are graded separately.\n"
+        f"{requirements}{name} band descriptors (public version):\n{bands}"
+        "0: does not attend/attempt or totally memorised response.\n\n"
+        "Scoring policy (be conservative):\n"
+        "- Use only 0.5 increments.\n"
+        "- When uncertain between two adjacent bands, choose the LOWER band.\n"
+        f"{evidence}{cap}\n"
+        f"Criterion-specific guidance:\n{_guidance_slice(task_type, name)}\n{output}"
+    )
+
+
+# Hướng dẫn chấm một tiêu chí cho chế độ song song, theo (task, tiêu chí, mức chi tiết)
+CRITERION_INSTRUCTIONS: Dict[Tuple[str, str, str], str] = {
+    (t, name, d): _build_criterion_instructions(t, name, d)
+    for t in ("task1", "task2")
+    for name in _BAND_SLICES[t]
+    for d in GRADE_DETAILS
+}
+
+
+def criterion_instructions(task_type: str, name: str, detail: str = "full") -> str:
+    """Hướng dẫn chấm riêng một tiêu chí (chỉ phần band descriptors và hướng dẫn của tiêu chí đó)."""
+    return CRITERION_INSTRUCTIONS[("task1" if task_type == "task1" else "task2", name, detail)]
+
+
+def features_block(features: EssayFeatures) -> str:
+    """Số từ kèm các đặc trưng văn bản tính sẵn cục bộ để mô hình tham chiếu."""
+    f = features
+    return (
+        f"WORD_COUNT:{f.word_count}\n"
+        "TEXT_FEATURES (computed locally; supporting evidence only, always judge the essay itself):\n"
+        f"- sentences: {f.sentence_count} (mean length {f.mean_sentence_length:.1f} words, std {f.sentence_length_std:.1f})\n"
+        f"- paragraphs: {f.paragraph_count}\n"
+        f"- type_token_ratio: {f.type_token_ratio:.2f}\n"
+        f"- less_common_vocabulary: {f.lexical_sophistication:.0%} of content words\n"
+        f"- cohesive_devices: {f.cohesive_density:.1f} per 100 words ({f.cohesive_variety} distinct)\n"
+        f"- subordinators_per_sentence: {f.complex_sentence_ratio:.2f}\n"
+        f"- likely_spelling_errors: {f.spelling_error_rate:.1%} of words"
+    )
+
+
+def grading_payload(prompt: str, essay: str, task_type: str, features: EssayFeatures) -> str:
+    """Phần thay đổi theo từng lần chấm: đề, số từ/đặc trưng văn bản và bài viết."""
+    # Thống kê số từ và đặc trưng để mô hình tham chiếu khi áp dụng phạt
+    return (
+        f"PROMPT:\n{prompt}\n\n{features_block(features)}\nTASK_TYPE:{task_type}\n\nESSAY:\n{essay}\n\n"
+        "Please be fair, consistent, and conservative as per the policy."
+    )
+
+
+def packed_payload(items: List[Tuple[str, str, str, EssayFeatures]], task_type: str) -> str:
+    """Phần thay đổi của một lần chấm gộp từ các (id, đề, bài, đặc trưng).
+
+    Mỗi đề chỉ xuất hiện một lần (cả lớp thường làm cùng đề); mỗi bài nằm giữa hai dòng đánh dấu id.
+    """
+    prompt_ids: Dict[str, str] = {}
+    for _, prompt, _, _ in items:
+        prompt_ids.setdefault(prompt, f"P{len(prompt_ids) + 1}")
+    prompts = "\n\n".join(f"PROMPT {pid}:\n{prompt}" for prompt, pid in prompt_ids.items())
+    essays = "\n\n".join(
+        f"=== ESSAY {eid} (PROMPT {prompt_ids[prompt]}) ===\n{features_block(features)}\nTASK_TYPE:{task_type}\n\n"
+        f"ESSAY:\n{essay}\n=== END {eid} ==="
+        for eid, prompt, essay, features in items
+    )
+    return f"{prompts}\n\n{essays}\n\nPlease be fair, consistent, and conservative as per the policy."
+
+
+def summary_contents(prompt: str, essay: str, task_type: str, assessment: str, detail: str = "feedback") -> str:
+    """Prompt viết nhận xét tổng và gợi ý (mức full thêm bản viết lại) sau khi đã chấm riêng từng tiêu chí."""
+    task = "Task 1" if task_type == "task1" else "Task 2"
+    fields = (
+        "- feedback (string) concise summary of strengths and weaknesses\n"
+        "- suggestions (string) concrete, actionable improvements\n"
+    )
+    language = "feedback and suggestions"
+    if detail == "full":
+        fields += "- improved_version (string) a polished version that preserves meaning and structure\n"
+        language = "feedback, suggestions, and improved_version"
+    return (
+        f"You are an official IELTS Writing examiner. The Writing {task} essay below has already been scored "
+        "criterion by criterion (EXAMINER NOTES); do not re-score it. Summarise the assessment for the student.\n"
+        f"Return a JSON with: \n{fields}"
+        f"Use Vietnamese for {language}.\n\n"
+        f"EXAMINER NOTES (JSON):\n{assessment}\n\nPROMPT:\n{prompt}\n\nESSAY:\n{essay}"
+    )
+
+
+def improvement_contents(prompt: str, essay: str, task_type: str, assessment: Optional[str] = None) -> str:
+    """Prompt riêng để viết lại bài đã chấm (không cần band descriptors); kèm nhận xét đã có nếu có."""
+    task = "Task 1" if task_type == "task1" else "Task 2"
+    notes = f"EXAMINER NOTES (JSON):\n{assessment}\n\n" if assessment else ""
+    return (
+        f"You are an experienced IELTS Writing teacher. Rewrite the student's Writing {task} essay below into a "
+        "polished version that preserves its meaning and structure, fixing the weaknesses noted by the examiner "
+        "(if any).\n"
+        "Return a JSON with: improved_version (string). Use Vietnamese for improved_version.\n\n"
+        f"{notes}PROMPT:\n{prompt}\n\nESSAY:\n{essay}"
+    )
@@ -0,0 +1,411 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Optional, Protocol, Tuple
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+_LATENCY_KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+
+class Provider(Protocol):
+    """Backend sinh nội dung mà GeminiClient gọi tới (Gemini thật hoặc backend giả để benchmark).
+
+    Phản hồi chỉ cần có thuộc tính `text` như GenerateContentResponse; `caches` là API
+    cached content của Gemini (None nếu backend không hỗ trợ context cache).
+    """
+
+    name: str
+    caches: object
+
+    def generate_content(self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None): ...
+
+    async def agenerate_content(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ): ...
+
+    async def agenerate_content_stream(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ) -> AsyncIterator: ...
+
+    async def aconnect(self, model: str) -> None: ...
+
+    def close(self) -> None: ...
+
+    async def aclose(self) -> None: ...
+
+
+class GeminiProvider:
+    """Google Gemini qua google-genai, dùng pool kết nối httpx riêng (keep-alive giữa các request)."""
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        api_key: str,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 120.0,
+    ) -> None:
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http = httpx.Client(limits=limits, timeout=timeout)
+        self._ahttp = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(httpx_client=self._http, httpx_async_client=self._ahttp),
+        )
+
+    @property
+    def caches(self):
+        return self.client.caches
+
+    def generate_content(self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def agenerate_content(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ):
+        return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+    async def agenerate_content_stream(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ) -> AsyncIterator:
+        return await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+
+    async def aconnect(self, model: str) -> None:
+        """Mở sẵn kết nối của pool async (DNS, TLS, HTTP/2) bằng một lời gọi nhẹ có xác thực: lấy thông tin model."""
+        await self.client.aio.models.get(model=model)
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        finally:
+            self._http.close()
+
+    async def aclose(self) -> None:
+        try:
+            await self.client.aio.aclose()
+            await self._ahttp.aclose()
+        finally:
+            self.close()
+
+
+def parse_latency(spec: str, seed: Optional[int] = None) -> Callable[[], float]:
+    """Hàm lấy mẫu độ trễ (giây) từ chuỗi cấu hình.
+
+    Dạng hỗ trợ: "fixed:0.8", "uniform:0.3,1.5", "normal:0.8,0.2" (mean, std),
+    "lognormal:-0.3,0.4" (mu, sigma của log giây). Giá trị âm được cắt về 0.
+    """
+    kind, _, raw = (spec or "fixed:0").partition(":")
+    kind = kind.strip().lower()
+    if kind not in _LATENCY_KINDS:
+        raise ValueError(f"Không hỗ trợ phân phối độ trễ {kind!r} (chọn một trong {', '.join(_LATENCY_KINDS)})")
+    try:
+        args = [float(x) for x in raw.split(",") if x.strip()]
+    except ValueError as exc:
+        raise ValueError(f"Tham số độ trễ không hợp lệ: {spec!r}") from exc
+    expected = 1 if kind == "fixed" else 2
+    if len(args) != expected:
+        raise ValueError(f"Phân phối {kind} cần {expected} tham số: {spec!r}")
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    samplers = {
+        "fixed": lambda: args[0],
+        "uniform": lambda: rng.uniform(args[0], args[1]),
+        "normal": lambda: rng.gauss(args[0], args[1]),
+        "lognormal": lambda: rng.lognormvariate(args[0], args[1]),
+    }
+    sample = samplers[kind]
+
+    def draw() -> float:
+        with lock:
+            return max(0.0, sample())
+
+    return draw
+
+
+class _FakeUsage:
+    """usage_metadata giả: ước lượng khoảng 4 ký tự mỗi token."""
+
+    def __init__(self, contents: str, text: str) -> None:
+        self.prompt_token_count = len(contents) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+        self.cached_content_token_count = None
+        self.thoughts_token_count = None
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _FakeResponse:
+    def __init__(self, text: str, usage: Optional[_FakeUsage] = None) -> None:
+        self.text = text
+        self.usage_metadata = usage
+
+
+class _FakeCaches:
+    """API cached content giả trong bộ nhớ (create/update/delete) để chạy context cache offline.
+
+    Cache hết TTL hoặc đã xóa thì request tham chiếu tới nó bị từ chối bằng 404 như Gemini.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._next_id = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+
+    def create(self, model: str, config: Optional[types.CreateCachedContentConfig] = None) -> types.CachedContent:
+        with self._lock:
+            self._next_id += 1
+            name = f"cachedContents/fake-{self._next_id}"
+            instruction = str(getattr(config, "system_instruction", None) or "")
+            self._entries[name] = (instruction, time.time() + _ttl_seconds(config))
+            self.created += 1
+        return types.CachedContent(name=name, model=model, display_name=getattr(config, "display_name", None))
+
+    def update(self, name: str, config: Optional[types.UpdateCachedContentConfig] = None) -> types.CachedContent:
+        with self._lock:
+            instruction = self._get(name)
+            self._entries[name] = (instruction, time.time() + _ttl_seconds(config))
+            self.updated += 1
+        return types.CachedContent(name=name)
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            self._get(name)
+            del self._entries[name]
+            self.deleted += 1
+
+    def instruction(self, name: str) -> str:
+        """Hướng dẫn đã cache của `name` (ghép lại vào prompt khi sinh phản hồi giả)."""
+        with self._lock:
+            return self._get(name)
+
+    def _get(self, name: str) -> str:
+        entry = self._entries.get(name)
+        if entry is None or entry[1] <= time.time():
+            self._entries.pop(name, None)
+            raise errors.ClientError(
+                404, {"error": {"code": 404, "message": f"CachedContent not found: {name}", "status": "NOT_FOUND"}}
+            )
+        return entry[0]
+
+
+def _ttl_seconds(config) -> float:
+    ttl = getattr(config, "ttl", None) or "3600s"
+    return float(str(ttl).rstrip("s"))
+
+
+_FAKE_TASK1 = (
+    "The bar chart below shows the number of visitors to three museums in London between 2010 and 2020. "
+    "Summarise the information by selecting and reporting the main features, and make comparisons where relevant."
+)
+_FAKE_TASK2 = (
+    "Some people believe that university education should be free for all students, while others think "
+    "students should pay for their own studies. Discuss both views and give your own opinion."
+)
+_FAKE_CHART = {
+    "chart_type": "bar",
+    "title": "Museum visitors in London (millions)",
+    "ylabel": "Visitors (millions)",
+    "categories": ["2010", "2015", "2020"],
+    "series": [
+        {"label": "British Museum", "values": [5.8, 6.8, 1.3]},
+        {"label": "Science Museum", "values": [2.7, 3.2, 0.8]},
+        {"label": "Tate Modern", "values": [5.1, 4.7, 1.4]},
+    ],
+}
+_FAKE_COMMENT = "Relevant ideas with some imprecise wording, e.g. 'many people think'."
+# Một bài trong prompt chấm gộp: (id, phần đặc trưng + bài viết)
+_PACK_BLOCK = re.compile(r"^=== ESSAY (\S+) \(PROMPT \S+\) ===\n(.*?)\n=== END \1 ===$", re.S | re.M)
+
+
+class FakeProvider:
+    """Backend giả, tất định theo nội dung request: trả JSON chấm/biểu đồ mẫu với độ trễ và tỉ lệ lỗi cấu hình được.
+
+    Dùng cho benchmark/load test không tốn quota. Loại phản hồi được chọn theo response schema
+    (chấm bài, chấm gộp nhiều bài, chấm từng tiêu chí, dữ liệu biểu đồ, đề Task 1 kèm biểu đồ) hoặc
+    nội dung prompt (đề Task 1/Task 2).
+    Lỗi giả là ServerError 503 nên đi qua đúng đường retry/circuit breaker như lỗi thật.
+    `caches` là API cached content giả trong bộ nhớ, nên context cache chạy được offline.
+    output_tps > 0 cộng thêm thời gian sinh token đầu ra (token/giây) như model thật, để phản hồi
+    dài (vd. có bản viết lại) chậm hơn tương ứng.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        seed: Optional[int] = 0,
+        stream_chunk: int = 64,
+        output_tps: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.output_tps = output_tps
+        self.stream_chunk = max(1, stream_chunk)
+        self._delay = parse_latency(latency, seed)
+        self._errors = random.Random(None if seed is None else seed + 1)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.caches = _FakeCaches()
+
+    def generate_content(self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None):
+        delay = self._begin()
+        text = self._respond(contents, config)
+        time.sleep(delay + self._decode_time(text))
+        return _FakeResponse(text, _FakeUsage(str(contents), text))
+
+    async def agenerate_content(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ):
+        delay = self._begin()
+        text = self._respond(contents, config)
+        await asyncio.sleep(delay + self._decode_time(text))
+        return _FakeResponse(text, _FakeUsage(str(contents), text))
+
+    async def agenerate_content_stream(
+        self, model: str, contents: str, config: Optional[types.GenerateContentConfig] = None
+    ) -> AsyncIterator:
+        text = self._respond(contents, config)
+        size = self.stream_chunk
+
+        async def chunks():
+            # Như SDK: request chỉ thực sự gửi đi (và có thể lỗi) khi đọc chunk đầu tiên
+            delay = self._begin() + self._decode_time(text)
+            pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+            step = delay / len(pieces)
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(step)
+                # Như Gemini: usage của cả lượt sinh đi kèm chunk cuối
+                last = i == len(pieces) - 1
+                yield _FakeResponse(piece, _FakeUsage(str(contents), text) if last else None)
+
+        return chunks()
+
+    def stats(self) -> dict:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "output_tps": self.output_tps,
+            "calls": self.calls,
+            "failures": self.failures,
+        }
+
+    async def aconnect(self, model: str) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    def _begin(self) -> float:
+        """Đếm lời gọi, lấy mẫu độ trễ và ném lỗi 503 giả theo error_rate."""
+        with self._lock:
+            self.calls += 1
+            fail = self.error_rate > 0 and self._errors.random() < self.error_rate
+            if fail:
+                self.failures += 1
+        if fail:
+            raise errors.ServerError(
+                503, {"error": {"code": 503, "message": "Fake provider overloaded", "status": "UNAVAILABLE"}}
+            )
+        return self._delay()
+
+    def _decode_time(self, text: str) -> float:
+        if self.output_tps <= 0:
+            return 0.0
+        return (len(text) // 4 + 1) / self.output_tps
+
+    def _respond(self, contents: str, config: Optional[types.GenerateContentConfig]) -> str:
+        text = str(contents)
+        cache_name = getattr(config, "cached_content", None)
+        if cache_name:
+            # Như Gemini: hướng dẫn đã cache đứng trước phần nội dung của request
+            text = f"{self.caches.instruction(cache_name)}\n\n{text}"
+        schema = getattr(config, "response_json_schema", None) or {}
+        props = schema.get("properties", {}) if isinstance(schema, dict) else {}
+        if "criteria" in props:
+            return json.dumps(_fake_grade(text, props))
+        if "results" in props:
+            return json.dumps({"results": _fake_pack(text, props["results"].get("items", {}).get("properties"))})
+        if "band" in props:
+            return json.dumps(_fake_criterion(text, props))
+        if "feedback" in props:
+            # Nhận xét tổng viết sau khi đã chấm song song từng tiêu chí
+            return json.dumps(_fake_grade(text, props))
+        if "improved_version" in props:
+            return json.dumps({"improved_version": _fake_rewrite(text)})
+        if "task1" in props:
+            return json.dumps({"task1": _FAKE_TASK1, "chart_data": _FAKE_CHART})
+        if "chart_type" in props:
+            return json.dumps(_FAKE_CHART)
+        return _FAKE_TASK1 if "Task 1" in text else _FAKE_TASK2
+
+
+def _fake_grade(contents: str, props: Optional[dict] = None) -> dict:
+    """Kết quả chấm mẫu; band suy ra từ hash nội dung nên cùng bài luôn cùng điểm.
+
+    Chỉ gồm các trường có trong schema (theo mức chi tiết), để số token đầu ra giống model thật.
+    """
+    digest = hashlib.blake2b(contents.encode("utf-8"), digest_size=8).digest()
+    first = "Task Achievement" if "Writing Task 1" in contents else "Task Response"
+    names = [first, "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+    props = props or {"criteria": {}, "overall_band": {}, "feedback": {}, "suggestions": {}, "improved_version": {}}
+    item_props = props.get("criteria", {}).get("items", {}).get("properties", {"comment": {}})
+    criteria = [
+        {"name": name, "band": 5.0 + (digest[i] % 7) * 0.5, "comment": _FAKE_COMMENT}
+        for i, name in enumerate(names)
+    ]
+    overall = sum(c["band"] for c in criteria) / len(criteria)
+    if "comment" not in item_props:
+        criteria = [{"name": c["name"], "band": c["band"]} for c in criteria]
+    result = {
+        "criteria": criteria,
+        "overall_band": overall,
+        "feedback": "The essay answers the question with a clear position but needs better-developed support.",
+        "suggestions": "Extend each main idea with a specific example and vary sentence openings.",
+        "improved_version": _fake_rewrite(contents),
+    }
+    return {key: value for key, value in result.items() if key in props}
+
+
+def _fake_criterion(contents: str, props: dict) -> dict:
+    """Band mẫu của một tiêu chí (chế độ chấm song song), tất định theo nội dung request."""
+    digest = hashlib.blake2b(contents.encode("utf-8"), digest_size=8).digest()
+    result = {"band": 5.0 + (digest[0] % 7) * 0.5, "comment": _FAKE_COMMENT}
+    return {key: value for key, value in result.items() if key in props}
+
+
+def _fake_pack(contents: str, props: Optional[dict] = None) -> list:
+    """Kết quả chấm gộp mẫu: mỗi bài giữa hai dòng đánh dấu id được chấm như một lần gọi riêng."""
+    task1 = "Writing Task 1" in contents
+    results = []
+    for eid, block in _PACK_BLOCK.findall(contents):
+        # Band theo riêng nội dung bài; tên tiêu chí đầu theo rubric của cả gói
+        result = _fake_grade(("Writing Task 1\n" if task1 else "") + block, props)
+        results.append({"id": eid, **result})
+    return results
+
+
+def _fake_rewrite(contents: str) -> str:
+    """Bản viết lại giả dài bằng bài gốc (như model thật viết lại cả bài)."""
+    essay = contents.rsplit("ESSAY:\n", 1)[-1].split("\n\nPlease be fair", 1)[0]
+    return essay.strip() or "University education benefits society as a whole, so ..."
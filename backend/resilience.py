@@ -0,0 +1,363 @@
+import asyncio
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+import httpx
+from google.genai import errors
+
+logger = logging.getLogger(__name__)
+
+_RETRYABLE_CODES = (429, 500, 502, 503, 504)
+_RETRY_DELAY_RE = re.compile(r"^([0-9.]+)s$")
+# Ước lượng token đầu ra cho một lần gọi khi tính vào quota tokens/phút (chỉnh lại theo usage thực tế)
+_OUTPUT_TOKEN_ALLOWANCE = 1024
+
+
+class UpstreamUnavailable(Exception):
+    """Gemini tạm thời không phục vụ được (quá tải, lỗi 5xx, circuit breaker đang mở)."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after = max(1.0, retry_after)
+
+
+class RateLimited(UpstreamUnavailable):
+    """Vượt quota requests/tokens mỗi phút (cục bộ hoặc do Gemini trả 429)."""
+
+    status_code = 429
+
+
+class CircuitOpen(UpstreamUnavailable):
+    """Circuit breaker đang mở sau nhiều lỗi liên tiếp: trả lỗi ngay, không gọi upstream."""
+
+
+def estimate_tokens(contents: str) -> int:
+    """Ước lượng token của một lần gọi (~4 ký tự/token cho đầu vào + phần dành cho đầu ra)."""
+    return len(contents or "") // 4 + _OUTPUT_TOKEN_ALLOWANCE
+
+
+def usage_tokens(resp: Any) -> Optional[int]:
+    """Tổng token thực tế từ usage_metadata của response (nếu SDK trả về)."""
+    usage = getattr(resp, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None) if usage is not None else None
+    return int(total) if total else None
+
+
+def _error_code(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, errors.APIError):
+        return exc.code
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429/5xx và lỗi mạng/timeout là lỗi tạm thời; lỗi 4xx còn lại thì thử lại cũng vô ích."""
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return _error_code(exc) in _RETRYABLE_CODES
+
+
+def retry_hint(exc: BaseException) -> Optional[float]:
+    """Thời gian chờ upstream gợi ý: header Retry-After hoặc RetryInfo.retryDelay trong lỗi 429."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        items = (details.get("error") or details).get("details") or []
+        for item in items if isinstance(items, list) else []:
+            match = _RETRY_DELAY_RE.match(str(item.get("retryDelay", ""))) if isinstance(item, dict) else None
+            if match:
+                return float(match.group(1))
+    return None
+
+
+class RateLimiter:
+    """Token bucket cho requests/phút và tokens/phút, trạng thái lưu trong SQLite.
+
+    Với path là file, mọi worker uvicorn (kể cả khác tiến trình) cùng rút từ một bucket nên
+    tổng lưu lượng không vượt quota của API key. Mặc định ":memory:" chỉ giới hạn trong tiến trình.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, path: str = ":memory:") -> None:
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.waits = 0
+
+    def _buckets(self, scope: str, tokens: int) -> Tuple[Tuple[str, float, float], ...]:
+        """(tên bucket, dung lượng/phút, lượng cần rút) cho các giới hạn đang bật."""
+        buckets = []
+        if self.requests_per_minute:
+            buckets.append((f"{scope}:requests", float(self.requests_per_minute), 1.0))
+        if self.tokens_per_minute:
+            # Một lần gọi lớn hơn cả quota vẫn phải đi được, chỉ là chờ bucket đầy
+            cost = float(min(tokens, self.tokens_per_minute))
+            buckets.append((f"{scope}:tokens", float(self.tokens_per_minute), cost))
+        return tuple(buckets)
+
+    def try_acquire(self, scope: str, tokens: int = 0) -> float:
+        """Rút 1 request và `tokens` token nếu đủ; trả về 0, hoặc số giây cần chờ (không rút gì)."""
+        buckets = self._buckets(scope, tokens)
+        if not buckets:
+            return 0.0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                wait = 0.0
+                for name, capacity, cost in buckets:
+                    row = self._conn.execute(
+                        "SELECT level, updated FROM rate_buckets WHERE name = ?", (name,)
+                    ).fetchone()
+                    level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60.0)
+                    levels.append(level)
+                    if level < cost:
+                        wait = max(wait, (cost - level) * 60.0 / capacity)
+                if wait == 0.0:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO rate_buckets(name, level, updated) VALUES (?, ?, ?)",
+                        [(b[0], level - b[2], now) for b, level in zip(buckets, levels)],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if wait:
+            self.waits += 1
+        return wait
+
+    def adjust(self, scope: str, delta_tokens: int) -> None:
+        """Bù chênh lệch giữa token ước lượng và token thực tế sau khi gọi xong."""
+        if not self.tokens_per_minute or not delta_tokens:
+            return
+        name = f"{scope}:tokens"
+        with self._lock:
+            self._conn.execute(
+                "UPDATE rate_buckets SET level = MIN(?, level - ?) WHERE name = ?",
+                (float(self.tokens_per_minute), float(delta_tokens), name),
+            )
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "waits": self.waits,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CircuitBreaker:
+    """Mở mạch sau `failure_threshold` lỗi upstream liên tiếp, thử lại một request sau `reset_timeout` giây."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self) -> None:
+        """Như before_call nhưng không nhận lượt thăm dò (chặn sớm trước khi rút quota)."""
+        self._gate(claim=False)
+
+    def before_call(self) -> bool:
+        """Chặn lời gọi khi mạch mở; ở trạng thái half-open chỉ cho một request thăm dò đi qua.
+
+        Trả về True nếu lời gọi này là request thăm dò: người gọi phải gọi end_probe() khi lời gọi
+        kết thúc theo bất kỳ cách nào (kể cả bị hủy), nếu không mạch sẽ mở mãi.
+        """
+        return self._gate(claim=True)
+
+    def end_probe(self) -> None:
+        """Trả lượt thăm dò nếu request thăm dò kết thúc mà chưa ghi nhận thành công/lỗi (bị hủy, lỗi khác)."""
+        with self._lock:
+            self._probing = False
+
+    def _gate(self, claim: bool) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining <= 0 and not self._probing:
+                if claim:
+                    self._probing = True
+                return claim
+            self.rejected += 1
+        raise CircuitOpen("Gemini đang gặp sự cố, vui lòng thử lại sau", retry_after=max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class Resilience:
+    """Bọc lời gọi Gemini: giới hạn quota, retry backoff có jitter với lỗi tạm thời và circuit breaker.
+
+    Hết lượt retry (hoặc chờ quota quá `max_wait`) thì ném RateLimited/UpstreamUnavailable kèm
+    retry_after để API trả 429/503 cho client thay vì 500.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        limiter: Optional[RateLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_wait: float = 20.0,
+    ) -> None:
+        self.scope = scope
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self.retries = 0
+        self.exhausted = 0
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: tránh các worker cùng thử lại một lúc
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _admit(self, tokens: int, waited: float) -> float:
+        """Số giây cần chờ quota (0 nếu đã rút được); quá max_wait thì ném RateLimited."""
+        if self.limiter is None:
+            return 0.0
+        wait = self.limiter.try_acquire(self.scope, tokens)
+        if wait and waited + wait > self.max_wait:
+            raise RateLimited("Đã vượt giới hạn gọi Gemini mỗi phút, vui lòng thử lại sau", retry_after=wait)
+        return wait
+
+    def _on_error(self, exc: Exception, attempt: int) -> float:
+        """Ghi nhận lỗi; trả về thời gian chờ trước lần thử kế tiếp hoặc ném lỗi cuối cùng."""
+        if isinstance(exc, UpstreamUnavailable):
+            raise exc
+        if not is_retryable(exc):
+            # Upstream vẫn trả lời (vd. 400): không phải sự cố, không tính vào breaker
+            self.breaker.record_success()
+            raise exc
+        self.breaker.record_failure()
+        hint = retry_hint(exc)
+        delay = max(self._backoff(attempt), hint or 0.0)
+        if attempt + 1 >= self.max_attempts or delay > self.max_delay * 2:
+            self.exhausted += 1
+            retry_after = hint or self.breaker.reset_timeout
+            if _error_code(exc) == 429:
+                raise RateLimited("Gemini báo vượt quota, vui lòng thử lại sau", retry_after=retry_after) from exc
+            raise UpstreamUnavailable("Gemini tạm thời không phản hồi, vui lòng thử lại sau", retry_after=retry_after) from exc
+        self.retries += 1
+        logger.warning("Gọi Gemini lỗi (%s), thử lại sau %.2fs", exc, delay)
+        return delay
+
+    def _record_usage(self, estimated: int, result: Any) -> None:
+        actual = usage_tokens(result)
+        if self.limiter is not None and actual is not None:
+            self.limiter.adjust(self.scope, actual - estimated)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        waited = 0.0
+        attempt = 0
+        while True:
+            # Rút quota trước khi nhận lượt thăm dò: chờ quota/bị từ chối không giữ lượt của breaker
+            self.breaker.check()
+            wait = self._admit(tokens, waited)
+            if wait:
+                waited += wait
+                time.sleep(wait)
+                continue
+            probe = self.breaker.before_call()
+            try:
+                result = fn()
+                self.breaker.record_success()
+            except Exception as exc:  # noqa: BLE001 - phân loại trong _on_error
+                delay = self._on_error(exc, attempt)
+            else:
+                self._record_usage(tokens, result)
+                return result
+            finally:
+                if probe:
+                    self.breaker.end_probe()
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        waited = 0.0
+        attempt = 0
+        while True:
+            self.breaker.check()
+            wait = await asyncio.to_thread(self._admit, tokens, waited) if self.limiter is not None else 0.0
+            if wait:
+                waited += wait
+                await asyncio.sleep(wait)
+                continue
+            probe = self.breaker.before_call()
+            try:
+                result = await fn()
+                self.breaker.record_success()
+            except Exception as exc:  # noqa: BLE001 - phân loại trong _on_error
+                delay = self._on_error(exc, attempt)
+            else:
+                self._record_usage(tokens, result)
+                return result
+            finally:
+                # Bị hủy (client ngắt SSE, đóng socket bài nháp, tắt server) thì trả lượt thăm dò
+                if probe:
+                    self.breaker.end_probe()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        stats = {"retries": self.retries, "exhausted": self.exhausted, "breaker": self.breaker.stats()}
+        if self.limiter is not None:
+            stats["rate_limit"] = self.limiter.stats()
+        return stats
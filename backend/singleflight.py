@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class _Call:
+    """Một lời gọi upstream đang chạy mà các request trùng khóa sẽ chờ chung."""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Flight:
+    """Lời gọi async đang chạy (task riêng) và số caller đang chờ nó."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Future[Any]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Gộp các lời gọi trùng khóa đang chạy đồng thời thành một lời gọi upstream duy nhất.
+
+    Request đầu tiên (leader) thực hiện lời gọi; các request cùng khóa đến trong lúc đó
+    chờ và nhận chung kết quả (hoặc lỗi). Hỗ trợ cả nhánh sync (thread) và async (event loop).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            # Lời gọi chung chạy thành task riêng mà mọi caller (kể cả leader) cùng chờ
+            flight = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda task: self._landed(key, flight))
+            self._flights[key] = flight
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            # shield: caller bị hủy (client ngắt kết nối...) chỉ hủy chính nó, các caller khác vẫn nhận kết quả
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Không còn ai chờ: hủy lời gọi, caller tới sau bắt đầu lời gọi mới
+                self._landed(key, flight)
+                flight.task.cancel()
+
+    def _landed(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Tránh cảnh báo "exception was never retrieved" khi mọi caller đã rời đi
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls) + len(self._flights),
+        }
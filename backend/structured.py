@@ -0,0 +1,113 @@
+import copy
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+M = TypeVar("M", bound=BaseModel)
+
+_OUTCOMES = ("ok", "invalid", "repaired", "failed")
+
+
+class OutputValidationError(ValueError):
+    """Phản hồi JSON của model không đúng schema hoặc ràng buộc nghiệp vụ.
+
+    syntax=True khi không đọc được JSON (rỗng, bị cắt giữa chừng...): sửa không có ý nghĩa,
+    nên gửi lại request gốc thay vì gửi prompt sửa.
+    """
+
+    def __init__(self, message: str, syntax: bool = False) -> None:
+        super().__init__(message)
+        self.syntax = syntax
+
+
+def llm_schema(model: Type[BaseModel], exclude: Iterable[str] = (), order: Optional[Sequence[str]] = None) -> dict:
+    """JSON schema gửi cho model (response_json_schema) suy ra từ một Pydantic model.
+
+    $ref được thay bằng định nghĩa tương ứng, bỏ title/default; `exclude` loại các trường chỉ dùng
+    nội bộ, `order` sắp lại thứ tự trường (model sinh JSON theo thứ tự này).
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def inline(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(copy.deepcopy(defs[node["$ref"].rsplit("/", 1)[-1]]))
+            return {k: inline(v) for k, v in node.items() if k not in ("title", "default")}
+        if isinstance(node, list):
+            return [inline(v) for v in node]
+        return node
+
+    schema = inline(schema)
+    excluded = set(exclude)
+    props = {k: v for k, v in schema["properties"].items() if k not in excluded}
+    if order:
+        props = {k: props[k] for k in [*order, *props] if k in props}
+    schema["properties"] = props
+    schema["required"] = [k for k in props if k in schema.get("required", [])]
+    return schema
+
+
+def strip_code_fence(text: str) -> str:
+    """Bỏ ```json ... ``` nếu model vẫn bọc JSON trong code block."""
+    stripped = (text or "").strip()
+    if stripped.startswith("```"):
+        stripped = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+        if stripped.rstrip().endswith("```"):
+            stripped = stripped.rstrip()[:-3]
+    return stripped
+
+
+def parse_model(text: str, model: Type[M]) -> M:
+    """Đọc và kiểm tra JSON trong một lượt bằng parser JSON của pydantic-core."""
+    try:
+        return model.model_validate_json(strip_code_fence(text))
+    except ValidationError as exc:
+        errors = exc.errors(include_url=False)
+        syntax = any(e.get("type") == "json_invalid" for e in errors)
+        raise OutputValidationError(_summarize(errors), syntax=syntax) from exc
+
+
+def _summarize(errors: list) -> str:
+    parts = []
+    for error in errors[:5]:
+        loc = ".".join(str(p) for p in error.get("loc", ())) or "(root)"
+        parts.append(f"{loc}: {error.get('msg', '')}")
+    return "; ".join(parts)
+
+
+def repair_contents(text: str, error: str, hint: str = "") -> str:
+    """Prompt sửa: đưa lại phản hồi lỗi và lý do để model trả về JSON hợp lệ."""
+    return (
+        "Your previous JSON response failed validation.\n"
+        f"ERRORS: {error}\n"
+        + (f"{hint}\n" if hint else "")
+        + "Return ONLY the corrected JSON object conforming to the required schema. Keep every valid value "
+        "(bands, comments, texts) unchanged; fix only what the errors mention.\n\n"
+        f"PREVIOUS RESPONSE:\n{text}"
+    )
+
+
+class ParseCounters:
+    """Đếm kết quả parse phản hồi có cấu trúc theo từng loại (grade, chart...)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, outcome: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(kind, dict.fromkeys(_OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for kind, counts in self._counts.items():
+                total = counts["ok"] + counts["invalid"]
+                out[kind] = {
+                    **counts,
+                    "failure_rate": round(counts["invalid"] / total, 4) if total else 0.0,
+                }
+            return out
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Set
+
+from .models import GenerateTasksResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _prompt_key(item: GenerateTasksResponse) -> str:
+    """Khóa khử trùng lặp: hash của đề Task 1 + Task 2 đã chuẩn hóa khoảng trắng/chữ hoa."""
+    norm = " ".join(f"{item.task1}\n{item.task2}".lower().split())
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+class TaskPool:
+    """Kho đề sinh sẵn (kèm biểu đồ đã vẽ) để /api/generate_tasks trả về ngay.
+
+    Worker nền giữ số đề trong kho không thấp hơn low_water: khi xuống dưới mốc này,
+    worker sinh bù (tối đa refill_concurrency lượt song song) cho tới khi đầy max_size.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 20,
+        low_water: int = 5,
+        refill_concurrency: int = 2,
+        dedupe: bool = True,
+        persist_path: Optional[str] = None,
+        retry_delay: float = 5.0,
+    ) -> None:
+        self.max_size = max(1, max_size)
+        self.low_water = min(max(0, low_water), self.max_size)
+        self.refill_concurrency = max(1, refill_concurrency)
+        self.dedupe = dedupe
+        self.persist_path = persist_path
+        self.retry_delay = retry_delay
+        self._items: Deque[GenerateTasksResponse] = deque()
+        # Nhớ cả các đề đã phát gần đây để không sinh lại y hệt
+        self._recent_keys: Deque[str] = deque(maxlen=self.max_size * 4)
+        self._keys: Set[str] = set()
+        self._need_refill = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def pop(self) -> Optional[GenerateTasksResponse]:
+        """Lấy một đề sẵn có; trả về None (miss) nếu kho rỗng."""
+        item = self._items.popleft() if self._items else None
+        if item is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        if len(self._items) < self.low_water or item is None:
+            self._need_refill.set()
+        return item
+
+    def add(self, item: GenerateTasksResponse) -> bool:
+        """Thêm đề vào kho; bỏ qua nếu kho đầy hoặc trùng đề gần đây."""
+        if len(self._items) >= self.max_size:
+            return False
+        if self.dedupe:
+            key = _prompt_key(item)
+            if key in self._keys:
+                self.duplicates += 1
+                return False
+            if len(self._recent_keys) == self._recent_keys.maxlen:
+                self._keys.discard(self._recent_keys[0])
+            self._recent_keys.append(key)
+            self._keys.add(key)
+        self._items.append(item)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "low_water": self.low_water,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+        }
+
+    def start(self, generate: Callable[[], Awaitable[GenerateTasksResponse]]) -> None:
+        """Nạp kho từ đĩa (nếu có) và chạy worker sinh bù trên event loop hiện tại."""
+        self.load()
+        self._need_refill.set()
+        self._worker = asyncio.create_task(self._refill_loop(generate))
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self.save()
+
+    async def _refill_loop(self, generate: Callable[[], Awaitable[GenerateTasksResponse]]) -> None:
+        while True:
+            await self._need_refill.wait()
+            deficit = self.max_size - len(self._items)
+            if deficit <= 0:
+                self._need_refill.clear()
+                continue
+            batch = min(deficit, self.refill_concurrency)
+            results = await asyncio.gather(*(generate() for _ in range(batch)), return_exceptions=True)
+            added = 0
+            for res in results:
+                if isinstance(res, BaseException):
+                    self.errors += 1
+                    logger.warning("Sinh đề cho kho thất bại: %s", res)
+                    continue
+                self.generated += 1
+                added += int(self.add(res))
+            if added == 0:
+                # Upstream lỗi hoặc chỉ toàn đề trùng: chờ rồi thử lại thay vì gọi dồn dập
+                await asyncio.sleep(self.retry_delay)
+
+    def load(self) -> None:
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as fh:
+                raw = json.load(fh)
+            for entry in raw:
+                self.add(GenerateTasksResponse(**entry))
+        except Exception as exc:  # noqa: BLE001 - kho hỏng thì bắt đầu lại từ rỗng
+            logger.warning("Không đọc được kho đề %s: %s", self.persist_path, exc)
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump([item.model_dump() for item in self._items], fh, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as exc:  # noqa: BLE001 - best effort khi shutdown
+            logger.warning("Không ghi được kho đề %s: %s", self.persist_path, exc)
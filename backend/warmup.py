@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from . import charts
+from .clients import ClientRegistry
+from .gemini_client import quick_grade, warm_up_requests
+
+logger = logging.getLogger(__name__)
+
+# Thời gian tối đa chờ mở kết nối tới upstream
+_CONNECT_TIMEOUT = 30.0
+
+# Bài mẫu ngắn cho bước làm nóng phân tích/dựng payload (đủ nhiều đoạn và từ nối để đi qua mọi nhánh)
+_SAMPLE_ESSAY = (
+    "Some people believe that technology has made our lives more complicated. However, I would argue that "
+    "its benefits clearly outweigh the drawbacks.\n\n"
+    "Firstly, modern devices allow people to communicate instantly, which saves time and money. For example, "
+    "families living in different countries can talk every day.\n\n"
+    "On the other hand, although some workers feel overwhelmed by constant notifications, this problem can "
+    "be solved by better habits.\n\n"
+    "In conclusion, technology simplifies daily life as long as it is used sensibly."
+)
+
+
+class WarmUp:
+    """Trạng thái làm nóng lúc khởi động: thời gian (ms) của từng bước, None nếu bước đó lỗi."""
+
+    def __init__(self) -> None:
+        self.done = False
+        self.steps: Dict[str, Optional[float]] = {}
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def run(self, clients: ClientRegistry, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Chạy lần lượt các bước (gọi trong thread nền); lỗi một bước chỉ được ghi log, không dừng bước sau.
+
+        `loop` là event loop của server: pool kết nối async gắn với loop đó nên bước mở kết nối chạy trên
+        loop này (bỏ qua nếu không có).
+        """
+        steps: Tuple[Tuple[str, Callable[[], None]], ...] = (
+            ("charts", lambda: _warm_charts(clients)),
+            ("analysis", lambda: quick_grade(_SAMPLE_ESSAY)),
+            ("client", clients.get),
+            ("connection", lambda: _warm_connection(clients, loop)),
+            ("requests", lambda: warm_up_requests(_SAMPLE_ESSAY)),
+        )
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as exc:  # noqa: BLE001 - bước lỗi sẽ được nạp lại ở request đầu tiên cần tới
+                logger.warning("Làm nóng %s lỗi: %s", name, exc)
+                self.steps[name] = None
+                continue
+            self.steps[name] = round((time.perf_counter() - started) * 1000, 1)
+        self.finished = time.monotonic()
+        self.done = True
+
+    def stats(self) -> dict:
+        end = self.finished if self.finished is not None else time.monotonic()
+        return {"done": self.done, "elapsed_ms": round((end - self.started) * 1000, 1), "steps_ms": dict(self.steps)}
+
+
+def _warm_connection(clients: ClientRegistry, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Một lời gọi có xác thực qua pool async để request đầu tiên dùng lại kết nối đã mở (backend giả: không làm gì)."""
+    if loop is None:
+        return
+    future = asyncio.run_coroutine_threadsafe(clients.get().aconnect(), loop)
+    try:
+        future.result(timeout=_CONNECT_TIMEOUT)
+    finally:
+        # Quá hạn thì hủy lời gọi trên loop để không còn treo khi đóng client lúc tắt server
+        future.cancel()
+
+
+def _warm_charts(clients: ClientRegistry) -> None:
+    """Khởi động pool vẽ (mỗi worker tự import matplotlib và nạp font); vẽ trong tiến trình thì nạp ngay tại đây."""
+    renderer = clients.chart_renderer
+    if renderer is None:
+        return
+    if renderer.workers:
+        renderer.start()
+    else:
+        charts.warm_up()
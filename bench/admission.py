@@ -0,0 +1,103 @@
+"""Benchmark điều phối request gọi LLM khi có đợt tải dồn: độ trễ của chấm tương tác khi bị chấm hàng loạt
+và sinh đề chen vào, so giữa một hàng đợi chung (FIFO) và hàng đợi theo lớp ưu tiên, cùng số request bị từ
+chối (429). Thời gian giữ lượt của mỗi lời gọi được giả lập bằng sleep, không gọi model.
+
+    python -m bench.admission
+    python -m bench.admission --concurrency 8 --interactive 200 --batch 400 --service fixed:0.8
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+from backend.admission import AdmissionScheduler, Overloaded
+from backend.providers import parse_latency
+
+from .common import latency_summary, write_results
+
+
+async def _scenario(args: argparse.Namespace, prioritized: bool) -> Dict[str, dict]:
+    scheduler = AdmissionScheduler(
+        args.concurrency,
+        max_queue=args.max_queue,
+        max_wait={"interactive": args.max_wait, "generate": args.max_wait * 2, "batch": 0},
+    )
+    rng = random.Random(args.seed)
+    service = parse_latency(args.service, seed=args.seed)
+    samples: Dict[str, List[float]] = {"interactive": [], "generate": [], "batch": []}
+    shed: Dict[str, int] = {name: 0 for name in samples}
+
+    async def request(kind: str, client: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        # FIFO: mọi yêu cầu chung một lớp, không ưu tiên
+        priority = kind if prioritized else "batch"
+        start = time.perf_counter()
+        try:
+            async with scheduler.slot(priority, client, shed=kind != "batch"):
+                await asyncio.sleep(service())
+        except Overloaded:
+            shed[kind] += 1
+            return
+        samples[kind].append(time.perf_counter() - start)
+
+    tasks = []
+    # Chấm hàng loạt đổ vào ngay từ đầu, chấm tương tác và sinh đề tới đều trong suốt đợt tải
+    for n in range(args.batch):
+        tasks.append(request("batch", f"job-{n % 4}", 0.0))
+    for n in range(args.interactive):
+        tasks.append(request("interactive", f"user-{n % args.users}", rng.uniform(0, args.duration)))
+    for n in range(args.generate):
+        tasks.append(request("generate", f"user-{n % args.users}", rng.uniform(0, args.duration)))
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    results = {}
+    for kind, values in samples.items():
+        results[kind] = {
+            "iterations": len(values),
+            "latency_ms": latency_summary(values),
+            "shed": shed[kind],
+        }
+    results["total"] = {"seconds": round(elapsed, 2), "stats": scheduler.stats()}
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Số request gọi LLM chạy đồng thời")
+    parser.add_argument("--interactive", type=int, default=120, help="Số lượt chấm tương tác")
+    parser.add_argument("--generate", type=int, default=30, help="Số lượt sinh đề")
+    parser.add_argument("--batch", type=int, default=200, help="Số bài chấm hàng loạt/chạy nền")
+    parser.add_argument("--users", type=int, default=40, help="Số người học khác nhau")
+    parser.add_argument("--duration", type=float, default=10.0, help="Khoảng thời gian (giây) các yêu cầu tương tác tới")
+    parser.add_argument("--service", default="lognormal:-0.7,0.3", help="Thời gian giữ lượt mỗi lời gọi")
+    parser.add_argument("--max-queue", type=int, default=100, help="Giới hạn hàng đợi mỗi lớp")
+    parser.add_argument("--max-wait", type=float, default=15.0, help="Hạn chờ của chấm tương tác (giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/admission-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    for name, prioritized in (("fifo", False), ("priority", True)):
+        results[name] = asyncio.run(_scenario(args, prioritized))
+        for kind in ("interactive", "generate", "batch"):
+            row = results[name][kind]
+            lat = row["latency_ms"]
+            print(
+                f"{name:<9} {kind:<12} p50={lat['p50']}ms p95={lat['p95']}ms xong={row['iterations']} 429={row['shed']}",
+                flush=True,
+            )
+
+    names = (
+        "concurrency", "interactive", "generate", "batch", "users", "duration", "service", "max_queue", "max_wait", "seed"
+    )
+    config = {k: getattr(args, k) for k in names}
+    path = write_results("admission", {"config": config, "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Benchmark vẽ biểu đồ theo từng loại (line, bar, grouped bar, pie, table): vẽ ngay trong tiến trình,
+qua pool tiến trình tuần tự và qua pool với nhiều request đồng thời.
+
+    python -m bench.charts
+    python -m bench.charts --workers 4 --concurrency 8 --iterations 40 --dpi 150
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from backend.charts import ChartRenderer, render_chart
+
+from .common import latency_summary, rss_mb, write_results
+from .micro import CHARTS, measure
+
+
+def _concurrent(renderer: ChartRenderer, chart: dict, concurrency: int, iterations: int) -> dict:
+    """Gửi iterations lần vẽ từ concurrency thread cùng lúc (như nhiều request sinh đề đồng thời)."""
+    samples: List[float] = []
+
+    def one(_: int) -> None:
+        start = time.perf_counter()
+        if renderer.render(chart) is None:
+            raise RuntimeError("Pool không vẽ được biểu đồ")
+        samples.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(iterations)))
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "latency_ms": latency_summary(samples),
+        "ops_per_s": round(iterations / elapsed, 2) if elapsed > 0 else None,
+    }
+
+
+def _worker_rss(renderer: ChartRenderer) -> List[Optional[float]]:
+    pool = renderer._pool  # noqa: SLF001 - chỉ để đọc RSS của worker
+    processes = getattr(pool, "_processes", None) or {}
+    return [rss_mb(pid) for pid in processes]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20, help="Số lần vẽ mỗi loại biểu đồ cho mỗi chế độ")
+    parser.add_argument("--workers", type=int, default=2, help="Số tiến trình trong pool vẽ")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số request vẽ đồng thời ở chế độ pool_concurrent")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--only", help="Chỉ chạy các loại biểu đồ này (phân tách bởi dấu phẩy)")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/charts-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in (args.only or "").split(",") if n.strip()] or list(CHARTS)
+    renderer = ChartRenderer(workers=args.workers, dpi=args.dpi)
+    started = time.perf_counter()
+    renderer.start()
+    warmup_s = round(time.perf_counter() - started, 3)
+    print(f"Pool {args.workers} worker sẵn sàng sau {warmup_s}s", flush=True)
+
+    results: Dict[str, dict] = {}
+    try:
+        for name in names:
+            chart = CHARTS[name]
+            first = render_chart(chart, dpi=args.dpi)
+            if first is None:
+                raise RuntimeError(f"Không vẽ được biểu đồ mẫu {name}")
+            cases = {
+                "inline": lambda: measure(lambda: render_chart(chart, dpi=args.dpi), args.iterations, warmup=1),
+                "pool": lambda: measure(lambda: renderer.render(chart), args.iterations, warmup=1),
+                f"pool_c{args.concurrency}": lambda: _concurrent(
+                    renderer, chart, args.concurrency, args.iterations
+                ),
+            }
+            for mode, case in cases.items():
+                key = f"{name}.{mode}"
+                results[key] = {**case(), "png_bytes": len(first.data)}
+                lat = results[key]["latency_ms"]
+                print(f"{key:<30} p50={lat['p50']}ms p95={lat['p95']}ms ops/s={results[key]['ops_per_s']}", flush=True)
+        worker_rss = _worker_rss(renderer)
+        stats = renderer.stats()
+    finally:
+        renderer.close()
+
+    config = {
+        "iterations": args.iterations,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "dpi": args.dpi,
+        "charts": names,
+    }
+    payload = {
+        "config": config,
+        "warmup_s": warmup_s,
+        "peak_rss_mb": rss_mb(peak=True),
+        "worker_rss_mb": worker_rss,
+        "renderer": stats,
+        "results": results,
+    }
+    path = write_results("charts", payload, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
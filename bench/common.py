@@ -0,0 +1,129 @@
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+
+_WORDS = (
+    "education technology society government people should think because however therefore important young "
+    "children learn school university students cost public private benefit argue believe example economy "
+    "environment city transport health family community career opportunity skills research modern traditional "
+    "although furthermore consequently significant particularly increasingly responsibility individuals"
+).split()
+
+
+class UsageMeter:
+    """Bọc provider, cộng số lời gọi và token theo usage_metadata của mọi phản hồi (sync lẫn async)."""
+
+    def __init__(self, provider) -> None:
+        self.provider = provider
+        self.reset()
+
+    @property
+    def caches(self):
+        return self.provider.caches
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def generate_content(self, model: str, contents: str, config=None):
+        return self._count(self.provider.generate_content(model, contents, config))
+
+    async def agenerate_content(self, model: str, contents: str, config=None):
+        return self._count(await self.provider.agenerate_content(model, contents, config))
+
+    def close(self) -> None:
+        self.provider.close()
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+    def _count(self, resp):
+        self.calls += 1
+        self.prompt_tokens += resp.usage_metadata.prompt_token_count
+        self.output_tokens += resp.usage_metadata.candidates_token_count
+        return resp
+
+
+def latency_summary(samples: Iterable[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/mean/max (ms) của danh sách độ trễ tính bằng giây."""
+    values = np.asarray(list(samples), dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "mean": round(float(values.mean()), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def rss_mb(pid: Optional[int] = None, peak: bool = False) -> Optional[float]:
+    """RSS hiện tại (hoặc đỉnh, VmHWM) của tiến trình theo /proc; None nếu không đọc được."""
+    field = "VmHWM:" if peak else "VmRSS:"
+    try:
+        with open(f"/proc/{pid or 'self'}/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith(field):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    if pid is None and peak:
+        # Ngoài Linux: ru_maxrss là KB (Linux) hoặc byte (macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0), 1)
+    return None
+
+
+def sample_essay(seed: int, words: int = 280) -> str:
+    """Bài viết giả tất định theo seed (mỗi request một bài khác nhau để không trúng cache)."""
+    rng = random.Random(seed)
+    sentences: List[str] = []
+    count = 0
+    while count < words:
+        length = rng.randint(8, 22)
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        count += length
+    paragraphs = [" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)]
+    return "\n\n".join(paragraphs)
+
+
+def environment() -> dict:
+    """Thông tin môi trường/phiên bản đi kèm kết quả để so sánh giữa các lần release."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def write_results(kind: str, payload: dict, out: Optional[str] = None) -> Path:
+    """Ghi kết quả JSON (mặc định bench/results/<kind>-<thời gian>.json) và trả về đường dẫn."""
+    path = Path(out) if out else RESULTS_DIR / f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {"kind": kind, "environment": environment(), **payload}
+    path.write_text(json.dumps(document, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
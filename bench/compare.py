@@ -0,0 +1,80 @@
+"""So sánh hai file kết quả benchmark (cùng loại load/micro) để phát hiện regression.
+
+    python -m bench.compare bench/results/load-old.json bench/results/load-new.json --threshold 0.1
+
+Trả mã thoát 1 nếu có chỉ số xấu đi quá ngưỡng (độ trễ tăng / throughput giảm).
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def _load(path: str) -> dict:
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _metrics(doc: dict) -> Dict[str, Dict[str, Tuple[Optional[float], bool]]]:
+    """{tên case: {chỉ số: (giá trị, cao hơn là tốt hơn)}} cho cả hai loại kết quả."""
+    out: Dict[str, Dict[str, Tuple[Optional[float], bool]]] = {}
+    if doc.get("kind") == "load":
+        for row in doc.get("results", []):
+            lat = row.get("latency_ms") or {}
+            out[f"{row['endpoint']}@c{row['concurrency']}"] = {
+                "p50_ms": (lat.get("p50"), False),
+                "p95_ms": (lat.get("p95"), False),
+                "p99_ms": (lat.get("p99"), False),
+                "throughput_rps": (row.get("throughput_rps"), True),
+                "errors": (row.get("errors"), False),
+                "peak_rss_mb": (row.get("peak_rss_mb"), False),
+            }
+    else:
+        for name, row in (doc.get("results") or {}).items():
+            lat = row.get("latency_ms") or {}
+            out[name] = {
+                "p50_ms": (lat.get("p50"), False),
+                "p95_ms": (lat.get("p95"), False),
+                "ops_per_s": (row.get("ops_per_s"), True),
+            }
+    return out
+
+
+def compare(old: dict, new: dict, threshold: float) -> Iterator[Tuple[str, str, float, float, Optional[float], bool]]:
+    """(case, chỉ số, cũ, mới, thay đổi tương đối, là regression) cho các chỉ số có ở cả hai file."""
+    old_metrics, new_metrics = _metrics(old), _metrics(new)
+    for case in sorted(set(old_metrics) & set(new_metrics)):
+        for metric, (before, higher_is_better) in old_metrics[case].items():
+            after = new_metrics[case].get(metric, (None, higher_is_better))[0]
+            if before is None or after is None:
+                continue
+            if before == 0:
+                # Từ 0 lên (vd. số lỗi) luôn là regression, không tính được phần trăm
+                yield case, metric, before, after, None, after > 0 and not higher_is_better
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            yield case, metric, before, after, change, worse > threshold
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Ngưỡng xấu đi tương đối (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    old, new = _load(args.baseline), _load(args.candidate)
+    if old.get("kind") != new.get("kind"):
+        parser.error(f"Khác loại kết quả: {old.get('kind')} và {new.get('kind')}")
+    regressions = 0
+    for case, metric, before, after, change, regressed in compare(old, new, args.threshold):
+        regressions += regressed
+        delta = "n/a" if change is None else f"{change:+.1%}"
+        print(f"{case:<45} {metric:<15} {before:>12} -> {after:<12} {delta:>8} {'REGRESSION' if regressed else ''}")
+    print(f"{regressions} regression(s) vượt ngưỡng {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Benchmark phản hồi bài nháp: độ trễ phân tích khi sửa một đoạn (chỉ phân tích lại đoạn đó) so với
+phân tích cả bài, và bộ nhớ giữ cho mỗi bài nháp đang mở.
+
+    python -m bench.drafts
+    python -m bench.drafts --sessions 5000 --words 350
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from typing import Dict, List, Optional
+
+from backend.analysis import analyze_essay
+from backend.drafts import DraftSession
+
+from .common import rss_mb, sample_essay, write_results
+from .micro import measure
+
+
+def _typing(essay: str) -> List[str]:
+    """Các bản nháp liên tiếp khi người học gõ thêm từng từ vào cuối đoạn giữa bài."""
+    paragraphs = essay.split("\n\n")
+    middle = len(paragraphs) // 2
+    drafts = []
+    for n in range(1, 41):
+        edited = list(paragraphs)
+        edited[middle] = edited[middle] + " word" * n
+        drafts.append("\n\n".join(edited))
+    return drafts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=320, help="Số từ mỗi bài nháp")
+    parser.add_argument("--iterations", type=int, default=400, help="Số lần lặp mỗi phép đo độ trễ")
+    parser.add_argument("--sessions", type=int, default=2000, help="Số bài nháp mở cùng lúc khi đo bộ nhớ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/drafts-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    essay = sample_essay(args.seed, args.words)
+    drafts = _typing(essay)
+    session = DraftSession()
+    session.edit(essay)
+    session.analyze()
+    step = iter(range(10**9))
+
+    def incremental() -> None:
+        session.edit(drafts[next(step) % len(drafts)])
+        session.analyze()
+
+    def full() -> None:
+        fresh = DraftSession()
+        fresh.edit(drafts[next(step) % len(drafts)])
+        fresh.analyze()
+
+    results: Dict[str, dict] = {
+        "edit_one_paragraph": measure(incremental, args.iterations),
+        "analyze_whole_draft": measure(full, args.iterations),
+        "analyze_essay": measure(lambda: analyze_essay(drafts[next(step) % len(drafts)]), args.iterations),
+    }
+    for name, row in results.items():
+        lat = row["latency_ms"]
+        print(f"{name:<22} p50={lat['p50']}ms p95={lat['p95']}ms ops/s={row['ops_per_s']}", flush=True)
+
+    # Bộ nhớ giữ lại của N bài nháp khác nhau đã phân tích (văn bản + số đo từng đoạn + tần suất từ)
+    gc.collect()
+    rss_before = rss_mb()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = []
+    for n in range(args.sessions):
+        draft = DraftSession()
+        draft.edit(sample_essay(args.seed + 1 + n, args.words))
+        draft.analyze()
+        sessions.append(draft)
+    gc.collect()
+    retained = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    rss_after = rss_mb()
+    memory = {
+        "sessions": len(sessions),
+        "bytes_per_session": round(retained / len(sessions)),
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+    }
+    print(f"bộ nhớ: {memory['bytes_per_session'] / 1024:.1f} KiB/bài nháp ({len(sessions)} bài)", flush=True)
+
+    config = {k: getattr(args, k) for k in ("words", "iterations", "sessions", "seed")}
+    path = write_results("drafts", {"config": config, "results": results, "memory": memory}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
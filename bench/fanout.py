@@ -0,0 +1,89 @@
+"""Benchmark chấm song song từng tiêu chí (bốn lời gọi nhỏ đồng thời, rồi một lời gọi viết nhận xét tổng)
+so với chấm một lần gọi: phân phối độ trễ (p50/p95), số lời gọi và token mỗi bài theo mức chi tiết.
+Backend giả sinh token đầu ra theo tốc độ cấu hình nên phản hồi dài chậm hơn tương ứng như model thật.
+
+    python -m bench.fanout
+    python -m bench.fanout --essays 30 --words 400 --details scores,feedback,full --latency lognormal:-0.3,0.4
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional
+
+from backend.gemini_client import GeminiClient
+from backend.providers import FakeProvider
+
+from .common import UsageMeter, latency_summary, sample_essay, write_results
+from .grading_tiers import _PROMPTS
+
+
+async def _run(
+    client: GeminiClient, meter: UsageMeter, prompt: str, essays: List[str], task_type: str, detail: str
+) -> dict:
+    """Chấm lần lượt từng bài (async như server), trả về phân phối độ trễ và lời gọi/token mỗi bài."""
+    meter.reset()
+    samples: List[float] = []
+    for essay in essays:
+        start = time.perf_counter()
+        await client.agrade_essay(prompt, essay, task_type, detail=detail)
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    count = len(essays)
+    return {
+        "iterations": count,
+        "latency_ms": latency_summary(samples),
+        "ops_per_s": round(count / total, 2) if total > 0 else None,
+        "calls_per_essay": round(meter.calls / count, 2),
+        "prompt_tokens": round(meter.prompt_tokens / count, 1),
+        "output_tokens": round(meter.output_tokens / count, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=20, help="Số bài chấm cho mỗi trường hợp (mỗi bài khác nhau)")
+    parser.add_argument("--words", type=int, default=380, help="Số từ mỗi bài (chế độ song song nhắm tới bài dài)")
+    parser.add_argument("--details", default="scores,feedback,full", help="Các mức chi tiết, cách nhau bởi dấu phẩy")
+    parser.add_argument("--task-type", choices=("task1", "task2"), default="task2")
+    parser.add_argument("--latency", default="lognormal:-1.2,0.4", help="Độ trễ tới token đầu tiên của backend giả")
+    parser.add_argument("--output-tps", type=float, default=200.0, help="Tốc độ sinh token đầu ra (token/giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/fanout-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    prompt, task_type = _PROMPTS[args.task_type], args.task_type
+    results: Dict[str, dict] = {}
+    case = 0
+    for detail in [d for d in args.details.split(",") if d.strip()]:
+        for mode, min_words in (("single", 0), ("fanout", 1)):
+            meter = UsageMeter(FakeProvider(latency=args.latency, seed=args.seed, output_tps=args.output_tps))
+            # Client mới cho mỗi trường hợp, không cache: mọi bài đều phải gọi model
+            client = GeminiClient("", provider=meter, fanout_min_words=min_words)
+            essays = [sample_essay(args.seed + case * args.essays + n, args.words) for n in range(args.essays)]
+            case += 1
+            try:
+                results[f"{mode}.{detail}"] = asyncio.run(_run(client, meter, prompt, essays, task_type, detail))
+            finally:
+                client.close()
+        single, fanout = results[f"single.{detail}"], results[f"fanout.{detail}"]
+        # Tỉ lệ độ trễ của chế độ song song so với một lần gọi, cùng mức chi tiết
+        fanout["vs_single"] = {
+            p: round(fanout["latency_ms"][p] / single["latency_ms"][p], 3) for p in ("p50", "p95")
+        }
+        for name in (f"single.{detail}", f"fanout.{detail}"):
+            row, lat = results[name], results[name]["latency_ms"]
+            print(
+                f"{name:<16} p50={lat['p50']}ms p95={lat['p95']}ms {row['calls_per_essay']} lời gọi/bài "
+                f"in={row['prompt_tokens']} out={row['output_tokens']} tok/bài",
+                flush=True,
+            )
+
+    config = {k: getattr(args, k) for k in ("essays", "words", "details", "task_type", "latency", "output_tps", "seed")}
+    path = write_results("fanout", {"config": config, "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
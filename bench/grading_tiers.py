@@ -0,0 +1,104 @@
+"""Benchmark các mức chi tiết khi chấm (scores, feedback, full) và bản viết lại lấy sau theo yêu cầu:
+độ trễ và số token đầu vào/đầu ra mỗi bài. Backend giả sinh token đầu ra theo tốc độ cấu hình nên
+phản hồi dài (có bản viết lại) chậm hơn tương ứng như model thật, không tốn quota.
+
+    python -m bench.grading_tiers
+    python -m bench.grading_tiers --essays 20 --latency fixed:0.5 --output-tps 150 --task-type task1
+"""
+import argparse
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from backend.gemini_client import GeminiClient
+from backend.providers import FakeProvider
+
+from .common import UsageMeter, latency_summary, sample_essay, write_results
+
+_PROMPTS = {
+    "task1": (
+        "The bar chart below shows the number of visitors to three museums in London between 2010 and 2020. "
+        "Summarise the information by selecting and reporting the main features, and make comparisons where relevant."
+    ),
+    "task2": (
+        "Some people believe that university education should be free for all students, while others think "
+        "students should pay for their own studies. Discuss both views and give your own opinion."
+    ),
+}
+
+
+def _run(meter: UsageMeter, fn: Callable[[str], object], essays: List[str]) -> dict:
+    """Chấm lần lượt từng bài, trả về phân phối độ trễ và token trung bình mỗi bài."""
+    meter.reset()
+    samples: List[float] = []
+    for essay in essays:
+        start = time.perf_counter()
+        fn(essay)
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    count = len(essays)
+    return {
+        "iterations": count,
+        "latency_ms": latency_summary(samples),
+        "ops_per_s": round(count / total, 2) if total > 0 else None,
+        "calls_per_essay": round(meter.calls / count, 2),
+        "prompt_tokens": round(meter.prompt_tokens / count, 1),
+        "output_tokens": round(meter.output_tokens / count, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=10, help="Số bài chấm cho mỗi mức (mỗi bài khác nhau)")
+    parser.add_argument("--words", type=int, default=280, help="Số từ mỗi bài")
+    parser.add_argument("--task-type", choices=("task1", "task2"), default="task2")
+    parser.add_argument("--latency", default="fixed:0.4", help="Độ trễ tới token đầu tiên của backend giả")
+    parser.add_argument("--output-tps", type=float, default=200.0, help="Tốc độ sinh token đầu ra (token/giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/grading_tiers-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    meter = UsageMeter(FakeProvider(latency=args.latency, seed=args.seed, output_tps=args.output_tps))
+    client = GeminiClient("", provider=meter)
+    prompt, task_type = _PROMPTS[args.task_type], args.task_type
+
+    def feedback_then_improve(essay: str) -> None:
+        grade = client.grade_essay(prompt, essay, task_type, detail="feedback")
+        client.improve_essay(prompt, essay, task_type, grade=grade)
+
+    cases: Dict[str, Callable[[str], object]] = {
+        "scores": lambda essay: client.grade_essay(prompt, essay, task_type, detail="scores"),
+        "feedback": lambda essay: client.grade_essay(prompt, essay, task_type, detail="feedback"),
+        "full": lambda essay: client.grade_essay(prompt, essay, task_type, detail="full"),
+        # Chấm mức feedback rồi người học bấm xem bản viết lại
+        "feedback+improve": feedback_then_improve,
+    }
+    results: Dict[str, dict] = {}
+    try:
+        for i, (name, fn) in enumerate(cases.items()):
+            essays = [sample_essay(args.seed + i * args.essays + n, args.words) for n in range(args.essays)]
+            results[name] = _run(meter, fn, essays)
+        full = results["full"]
+        for name, row in results.items():
+            # Tỉ lệ so với mức full để chọn mức mặc định (GRADE_DETAIL)
+            row["vs_full"] = {
+                "p50": round(row["latency_ms"]["p50"] / full["latency_ms"]["p50"], 3),
+                "output_tokens": round(row["output_tokens"] / full["output_tokens"], 3),
+            }
+            lat = row["latency_ms"]
+            print(
+                f"{name:<18} p50={lat['p50']}ms p95={lat['p95']}ms in={row['prompt_tokens']} "
+                f"out={row['output_tokens']} tok/bài ({row['vs_full']['p50']:.0%} độ trễ mức full)",
+                flush=True,
+            )
+    finally:
+        client.close()
+
+    config = {k: getattr(args, k) for k in ("essays", "words", "task_type", "latency", "output_tps", "seed")}
+    path = write_results("grading_tiers", {"config": config, "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
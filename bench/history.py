@@ -0,0 +1,146 @@
+"""Benchmark lịch sử chấm (SQLite): tốc độ ghi theo lô, độ trễ record() trong request và độ trễ truy vấn
+phân trang/tổng hợp khi bảng có hàng triệu dòng.
+
+    python -m bench.history --rows 1000000
+    python -m bench.history --rows 200000 --path /tmp/history-bench.sqlite --keep
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from backend.history import GradeHistory
+from backend.models import CriterionScore, GradeResponse
+
+from .common import latency_summary, rss_mb, write_results
+from .micro import measure
+
+_NAMES = ("Task Response", "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy")
+_ESSAY = "Some people believe that university education should be free for all students. " * 4
+
+
+def _result(rng: random.Random) -> GradeResponse:
+    criteria = [CriterionScore(name=name, band=rng.choice((5.0, 5.5, 6.0, 6.5, 7.0)), comment="c") for name in _NAMES]
+    overall = sum(c.band for c in criteria) / len(criteria)
+    return GradeResponse(overall_band=overall, criteria=criteria, feedback="f", suggestions="s")
+
+
+def _populate(history: GradeHistory, rows: int, users: int, prompts: int, days: int, seed: int) -> dict:
+    """Ghi rows bản ghi tổng hợp (rải đều trong `days` ngày gần nhất) bằng đúng đường ghi theo lô."""
+    rng = random.Random(seed)
+    results = [_result(rng) for _ in range(50)]
+    now = time.time()
+    batch_size = 5000
+    started = time.perf_counter()
+    written = 0
+    while written < rows:
+        batch = []
+        for _ in range(min(batch_size, rows - written)):
+            result = results[rng.randrange(len(results))]
+            bands = {c.name: c.band for c in result.criteria}
+            batch.append((
+                now - rng.random() * days * 86400,
+                f"user-{rng.randrange(users)}",
+                f"Prompt number {rng.randrange(prompts)}",
+                "task2",
+                "gemini-2.5-flash",
+                result.overall_band,
+                *(bands[name] for name in _NAMES),
+                0,
+                round(rng.uniform(2000, 9000), 1),
+                _ESSAY,
+                result.model_dump_json(),
+            ))
+        history._write(batch)  # noqa: SLF001 - ghi trực tiếp để dựng dữ liệu nhanh
+        written += len(batch)
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "seconds": round(elapsed, 2), "rows_per_s": round(rows / elapsed, 1)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Số bản ghi dựng sẵn")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--prompts", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--iterations", type=int, default=200, help="Số lần lặp mỗi truy vấn")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="File SQLite (mặc định file tạm)")
+    parser.add_argument("--keep", action="store_true", help="Giữ file SQLite sau khi chạy")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/history-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="ielts-history-")
+    path = args.path or os.path.join(workdir, "history.sqlite")
+    history = GradeHistory(path)
+    results: Dict[str, dict] = {}
+    try:
+        populate = _populate(history, args.rows, args.users, args.prompts, args.days, args.seed)
+        print(f"Đã ghi {args.rows} dòng: {populate['rows_per_s']} dòng/s", flush=True)
+
+        # record() chạy trong request: chỉ xếp hàng, phải tốn cỡ micro giây
+        rng = random.Random(args.seed + 1)
+        sample = _result(rng)
+        samples = []
+        for i in range(args.iterations * 10):
+            start = time.perf_counter()
+            history.record("Prompt 1", _ESSAY, "task2", sample, "gemini-2.5-flash", user_id=f"user-{i}", duration=3.2)
+            samples.append(time.perf_counter() - start)
+        history.flush()
+        results["record"] = {"iterations": len(samples), "latency_ms": latency_summary(samples)}
+        print(f"{'record':<25} p50={results['record']['latency_ms']['p50']}ms", flush=True)
+
+        user = "user-7"
+        first = history.page(user_id=user, limit=20)
+        deep_cursor = None
+        page = first
+        while page["next_cursor"] is not None:
+            deep_cursor = int(page["next_cursor"])
+            page = history.page(user_id=user, limit=20, cursor=deep_cursor)
+        cases = {
+            "page.user_first": lambda: history.page(user_id=user, limit=20),
+            "page.user_last": lambda: history.page(user_id=user, limit=20, cursor=deep_cursor),
+            "page.prompt_first": lambda: history.page(prompt_hash=first["items"][0]["prompt_hash"], limit=20),
+            "page.all_first": lambda: history.page(limit=20),
+            "summary.all_30d": lambda: history.summary(
+                time.strftime("%Y-%m-%d", time.gmtime(time.time() - 30 * 86400)), None
+            ),
+            "summary.all_365d": lambda: history.summary(
+                time.strftime("%Y-%m-%d", time.gmtime(time.time() - 365 * 86400)), None
+            ),
+            "summary.user_365d": lambda: history.summary(
+                time.strftime("%Y-%m-%d", time.gmtime(time.time() - 365 * 86400)), None, user_id=user
+            ),
+            "summary.prompt_all": lambda: history.summary(prompt_hash=first["items"][0]["prompt_hash"]),
+        }
+        for name, fn in cases.items():
+            results[name] = measure(fn, args.iterations)
+            lat = results[name]["latency_ms"]
+            print(f"{name:<25} p50={lat['p50']}ms p95={lat['p95']}ms ops/s={results[name]['ops_per_s']}", flush=True)
+        stats = history.stats()
+    finally:
+        history.close()
+        if not args.keep and not args.path:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            os.rmdir(workdir)
+
+    config = {k: getattr(args, k) for k in ("rows", "users", "prompts", "days", "iterations", "seed")}
+    payload = {
+        "config": config,
+        "populate": populate,
+        "history": stats,
+        "peak_rss_mb": rss_mb(peak=True),
+        "results": results,
+    }
+    out = write_results("history", payload, args.out)
+    print(f"Đã ghi kết quả: {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
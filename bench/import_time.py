@@ -0,0 +1,99 @@
+"""Kiểm tra thời gian khởi động: import backend.main trong tiến trình Python mới (lấy trung vị nhiều lần)
+phải nằm trong ngân sách, và các thư viện nặng chỉ nạp khi cần (numpy, matplotlib) không được import sẵn.
+
+    python -m bench.import_time
+    python -m bench.import_time --budget-ms 600 --runs 9
+
+Trả mã thoát 1 nếu vượt ngân sách hoặc có module nặng bị import lúc khởi động (dùng được trong CI).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .common import write_results
+
+ROOT = Path(__file__).resolve().parent.parent
+# Chỉ được import ở lần dùng đầu tiên (vẽ biểu đồ, tính đặc trưng, chỉ mục bài gần trùng)
+LAZY_MODULES = ("numpy", "matplotlib")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _probe(module: str) -> dict:
+    code = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _slowest(module: str, top: int) -> List[Tuple[str, float]]:
+    """Các module tốn thời gian import tự thân (self) nhiều nhất, theo -X importtime."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:"):
+            continue
+        try:
+            rows.append((parts[2].strip(), int(parts[0].split(":")[1]) / 1000))
+        except ValueError:
+            continue  # dòng tiêu đề
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return [(name, round(ms, 1)) for name, ms in rows[:top]]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="backend.main", help="Module được import như khi server khởi động")
+    parser.add_argument("--runs", type=int, default=5, help="Số lần đo (mỗi lần một tiến trình mới)")
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="Ngân sách thời gian import (trung vị)")
+    parser.add_argument("--top", type=int, default=10, help="Số module import chậm nhất được liệt kê")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/import_time-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    # Lần đầu làm nóng cache bytecode/đĩa, không tính
+    _probe(args.module)
+    probes = [_probe(args.module) for _ in range(args.runs)]
+    samples = [probe["seconds"] * 1000 for probe in probes]
+    median = round(statistics.median(samples), 1)
+    loaded = sorted({name for probe in probes for name in probe["loaded"]})
+    slowest = _slowest(args.module, args.top)
+
+    print(f"import {args.module}: trung vị {median}ms (min {min(samples):.1f}ms, ngân sách {args.budget_ms:.0f}ms)")
+    for name, ms in slowest:
+        print(f"  {ms:>8.1f}ms  {name}")
+    failures: Dict[str, object] = {}
+    if median > args.budget_ms:
+        failures["over_budget_ms"] = round(median - args.budget_ms, 1)
+        print(f"VƯỢT NGÂN SÁCH: {median}ms > {args.budget_ms:.0f}ms")
+    if loaded:
+        failures["eager_modules"] = loaded
+        print(f"IMPORT SẴN MODULE NẶNG: {', '.join(loaded)}")
+
+    results = {
+        "median_ms": median,
+        "samples_ms": [round(ms, 1) for ms in samples],
+        "eager_modules": loaded,
+        "slowest_self_ms": slowest,
+    }
+    config = {k: getattr(args, k) for k in ("module", "runs", "budget_ms")}
+    path = write_results("import_time", {"config": config, "results": results, "failures": failures}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""Load test các endpoint chính với backend LLM giả (không tốn quota).
+
+Mặc định tự khởi động uvicorn với LLM_PROVIDER=fake, chạy lần lượt từng endpoint ở các mức
+concurrency cố định (closed loop: mỗi worker gửi request tiếp theo ngay khi nhận phản hồi) và ghi
+p50/p95/p99, throughput, số lỗi và RSS đỉnh của server ra JSON.
+
+    python -m bench.load --concurrency 1,8,32 --requests 200
+    python -m bench.load --url http://localhost:8000   # server có sẵn (không đo được RSS)
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .common import ROOT, latency_summary, rss_mb, sample_essay, write_results
+
+ENDPOINTS = ("grade", "grade_batch", "generate_tasks")
+_TASK1_PROMPT = "The chart below shows the number of visitors to three museums between 2010 and 2020."
+_TASK2_PROMPT = "Some people think university education should be free. Discuss both views and give your opinion."
+
+
+def _request(endpoint: str, seq: int) -> Tuple[str, str, Optional[dict]]:
+    """(method, path, body) của request thứ seq; mỗi request một bài khác nhau."""
+    if endpoint == "grade":
+        return "POST", "/api/grade", {"prompt": _TASK2_PROMPT, "essay": sample_essay(seq), "task_type": "task2"}
+    if endpoint == "grade_batch":
+        return "POST", "/api/grade_batch", {
+            "task1_prompt": _TASK1_PROMPT,
+            "task1_essay": sample_essay(seq, words=170),
+            "task2_prompt": _TASK2_PROMPT,
+            "task2_essay": sample_essay(seq + 1_000_000),
+        }
+    if endpoint == "generate_tasks":
+        return "GET", "/api/generate_tasks", None
+    raise ValueError(f"Endpoint không hỗ trợ: {endpoint}")
+
+
+class _RssSampler:
+    """Lấy mẫu RSS của server định kỳ để biết đỉnh bộ nhớ trong từng đợt đo."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "_RssSampler":
+        if self.pid is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            value = rss_mb(self.pid)
+            if value is not None and (self.peak is None or value > self.peak):
+                self.peak = value
+            self._stop.wait(self.interval)
+
+
+async def run_level(
+    client: httpx.AsyncClient, endpoint: str, concurrency: int, total: int, seq_base: int
+) -> Tuple[List[float], Counter, float]:
+    """Gửi `total` request với `concurrency` worker; trả (độ trễ các request thành công, mã trạng thái, thời gian)."""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        for i in counter:
+            method, path, body = _request(endpoint, seq_base + i)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=body)
+                status = resp.status_code
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            elapsed = time.perf_counter() - start
+            statuses[str(status)] += 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def run_suite(
+    base_url: str,
+    endpoints: List[str],
+    levels: List[int],
+    total: int,
+    warmup: int,
+    pid: Optional[int],
+) -> List[dict]:
+    results = []
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0, limits=limits) as client:
+        seq = 0
+        for endpoint in endpoints:
+            if warmup:
+                await run_level(client, endpoint, min(warmup, max(levels)), warmup, seq)
+                seq += warmup
+            for level in levels:
+                with _RssSampler(pid) as sampler:
+                    latencies, statuses, wall = await run_level(client, endpoint, level, total, seq)
+                seq += total
+                ok = statuses.get("200", 0)
+                row = {
+                    "endpoint": endpoint,
+                    "concurrency": level,
+                    "requests": total,
+                    "ok": ok,
+                    "errors": total - ok,
+                    "status_counts": dict(statuses),
+                    "latency_ms": latency_summary(latencies),
+                    "throughput_rps": round(ok / wall, 2) if wall > 0 else None,
+                    "wall_s": round(wall, 3),
+                    "peak_rss_mb": sampler.peak,
+                }
+                results.append(row)
+                _print_row(row)
+    return results
+
+
+def _print_row(row: dict) -> None:
+    lat = row["latency_ms"]
+    print(
+        f"{row['endpoint']:<15} c={row['concurrency']:<4} ok={row['ok']:<5} err={row['errors']:<4} "
+        f"p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms "
+        f"rps={row['throughput_rps']} rss={row['peak_rss_mb']}MB",
+        flush=True,
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, workdir: str) -> Tuple[subprocess.Popen, str]:
+    """Chạy uvicorn với backend giả; cache/kho đề tắt để mỗi request thực sự đi qua đường chấm/sinh đề."""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update(
+        LLM_PROVIDER="fake",
+        FAKE_LLM_LATENCY=args.latency,
+        FAKE_LLM_ERROR_RATE=str(args.error_rate),
+        FAKE_LLM_SEED=str(args.seed),
+        GRADE_CACHE_ENABLED="1" if args.cache else "0",
+        CHART_STORE_ENABLED="1" if args.cache else "0",
+        CHART_STORE_PATH=os.path.join(workdir, "chart_store"),
+        NEAR_DUP_ENABLED="0",
+        TASK_POOL_SIZE="0",
+        JOBS_DB_PATH=os.path.join(workdir, "jobs.sqlite"),
+    )
+    cmd = [
+        sys.executable, "-m", "uvicorn", "backend.main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn thoát sớm (mã {proc.returncode})")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=1.0).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("uvicorn không khởi động được trong 30 giây")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Đo server có sẵn thay vì tự khởi động (khi đó cấu hình fake do server quyết định)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Danh sách endpoint, cách nhau bởi dấu phẩy")
+    parser.add_argument("--concurrency", default="1,8,32", help="Các mức concurrency, vd. 1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="Số request mỗi (endpoint, mức concurrency)")
+    parser.add_argument("--warmup", type=int, default=5, help="Số request khởi động (không tính) mỗi endpoint")
+    parser.add_argument("--latency", default="lognormal:-0.3,0.4", help="Phân phối độ trễ của backend giả")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ lỗi 503 giả của backend giả")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Bật cache kết quả chấm và kho ảnh biểu đồ (mặc định tắt)")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/load-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = sorted(set(endpoints) - set(ENDPOINTS))
+    if unknown:
+        parser.error(f"endpoint không hỗ trợ: {', '.join(unknown)}")
+    levels = _int_list(args.concurrency)
+
+    proc = None
+    with tempfile.TemporaryDirectory(prefix="ielts-bench-") as workdir:
+        if args.url:
+            url, pid = args.url.rstrip("/"), None
+        else:
+            proc, url = start_server(args, workdir)
+            pid = proc.pid
+        try:
+            results = asyncio.run(run_suite(url, endpoints, levels, args.requests, args.warmup, pid))
+            server_peak = rss_mb(pid, peak=True) if pid is not None else None
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    config: Dict[str, object] = {
+        "url": args.url,
+        "endpoints": endpoints,
+        "concurrency": levels,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "cache": args.cache,
+    }
+    if not args.url:
+        config.update(provider="fake", latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    path = write_results("load", {"config": config, "server_peak_rss_mb": server_peak, "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
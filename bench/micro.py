@@ -0,0 +1,157 @@
+"""Micro-benchmark các đoạn CPU-bound trong tiến trình: vẽ biểu đồ theo từng loại, trích/parse JSON,
+ghép prompt chấm và tính đặc trưng văn bản.
+
+    python -m bench.micro
+    python -m bench.micro --only chart_image --chart-iterations 50
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from backend import gemini_client
+from backend.analysis import analyze_essay
+from backend.gemini_client import GeminiClient
+from backend.prompts import grading_payload
+from backend.providers import FakeProvider
+
+from .common import latency_summary, rss_mb, sample_essay, write_results
+
+# Dữ liệu mẫu cho từng dạng biểu đồ mà _generate_chart_image hỗ trợ
+CHARTS: Dict[str, dict] = {
+    "bar": {
+        "chart_type": "bar", "title": "Car ownership", "ylabel": "Cars per 1000 people",
+        "categories": ["UK", "France", "Japan", "Brazil", "India"], "values": [471, 482, 591, 249, 22],
+    },
+    "bar_grouped": {
+        "chart_type": "bar", "title": "Museum visitors (millions)", "ylabel": "Visitors",
+        "categories": ["2010", "2015", "2020"],
+        "series": [
+            {"label": "British Museum", "values": [5.8, 6.8, 1.3]},
+            {"label": "Science Museum", "values": [2.7, 3.2, 0.8]},
+            {"label": "Tate Modern", "values": [5.1, 4.7, 1.4]},
+        ],
+    },
+    "line": {
+        "chart_type": "line", "title": "Average house prices", "ylabel": "Thousand GBP",
+        "years": [1990, 1995, 2000, 2005, 2010, 2015, 2020], "values": [72, 68, 95, 160, 167, 210, 250],
+    },
+    "pie": {
+        "chart_type": "pie", "title": "Household energy use",
+        "labels": ["Heating", "Water", "Lighting", "Appliances", "Cooking"], "values": [42, 30, 4, 15, 9],
+    },
+    "table": {
+        "chart_type": "table", "title": "Underground railway systems",
+        "data": [
+            ["City", "Opened", "Km of route", "Passengers (m/yr)"],
+            ["London", "1863", "394", "775"], ["Paris", "1900", "199", "1191"],
+            ["Tokyo", "1927", "155", "1927"], ["Washington DC", "1976", "126", "144"],
+        ],
+    },
+}
+
+_GRADE_JSON = json.dumps({
+    "criteria": [
+        {"name": "Task Response", "band": 6.5, "comment": "Clear position, some ideas underdeveloped."},
+        {"name": "Coherence and Cohesion", "band": 6.0, "comment": "Logical paragraphs, mechanical linkers."},
+        {"name": "Lexical Resource", "band": 6.5, "comment": "Some less common items, a few collocation slips."},
+        {"name": "Grammatical Range and Accuracy", "band": 6.0, "comment": "Mix of forms, frequent article errors."},
+    ],
+    "overall_band": 6.0,
+    "feedback": "The essay answers the question but support is thin.",
+    "suggestions": "Develop each idea with an example.",
+    "improved_version": "University education benefits society as a whole ... " * 20,
+})
+_JSON_INPUTS = {
+    "plain": _GRADE_JSON,
+    "fenced": f"```json\n{_GRADE_JSON}\n```",
+    "noisy": f"Here is the evaluation you asked for:\n\n{_GRADE_JSON}\n\nLet me know if you need more detail.",
+}
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 2) -> dict:
+    """Chạy fn nhiều lần, trả về phân phối thời gian (ms) và số lần/giây."""
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return {
+        "iterations": iterations,
+        "latency_ms": latency_summary(samples),
+        "ops_per_s": round(iterations / total, 2) if total > 0 else None,
+    }
+
+
+def benchmarks(chart_iterations: int, iterations: int) -> Dict[str, Callable[[], dict]]:
+    client = GeminiClient("bench", provider=FakeProvider())
+    essay1, essay2 = sample_essay(1, words=170), sample_essay(2)
+    prompt1 = "The chart below shows the number of visitors to three museums between 2010 and 2020."
+    prompt2 = "Some people think university education should be free. Discuss both views."
+    features2 = analyze_essay(essay2)
+    cases: Dict[str, Callable[[], dict]] = {}
+
+    for name, chart in CHARTS.items():
+        text = json.dumps(chart)
+
+        def chart_case(text=text, name=name) -> dict:
+            if client._generate_chart_image(text, "") is None:
+                raise RuntimeError(f"Không vẽ được biểu đồ mẫu {name}")
+            return measure(lambda: client._generate_chart_image(text, ""), chart_iterations, warmup=1)
+
+        cases[f"chart_image.{name}"] = chart_case
+
+    for name, text in _JSON_INPUTS.items():
+        cases[f"extract_json_dict.{name}"] = lambda text=text: measure(
+            lambda: gemini_client._extract_json_dict(text), iterations
+        )
+    cases["validate_grade"] = lambda: measure(
+        lambda: gemini_client._validate_grade(_GRADE_JSON, "task2", features2.word_count), iterations
+    )
+    cases["prompt_assembly.task1"] = lambda: measure(
+        lambda: client._build_grading_contents(prompt1, essay1, "task1"), iterations
+    )
+    cases["prompt_assembly.task2"] = lambda: measure(
+        lambda: client._build_grading_contents(prompt2, essay2, "task2"), iterations
+    )
+    cases["prompt_assembly.task2_precomputed_features"] = lambda: measure(
+        lambda: client._build_grading_contents(prompt2, essay2, "task2", features2), iterations
+    )
+    cases["grading_payload.task2"] = lambda: measure(
+        lambda: grading_payload(prompt2, essay2, "task2", features2), iterations
+    )
+    cases["analyze_essay.task2"] = lambda: measure(lambda: analyze_essay(essay2), iterations)
+    return cases
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500, help="Số lần lặp cho các phép đo nhanh")
+    parser.add_argument("--chart-iterations", type=int, default=20, help="Số lần vẽ mỗi loại biểu đồ")
+    parser.add_argument("--only", help="Chỉ chạy các benchmark có tên bắt đầu bằng tiền tố này (phân tách bởi dấu phẩy)")
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/micro-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    prefixes = [p.strip() for p in (args.only or "").split(",") if p.strip()]
+    results = {}
+    for name, case in benchmarks(args.chart_iterations, args.iterations).items():
+        if prefixes and not any(name.startswith(p) for p in prefixes):
+            continue
+        results[name] = case()
+        lat = results[name]["latency_ms"]
+        print(f"{name:<45} p50={lat['p50']}ms p95={lat['p95']}ms ops/s={results[name]['ops_per_s']}", flush=True)
+
+    config = {"iterations": args.iterations, "chart_iterations": args.chart_iterations, "only": prefixes}
+    path = write_results("micro", {"config": config, "peak_rss_mb": rss_mb(peak=True), "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Benchmark chấm gộp nhiều bài trong một lần gọi so với mỗi bài một lần gọi: số lời gọi, token
+đầu vào/đầu ra mỗi bài và throughput khi chấm cả lớp với số worker giới hạn (như job chấm hàng loạt).
+Backend giả sinh token đầu ra theo tốc độ cấu hình nên gói lớn trả lời chậm hơn tương ứng.
+
+    python -m bench.packing
+    python -m bench.packing --essays 64 --pack-sizes 1,4,8,16 --detail scores --concurrency 2
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List, Optional
+
+from backend.gemini_client import GeminiClient
+from backend.providers import FakeProvider
+
+from .common import UsageMeter, latency_summary, sample_essay, write_results
+from .grading_tiers import _PROMPTS
+
+
+async def _run(
+    client: GeminiClient, meter: UsageMeter, items, task_type: str, detail: str, size: int, concurrency: int
+) -> dict:
+    """Chấm mọi bài theo các gói `size` bài với tối đa `concurrency` gói chạy đồng thời."""
+    meter.reset()
+    queue: "asyncio.Queue[list]" = asyncio.Queue()
+    for i in range(0, len(items), size):
+        queue.put_nowait(items[i:i + size])
+    samples: List[float] = []
+    failed = 0
+
+    async def worker() -> None:
+        nonlocal failed
+        while not queue.empty():
+            pack = queue.get_nowait()
+            start = time.perf_counter()
+            results = await client.agrade_pack(pack, task_type, detail=detail)
+            samples.append(time.perf_counter() - start)
+            failed += sum(isinstance(r, Exception) for r in results)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    count = len(items)
+    return {
+        "iterations": len(samples),
+        "latency_ms": latency_summary(samples),
+        "ops_per_s": round(count / elapsed, 2) if elapsed > 0 else None,
+        "failed": failed,
+        "calls_per_essay": round(meter.calls / count, 3),
+        "prompt_tokens": round(meter.prompt_tokens / count, 1),
+        "output_tokens": round(meter.output_tokens / count, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=32, help="Số bài của cả lớp (mỗi bài khác nhau, cùng đề)")
+    parser.add_argument("--words", type=int, default=280, help="Số từ mỗi bài")
+    parser.add_argument("--pack-sizes", default="1,4,8", help="Số bài mỗi gói, cách nhau bởi dấu phẩy (1 = từng bài)")
+    parser.add_argument("--max-tokens", type=int, default=24000, help="Ngân sách token mỗi gói (GRADE_PACK_MAX_TOKENS)")
+    parser.add_argument("--detail", choices=("scores", "feedback", "full"), default="feedback")
+    parser.add_argument("--task-type", choices=("task1", "task2"), default="task2")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số gói chấm đồng thời (JOBS_CONCURRENCY)")
+    parser.add_argument("--latency", default="fixed:0.4", help="Độ trễ tới token đầu tiên của backend giả")
+    parser.add_argument("--output-tps", type=float, default=200.0, help="Tốc độ sinh token đầu ra (token/giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="File JSON kết quả (mặc định bench/results/packing-<thời gian>.json)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.pack_sizes.split(",") if s.strip()]
+    prompt, task_type = _PROMPTS[args.task_type], args.task_type
+    results: Dict[str, dict] = {}
+    for i, size in enumerate(sizes):
+        meter = UsageMeter(FakeProvider(latency=args.latency, seed=args.seed, output_tps=args.output_tps))
+        # Client mới cho mỗi cỡ gói: không có cache nên mọi bài đều phải gọi model
+        client = GeminiClient("", provider=meter, pack_max_essays=size, pack_max_tokens=args.max_tokens)
+        items = [(prompt, sample_essay(args.seed + i * args.essays + n, args.words)) for n in range(args.essays)]
+        try:
+            results[f"pack_{size}"] = asyncio.run(
+                _run(client, meter, items, task_type, args.detail, size, args.concurrency)
+            )
+        finally:
+            client.close()
+    base = results[f"pack_{sizes[0]}"]
+    for name, row in results.items():
+        # Tỉ lệ so với cỡ gói đầu tiên (mặc định 1 = mỗi bài một lần gọi)
+        row["vs_first"] = {
+            "ops_per_s": round(row["ops_per_s"] / base["ops_per_s"], 3),
+            "prompt_tokens": round(row["prompt_tokens"] / base["prompt_tokens"], 3),
+        }
+        print(
+            f"{name:<8} {row['ops_per_s']} bài/s, {row['calls_per_essay']} lời gọi/bài, in={row['prompt_tokens']} "
+            f"out={row['output_tokens']} tok/bài ({row['vs_first']['prompt_tokens']:.0%} token đầu vào, "
+            f"{row['vs_first']['ops_per_s']:.2f}x throughput)",
+            flush=True,
+        )
+
+    config = {
+        k: getattr(args, k)
+        for k in ("essays", "words", "pack_sizes", "max_tokens", "detail", "task_type", "concurrency", "latency",
+                  "output_tps", "seed")
+    }
+    path = write_results("packing", {"config": config, "results": results}, args.out)
+    print(f"Đã ghi kết quả: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
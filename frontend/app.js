@@ -3,6 +3,20 @@ const apiBase = (typeof window !== 'undefined' && window.API_BASE)
   ? window.API_BASE
   : DEFAULT_API_BASE;
 
+// Mã người học ẩn danh, giữ trong trình duyệt để server lưu lịch sử chấm theo người
+const userId = (() => {
+  try {
+    let id = localStorage.getItem('ielts_user_id');
+    if (!id) {
+      id = (crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random().toString(16).slice(2));
+      localStorage.setItem('ielts_user_id', id);
+    }
+    return id;
+  } catch (e) {
+    return null;
+  }
+})();
+
 const prompt1El = document.getElementById('prompt1');
 const prompt2El = document.getElementById('prompt2');
 const promptErrorEl = document.getElementById('prompt-error');
@@ -22,8 +36,11 @@ const result2El = document.getElementById('result2');
 const btnHealth = document.getElementById('btn-health');
 const btnGenerate = document.getElementById('btn-generate');
 const btnSubmitBatch = document.getElementById('btn-submit-batch');
+const draft1El = document.getElementById('draft1');
+const draft2El = document.getElementById('draft2');
 
-function renderOneResult(container, data) {
+// request: body đã gửi đi chấm, dùng để lấy bản viết lại khi kết quả chưa có (mức scores/feedback)
+function renderOneResult(container, data, request) {
   if (!data || typeof data !== 'object') {
     container.innerHTML = '<p class="small">Không có dữ liệu.</p>';
     return;
@@ -35,16 +52,86 @@ function renderOneResult(container, data) {
       <div class="small">${escapeHtml(c.comment || '')}</div>
     </div>
   `).join('');
+  const canImprove = request && data.detail && data.detail !== 'full';
   const improvedBlock = data.improved_version
     ? `<div class="card"><h3>Bản viết mượt hơn</h3><div class="small">${escapeHtml(data.improved_version)}</div></div>`
+    : (canImprove ? '<button class="btn-improve">Xem bản viết mượt hơn</button>' : '');
+  const summaryBlock = data.detail === 'scores'
+    ? ''
+    : `<div class="card"><h3>Tóm tắt</h3><div>${escapeHtml(data.feedback || '')}</div></div>
+    <div class="card"><h3>Gợi ý cải thiện</h3><div>${escapeHtml(data.suggestions || '')}</div></div>`;
+  const approxNote = data.approximate
+    ? `<p class="small">Kết quả ước lượng từ một bài gần giống đã chấm trước đó${data.similarity != null ? ` (độ tương đồng ${Math.round(data.similarity * 100)}%)` : ''}.</p>`
     : '';
   container.innerHTML = `
-    <div class="band">Overall Band: ${data.overall_band?.toFixed ? data.overall_band.toFixed(1) : data.overall_band}</div>
-    <div class="card"><h3>Tóm tắt</h3><div>${escapeHtml(data.feedback || '')}</div></div>
-    <div class="card"><h3>Gợi ý cải thiện</h3><div>${escapeHtml(data.suggestions || '')}</div></div>
+    ${approxNote}
+    <div class="band">Overall Band: ${data.overall_band?.toFixed ? data.overall_band.toFixed(1) : (data.overall_band ?? '...')}</div>
+    ${summaryBlock}
     <div class="criteria">${criteriaHtml}</div>
     ${improvedBlock}
   `;
+  container.querySelector('.btn-improve')?.addEventListener('click', async (ev) => {
+    ev.target.disabled = true;
+    ev.target.textContent = 'Đang viết lại...';
+    try {
+      data.improved_version = await fetchImprovedVersion(request);
+      renderOneResult(container, data, request);
+    } catch (e) {
+      ev.target.disabled = false;
+      ev.target.textContent = 'Lỗi: ' + (e && e.message ? e.message : 'Failed to fetch') + ' — thử lại';
+    }
+  });
+}
+
+// Bản viết lại chỉ được tạo khi người học bấm xem (chấm ở mức scores/feedback nhanh hơn nhiều)
+async function fetchImprovedVersion(request) {
+  const res = await fetch(`${apiBase}/api/grade/improved_version`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ prompt: request.prompt, essay: request.essay, task_type: request.task_type })
+  });
+  if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+  const data = await res.json();
+  return data.improved_version;
+}
+
+// Chấm một bài qua /api/grade/stream (SSE), vẽ lại kết quả mỗi khi có thêm phần mới
+async function streamGrade(body, container) {
+  const res = await fetch(`${apiBase}/api/grade/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  });
+  if (!res.ok || !res.body) throw new Error(`${res.status} ${res.statusText}`);
+  const state = { criteria: [] };
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      const payload = data ? JSON.parse(data) : {};
+      // Lỗi của riêng một tiêu chí (có "field"): bỏ qua, "done" sẽ mang kết quả đã kiểm tra lại
+      if (event === 'error' && payload.field) continue;
+      if (event === 'error') throw new Error(payload.detail || 'Lỗi chấm bài');
+      // "done" mang GradeResponse đầy đủ, ghi đè các phần đã nhận
+      if (event === 'criterion') state.criteria.push(payload);
+      else Object.assign(state, payload);
+      renderOneResult(container, state, body);
+    }
+  }
+  return state;
 }
 
 function escapeHtml(str) {
@@ -56,6 +143,71 @@ function escapeHtml(str) {
     .replaceAll("'", '&#039;');
 }
 
+// Số đo tức thì khi đang viết qua WebSocket: server chỉ phân tích lại đoạn vừa sửa,
+// và tự chấm nhanh (mức scores) khi người học ngừng gõ lâu
+function connectDraft(taskType, essayEl, promptEl, metricsEl, resultEl) {
+  const url = apiBase.replace(/^http/, 'ws') + '/api/drafts/ws';
+  let ws = null;
+  let timer = null;
+  let retry = 1000;
+
+  const send = () => {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    ws.send(JSON.stringify({
+      type: 'draft',
+      text: essayEl.value || '',
+      task_type: taskType,
+      prompt: readyPrompt(promptEl),
+      user_id: userId
+    }));
+  };
+
+  const open = () => {
+    ws = new WebSocket(url);
+    ws.onopen = () => { retry = 1000; if (essayEl.value) send(); };
+    ws.onmessage = (ev) => {
+      const msg = JSON.parse(ev.data);
+      if (msg.type === 'metrics') renderDraftMetrics(metricsEl, msg);
+      else if (msg.type === 'grade' && msg.trigger === 'idle' && !resultEl.classList.contains('loading')) {
+        renderOneResult(resultEl, msg.result, {
+          prompt: readyPrompt(promptEl), essay: essayEl.value, task_type: taskType
+        });
+      }
+    };
+    // Mất kết nối thì thử lại chậm dần; bài viết vẫn gõ bình thường
+    ws.onclose = () => { ws = null; setTimeout(open, retry); retry = Math.min(retry * 2, 30000); };
+  };
+
+  essayEl.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(send, 150);
+  });
+  open();
+}
+
+// Đề đang hiển thị, bỏ qua dòng hướng dẫn/thông báo lỗi (khi đó server không tự chấm)
+function readyPrompt(el) {
+  const text = (el.textContent || '').trim();
+  return /^(Ấn|Lỗi|Không|Chưa)/.test(text) ? '' : text;
+}
+
+function renderDraftMetrics(container, m) {
+  const words = m.remaining > 0
+    ? `<span class="warn">${m.word_count}/${m.min_words} từ (thiếu ${m.remaining})</span>`
+    : `${m.word_count} từ`;
+  const s = m.structure;
+  const paragraphs = s.paragraphs < s.ideal
+    ? `<span class="warn">${s.paragraphs} đoạn (nên có ${s.ideal})</span>`
+    : `${s.paragraphs} đoạn`;
+  const notes = [];
+  if (s.single_sentence.length) notes.push(`đoạn ${s.single_sentence.map(i => i + 1).join(', ')} chỉ có một câu`);
+  if (s.overlong.length) notes.push(`đoạn ${s.overlong.map(i => i + 1).join(', ')} quá dài`);
+  if (m.repetition.length) {
+    notes.push('lặp từ: ' + m.repetition.map(r => `${escapeHtml(r.word)} ×${r.count}`).join(', '));
+  }
+  container.innerHTML = [words, paragraphs, ...notes.map(n => `<span class="warn">${n}</span>`)].join(' · ');
+}
+
 async function checkHealth() {
   promptErrorEl.textContent = '';
   try {
@@ -95,6 +247,7 @@ async function generateTasks() {
     const t2 = (data && data.task2) ? String(data.task2).trim() : '';
     const chartData = (data && data.task1_chart_data) ? String(data.task1_chart_data).trim() : '';
     const chartImage = (data && data.task1_chart_image) ? String(data.task1_chart_image).trim() : '';
+    const chartUrl = (data && data.task1_chart_url) ? String(data.task1_chart_url).trim() : '';
     if (!t1 || !t2) {
       promptErrorEl.style.color = '#ef4444';
       promptErrorEl.textContent = 'Không lấy được đề từ máy chủ. Hãy kiểm tra API key hoặc log server.';
@@ -103,8 +256,9 @@ async function generateTasks() {
     prompt2El.textContent = t2 || 'Không lấy được đề Task 2.';
     
     // Hiển thị hình ảnh biểu đồ hoặc dữ liệu text
-    if (chartImage) {
-      chartImageEl.src = 'data:image/png;base64,' + chartImage;
+    if (chartUrl || chartImage) {
+      // Ảnh trong kho biểu đồ được trình duyệt cache theo URL; ảnh base64 là định dạng cũ
+      chartImageEl.src = chartUrl ? `${apiBase}${chartUrl}` : 'data:image/png;base64,' + chartImage;
       chartImageEl.style.display = 'block';
       chartDataFallbackEl.style.display = 'none';
       chartDataContainerEl.style.display = 'block';
@@ -154,16 +308,11 @@ async function submitBatch() {
   result2El.innerHTML = '<p class="small">Đang chấm Task 2...</p>';
 
   try {
-    const url = `${apiBase}/api/grade_batch`;
-    const res = await fetch(url, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ task1_prompt, task1_essay, task2_prompt, task2_essay })
-    });
-    if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
-    const data = await res.json();
-    renderOneResult(result1El, data.task1);
-    renderOneResult(result2El, data.task2);
+    // Chấm song song 2 task qua stream để hiện điểm từng tiêu chí sớm nhất có thể
+    await Promise.all([
+      streamGrade({ prompt: task1_prompt, essay: task1_essay, task_type: 'task1', user_id: userId }, result1El),
+      streamGrade({ prompt: task2_prompt, essay: task2_essay, task_type: 'task2', user_id: userId }, result2El),
+    ]);
   } catch (e) {
     console.error('Grade batch failed:', e);
     const msg = escapeHtml(e && e.message ? e.message : 'Failed to fetch');
@@ -180,6 +329,11 @@ btnHealth?.addEventListener('click', checkHealth);
 btnGenerate.addEventListener('click', generateTasks);
 btnSubmitBatch.addEventListener('click', submitBatch);
 
+if (typeof WebSocket !== 'undefined') {
+  connectDraft('task1', essay1El, prompt1El, draft1El, result1El);
+  connectDraft('task2', essay2El, prompt2El, draft2El, result2El);
+}
+
 // Toggle UI giữa auto vs manual
 function updatePromptMode() {
   const manual = !!modeManualEl?.checked;
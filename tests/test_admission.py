@@ -0,0 +1,111 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+import pytest
+
+from backend import main
+from backend.admission import AdmissionScheduler, Overloaded
+from backend.gemini_client import GeminiClient
+from backend.models import GradeRequest
+from backend.providers import FakeProvider
+
+
+async def _queue(scheduler, requests, order):
+    """Giữ lượt duy nhất, xếp hàng các (priority, client, tag) rồi trả lượt để xem thứ tự được cấp."""
+    held = await scheduler.acquire("interactive", "holder")
+
+    async def wait(priority, client, tag):
+        lease = await scheduler.acquire(priority, client)
+        order.append(tag)
+        await asyncio.sleep(0)
+        lease.release()
+
+    tasks = []
+    for priority, client, tag in requests:
+        tasks.append(asyncio.create_task(wait(priority, client, tag)))
+        await asyncio.sleep(0)
+    held.release()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_higher_priority_lane_goes_first():
+    order = []
+    scheduler = AdmissionScheduler(concurrency=1)
+    requests = [("batch", "a", "batch"), ("generate", "a", "generate"), ("interactive", "a", "interactive")]
+    asyncio.run(_queue(scheduler, requests, order))
+    assert order == ["interactive", "generate", "batch"]
+
+
+def test_clients_take_turns_within_a_lane():
+    order = []
+    scheduler = AdmissionScheduler(concurrency=1)
+    requests = [("interactive", "a", "a1"), ("interactive", "a", "a2"), ("interactive", "a", "a3"),
+                ("interactive", "b", "b1"), ("interactive", "b", "b2")]
+    asyncio.run(_queue(scheduler, requests, order))
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
+
+
+def test_full_queue_sheds_newest_request_of_heaviest_client():
+    order = []
+    scheduler = AdmissionScheduler(concurrency=1, max_queue=3)
+    requests = [("interactive", "a", "a1"), ("interactive", "a", "a2"), ("interactive", "a", "a3"),
+                ("interactive", "b", "b1")]
+    outcomes = asyncio.run(_queue(scheduler, requests, order))
+    assert order == ["a1", "b1", "a2"]
+    shed = outcomes[2]
+    assert isinstance(shed, Overloaded) and shed.status_code == 429
+    assert scheduler.stats()["priorities"]["interactive"]["shed"] == 1
+
+    error = main._http_error(Overloaded("full", retry_after=2.0, position=shed.position))
+    assert error.status_code == 429
+    assert error.headers["X-Queue-Position"] == str(shed.position)
+
+
+def test_heaviest_client_is_rejected_when_it_cannot_evict():
+    async def run():
+        scheduler = AdmissionScheduler(concurrency=1, max_queue=2)
+        held = await scheduler.acquire("interactive", "holder")
+        waiting = [asyncio.create_task(scheduler.acquire("interactive", "a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as exc:
+            await scheduler.acquire("interactive", "a")
+        assert exc.value.position == 3
+        for task in waiting:
+            task.cancel()
+        held.release()
+
+    asyncio.run(run())
+
+
+def test_wait_estimate_rejects_when_over_deadline():
+    async def run():
+        scheduler = AdmissionScheduler(concurrency=1, max_wait={"interactive": 1.0})
+        # Một lượt giữ 5 giây làm mốc EWMA: người chờ kế tiếp chắc chắn quá hạn 1 giây
+        scheduler._running = 1
+        scheduler._release(5.0)
+        held = await scheduler.acquire("interactive", "a")
+        with pytest.raises(Overloaded) as exc:
+            await scheduler.acquire("interactive", "b")
+        assert exc.value.retry_after == pytest.approx(5.0)
+        held.release()
+
+    asyncio.run(run())
+
+
+def test_stream_lease_released_when_client_disconnects_before_start():
+    async def run():
+        scheduler = AdmissionScheduler(concurrency=1)
+        client = GeminiClient("", provider=FakeProvider())
+        state = SimpleNamespace(admission=scheduler, clients=SimpleNamespace(get=lambda: client), history=None)
+        request = SimpleNamespace(app=SimpleNamespace(state=state), client=None)
+        payload = GradeRequest(prompt="Discuss both views.", essay="Free university education helps. " * 20)
+        response = await main.grade_stream(payload, request)
+        assert scheduler.stats()["running"] == 1
+        # Client ngắt trước khi body được đọc: generator chưa chạy, chỉ finalize trả lượt
+        del response
+        gc.collect()
+        await asyncio.sleep(0)
+        assert scheduler.stats()["running"] == 0
+
+    asyncio.run(run())
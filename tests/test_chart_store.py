@@ -0,0 +1,103 @@
+import os
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.chart_store import ChartStore
+
+_CHART = {
+    "chart_type": "bar",
+    "title": "Museum visitors",
+    "categories": ["2010", "2015", "2020"],
+    "series": [{"label": "British Museum", "values": [5.8, 6.8, 1.3]}],
+}
+
+
+def _name(char: str, ext: str = "json") -> str:
+    return f"{char * 32}.{ext}"
+
+
+def test_save_is_content_addressed(tmp_path):
+    store = ChartStore(str(tmp_path), renderer=None)
+    first = store.save(dict(_CHART))
+    # Cùng dữ liệu (khác thứ tự khóa, thêm trường None) cho cùng id, lần sau là cache hit
+    second = store.save({**{k: _CHART[k] for k in reversed(list(_CHART))}, "ylabel": None})
+    assert first is not None and first == second
+    assert store.stats()["hits"] == 1
+    assert (tmp_path / f"{first}.json").exists() and (tmp_path / store.variant(first, "png")).exists()
+
+
+def test_get_renders_missing_format_and_dpi(tmp_path):
+    store = ChartStore(str(tmp_path), renderer=None)
+    key = store.save(dict(_CHART))
+    svg = store.get(key, "svg")
+    assert svg is not None and b"<svg" in svg[:500]
+    png = store.get(key, "png", dpi=150)
+    assert png is not None and png.startswith(b"\x89PNG")
+    assert (tmp_path / store.variant(key, "png", 150)).exists()
+    assert store.get("0" * 32, "png") is None
+
+
+def test_lru_evicts_least_recently_used(tmp_path):
+    store = ChartStore(str(tmp_path), max_bytes=250, renderer=None)
+    store._write(_name("a"), b"x" * 100)
+    store._write(_name("b"), b"x" * 100)
+    assert store._read(_name("a")) is not None
+    store._write(_name("c"), b"x" * 100)
+    assert sorted(os.listdir(tmp_path)) == [_name("a"), _name("c")]
+    assert store.stats()["evictions"] == 1 and store.stats()["bytes"] == 200
+
+
+def test_startup_rebuilds_order_from_mtime(tmp_path):
+    now = time.time()
+    for i, char in enumerate("cab"):
+        path = tmp_path / _name(char)
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (now - 100 + i, now - 100 + i))
+    store = ChartStore(str(tmp_path), max_bytes=250, renderer=None)
+    # c có mtime cũ nhất nên bị bỏ khi dựng lại chỉ mục
+    assert sorted(os.listdir(tmp_path)) == [_name("a"), _name("b")]
+    store._write(_name("d"), b"x" * 100)
+    assert sorted(os.listdir(tmp_path)) == [_name("b"), _name("d")]
+
+
+def test_scan_keeps_other_workers_fresh_tmp_files(tmp_path):
+    other = tmp_path / f".{_name('a')}.{os.getpid() + 1}.1.tmp"
+    own = tmp_path / f".{_name('b')}.{os.getpid()}.1.tmp"
+    stale = tmp_path / f".{_name('c')}.{os.getpid() + 1}.1.tmp"
+    for path in (other, own, stale):
+        path.write_bytes(b"partial")
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+    ChartStore(str(tmp_path), renderer=None)
+    assert other.exists() and not own.exists() and not stale.exists()
+
+
+def test_write_error_is_counted_and_cleaned_up(tmp_path):
+    store = ChartStore(str(tmp_path), renderer=None)
+    # Đích là thư mục: os.replace lỗi như khi đĩa gặp sự cố
+    (tmp_path / _name("a")).mkdir()
+    assert store._write(_name("a"), b"data") is False
+    assert store.stats()["write_errors"] == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_chart_endpoint_etag_and_not_modified(tmp_path):
+    store = ChartStore(str(tmp_path), renderer=None)
+    key = store.save(dict(_CHART))
+    main.app.state.clients = SimpleNamespace(chart_store=store)
+    try:
+        client = TestClient(main.app)
+        first = client.get(f"/api/charts/{key}.png")
+        assert first.status_code == 200 and first.headers["content-type"] == "image/png"
+        etag = first.headers["etag"]
+        assert etag == store.etag(key, "png")
+        again = client.get(f"/api/charts/{key}.png", headers={"If-None-Match": f"W/{etag}"})
+        assert again.status_code == 304 and again.content == b""
+        other = client.get(f"/api/charts/{key}.png?dpi=150", headers={"If-None-Match": etag})
+        assert other.status_code == 200 and other.headers["etag"] != etag
+        assert client.get(f"/api/charts/{'0' * 32}.png").status_code == 404
+    finally:
+        del main.app.state.clients
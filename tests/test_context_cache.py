@@ -0,0 +1,35 @@
+import time
+
+from backend.context_cache import RubricContextCache
+from backend.gemini_client import GeminiClient
+from backend.providers import FakeProvider
+
+_PROMPT = "Some people think university should be free. Discuss both views."
+_ESSAY = "University education should be free because it benefits society. " * 30
+
+
+def test_create_refresh_and_close_delete():
+    provider = FakeProvider()
+    cache = RubricContextCache(provider, "fake-model", ttl=600, refresh_margin=60)
+    name = cache.get_name("task2")
+    assert name is not None and provider.caches.created == 1
+    assert cache.get_name("task2") == name and provider.caches.updated == 0
+
+    # Sắp hết TTL: lần lấy kế tiếp gia hạn đúng cache cũ thay vì tạo mới
+    cache._entries["task2"] = (name, time.time() + 30)
+    assert cache.get_name("task2") == name
+    assert provider.caches.updated == 1 and cache.refreshed == 1
+
+    cache.close()
+    assert provider.caches.deleted == 1
+    assert cache.stats()["active"] == []
+
+
+def test_grading_uses_context_cache():
+    provider = FakeProvider()
+    client = GeminiClient("", provider=provider, context_cache=True)
+    result = client.grade_essay(_PROMPT, _ESSAY)
+    assert provider.caches.created == 1
+    assert [c.name for c in result.criteria][0] == "Task Response"
+    client.close()
+    assert provider.caches.deleted == 1
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from backend.drafts import DraftHub, DraftSession
+from backend.models import GradeResponse
+
+_PARAGRAPHS = [
+    "Some people believe university should be free. Others disagree strongly.",
+    "Free tuition widens access to education. It also helps the economy grow.",
+    "However, taxes would rise for everyone. Governments have limited budgets.",
+    "In conclusion, partial support is the fairest option for society.",
+]
+_LONG = "\n\n".join(p + " " + " ".join(f"word{i}" for i in range(80)) for p in _PARAGRAPHS)
+
+
+class _Socket:
+    """WebSocket giả: message của client lấy từ hàng đợi, message server gửi ghi vào sent."""
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        self.closed = code
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    def send(self, **data):
+        self.incoming.put_nowait({"type": "websocket.receive", "text": json.dumps(data)})
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+
+
+def _result():
+    return GradeResponse(overall_band=6.0, criteria=[], feedback="", suggestions="")
+
+
+def test_edit_reanalyses_only_changed_paragraph():
+    session = DraftSession()
+    session.edit("\n\n".join(_PARAGRAPHS))
+    assert session.analyze()["changed"] == [0, 1, 2, 3]
+    edited = list(_PARAGRAPHS)
+    edited[2] = "However, taxes would rise for every worker. Budgets are limited."
+    session.edit("\n\n".join(edited))
+    message = session.analyze()
+    assert message["changed"] == [2]
+    fresh = DraftSession()
+    fresh.edit("\n\n".join(edited))
+    expected = fresh.analyze()
+    for key in ("word_count", "sentence_count", "paragraph_words", "repetition"):
+        assert message[key] == expected[key]
+
+
+def test_quick_edits_are_debounced_into_one_analysis():
+    async def grade(*args):
+        return _result()
+
+    async def run():
+        hub = DraftHub(grade, debounce=0.1, idle_grade=0)
+        socket = _Socket()
+        serving = asyncio.create_task(hub.serve(socket))
+        for i in range(1, 4):
+            socket.send(type="draft", text=" ".join(_PARAGRAPHS[:i]))
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.3)
+        socket.disconnect()
+        await serving
+        return hub, socket
+
+    hub, socket = asyncio.run(run())
+    metrics = [m for m in socket.sent if m["type"] == "metrics"]
+    assert len(metrics) == 1 and metrics[0]["version"] == 3
+    assert hub.stats()["analyses"] == 1
+
+
+def test_idle_grade_fires_once():
+    calls = []
+
+    async def grade(prompt, essay, task_type, detail, user_id):
+        calls.append((detail, user_id))
+        return _result()
+
+    async def run():
+        hub = DraftHub(grade, debounce=0.01, idle_grade=0.05, idle_detail="scores")
+        socket = _Socket()
+        serving = asyncio.create_task(hub.serve(socket))
+        socket.send(type="draft", text=_LONG, prompt="Discuss both views.", user_id="u1")
+        await asyncio.sleep(0.4)
+        socket.disconnect()
+        await serving
+        return hub, socket
+
+    hub, socket = asyncio.run(run())
+    assert calls == [("scores", "u1")]
+    grades = [m for m in socket.sent if m["type"] == "grade"]
+    assert len(grades) == 1 and grades[0]["trigger"] == "idle"
+    assert hub.stats()["grades"] == {"submit": 0, "idle": 1}
+
+
+def test_session_cleaned_up_when_socket_closes():
+    state = {}
+
+    async def grade(*args):
+        state["started"].set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        return _result()
+
+    async def run():
+        state["started"] = asyncio.Event()
+        hub = DraftHub(grade, debounce=0.01, idle_grade=0)
+        socket = _Socket()
+        serving = asyncio.create_task(hub.serve(socket))
+        socket.send(type="submit", text=_LONG, prompt="Discuss both views.")
+        await asyncio.wait_for(state["started"].wait(), 1.0)
+        assert hub.stats()["open"] == 1
+        socket.disconnect()
+        await asyncio.wait_for(serving, 1.0)
+        await asyncio.sleep(0)
+        return hub
+
+    hub = asyncio.run(run())
+    assert hub.stats()["open"] == 0
+    assert state.get("cancelled") is True
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.gemini_client import GeminiClient
+from backend.prompts import criterion_instructions
+from backend.providers import FakeProvider
+
+_PROMPT = "Some people think university should be free. Discuss both views."
+_SHORT = "University education should be free because it benefits society as a whole. " * 10
+_LONG = _SHORT * 4
+# Band model trả về cho từng tiêu chí (chưa làm tròn) để so hai đường chấm
+_BANDS = {
+    "Task Response": 6.7,
+    "Coherence and Cohesion": 7.3,
+    "Lexical Resource": 5.9,
+    "Grammatical Range and Accuracy": 6.2,
+}
+
+
+class _Bands(FakeProvider):
+    """Trả cùng band thô cho mỗi tiêu chí dù chấm một lần gọi hay từng tiêu chí riêng."""
+
+    def _respond(self, contents, config):
+        data = json.loads(super()._respond(contents, config))
+        if "criteria" in data:
+            for item in data["criteria"]:
+                item["band"] = _BANDS[item["name"]]
+        elif "band" in data:
+            name = next(n for n in _BANDS if contents.startswith(criterion_instructions("task2", n, "full")))
+            data["band"] = _BANDS[name]
+        return json.dumps(data)
+
+
+def _bands(result):
+    return result.overall_band, [(c.name, c.band) for c in result.criteria]
+
+
+@pytest.mark.parametrize(
+    "essay, expected",
+    [
+        (_LONG, (6.0, [6.5, 7.0, 5.5, 6.0])),
+        # Dưới 250 từ: Task Response bị cap 5.0, overall tối đa 5.5
+        (_SHORT, (5.5, [5.0, 7.0, 5.5, 6.0])),
+    ],
+)
+def test_fanout_matches_single_call_rounding_and_word_cap(essay, expected):
+    fanout = GeminiClient("", provider=_Bands(), fanout_min_words=1).grade_essay(_PROMPT, essay)
+    single = GeminiClient("", provider=_Bands()).grade_essay(_PROMPT, essay)
+    assert _bands(fanout) == _bands(single)
+    assert (fanout.overall_band, [c.band for c in fanout.criteria]) == expected
+    assert fanout.feedback and fanout.improved_version
+
+
+def test_async_fanout_matches_sync():
+    provider = _Bands()
+    client = GeminiClient("", provider=provider, fanout_min_words=1)
+    result = asyncio.run(client.agrade_essay(_PROMPT, _LONG))
+    assert _bands(result) == _bands(GeminiClient("", provider=_Bands()).grade_essay(_PROMPT, _LONG))
+    assert provider.calls == 5
+
+
+def test_fanout_only_for_long_essays():
+    provider = _Bands()
+    GeminiClient("", provider=provider, fanout_min_words=200).grade_essay(_PROMPT, _SHORT)
+    assert provider.calls == 1
+
+
+@pytest.mark.parametrize("run_async", [False, True])
+def test_scores_detail_skips_summary_call(run_async):
+    provider = FakeProvider()
+    client = GeminiClient("", provider=provider, fanout_min_words=1)
+    if run_async:
+        result = asyncio.run(client.agrade_essay(_PROMPT, _LONG, detail="scores"))
+    else:
+        result = client.grade_essay(_PROMPT, _LONG, detail="scores")
+    assert provider.calls == 4
+    assert result.detail == "scores" and result.feedback == "" and result.improved_version is None
+    assert len(result.criteria) == 4
@@ -0,0 +1,78 @@
+from backend import grade_cache
+from backend.grade_cache import GradeCache, grade_cache_key
+from backend.models import CriterionScore, GradeResponse
+
+_PROMPT = "Some people think university should be free.\nDiscuss both views."
+
+
+def _result(band: float) -> GradeResponse:
+    names = ["Task Response", "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+    criteria = [CriterionScore(name=name, band=band, comment="") for name in names]
+    return GradeResponse(overall_band=band, criteria=criteria, feedback="ok", suggestions="")
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_key_collapses_whitespace_but_keeps_case_and_context():
+    key = grade_cache_key(_PROMPT, "First line.\n\nSecond  line. ", "task2", "m", "v1")
+    assert key == grade_cache_key(" " + _PROMPT.replace("\n", " "), "First line. Second line.", "task2", "m", "v1")
+    # Chữ hoa/thường là một phần bài làm (ảnh hưởng điểm ngữ pháp) nên không gộp
+    assert key != grade_cache_key(_PROMPT, "first line. second line.", "task2", "m", "v1")
+    assert key != grade_cache_key(_PROMPT, "First line. Second line.", "task1", "m", "v1")
+    assert key != grade_cache_key(_PROMPT, "First line. Second line.", "task2", "other", "v1")
+    assert key != grade_cache_key(_PROMPT, "First line. Second line.", "task2", "m", "v2")
+
+
+def test_memory_entries_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(grade_cache, "time", clock)
+    cache = GradeCache(ttl=60)
+    cache.set("k", _result(6.0))
+    clock.now += 59
+    assert cache.get("k").overall_band == 6.0
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = GradeCache(max_items=2)
+    cache.set("a", _result(5.0))
+    cache.set("b", _result(6.0))
+    assert cache.get("a") is not None
+    cache.set("c", _result(7.0))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["memory_size"] == 2
+
+
+def test_returned_values_are_copies():
+    cache = GradeCache()
+    cache.set("k", _result(6.0))
+    cache.get("k").criteria[0].band = 9.0
+    assert cache.get("k").criteria[0].band == 6.0
+
+
+def test_sqlite_tier_survives_restart_and_keeps_expiry(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(grade_cache, "time", clock)
+    path = str(tmp_path / "grades.sqlite")
+    cache = GradeCache(ttl=60, path=path)
+    cache.set("k", _result(6.5))
+    cache.close()
+
+    clock.now += 30
+    cache = GradeCache(ttl=60, path=path)
+    assert cache.get("k") == _result(6.5)
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("k") is not None and cache.stats()["memory_hits"] == 1
+    # Bản nạp lên bộ nhớ giữ hạn dùng gốc từ đĩa, không được gia hạn thêm một TTL
+    clock.now += 31
+    assert cache.get("k") is None
+    cache.close()
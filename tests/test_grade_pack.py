@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from backend.gemini_client import GeminiClient
+from backend.models import GradeResponse
+from backend.providers import FakeProvider
+
+_PROMPT = "Some people think university should be free. Discuss both views."
+_ESSAYS = [
+    "University education should be free because it benefits society as a whole. " * 25,
+    "Students should pay for their own studies since graduates earn higher salaries later. " * 25,
+    "Governments have limited budgets, so free tuition must be balanced against health care. " * 25,
+]
+
+
+class _PackEdits(FakeProvider):
+    """Sửa phản hồi chấm gộp: edit(results) trả về danh sách kết quả đã đổi thứ tự/bỏ bớt."""
+
+    def __init__(self, edit, **kwargs):
+        super().__init__(**kwargs)
+        self.edit = edit
+        self.contents = []
+
+    def _respond(self, contents, config):
+        self.contents.append(contents)
+        text = super()._respond(contents, config)
+        data = json.loads(text) if text.startswith("{") else None
+        if data is None or "results" not in data:
+            return text
+        edited = self.edit(data["results"])
+        return edited if isinstance(edited, str) else json.dumps({"results": edited})
+
+
+def _client(provider):
+    return GeminiClient("", provider=provider, pack_max_essays=8)
+
+
+def _items():
+    return [(_PROMPT, essay) for essay in _ESSAYS]
+
+
+def _single(essay):
+    return _client(FakeProvider()).grade_essay(_PROMPT, essay, "task2")
+
+
+def test_pack_is_graded_in_one_call_and_split_per_essay():
+    provider = _PackEdits(lambda results: results)
+    results = _client(provider).grade_pack(_items())
+    assert provider.calls == 1
+    assert all(isinstance(r, GradeResponse) and len(r.criteria) == 4 for r in results)
+
+    reordered = _client(_PackEdits(lambda results: results[::-1])).grade_pack(_items())
+    assert [r.model_dump() for r in reordered] == [r.model_dump() for r in results]
+
+
+def test_missing_essay_is_regraded_alone():
+    provider = _PackEdits(lambda results: [r for r in results if r["id"] != "e2"])
+    results = _client(provider).grade_pack(_items())
+    # Một lời gọi gộp rồi một lời gọi riêng cho bài bị thiếu
+    assert provider.calls == 2
+    assert _ESSAYS[1].strip() in provider.contents[1] and _ESSAYS[0].strip() not in provider.contents[1]
+    assert results[1].model_dump() == _single(_ESSAYS[1]).model_dump()
+    packed = _client(_PackEdits(lambda results: results)).grade_pack(_items())
+    assert results[0].model_dump() == packed[0].model_dump()
+    assert results[2].model_dump() == packed[2].model_dump()
+
+
+def test_missing_essay_is_regraded_alone_async():
+    provider = _PackEdits(lambda results: [r for r in results if r["id"] != "e3"])
+    results = asyncio.run(_client(provider).agrade_pack(_items()))
+    assert provider.calls == 2
+    assert results[2].model_dump() == _single(_ESSAYS[2]).model_dump()
+
+
+def test_broken_pack_response_falls_back_to_halves_then_single_calls():
+    provider = _PackEdits(lambda results: '{"results": [')
+    results = _client(provider).grade_pack(_items())
+    # Gói 3 bài hỏng -> nửa 2 bài (vẫn hỏng) + 1 bài riêng -> 2 bài riêng
+    assert provider.calls == 5
+    assert [r.model_dump() for r in results] == [_single(essay).model_dump() for essay in _ESSAYS]
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.config import get_settings
+from backend.history import GradeHistory, prompt_hash
+from backend.models import CriterionScore, GradeResponse
+
+_PROMPT = "Some people think university should be free.\nDiscuss both views."
+
+
+def _result(band: float, task_type: str = "task2") -> GradeResponse:
+    first = "Task Achievement" if task_type == "task1" else "Task Response"
+    names = [first, "Coherence and Cohesion", "Lexical Resource", "Grammatical Range and Accuracy"]
+    criteria = [CriterionScore(name=name, band=band + 0.5 * i, comment="") for i, name in enumerate(names)]
+    return GradeResponse(overall_band=band, criteria=criteria, feedback="", suggestions="")
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = GradeHistory(str(tmp_path / "history.sqlite"), batch_size=3, flush_interval=0.3)
+    yield history
+    history.close()
+
+
+def test_flush_writes_queued_records(history):
+    for i in range(5):
+        history.record(_PROMPT, f"essay {i}", "task2", _result(5.0), model="m", user_id="u1")
+    # flush_interval dài: không có flush() thì lô cuối còn nằm trong hàng đợi
+    history.flush()
+    assert history.stats()["written"] == 5 and history.stats()["queued"] == 0
+    assert len(history.page(user_id="u1", limit=10)["items"]) == 5
+
+
+def test_keyset_pagination_walks_newest_first_without_overlap(history):
+    for i in range(7):
+        history.record(_PROMPT, f"essay {i}", "task2", _result(5.0), model="m", user_id="u1" if i % 2 else "u2")
+    history.flush()
+    seen, cursor = [], None
+    while True:
+        page = history.page(user_id="u1", limit=2, cursor=int(cursor) if cursor else None)
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 3 and seen == sorted(seen, reverse=True)
+    assert all(history.get(grade_id)["user_id"] == "u1" for grade_id in seen)
+
+
+def test_daily_aggregate_matches_rows(history):
+    for i in range(8):
+        task_type = "task1" if i % 3 == 0 else "task2"
+        history.record(_PROMPT, f"essay {i}", task_type, _result(4.0 + i * 0.5, task_type), model="m", user_id="u")
+    history.flush()
+    key = prompt_hash(_PROMPT)
+    for task_type in (None, "task1", "task2"):
+        daily = history.summary(task_type=task_type)
+        rows = history.summary(task_type=task_type, prompt_hash=key)
+        assert daily["source"] == "daily" and rows["source"] == "rows"
+        assert daily["count"] == rows["count"] > 0
+        assert daily["overall_band"] == rows["overall_band"]
+        assert daily["criteria"] == rows["criteria"]
+
+
+def test_history_is_off_by_default(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.delenv("HISTORY_DB_PATH", raising=False)
+    get_settings.cache_clear()
+    try:
+        assert get_settings().history_db_path is None
+    finally:
+        get_settings.cache_clear()
+
+
+def test_history_item_only_readable_by_its_user(history):
+    history.record(_PROMPT, "my essay", "task2", _result(6.0), model="m", user_id="owner")
+    history.flush()
+    grade_id = history.page(user_id="owner")["items"][0]["id"]
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(history=history)))
+    item = asyncio.run(main.grade_history_item(grade_id, request, user_id="owner"))
+    assert item["essay"] == "my essay"
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.grade_history_item(grade_id, request, user_id="someone-else"))
+    assert exc.value.status_code == 404
+
+
+def test_history_list_requires_user_id():
+    # Không chạy lifespan: kiểm tra tham số bị từ chối trước khi vào handler
+    response = TestClient(main.app).get("/api/history")
+    assert response.status_code == 422
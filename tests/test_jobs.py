@@ -0,0 +1,82 @@
+import asyncio
+import csv
+import io
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.jobs import JobRunner, JobStore, JobUploadError
+from backend.models import GradeResponse
+
+
+def test_worker_survives_settle_error(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), lease_seconds=0.0)
+    lines = b"".join(b'{"prompt": "p", "essay": "essay %d"}\n' % i for i in range(3))
+    job_id, total = store.create_job(io.BytesIO(lines), "jsonl")
+    complete = store.complete
+    failures = []
+
+    def flaky_complete(row, result):
+        if not failures:
+            failures.append(row)
+            raise sqlite3.OperationalError("database is locked")
+        complete(row, result)
+
+    store.complete = flaky_complete
+
+    async def grade(prompt, essay, task_type):
+        return GradeResponse(overall_band=6.0, criteria=[], feedback="", suggestions="")
+
+    async def run():
+        runner = JobRunner(store, grade, concurrency=1, poll_interval=0.01)
+        runner.start()
+        for _ in range(200):
+            if store.status(job_id)["done"] == total:
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+
+    asyncio.run(run())
+    assert failures
+    assert store.status(job_id)["done"] == total
+    store.close()
+
+
+def test_csv_field_over_limit_is_an_upload_error(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    essay = "x" * (csv.field_size_limit() + 1)
+    upload = io.BytesIO(f'prompt,essay\np,"{essay}"\n'.encode("utf-8"))
+    with pytest.raises(JobUploadError):
+        store.create_job(upload, "csv")
+    store.close()
+
+
+def test_create_job_endpoint_rejects_bad_csv(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    main.app.state.jobs = SimpleNamespace(store=store, notify=lambda: None)
+    try:
+        body = 'prompt,essay\np,"' + "x" * (csv.field_size_limit() + 1) + '"\n'
+        response = TestClient(main.app).post("/api/jobs?format=csv", content=body.encode("utf-8"))
+    finally:
+        main.app.state.jobs = None
+        store.close()
+    assert response.status_code == 400
+
+
+def test_renewed_rows_are_not_reclaimed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), lease_seconds=0.2)
+    store.create_job(io.BytesIO(b'{"prompt": "p", "essay": "e"}\n'), "jsonl")
+    rows = store.claim(10)
+    assert len(rows) == 1
+    time.sleep(0.1)
+    store.renew(rows)
+    time.sleep(0.15)
+    # Đã gia hạn: chưa quá lease nên không bị nhận lại
+    assert store.claim(10) == []
+    time.sleep(0.25)
+    assert len(store.claim(10)) == 1
+    store.close()
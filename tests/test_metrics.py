@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+from backend import main, metrics
+from backend.metrics import Histogram
+
+
+def test_histogram_renders_cumulative_buckets_sum_count_and_escaped_labels():
+    histogram = Histogram("t_seconds", "help", ("endpoint",), buckets=(0.1, 1.0))
+    label = 'a"b\\c\nd'
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, endpoint=label)
+    assert list(histogram.samples()) == [
+        't_seconds_bucket{endpoint="a\\"b\\\\c\\nd",le="0.1"} 2',
+        't_seconds_bucket{endpoint="a\\"b\\\\c\\nd",le="1.0"} 3',
+        't_seconds_bucket{endpoint="a\\"b\\\\c\\nd",le="+Inf"} 4',
+        't_seconds_sum{endpoint="a\\"b\\\\c\\nd"} 3.65',
+        't_seconds_count{endpoint="a\\"b\\\\c\\nd"} 4',
+    ]
+
+
+def test_metrics_endpoint_exposes_request_histogram_and_server_timing():
+    main.app.state.server_timing = True
+    try:
+        client = TestClient(main.app)
+        with metrics.labels(task_type="task2"):
+            metrics.observe_stage("parse", 0.002)
+        first = client.get("/metrics")
+        response = client.get("/metrics")
+    finally:
+        main.app.state.server_timing = False
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert first.headers["server-timing"].startswith("total;dur=")
+    lines = response.text.splitlines()
+    assert "# TYPE ielts_request_duration_seconds histogram" in lines
+    prefix = 'ielts_request_duration_seconds_count{endpoint="/metrics",method="GET",status="200"} '
+    assert any(line.startswith(prefix) for line in lines)
+    assert any(
+        line.startswith('ielts_request_duration_seconds_bucket{endpoint="/metrics",method="GET",status="200",le="+Inf"}')
+        for line in lines
+    )
+    assert any(
+        line.startswith('ielts_stage_duration_seconds_count{stage="parse",endpoint="background",task_type="task2"')
+        for line in lines
+    )
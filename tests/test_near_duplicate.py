@@ -0,0 +1,45 @@
+import random
+
+from backend.models import GradeResponse
+from backend.near_duplicate import NearDuplicateIndex
+
+_WORDS = "education technology society government people should think because however therefore".split()
+
+
+def _essay(seed: int, words: int = 120) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_WORDS) + str(rng.randrange(50)) for _ in range(words))
+
+
+def _response(band: float) -> GradeResponse:
+    return GradeResponse(overall_band=band, criteria=[], feedback="", suggestions="")
+
+
+def test_query_finds_resubmitted_essay():
+    index = NearDuplicateIndex(capacity=16)
+    for i in range(10):
+        index.add("prompt", _essay(i), "task2", "m", _response(i))
+    match = index.query("prompt", _essay(3) + " extra", "task2", "m")
+    assert match is not None and match.response.overall_band == 3
+    assert index.query("other prompt", _essay(3), "task2", "m") is None
+
+
+def test_capacity_evicts_oldest(tmp_path):
+    path = str(tmp_path / "near.sqlite")
+    index = NearDuplicateIndex(path=path, capacity=4)
+    for i in range(7):
+        index.add("prompt", _essay(i), "task2", "m", _response(i))
+    assert len(index) == 4 and index.evicted == 3
+    assert index.query("prompt", _essay(2), "task2", "m") is None
+    for i in range(3, 7):
+        assert index.query("prompt", _essay(i), "task2", "m").response.overall_band == i
+    index.close()
+
+    reloaded = NearDuplicateIndex(path=path, capacity=2)
+    assert len(reloaded) == 2
+    assert reloaded.query("prompt", _essay(4), "task2", "m") is None
+    reloaded.add("prompt", _essay(7), "task2", "m", _response(7))
+    for i in (6, 7):
+        assert reloaded.query("prompt", _essay(i), "task2", "m").response.overall_band == i
+    assert reloaded.query("prompt", _essay(5), "task2", "m") is None
+    reloaded.close()
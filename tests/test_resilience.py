@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+
+from backend.resilience import Resilience
+
+
+def _flaky(result):
+    calls = {"n": 0}
+
+    def fn():
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise httpx.ConnectTimeout("timeout")
+        return result
+
+    return fn, calls
+
+
+def test_call_retries_after_transient_error():
+    fn, calls = _flaky("ok")
+    res = Resilience("test", base_delay=0.001, max_delay=0.01)
+    assert res.call(fn) == "ok"
+    assert calls["n"] == 2
+    assert res.retries == 1
+    assert res.breaker.state == "closed"
+
+
+def test_acall_retries_after_transient_error():
+    fn, calls = _flaky("ok")
+
+    async def afn():
+        return fn()
+
+    res = Resilience("test", base_delay=0.001, max_delay=0.01)
+    assert asyncio.run(res.acall(afn)) == "ok"
+    assert calls["n"] == 2
+    assert res.retries == 1
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+def test_do_runs_concurrent_identical_calls_once():
+    flight = SingleFlight()
+    runs = []
+    gate = threading.Event()
+
+    def fn():
+        runs.append(1)
+        gate.wait(1.0)
+        return "ok"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(5)]
+    threads[0].start()
+    time.sleep(0.05)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert runs == [1] and results == ["ok"] * 5
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_do_delivers_exception_to_every_waiter():
+    flight = SingleFlight()
+    gate = threading.Event()
+
+    def fn():
+        gate.wait(1.0)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", fn)
+        except ValueError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    threads[0].start()
+    time.sleep(0.05)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3 and flight.stats()["in_flight"] == 0
+
+
+def test_ado_runs_once_and_removes_key():
+    async def run():
+        flight = SingleFlight()
+        runs = []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        results = await asyncio.gather(*(flight.ado("k", fn) for _ in range(5)))
+        assert runs == [1] and results == ["ok"] * 5
+        assert flight.stats()["in_flight"] == 0
+        # Khóa đã được gỡ: lời gọi sau chạy lại
+        assert await flight.ado("k", fn) == "ok" and runs == [1, 1]
+
+    asyncio.run(run())
+
+
+def test_ado_delivers_exception_to_every_waiter():
+    async def run():
+        flight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flight.ado("k", fn) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_cancelling_leader_still_delivers_to_followers():
+    async def run():
+        flight = SingleFlight()
+        runs = []
+
+        async def fn():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        leader = asyncio.create_task(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == "ok"
+        assert runs == [1] and flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+
+def test_call_cancelled_when_every_waiter_leaves():
+    async def run():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1.0)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import re
+
+import pytest
+from google.genai import errors
+
+from backend import metrics
+from backend.gemini_client import GeminiClient
+from backend.providers import FakeProvider, _FakeResponse
+
+_PROMPT = "Some people think university should be free. Discuss both views."
+_ESSAY = "University education should be free because it benefits society. " * 30
+
+
+class _MalformedOnce(FakeProvider):
+    """Lần đầu trả tiêu chí có band không phải số và tên viết tắt, các lần sau trả JSON mẫu."""
+
+    def _respond(self, contents, config):
+        text = super()._respond(contents, config)
+        if self.calls > 1:
+            return text
+        data = json.loads(text)
+        data["criteria"][0]["name"] = "TR"
+        data["criteria"][1]["band"] = "seven"
+        return json.dumps(data)
+
+
+class _BrokenStream(FakeProvider):
+    async def agenerate_content_stream(self, model, contents, config=None):
+        async def chunks():
+            yield await self.agenerate_content(model, contents, config)
+            raise errors.ServerError(500, {"error": {"code": 500, "message": "stream reset", "status": "INTERNAL"}})
+
+        return chunks()
+
+
+async def _collect(client):
+    return [event async for event in client.astream_grade(_PROMPT, _ESSAY)]
+
+
+def test_stream_normalises_names_and_reports_bad_items():
+    client = GeminiClient("", provider=_MalformedOnce())
+    events = asyncio.run(_collect(client))
+    names = [data["name"] for event, data in events if event == "criterion"]
+    assert names == ["Task Response", "Lexical Resource", "Grammatical Range and Accuracy"]
+    errors_ = [data for event, data in events if event == "error"]
+    assert len(errors_) == 1 and errors_[0]["field"] == "criteria[]"
+    assert events[-1][0] == "done" and len(events[-1][1]["criteria"]) == 4
+
+
+def test_stream_retries_without_stale_context_cache():
+    provider = FakeProvider()
+    client = GeminiClient("", provider=provider, context_cache=True)
+    name = client.context_cache.get_name("task2")
+    # Cache bị xóa phía upstream trong khi client vẫn giữ tên
+    provider.caches.delete(name)
+    events = asyncio.run(_collect(client))
+    assert events[-1][0] == "done"
+    assert client.context_cache.stats()["active"] == []
+
+
+def test_stream_records_error_on_mid_stream_failure():
+    client = GeminiClient("", provider=_BrokenStream(), model_name="broken-stream")
+    with pytest.raises(errors.ServerError):
+        asyncio.run(_collect(client))
+    assert any(
+        'outcome="error"' in line and 'model="broken-stream"' in line for line in metrics.render().splitlines()
+    )
+
+
+class _SplitOnSpaces(FakeProvider):
+    """Mỗi khoảng trắng là một chunk riêng, như khi model stream từng token."""
+
+    async def agenerate_content_stream(self, model, contents, config=None):
+        text = self._respond(contents, config)
+
+        async def chunks():
+            for piece in re.split(r"( )", text):
+                if piece:
+                    yield _FakeResponse(piece)
+
+        return chunks()
+
+
+def test_stream_keeps_whitespace_only_chunks():
+    client = GeminiClient("", provider=_SplitOnSpaces())
+    events = asyncio.run(_collect(client))
+    feedback = [data["feedback"] for event, data in events if event == "feedback"]
+    assert feedback and " " in feedback[0]
+    comments = [data["comment"] for event, data in events if event == "criterion"]
+    assert comments and all(" " in comment for comment in comments)
+    assert events[-1][1]["feedback"] == feedback[0]
@@ -0,0 +1,132 @@
+import json
+import random
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel, Field
+
+from backend.gemini_client import GeminiClient
+from backend.json_stream import IncrementalJsonObject
+from backend.providers import FakeProvider
+from backend.structured import OutputValidationError, llm_schema, parse_model
+
+_PROMPT = "Some people think university should be free. Discuss both views."
+_ESSAY = "University education should be free because it benefits society. " * 30
+
+
+class _Item(BaseModel):
+    name: str = Field(title="Name")
+    band: float = Field(ge=0, le=9)
+
+
+class _Output(BaseModel):
+    summary: str
+    items: List[_Item]
+    note: Optional[str] = None
+    internal: bool = False
+
+
+def test_llm_schema_inlines_refs_and_applies_exclude_and_order():
+    schema = llm_schema(_Output, exclude=("internal",), order=("items", "summary"))
+    text = json.dumps(schema)
+    assert "$ref" not in text and "$defs" not in text
+    assert '"title"' not in text and '"default"' not in text
+    assert list(schema["properties"]) == ["items", "summary", "note"]
+    assert schema["required"] == ["items", "summary"]
+    item = schema["properties"]["items"]["items"]
+    assert item["properties"]["band"] == {"type": "number", "minimum": 0, "maximum": 9}
+    assert item["required"] == ["name", "band"]
+
+
+def test_parse_model_accepts_code_fence():
+    text = '```json\n{"summary": "s", "items": [{"name": "a", "band": 6}]}\n```'
+    assert parse_model(text, _Output).items[0].band == 6.0
+
+
+@pytest.mark.parametrize("text", ['{"summary": "s", "items": [{"name": "a", "ba', "", "not json"])
+def test_parse_model_flags_truncated_or_empty_json_as_syntax(text):
+    with pytest.raises(OutputValidationError) as exc:
+        parse_model(text, _Output)
+    assert exc.value.syntax is True
+
+
+def test_parse_model_flags_constraint_violation_as_schema_error():
+    with pytest.raises(OutputValidationError) as exc:
+        parse_model('{"summary": "s", "items": [{"name": "a", "band": 12}]}', _Output)
+    assert exc.value.syntax is False
+    assert "items.0.band" in str(exc.value)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_parser_handles_arbitrary_chunk_boundaries(seed):
+    data = {
+        "criteria": [
+            {"name": "Task Response", "band": 6.5, "comment": 'Uses "quotes", {braces} and [brackets]\\n'},
+            {"name": "Lexical Resource", "band": 6, "comment": "ý kiến rõ ràng"},
+        ],
+        "overall_band": 6.0,
+        "feedback": "Line one.\nLine two, with a comma.",
+        "improved_version": "Tuition-free universities widen access.",
+    }
+    text = "```json\n" + json.dumps(data, ensure_ascii=False, indent=1) + "\n```"
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), 12))
+    parser = IncrementalJsonObject()
+    events = []
+    for start, end in zip([0, *cuts], [*cuts, len(text)]):
+        events.extend(parser.feed(text[start:end]))
+    assert parser.done
+    assert events == [
+        ("criteria[]", data["criteria"][0]),
+        ("criteria[]", data["criteria"][1]),
+        ("criteria", data["criteria"]),
+        ("overall_band", 6.0),
+        ("feedback", data["feedback"]),
+        ("improved_version", data["improved_version"]),
+    ]
+
+
+class _Scripted(FakeProvider):
+    """Trả lần lượt các phản hồi sửa từ JSON mẫu (None = giữ nguyên) và ghi lại prompt đã nhận."""
+
+    def __init__(self, edits):
+        super().__init__()
+        self.edits = list(edits)
+        self.contents = []
+
+    def _respond(self, contents, config):
+        self.contents.append(contents)
+        text = super()._respond(contents, config)
+        edit = self.edits.pop(0) if self.edits else None
+        return edit(text) if edit else text
+
+
+def _drop_criterion(text):
+    data = json.loads(text)
+    data["criteria"] = data["criteria"][:3]
+    return json.dumps(data)
+
+
+def test_schema_error_is_repaired_once():
+    provider = _Scripted([_drop_criterion])
+    client = GeminiClient("", provider=provider)
+    result = client.grade_essay(_PROMPT, _ESSAY)
+    assert len(result.criteria) == 4 and provider.calls == 2
+    assert provider.contents[1].startswith("Your previous JSON response failed validation.")
+    assert client.parse_counters.stats()["grade"]["repaired"] == 1
+
+
+def test_truncated_json_resends_original_request():
+    provider = _Scripted([lambda text: text[: len(text) // 2]])
+    client = GeminiClient("", provider=provider)
+    client.grade_essay(_PROMPT, _ESSAY)
+    assert provider.calls == 2 and provider.contents[1] == provider.contents[0]
+
+
+def test_second_failure_is_not_retried_again():
+    provider = _Scripted([_drop_criterion, _drop_criterion, _drop_criterion])
+    client = GeminiClient("", provider=provider)
+    with pytest.raises(OutputValidationError):
+        client.grade_essay(_PROMPT, _ESSAY)
+    assert provider.calls == 2
+    assert client.parse_counters.stats()["grade"]["failed"] == 1